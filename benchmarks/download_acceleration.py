@@ -0,0 +1,143 @@
+"""
+Скорость скачивания через yt-dlp в одно соединение и с ускорением из tools.yt_dlp_downloader.acceleration
+
+Файл раздаётся локальным http сервером с поддержкой Range. Скорость каждого соединения ограничена,
+как у сайтов с видео, иначе на локальном сервере несколько соединений ничего не дают.
+Для ускорения нужен установленный aria2c:
+    python -m benchmarks.download_acceleration --size 256 --connection-rate 8 --repeat 3
+"""
+
+import argparse
+import logging.config
+import re
+import tempfile
+import threading
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from configs import LOGGING_CONFIG
+from tools.yt_dlp_downloader.acceleration import ARIA2C_PATH, get_acceleration_options
+from tools.yt_dlp_downloader.yt_dlp_download_videos import download
+
+logger = logging.getLogger(__name__)
+
+RANGE_REGEX = re.compile(r"bytes=(\d*)-(\d*)")
+CHUNK_SIZE = 64 * 2**10
+
+
+class RangeRequestHandler(BaseHTTPRequestHandler):
+    """
+    Отдаёт server.data как video/mp4, не быстрее server.connection_rate байт в секунду на соединение
+    """
+
+    server: "FileServer"
+
+    def log_message(self, format: str, *args) -> None:  # noqa: A002, D102
+        logger.debug(format, *args)
+
+    def _get_range(self) -> tuple[int, int]:
+        size = len(self.server.data)
+        match = RANGE_REGEX.fullmatch(self.headers.get("Range", ""))
+        if match is None:
+            return 0, size - 1
+
+        start, end = match.groups()
+        if not start:
+            return max(0, size - int(end)), size - 1
+
+        return int(start), min(int(end), size - 1) if end else size - 1
+
+    def _send_headers(self) -> tuple[int, int]:
+        start, end = self._get_range()
+        is_partial = "Range" in self.headers
+        self.send_response(206 if is_partial else 200)
+        self.send_header("Content-Type", "video/mp4")
+        self.send_header("Accept-Ranges", "bytes")
+        self.send_header("Content-Length", str(end - start + 1))
+        if is_partial:
+            self.send_header("Content-Range", f"bytes {start}-{end}/{len(self.server.data)}")
+        self.end_headers()
+        return start, end
+
+    def do_HEAD(self) -> None:  # noqa: D102, N802
+        self._send_headers()
+
+    def do_GET(self) -> None:  # noqa: D102, N802
+        start, end = self._send_headers()
+        started = time.perf_counter()
+        sent = 0
+        try:
+            for offset in range(start, end + 1, CHUNK_SIZE):
+                chunk = self.server.data[offset : min(offset + CHUNK_SIZE, end + 1)]
+                self.wfile.write(chunk)
+                sent += len(chunk)
+
+                delay = sent / self.server.connection_rate - (time.perf_counter() - started)
+                if delay > 0:
+                    time.sleep(delay)
+        except ConnectionError:
+            # yt-dlp закрывает соединение, прочитав заголовки при определении типа ссылки
+            pass
+
+
+class FileServer(ThreadingHTTPServer):  # noqa: D101
+    daemon_threads = True
+
+    def __init__(self, data: bytes, connection_rate: float):  # noqa: D107
+        super().__init__(("127.0.0.1", 0), RangeRequestHandler)
+        self.data = memoryview(data)
+        self.connection_rate = connection_rate
+
+
+@contextmanager
+def serve(data: bytes, connection_rate: float) -> Iterator[str]:  # noqa: D103
+    server = FileServer(data, connection_rate)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{server.server_address[1]}/lecture.mp4"
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def measure(url: str, size: int, repeat: int, *, accelerate: bool) -> float:
+    """
+    Возвращает среднюю скорость в байтах в секунду
+    """
+    elapsed = 0.0
+    for _ in range(repeat):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            start = time.perf_counter()
+            # Выбор форматов рассчитан на сайты с видео, а здесь один формат без разрешения
+            download(url, temp_dir, accelerate=accelerate, format="best")
+            elapsed += time.perf_counter() - start
+
+    return size * repeat / elapsed
+
+
+def main() -> None:  # noqa: D103
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, default=256, help="Размер файла, MB")
+    parser.add_argument("--connection-rate", type=float, default=8, help="Скорость одного соединения, MB/s")
+    parser.add_argument("--repeat", type=int, default=3, help="Сколько раз скачать файл в каждом режиме")
+    args = parser.parse_args()
+
+    if ARIA2C_PATH is None:
+        logger.warning("aria2c is not installed, accelerated download of a file without fragments is not faster")
+
+    size = args.size * 2**20
+    with serve(bytes(size), args.connection_rate * 2**20) as url:
+        logger.info("Acceleration options: %s", get_acceleration_options(url))
+        single = measure(url, size, args.repeat, accelerate=False)
+        accelerated = measure(url, size, args.repeat, accelerate=True)
+
+    logger.info("Single connection: %.1f MB/s", single / 2**20)
+    logger.info("Accelerated:       %.1f MB/s (x%.2f)", accelerated / 2**20, accelerated / single)
+
+
+if __name__ == "__main__":
+    logging.config.dictConfig(LOGGING_CONFIG)
+    main()
@@ -0,0 +1,90 @@
+"""
+Сколько строк ProcessedVideo в секунду загружает проверка состояния с тяжёлыми колонками и без них
+
+Запуск на базе с обработанными видео:
+    python -m benchmarks.status_check --limit 500 --repeat 5
+"""
+
+import argparse
+import asyncio
+import logging.config
+import time
+from collections.abc import Callable
+
+from sqlalchemy import Select, select
+from sqlalchemy.orm import selectinload
+
+from configs import LOGGING_CONFIG
+from djgram.db.base import get_autocommit_session
+from processing.models import ProcessedVideo, Video
+from processing.models.loading import defer_heavy_columns
+
+logger = logging.getLogger(__name__)
+
+
+def full_stmt(ids: list[int]) -> Select:
+    """
+    Как проверка состояния загружала видео раньше
+    """
+    # noinspection PyTypeChecker
+    return select(ProcessedVideo).options(selectinload(ProcessedVideo.original_video)).where(ProcessedVideo.id.in_(ids))
+
+
+def deferred_stmt(ids: list[int]) -> Select:
+    """
+    Без тяжёлых колонок, как в get_video_for_processing
+    """
+    # noinspection PyTypeChecker
+    return (
+        select(ProcessedVideo)
+        .options(*defer_heavy_columns(ProcessedVideo))
+        .options(selectinload(ProcessedVideo.original_video).options(*defer_heavy_columns(Video)))
+        .where(ProcessedVideo.id.in_(ids))
+    )
+
+
+async def measure(stmt_factory: Callable[[list[int]], Select], ids: list[int], repeat: int) -> float:
+    """
+    Возвращает строк в секунду. Каждый запрос в новой сессии, чтобы не попадать в identity map
+    """
+    loaded = 0
+    start = time.perf_counter()
+    for _ in range(repeat):
+        async with get_autocommit_session() as db_session:
+            for processed_video in await db_session.scalars(stmt_factory(ids)):
+                # Как при проверке состояния
+                _ = processed_video.status, processed_video.waiters, processed_video.original_video.yt_dlp_info
+                loaded += 1
+
+    return loaded / (time.perf_counter() - start)
+
+
+async def main() -> None:  # noqa: D103
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--limit", type=int, default=500, help="Сколько последних обработанных видео загружать")
+    parser.add_argument("--repeat", type=int, default=5, help="Сколько раз повторить загрузку")
+    args = parser.parse_args()
+
+    async with get_autocommit_session() as db_session:
+        # noinspection PyTypeChecker
+        ids = list(
+            await db_session.scalars(select(ProcessedVideo.id).order_by(ProcessedVideo.id.desc()).limit(args.limit)),
+        )
+
+    if len(ids) == 0:
+        logger.error("No processed videos in database")
+        return
+
+    # Прогрев соединений и кешей запросов
+    await measure(full_stmt, ids, 1)
+    await measure(deferred_stmt, ids, 1)
+
+    full = await measure(full_stmt, ids, args.repeat)
+    deferred = await measure(deferred_stmt, ids, args.repeat)
+    logger.info("Full rows:     %.0f rows/s", full)
+    logger.info("Deferred rows: %.0f rows/s (x%.2f)", deferred, deferred / full)
+
+
+if __name__ == "__main__":
+    logging.config.dictConfig(LOGGING_CONFIG)
+    asyncio.run(main())
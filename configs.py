@@ -1,5 +1,8 @@
 import copy
 import os
+import shutil
+import socket
+import tempfile
 from datetime import timedelta
 from pathlib import Path
 
@@ -72,6 +75,17 @@ REDIS_PASSWORD: str | None = os.environ.get("REDIS_PASSWORD")
 #: Номер базы данных для хранилища машины конченых состояний
 REDIS_STORAGE_DB: int = int(os.environ.get("REDIS_STORAGE_DB", 0))  # pyright: ignore [reportArgumentType]
 REDIS_YT_DLP_CACHE_DB: int = int(os.environ.get("REDIS_YT_DLP_CACHE_DB", 0))  # pyright: ignore [reportArgumentType]
+REDIS_GPU_ADMISSION_DB: int = int(os.environ.get("REDIS_GPU_ADMISSION_DB", 0))  # pyright: ignore [reportArgumentType]
+#: Номер базы данных для реестра скачиваемых сейчас видео
+REDIS_DOWNLOADS_DB: int = int(os.environ.get("REDIS_DOWNLOADS_DB", 0))  # pyright: ignore [reportArgumentType]
+#: Номер базы данных для недавно отправленных сообщений о состоянии
+REDIS_TELEGRAM_DB: int = int(os.environ.get("REDIS_TELEGRAM_DB", 0))  # pyright: ignore [reportArgumentType]
+#: Номер базы данных для хода обработки и сообщений о состоянии, которые его показывают
+REDIS_PROGRESS_DB: int = int(os.environ.get("REDIS_PROGRESS_DB", 0))  # pyright: ignore [reportArgumentType]
+#: Номер базы данных для версии каталога профилей обработки
+REDIS_PROFILES_DB: int = int(os.environ.get("REDIS_PROFILES_DB", 0))  # pyright: ignore [reportArgumentType]
+#: Номер базы данных для состояния распределённого рендеринга
+REDIS_RENDER_DB: int = int(os.environ.get("REDIS_RENDER_DB", 0))  # pyright: ignore [reportArgumentType]
 
 RABBITMQ_HOST: str = os.environ.get("RABBITMQ_HOST", "localhost")
 RABBITMQ_PORT: int = int(os.environ.get("RABBITMQ_PORT", 5672))
@@ -95,10 +109,14 @@ ORIGINAL_VIDEO_STORAGE = "original-video"
 THUMBNAILS_STORAGE = "thumbnails"
 PROCESSED_VIDEO_STORAGE = "processed-video"
 LECTURES_SUMMARY_STORAGE = "lectures-summary"
+PROCESSING_CHECKPOINTS_STORAGE = "processing-checkpoints"
+YT_DLP_INFO_STORAGE = "yt-dlp-info"
 
 VIDEO_DOWNLOAD_QUEUE = os.environ["VIDEO_DOWNLOAD_QUEUE"]
 VIDEO_PROCESS_QUEUE = os.environ["VIDEO_PROCESS_QUEUE"]
 VIDEO_UPLOAD_QUEUE = os.environ["VIDEO_UPLOAD_QUEUE"]
+LECTURES_SUMMARIZE_QUEUE = os.environ.get("LECTURES_SUMMARIZE_QUEUE", "lectures_summarize_queue")
+VIDEO_RENDER_QUEUE = os.environ.get("VIDEO_RENDER_QUEUE", "video_render_queue")
 
 # ---------- Настройка логики обработки ---------- #
 
@@ -164,12 +182,126 @@ UNSILENCE_DEFAULT_CPU_COUNT = min(max(1, os.cpu_count() - 1), NVENC_MAX_CONCURRE
 # Если менять в разумных пределах, то время работы почти не зависит от этого параметра
 MAX_DEEPFILTERNET_CHUNK_SIZE_BYTES = 1 * 2**30
 
+# ---------- Допуск к gpu ---------- #
+
+#: Имя узла, на котором стоит видеокарта. Воркеры в разных контейнерах на одной машине должны иметь одинаковое имя
+GPU_NODE_NAME = os.environ.get("GPU_NODE_NAME", socket.gethostname())
+GPU_ADMISSION_MAX_VRAM = 0.9 * TOTAL_VRAM
+GPU_ADMISSION_WHISPER_VRAM = 5 * 2**30  # large-v3 в float32 с запасом
+GPU_ADMISSION_DEEPFILTERNET_VRAM = 2 * MAX_DEEPFILTERNET_CHUNK_SIZE_BYTES
+GPU_ADMISSION_NVENC_SESSION_VRAM = 300 * 2**20
+#: Время жизни аренды, продлевается, пока задача жива. Нужно, чтобы упавший воркер не держал ресурсы вечно
+GPU_ADMISSION_LEASE_TTL = 60
+GPU_ADMISSION_POLL_INTERVAL = 1
+
+# ---------- Бюджет временного диска ---------- #
+
+TEMP_DISK_TOTAL = shutil.disk_usage(tempfile.gettempdir()).total
+#: Кеш результатов префиксов AudioPipeline. Лежит на временном диске, чтобы файлы переносились жёсткими ссылками
+AUDIO_PREFIX_CACHE_FOLDER = Path(
+    os.environ.get("AUDIO_PREFIX_CACHE_FOLDER", Path(tempfile.gettempdir()) / "audio_prefix_cache"),
+)
+AUDIO_PREFIX_CACHE_MAX_SIZE = int(os.environ.get("AUDIO_PREFIX_CACHE_MAX_SIZE", 0.1 * TEMP_DISK_TOTAL))
+#: Сколько байт временного диска могут занять все задачи узла вместе
+TEMP_DISK_BUDGET = int(os.environ.get("TEMP_DISK_BUDGET", 0.8 * TEMP_DISK_TOTAL - AUDIO_PREFIX_CACHE_MAX_SIZE))
+#: Имя узла, на котором лежит временный диск. Воркеры, пишущие на один диск, должны иметь одинаковое имя
+TEMP_DISK_NODE_NAME = os.environ.get("TEMP_DISK_NODE_NAME", GPU_NODE_NAME)
+TEMP_DISK_LEASE_TTL = 60
+TEMP_DISK_POLL_INTERVAL = 5
+#: Как часто замерять занятое задачей место для статистики
+TEMP_DISK_USAGE_POLL_INTERVAL = 2
+
+# Сколько раз повторять упавший этап обработки видео. Повтор продолжает с последнего завершённого этапа
+PROCESSING_STAGE_MAX_RETRIES = 2
+#: Задержка перед первым повтором упавшего этапа в секундах, с каждой попыткой удваивается
+PROCESSING_STAGE_RETRY_BACKOFF = 30
+
+# ---------- Распределённый рендеринг ---------- #
+
+#: Рендерить группы интервалов отдельными задачами на воркерах очереди VIDEO_RENDER_QUEUE
+DISTRIBUTED_RENDERING: bool = bool(int(os.environ.get("DISTRIBUTED_RENDERING", "0")))
+#: Короткие видео быстрее отрендерить на месте, чем раздавать по воркерам
+DISTRIBUTED_RENDERING_MIN_DURATION = 30 * 60
+#: Сколько часов живут подписанные ссылки, по которым воркеры читают исходники из S3
+DISTRIBUTED_RENDERING_URL_EXPIRY = 6
+#: Сколько ждать следующую готовую группу интервалов, в секундах. Дольше одна группа и не рендерится
+DISTRIBUTED_RENDERING_GROUP_TIMEOUT = 2 * 3600
+#: Сколько живёт в redis состояние распределённого рендеринга одного видео
+DISTRIBUTED_RENDERING_STATE_TTL = 24 * 3600
+
 VIDEO_DOWNLOAD_TIMEOUT = 1200  # 100 mbit/sec -> 15 GB
+#: Через сколько секунд запись о скачивании пропадает из реестра, если скачивающая задача умерла
+INFLIGHT_DOWNLOAD_TTL = 60
+#: Сколько хранятся присоединившиеся к скачиванию запросы. Их забирает скачивающая задача,
+#: а если она умерла, то они снова ставятся в очередь проверкой раз в 2 * INFLIGHT_DOWNLOAD_TTL
+INFLIGHT_DOWNLOAD_ATTACHED_TTL = 24 * 3600
 VIDEO_UPLOAD_TIMEOUT = 1200  # 100 mbit/sec -> 15 GB
 
+# ---------- Рассылка в telegram ---------- #
+
+#: Сообщений в секунду на весь процесс. Лимит telegram — около 30 на бота
+TELEGRAM_GLOBAL_RATE = 25
+#: Сообщений в секунду в один личный чат
+TELEGRAM_PRIVATE_CHAT_RATE = 1
+#: Сообщений в секунду в одну группу. Лимит telegram — 20 в минуту
+TELEGRAM_GROUP_CHAT_RATE = 20 / 60
+#: Сколько раз повторять отправку после TelegramRetryAfter
+TELEGRAM_SEND_RETRIES = 3
+#: Одинаковое сообщение о состоянии не отправляется в чат повторно в течение этого времени, в секундах
+TELEGRAM_STATUS_COALESCE_WINDOW = 10 * 60
+
+# ---------- Ход обработки ---------- #
+
+#: Как часто один шаг публикует свой прогресс, в секундах
+PROGRESS_PUBLISH_INTERVAL = 5
+#: Как часто редактируется сообщение о состоянии одной обработки, в секундах
+PROGRESS_STATUS_EDIT_INTERVAL = 15
+#: Сколько хранятся последний прогресс и список сообщений о состоянии, в секундах
+PROGRESS_TTL = 24 * 3600
+
+# ---------- Профили обработки ---------- #
+
+#: Как часто каталог профилей в памяти проверяет, не изменились ли профили, в секундах
+PROFILE_CATALOGUE_CHECK_INTERVAL = 30
+#: Запрос несуществующего профиля перечитывает каталог не чаще раза в столько секунд
+PROFILE_CATALOGUE_FORCE_RELOAD_INTERVAL = 5
+
+# ---------- Версия видео для telegram ---------- #
+
+#: Максимальный размер файла, который бот может отправить. У локального сервера bot api лимит 2000 MB
+TELEGRAM_UPLOAD_LIMIT = (2000 if TELEGRAM_LOCAL else 50) * 2**20
+#: Размер, под который подбирается битрейт версии для telegram, с запасом на контейнер и неточность битрейта
+TELEGRAM_RENDITION_MAX_SIZE = int(0.9 * TELEGRAM_UPLOAD_LIMIT)
+#: H.264 воспроизводится всеми клиентами telegram, в отличие от HEVC
+TELEGRAM_RENDITION_VIDEO_CODEC = "h264_nvenc" if USE_NVENC else "libx264"
+TELEGRAM_RENDITION_AUDIO_BITRATE = 96_000
+#: Лестница битрейтов: (максимальная высота кадра, битрейт видео). Выбирается первая ступень, которая влезает в лимит
+TELEGRAM_RENDITION_LADDER = (
+    (1080, 4_000_000),
+    (720, 2_000_000),
+    (540, 1_000_000),
+    (360, 500_000),
+    (240, 250_000),
+)
+
 # ---------- yt-dlp ---------- #
 
-YT_DLP_EXTRACT_INFO_CACHE_TTL = timedelta(minutes=5)
+#: Сколько хранится информация с подписанными ссылками на форматы. Ссылки быстро устаревают
+YT_DLP_MEDIA_CACHE_TTL = timedelta(minutes=30)
+#: Сколько хранятся метаданные (название, длительность, записи плейлиста) без ссылок на форматы
+YT_DLP_METADATA_CACHE_TTL = timedelta(hours=12)
+#: Сколько хранится информация о трансляциях, которые идут или ещё не начались. Их статус быстро меняется
+YT_DLP_LIVE_CACHE_TTL = timedelta(minutes=1)
+#: Сколько помнится, что ссылка не поддерживается или неправильная
+YT_DLP_NEGATIVE_CACHE_TTL = timedelta(hours=1)
+#: Сколько значений кеша yt-dlp хранится в памяти процесса, помимо redis
+YT_DLP_INFO_MEMORY_CACHE_SIZE = 256
+#: Сколько ссылок бот одновременно разбирает для предпросмотра. Остальные ждут, не занимая потоки скачивания
+YT_DLP_PREVIEW_WORKERS = 8
+#: Сколько записей плейлиста показывается в предпросмотре
+YT_DLP_PREVIEW_MAX_ENTRIES = 100
+#: Сколько лекций со страницы курса lectoriyfopf.ru одновременно извлекается с youtube
+LECTORIYFOPF_EXTRACT_WORKERS = 8
 
 # YT_DLP_HTTP_CHUNK_SIZE = 10485760  # 10 MB  # noqa: ERA001
 YT_DLP_HTTP_CHUNK_SIZE = None
@@ -179,10 +311,50 @@ YT_DLP_HTTP_CHUNK_SIZE = None
 # Хотя скорость в основном зависит от кэширования на стороне провайдера
 YT_DLP_YOUTUBE_FORMATS_DASHY = False
 
+#: Скачивать файлы без фрагментов через aria2c в несколько соединений, если он установлен
+YT_DLP_MULTI_CONNECTION = True
+#: Сколько соединений допускает сайт. Общий лимит на все процессы, см. utils.download_connections
+YT_DLP_HOST_CONNECTIONS = {
+    # youtube замедляет отдачу при большом числе соединений
+    "youtube.com": 4,
+    "youtu.be": 4,
+    "vk.com": 8,
+    "vkvideo.ru": 8,
+    "rutube.ru": 8,
+}
+YT_DLP_DEFAULT_HOST_CONNECTIONS = 4
+#: Меньшие куски aria2c не делит между соединениями
+YT_DLP_ARIA2C_MIN_SPLIT_SIZE = "8M"
+#: Время жизни аренды соединений с сайтом, продлевается, пока скачивание идёт
+DOWNLOAD_CONNECTIONS_LEASE_TTL = 60
+DOWNLOAD_CONNECTIONS_POLL_INTERVAL = 1
+
 # Лекции чётче 1080p не имеют смысла
 YT_DLP_VIDEO_MAX_HEIGHT = 1080
 YT_DLP_VIDEO_MAX_WIDTH = 1920 * 2  # формат 32x9 подходит
 
+#: Веса оценки видеоформатов, см. tools.yt_dlp_downloader.yt_dlp_format_select.score_video_format.
+#: Разрешение важнее всего, чтобы слайды оставались читаемыми
+YT_DLP_FORMAT_SCORE_WEIGHTS = {
+    "resolution": 4.0,
+    "bitrate_sufficiency": 1.0,
+    "size": 1.0,
+    "decode_cost": 1.0,
+    "hardware_decode": 1.0,
+}
+#: Сколько бит на пиксель кадра достаточно для лекций (слайды и говорящая голова). Больший битрейт не улучшает
+#: результат после перекодирования в FORCE_VIDEO_CODEC, а только дольше скачивается и декодируется
+YT_DLP_SUFFICIENT_BITS_PER_PIXEL = 0.05
+#: Относительная стоимость программного декодирования семейств кодеков, неизвестные стоят 1
+YT_DLP_CODEC_DECODE_COST = {
+    "h264": 0.2,
+    "hevc": 0.5,
+    "vp9": 0.6,
+    "av1": 1.0,
+}
+#: Кодеки, которые рендеринг декодирует на gpu (hwaccel cuda). Старые nvdec не умеют vp9 и av1
+YT_DLP_HARDWARE_DECODABLE_CODECS = ("h264", "hevc") if USE_NVENC else ()
+
 # ---------- Конспектирование ---------- #
 
 WHISPER_MODEL_SIZE = os.environ["WHISPER_MODEL_SIZE"]
@@ -194,6 +366,12 @@ OPENAI_MODEL = os.environ["OPENAI_MODEL"]
 OPENAI_API_KEY = os.environ["OPENAI_API_KEY"]
 OPENAI_BASE_URL = os.environ["OPENAI_BASE_URL"]
 OPENAI_PROXY_URL = os.environ.get("OPENAI_PROXY_URL")
+# Транскрипции длиннее этого отправляются в llm по частям (map-reduce)
+OPENAI_SINGLE_REQUEST_MAX_TOKENS = int(os.environ.get("OPENAI_SINGLE_REQUEST_MAX_TOKENS", 48000))
+OPENAI_CHUNK_MAX_TOKENS = int(os.environ.get("OPENAI_CHUNK_MAX_TOKENS", 16000))
+OPENAI_MAX_CONCURRENT_REQUESTS = int(os.environ.get("OPENAI_MAX_CONCURRENT_REQUESTS", 4))
+# Грубая оценка для русского текста, чтобы не тянуть токенизатор
+OPENAI_CHARS_PER_TOKEN = 2.5
 
 REQUIRED_LATEX_PACKAGES = (
     r"\usepackage{cmap}",
@@ -203,9 +381,32 @@ REQUIRED_LATEX_PACKAGES = (
     r"\usepackage{hyperref}",
 )
 PDFLATEX_EXECUTABLE = "pdflatex"
+#: Папка для прекомпилированных преамбул (.fmt) и готовых pdf
+LATEX_CACHE_FOLDER = Path(os.environ.get("LATEX_CACHE_FOLDER", BASE_DIR / "latex_cache"))
+LATEX_MAX_CONCURRENT_COMPILATIONS = int(os.environ.get("LATEX_MAX_CONCURRENT_COMPILATIONS", 2))
+LATEX_MAX_PASSES = 3
+LATEX_PDF_CACHE_MAX_FILES = int(os.environ.get("LATEX_PDF_CACHE_MAX_FILES", 256))
+LATEX_FORMAT_CACHE_MAX_FILES = int(os.environ.get("LATEX_FORMAT_CACHE_MAX_FILES", 32))
 
 PDF_UPLOAD_TIMEOUT = 60  # 100 mbit/sec -> 750 MB
 
+# ---------- Метрики ---------- #
+
+#: Порт, на котором процесс отдаёт /metrics для prometheus. 0 — не отдавать
+METRICS_PORT: int = int(os.environ.get("METRICS_PORT", 0))  # pyright: ignore [reportArgumentType]
+if METRICS_PORT != 0:
+    # Задачи celery выполняются в дочерних процессах, поэтому метрики собираются через файлы в этой папке.
+    # Переменную читает prometheus_client при импорте, поэтому она задаётся здесь
+    os.environ.setdefault(
+        "PROMETHEUS_MULTIPROC_DIR",
+        (Path(tempfile.gettempdir()) / f"antilector_metrics_{METRICS_PORT}").as_posix(),
+    )
+#: Папка для метрик дочерних процессов. None, если метрики не отдаются
+PROMETHEUS_MULTIPROC_DIR = Path(os.environ["PROMETHEUS_MULTIPROC_DIR"]) if METRICS_PORT != 0 else None
+if PROMETHEUS_MULTIPROC_DIR is not None:
+    # prometheus_client открывает файлы в ней, как только создаются метрики
+    PROMETHEUS_MULTIPROC_DIR.mkdir(parents=True, exist_ok=True)
+
 # ---------- Логирование ---------- #
 
 UNSILENCE_MIN_INTERVAL_LENGTH_FOR_LOGGING = 300
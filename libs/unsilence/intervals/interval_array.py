@@ -0,0 +1,263 @@
+import base64
+import struct
+from collections.abc import Iterable
+from typing import Self
+
+import numpy as np
+
+from .interval import Interval, SerializedInterval
+
+# Количество интервалов и первая граница (float64), за ними разности соседних границ
+# (float32 little-endian, начало и конец каждого интервала по очереди) и упакованные флаги тишины
+_HEADER = struct.Struct("<Id")
+#: Границы округляются до 2**-16 с (~15 мкс). Разности, кратные этому шагу и меньшие 256 с, точно
+#: представимы во float32, поэтому при восстановлении суммой разностей ошибка не накапливается
+_TIME_QUANTUM = 2**-16
+
+
+class IntervalArray:
+    """
+    Sequence of intervals stored as numpy arrays
+
+    A VAD pass over a long lecture yields tens of thousands of intervals, so all operations here are vectorised.
+    They give exactly the same result as the loops over lib.Intervals.Interval objects they replace
+    """
+
+    def __init__(self, starts: np.ndarray, ends: np.ndarray, silent: np.ndarray):
+        """
+        Initializes an IntervalArray
+
+        :param starts: Start times in seconds
+        :param ends: End times in seconds
+        :param silent: Whether each interval is silent
+        """
+        self.starts = np.asarray(starts, dtype=np.float64)
+        self.ends = np.asarray(ends, dtype=np.float64)
+        self.silent = np.asarray(silent, dtype=np.bool_)
+
+        if not (self.starts.shape == self.ends.shape == self.silent.shape) or self.starts.ndim != 1:
+            raise ValueError("starts, ends and silent must be one-dimensional arrays of the same length")
+
+    @classmethod
+    def empty(cls) -> Self:
+        return cls(np.empty(0), np.empty(0), np.empty(0, dtype=np.bool_))
+
+    @classmethod
+    def from_intervals(cls, intervals: Iterable[Interval]) -> Self:
+        """
+        Creates an IntervalArray from lib.Intervals.Interval objects
+        """
+        intervals = list(intervals)
+        return cls(
+            np.fromiter((interval.start for interval in intervals), dtype=np.float64, count=len(intervals)),
+            np.fromiter((interval.end for interval in intervals), dtype=np.float64, count=len(intervals)),
+            np.fromiter((bool(interval.is_silent) for interval in intervals), dtype=np.bool_, count=len(intervals)),
+        )
+
+    @classmethod
+    def from_serialized(cls, serialized_intervals: Iterable[SerializedInterval]) -> Self:
+        """
+        Creates an IntervalArray from serialized lib.Intervals.Interval objects
+        """
+        return cls.from_intervals(map(Interval.deserialize, serialized_intervals))
+
+    def to_intervals(self) -> list[Interval]:
+        """
+        Compatibility view for code working with lib.Intervals.Interval objects
+        """
+        return [
+            Interval(start, end, is_silent=is_silent)
+            for start, end, is_silent in zip(
+                self.starts.tolist(),
+                self.ends.tolist(),
+                self.silent.tolist(),
+                strict=True,
+            )
+        ]
+
+    @property
+    def durations(self) -> np.ndarray:
+        return self.ends - self.starts
+
+    def __len__(self) -> int:
+        """
+        Number of intervals
+        """
+        return len(self.starts)
+
+    def __getitem__(self, index: np.ndarray | slice) -> "IntervalArray":
+        """
+        Selects intervals by a mask, indices or slice
+        """
+        return IntervalArray(self.starts[index], self.ends[index], self.silent[index])
+
+    def __eq__(self, other: object) -> bool:
+        """
+        Intervals are equal if all starts, ends and silence flags are equal
+        """
+        if not isinstance(other, IntervalArray):
+            return NotImplemented
+
+        return (
+            np.array_equal(self.starts, other.starts)
+            and np.array_equal(self.ends, other.ends)
+            and np.array_equal(self.silent, other.silent)
+        )
+
+    __hash__ = None  # pyright: ignore [reportAssignmentType]
+
+    def copy(self) -> "IntervalArray":
+        return IntervalArray(self.starts.copy(), self.ends.copy(), self.silent.copy())
+
+    def combine(self, short_interval_threshold: float) -> "IntervalArray":
+        """
+        Combines multiple intervals in order to remove intervals smaller than a threshold
+
+        Short intervals and intervals of the same type are appended to the previous interval. The first interval
+        starts at 0 and takes the type of the first long interval (audible if there are none)
+
+        :param short_interval_threshold: Threshold for the shortest allowed interval
+        :return: New IntervalArray
+        """
+        if len(self) == 0:
+            return IntervalArray(np.zeros(1), np.zeros(1), np.zeros(1, dtype=np.bool_))
+
+        long_indices = np.flatnonzero(self.durations > short_interval_threshold)
+        if len(long_indices) == 0:
+            return IntervalArray(np.zeros(1), self.ends[-1:], np.zeros(1, dtype=np.bool_))
+
+        # Новый интервал начинается с длинного интервала, тип которого отличается от предыдущего длинного
+        long_silent = self.silent[long_indices]
+        group_starts = long_indices[1:][long_silent[1:] != long_silent[:-1]]
+
+        starts = np.concatenate(([0.0], self.starts[group_starts]))
+        ends = np.concatenate((self.ends[group_starts - 1], self.ends[-1:]))
+        silent = np.concatenate((long_silent[:1], self.silent[group_starts]))
+        return IntervalArray(starts, ends, silent)
+
+    def enlarge_audible(self, stretch_time: float) -> "IntervalArray":
+        """
+        Enlarges audible and shrinks silent intervals, except for the start of the first and the end of the last
+
+        :param stretch_time: Time the intervals should be enlarged/shrunken
+        :return: New IntervalArray
+        """
+        if len(self) == 0:
+            return self.copy()
+
+        if np.any(stretch_time >= self.durations):
+            raise ValueError("Stretch time to large, please choose smaller size")
+
+        stretch_time_parts = np.where(self.silent, -1, 1) * stretch_time / 2
+        starts = self.starts.copy()
+        ends = self.ends.copy()
+        starts[1:] -= stretch_time_parts[1:]
+        ends[:-1] += stretch_time_parts[:-1]
+        return IntervalArray(starts, ends, self.silent.copy())
+
+    def remove_breaks(self, silence_upper_threshold: float | None) -> "IntervalArray":
+        """
+        Removes silent intervals not shorter than silence_upper_threshold. None приравнивается к float("inf")
+
+        :return: New IntervalArray or self if nothing has to be removed
+        """
+        if silence_upper_threshold is None or silence_upper_threshold == float("inf"):
+            return self
+
+        return self[~(self.silent & (self.durations >= silence_upper_threshold))]
+
+    def or_merge(self, other: "IntervalArray") -> "IntervalArray":
+        """
+        Applies logical or to silence of 2 sorted sequences of intervals
+
+        Every pair of overlapping (or touching) intervals gives an interval of their intersection, which is silent
+        if any of them is silent. Both sequences must be sorted and must not overlap themselves
+        """
+        if len(self) == 0 or len(other) == 0:
+            return IntervalArray.empty()
+
+        # Интервалы other, закончившиеся не позже конца предыдущего интервала self, уже обработаны
+        first = np.searchsorted(other.ends, self.ends, side="right")
+        lo = np.concatenate(([0], first[:-1]))
+        # Обрабатываются интервалы other до первого, начавшегося после конца интервала self,
+        # и до первого, закончившегося после него, включительно
+        hi = np.minimum(np.searchsorted(other.starts, self.ends, side="right"), np.minimum(first + 1, len(other)))
+        counts = np.maximum(hi - lo, 0)
+
+        self_indices = np.repeat(np.arange(len(self)), counts)
+        offsets = np.repeat(np.cumsum(counts) - counts - lo, counts)
+        other_indices = np.arange(len(self_indices)) - offsets
+
+        return IntervalArray(
+            np.maximum(self.starts[self_indices], other.starts[other_indices]),
+            np.minimum(self.ends[self_indices], other.ends[other_indices]),
+            self.silent[self_indices] | other.silent[other_indices],
+        )
+
+    def collapse(self) -> "IntervalArray":
+        """
+        Combines consecutive intervals of the same type into one
+        """
+        if len(self) < 2:  # noqa: PLR2004
+            return self
+
+        group_starts = np.concatenate(([0], np.flatnonzero(self.silent[1:] != self.silent[:-1]) + 1))
+        group_ends = np.concatenate((group_starts[1:] - 1, [len(self) - 1]))
+        collapsed = IntervalArray(self.starts[group_starts], self.ends[group_ends], self.silent[group_starts])
+
+        # Последняя группа отбрасывается, если не продлевает предыдущую
+        if len(collapsed) > 1 and collapsed.ends[-1] <= collapsed.ends[-2]:
+            return collapsed[:-1]
+
+        return collapsed
+
+    def to_bytes(self) -> bytes:
+        """
+        Compact binary representation: a delta-encoded float32 per boundary and one bit per interval
+        instead of a dict. Boundaries are rounded to _TIME_QUANTUM
+        """
+        if len(self) == 0:
+            return _HEADER.pack(0, 0)
+
+        boundaries = np.round(np.column_stack((self.starts, self.ends)).ravel() / _TIME_QUANTUM)
+        return b"".join(
+            (
+                _HEADER.pack(len(self), boundaries[0] * _TIME_QUANTUM),
+                (np.diff(boundaries) * _TIME_QUANTUM).astype("<f4").tobytes(),
+                np.packbits(self.silent).tobytes(),
+            ),
+        )
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> Self:
+        """
+        Restores an IntervalArray from to_bytes
+        """
+        count, first_boundary = _HEADER.unpack_from(data)
+        if count == 0:
+            return cls.empty()
+
+        deltas = np.frombuffer(data, dtype="<f4", count=2 * count - 1, offset=_HEADER.size)
+        boundaries = first_boundary + np.concatenate(([0.0], np.cumsum(deltas, dtype=np.float64)))
+        silent = np.unpackbits(
+            np.frombuffer(data, dtype=np.uint8, offset=_HEADER.size + deltas.nbytes),
+            count=count,
+        ).astype(np.bool_)
+        return cls(boundaries[0::2], boundaries[1::2], silent)
+
+    def to_base64(self) -> str:
+        """
+        to_bytes as a string, so it can be stored in JSON
+        """
+        return base64.b64encode(self.to_bytes()).decode()
+
+    @classmethod
+    def from_base64(cls, data: str) -> Self:
+        return cls.from_bytes(base64.b64decode(data))
+
+    def __repr__(self):
+        """
+        String representation
+        :return: String representation
+        """
+        return f"<IntervalArray len={len(self)}>"
@@ -1,6 +1,7 @@
 import logging
 
 from .interval import Interval, SerializedInterval
+from .interval_array import IntervalArray
 
 logger = logging.getLogger(__name__)
 
@@ -69,67 +70,23 @@ class Intervals:
         :return: None
         """
         logger.debug("Optimazing intervals")
-        self.__combine_intervals(short_interval_threshold)
-        self.__enlarge_audible_intervals(stretch_time)
-        self.__remove_breaks(silence_upper_threshold)
+        # Python объекты интервалов создаются только один раз, в конце
+        intervals = IntervalArray.from_intervals(self._interval_list)
+        combined = intervals.combine(short_interval_threshold)
+        logger.debug("%s intervals combined in %s", len(intervals), len(combined))
 
-    def __combine_intervals(self, short_interval_threshold: float) -> None:
-        """
-        Combines multiple intervals in order to remove intervals smaller than a threshold
-        :param short_interval_threshold: Threshold for the shortest allowed interval
-        :return: None
-        """
-        intervals = []
-        current_interval = Interval(is_silent=None)
-
-        for interval in self._interval_list:
-            if interval.duration <= short_interval_threshold or current_interval.is_silent == interval.is_silent:
-                current_interval.end = interval.end
-
-            elif current_interval.is_silent is None:
-                current_interval.is_silent = interval.is_silent
-                current_interval.end = interval.end
-            else:
-                intervals.append(current_interval)
-                current_interval = interval.copy()
-
-        if current_interval.is_silent is None:
-            current_interval.is_silent = False
-
-        intervals.append(current_interval)
-
-        logger.debug("%s intervals combined in %s", len(self._interval_list), len(intervals))
-        self._interval_list = intervals
-
-    def __enlarge_audible_intervals(self, stretch_time: float) -> None:
-        """
-        Enlarges/Shrinks intervals based on if they are silent or audible
-        :param stretch_time: Time the intervals should be enlarged/shrunken
-        :return: None
-        """
         logger.debug("Enlarging intervals")
-        for i, interval in enumerate(self._interval_list):
-            interval.enlarge_audible_interval(
-                stretch_time,
-                is_start_interval=(i == 0),
-                is_end_interval=(i == len(self._interval_list) - 1),
-            )
-
-    def __remove_breaks(self, silence_upper_threshold: float | None) -> None:
+        enlarged = combined.enlarge_audible(stretch_time)
+        self._interval_list = enlarged.to_intervals()
+
         if silence_upper_threshold is None or silence_upper_threshold == float("inf"):
             logger.debug("Skip removing breaks")
             self._interval_list_without_breaks = self._interval_list
             return
 
-        intervals = []
-        for interval in self._interval_list:
-            if interval.is_silent and interval.duration >= silence_upper_threshold:
-                continue
-            intervals.append(interval)
-
-        logger.debug("Removed %s intervals with breaks", len(self._interval_list) - len(intervals))
-
-        self._interval_list_without_breaks = intervals
+        without_breaks = enlarged.remove_breaks(silence_upper_threshold)
+        logger.debug("Removed %s intervals with breaks", len(enlarged) - len(without_breaks))
+        self._interval_list_without_breaks = without_breaks.to_intervals()
 
     def remove_short_intervals_from_start(self, audible_speed: float = 1, silent_speed: float = 2) -> "Intervals":
         """
@@ -150,6 +107,29 @@ class Intervals:
 
         raise ValueError("No interval has a length over 0.5 seconds after speed changes! This is required.")
 
+    def to_array(self) -> tuple[IntervalArray, IntervalArray]:
+        """
+        Returns the intervals and the intervals without breaks as IntervalArray
+        """
+        return (
+            IntervalArray.from_intervals(self._interval_list),
+            IntervalArray.from_intervals(self._interval_list_without_breaks),
+        )
+
+    @staticmethod
+    def from_array(intervals: IntervalArray, intervals_without_breaks: IntervalArray | None = None) -> "Intervals":
+        """
+        Creates a new Instance from IntervalArray
+        :param intervals: intervals
+        :param intervals_without_breaks: intervals without breaks, optional
+        :return: New instance of Intervals
+        """
+        interval_list = intervals.to_intervals()
+        if intervals_without_breaks is None:
+            return Intervals(interval_list)
+
+        return Intervals(interval_list, intervals_without_breaks.to_intervals())
+
     def copy(self) -> "Intervals":
         """
         Creates a deep copy
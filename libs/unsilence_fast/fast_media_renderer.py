@@ -88,7 +88,16 @@ class FastMediaRenderer(MediaRenderer):
 
         return ram_bytes / raw_byte_rate
 
-    def _create_tasks(
+    @staticmethod
+    def get_input_file_info(input_file: Path) -> InputFileInfo:
+        video_bit_rate = get_media_bit_rate_safe(input_file, MediaStreamType.VIDEO)
+        return InputFileInfo(
+            video_bit_rate=video_bit_rate,
+            max_video_bit_rate=2 * video_bit_rate,
+            audio_bit_rate=get_media_bit_rate_safe(input_file, MediaStreamType.AUDIO),
+        )
+
+    def create_tasks(
         self,
         input_file: Path,
         intervals: Intervals,
@@ -188,12 +197,7 @@ class FastMediaRenderer(MediaRenderer):
         logger.debug("Sending tasks to queue")
         self._temp_path.mkdir(parents=True, exist_ok=True)
         file_list = []
-        video_bit_rate = get_media_bit_rate_safe(input_file, MediaStreamType.VIDEO)
-        input_file_info = InputFileInfo(
-            video_bit_rate=video_bit_rate,
-            max_video_bit_rate=2 * video_bit_rate,
-            audio_bit_rate=get_media_bit_rate_safe(input_file, MediaStreamType.AUDIO),
-        )
+        input_file_info = self.get_input_file_info(input_file)
         for i, task in enumerate(tasks):
             current_file_name = f"out_{i}{output_file.suffix}"
             current_path = self._temp_path / current_file_name
@@ -282,7 +286,7 @@ class FastMediaRenderer(MediaRenderer):
         if not input_file.exists():
             raise FileNotFoundError(f"Input file {input_file} does not exist!")
 
-        tasks = self._create_tasks(input_file, intervals, render_options)
+        tasks = self.create_tasks(input_file, intervals, render_options)
         logger.info("Rendering %s interval groups", len(tasks))
 
         completed_file_list = self._run_tasks(
@@ -300,6 +304,10 @@ class FastMediaRenderer(MediaRenderer):
             output_file=output_file,
         )
 
+        # Куски больше не нужны, а вместе они весят как всё видео
+        for file in completed_file_list:
+            file.unlink()
+
         shutil.move(final_output, output_file)
 
         return [task.serialize() for task in tasks]
@@ -75,15 +75,6 @@ class RenderIntervalThread(threading.Thread):
 
         completed = self._render_interval(task)
 
-        if completed and self._render_options.check_intervals:
-            probe_output = subprocess.run(  # noqa: S603
-                ["ffprobe", "-loglevel", "quiet", f"{task.output_file}"],  # noqa: S607
-                stdout=subprocess.DEVNULL,
-                stderr=subprocess.STDOUT,
-                check=False,
-            )
-            completed = probe_output.returncode == 0
-
         if self._on_task_completed is not None:
             self._on_task_completed(task, not completed)
 
@@ -112,46 +103,93 @@ class RenderIntervalThread(threading.Thread):
         """
         Renders an interval with the given task
         """
-        ffmpeg = task.interval_group_render_task.generate_command(
+        return render_interval_group(
+            interval_group_render_task=task.interval_group_render_task,
             input_file=self._input_file,
             output_file=task.output_file,
             input_file_info=task.input_file_info,
             render_options=self._render_options,
             separated_audio=self._separated_audio,
-        )
-
-        # Нет смысла логировать вообще все куски, поэтому оставляем только самые длинные
-        if task.interval_group_render_task.total_interval_duration >= self._min_interval_length_for_logging:
-            setup_progress_for_ffmpeg(
-                ffmpeg,
-                task.interval_group_render_task.total_interval_duration,
+            progress_description=(
                 f"[task {self.thread_id}] Rendering interval group"
                 f" №{task.task_id + 1}/{task.total_tasks} "
                 f"{{{task.interval_group_render_task.start_timestamp}, "
-                f"{task.interval_group_render_task.end_timestamp}}}",
+                f"{task.interval_group_render_task.end_timestamp}}}"
+            ),
+            min_interval_length_for_logging=self._min_interval_length_for_logging,
+        )
+
+
+def render_interval_group(  # noqa: PLR0913
+    interval_group_render_task: IntervalGroupRenderTask,
+    input_file: Path | str,
+    output_file: Path,
+    input_file_info: InputFileInfo,
+    render_options: RenderOptions,
+    separated_audio: Path | str | None,
+    progress_description: str,
+    min_interval_length_for_logging: float,
+) -> bool:
+    """
+    Рендерит одну группу интервалов в output_file
+
+    input_file и separated_audio могут быть ссылками, тогда ffmpeg сам читает только нужный кусок
+
+    Возвращает False, если кусок входного файла повреждён и его разрешено выкинуть
+    """
+    ffmpeg = interval_group_render_task.generate_command(
+        input_file=input_file,
+        output_file=output_file,
+        input_file_info=input_file_info,
+        render_options=render_options,
+        separated_audio=separated_audio,
+    )
+
+    # Нет смысла логировать вообще все куски, поэтому оставляем только самые длинные
+    if interval_group_render_task.total_interval_duration >= min_interval_length_for_logging:
+        setup_progress_for_ffmpeg(
+            ffmpeg,
+            interval_group_render_task.total_interval_duration,
+            progress_description,
+        )
+
+    logger.debug("Executing ffmpeg command: %s", shlex.join(ffmpeg.arguments))
+
+    try:
+        ffmpeg.execute()
+    except FFmpegError as exc:
+        if "Conversion failed!" in exc.message.splitlines()[-1]:
+            msg = (
+                f"Input file is corrupted between"
+                f" {interval_group_render_task.start_timestamp} and"
+                f" {interval_group_render_task.end_timestamp} (in seconds):"
+                f" {exc.message}"
             )
+            if render_options.drop_corrupted_intervals:
+                logger.warning(msg)
+                return False
+
+            raise OSError(msg) from exc
 
-        logger.debug("Executing ffmpeg command on thread %s: %s", self.thread_id, shlex.join(ffmpeg.arguments))
+        if "Error initializing complex filter" in exc.message:
+            raise ValueError(f"Invalid render options: {exc.message}: {shlex.join(exc.arguments)}") from exc
 
-        try:
-            ffmpeg.execute()
-        except FFmpegError as exc:
-            if "Conversion failed!" in exc.message.splitlines()[-1]:
-                msg = (
-                    f"Input file is corrupted between"
-                    f" {task.interval_group_render_task.start_timestamp} and"
-                    f" {task.interval_group_render_task.end_timestamp} (in seconds):"
-                    f" {exc.message}"
-                )
-                if self._render_options.drop_corrupted_intervals:
-                    logger.warning(msg)
-                    return False
+        raise ValueError(f"{exc.message}: {shlex.join(exc.arguments)}") from exc
 
-                raise OSError(msg) from exc
+    if render_options.check_intervals:
+        return check_rendered_file(output_file)
 
-            if "Error initializing complex filter" in exc.message:
-                raise ValueError(f"Invalid render options: {exc.message}: {shlex.join(exc.arguments)}") from exc
+    return True
 
-            raise ValueError(f"{exc.message}: {shlex.join(exc.arguments)}") from exc
 
-        return True
+def check_rendered_file(output_file: Path) -> bool:
+    """
+    Проверяет, что ffprobe может прочитать отрендеренный файл
+    """
+    probe_output = subprocess.run(  # noqa: S603
+        ["ffprobe", "-loglevel", "quiet", f"{output_file}"],  # noqa: S607
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.STDOUT,
+        check=False,
+    )
+    return probe_output.returncode == 0
@@ -209,11 +209,11 @@ class IntervalGroupRenderTask:
 
     def generate_command(
         self,
-        input_file: Path,
+        input_file: Path | str,
         output_file: Path,
         input_file_info: InputFileInfo,
         render_options: RenderOptions,
-        separated_audio: Path | None,
+        separated_audio: Path | str | None,
     ) -> FixedFFmpeg:
         if len(self.interval_render_tasks) == 0:
             raise ValueError("No tasks in group")
@@ -338,3 +338,18 @@ class IntervalGroupRenderTask:
 
     def serialize(self) -> list[SerializedInterval]:
         return [task.interval.serialize() for task in self.interval_render_tasks]
+
+    @classmethod
+    def deserialize(
+        cls,
+        serialized_obj: list[SerializedInterval],
+        render_options: RenderOptions,
+    ) -> "IntervalGroupRenderTask":
+        """
+        Восстанавливает группу из serialize. Фильтры пересчитываются по render_options
+        """
+        group = cls()
+        for serialized_interval in serialized_obj:
+            group.add(IntervalRenderTask.create(Interval.deserialize(serialized_interval), render_options))
+
+        return group
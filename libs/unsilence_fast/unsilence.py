@@ -1,3 +1,4 @@
+from collections.abc import Callable
 from pathlib import Path
 
 from libs.unsilence import Unsilence
@@ -22,6 +23,7 @@ class FastUnsilence(Unsilence):
         separated_audio: Path | None = None,
         on_render_progress_update: UpdateCallbackType | None = None,
         on_concat_progress_update: UpdateCallbackType | None = None,
+        media_renderer_factory: Callable[[Path], FastMediaRenderer] = FastMediaRenderer,
     ) -> list[list[SerializedInterval]]:
         """
         Renders the current intervals with options specified in the kwargs
@@ -30,6 +32,7 @@ class FastUnsilence(Unsilence):
         separated_audio: Audio stream from input in separated file (wav is the best).
             Providing can increase performance.
         temp_dir: The temp dir where temporary files can be saved
+        media_renderer_factory: Creates renderer from temp_dir. Allows to render interval groups somewhere else
 
         Remaining keyword arguments are passed to :func:`~unsilence.lib.render_media.MediaRenderer.MediaRenderer.render`
 
@@ -38,7 +41,7 @@ class FastUnsilence(Unsilence):
         if self._intervals is None:
             raise ValueError("Silence detection was not yet run and no intervals where given manually!")
 
-        renderer = FastMediaRenderer(temp_dir)
+        renderer = media_renderer_factory(temp_dir)
         return renderer.render(
             input_file=self._input_file,
             output_file=output_file,
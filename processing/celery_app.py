@@ -1,4 +1,9 @@
-from celery import Celery
+import os
+import time
+from typing import Any
+
+from celery import Celery, Task
+from celery.signals import before_task_publish, celeryd_init, task_postrun, task_prerun, worker_process_shutdown
 
 from configs import (
     RABBITMQ_DEFAULT_PASS,
@@ -6,6 +11,8 @@ from configs import (
     RABBITMQ_HOST,
     RABBITMQ_PORT,
 )
+from processing.routing import TASK_ROUTES, configure_worker
+from utils.metrics import TASK_DURATION, TASK_QUEUE_WAIT, mark_process_dead
 
 rabbitmq_url = f"{RABBITMQ_DEFAULT_USER}:{RABBITMQ_DEFAULT_PASS}@{RABBITMQ_HOST}:{RABBITMQ_PORT}"
 
@@ -17,5 +24,42 @@ app = Celery(
     backend=f"rpc://{rabbitmq_url}//",
     include=tasks,
 )
+app.conf.task_routes = TASK_ROUTES
 
 app.autodiscover_tasks(tasks, force=True)
+
+
+@celeryd_init.connect
+def _configure_worker(conf: Any, options: dict[str, Any], **_kwargs: Any) -> None:  # noqa: ANN401
+    configure_worker(conf, options)
+
+
+#: Время начала выполняющихся в этом процессе задач
+_task_starts: dict[str, float] = {}
+
+
+@before_task_publish.connect
+def _mark_enqueued_at(headers: dict[str, Any], **_kwargs: Any) -> None:  # noqa: ANN401
+    headers["enqueued_at"] = time.time()
+
+
+@task_prerun.connect
+def _observe_task_start(task_id: str, task: Task, **_kwargs: Any) -> None:  # noqa: ANN401
+    _task_starts[task_id] = time.perf_counter()
+
+    # Свои заголовки сообщения celery добавляет в request
+    enqueued_at = getattr(task.request, "enqueued_at", None)
+    if enqueued_at is not None:
+        TASK_QUEUE_WAIT.labels(task.name).observe(max(0.0, time.time() - enqueued_at))
+
+
+@task_postrun.connect
+def _observe_task_finish(task_id: str, task: Task, state: str | None = None, **_kwargs: Any) -> None:  # noqa: ANN401
+    start = _task_starts.pop(task_id, None)
+    if start is not None:
+        TASK_DURATION.labels(task.name, state or "UNKNOWN").observe(time.perf_counter() - start)
+
+
+@worker_process_shutdown.connect
+def _mark_process_dead(**_kwargs: Any) -> None:  # noqa: ANN401
+    mark_process_dead(os.getpid())
@@ -0,0 +1,59 @@
+"""
+Оценка того, сколько временного диска займёт этап обработки видео
+"""
+
+from configs import TELEGRAM_RENDITION_MAX_SIZE
+
+from .models import ProcessingStage, Video
+
+# pcm_s16le
+WAV_BYTES_PER_SAMPLE = 2
+DEFAULT_SAMPLE_RATE = 48000
+DEFAULT_CHANNELS = 2
+#: Запас на временные файлы самих действий (куски deepfilternet, списки для concat и т.д.)
+FOOTPRINT_MARGIN = 1.1
+
+
+def _estimate_wav_size(video: Video) -> float:
+    """
+    Размер wav, в который извлекается звук из видео
+    """
+    if video.meta is None:
+        # Без метаданных считаем, что звук занимает столько же, сколько видео
+        return video.file["size"]
+
+    audio_stream = next((stream for stream in video.meta["streams"] if stream["codec_type"] == "audio"), {})
+    sample_rate = int(audio_stream.get("sample_rate", DEFAULT_SAMPLE_RATE))
+    channels = int(audio_stream.get("channels", DEFAULT_CHANNELS))
+    duration = float(video.meta["format"].get("duration", 0))
+
+    return duration * sample_rate * channels * WAV_BYTES_PER_SAMPLE
+
+
+def estimate_temp_disk_usage(video: Video, stage: ProcessingStage, batch_size: int = 1) -> int:
+    """
+    Пик временного диска на этапе stage, если промежуточные файлы удаляются сразу после использования
+
+    batch_size — сколько обработанных видео из этого оригинала делаются в одной задаче по очереди
+    """
+    original_size = video.file["size"]
+    wav_size = _estimate_wav_size(video)
+
+    match stage:
+        case ProcessingStage.AUDIO:
+            # Оригинал удаляется после извлечения звука,
+            # дальше одновременно живут вход шага, выход шага и итоговый звук
+            footprint = max(original_size + wav_size, 3 * wav_size)
+            if batch_size > 1:
+                # Извлечённый звук живёт, пока его не обработают для всех видео пакета
+                footprint = max(original_size + wav_size, 4 * wav_size)
+        case ProcessingStage.DETECTION:
+            footprint = wav_size
+        case ProcessingStage.RENDER:
+            # Оригинал, звук, отрендеренные группы и склеенный результат, по размеру не больше оригинала,
+            # звук результата для nisqa и версия для telegram
+            footprint = 3 * original_size + 2 * wav_size + min(original_size, TELEGRAM_RENDITION_MAX_SIZE)
+        case _:
+            raise ValueError(f"Unknown processing stage {stage}")
+
+    return int(FOOTPRINT_MARGIN * footprint)
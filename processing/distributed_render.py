@@ -0,0 +1,555 @@
+"""
+Распределённый рендеринг: каждая группа интервалов рендерится отдельной задачей на воркерах VIDEO_RENDER_QUEUE
+
+Воркеры не скачивают исходники целиком. Если у видео есть индекс байтовых диапазонов,
+то скачиваются только куски, нужные для группы. Иначе ffmpeg читает файл по подписанной ссылке через HTTP Range.
+Отрендеренные куски загружаются в хранилище промежуточных результатов, а склеивает их уже координатор
+
+Координатор не ждёт группы, занимая воркер. Он отправляет группы и завершает задачу,
+а каждая группа по готовности отмечается в redis. Последняя готовая группа снова ставит в очередь этап рендеринга,
+и тогда координатор склеивает куски. У celery есть chord, но его не поддерживает rpc backend
+"""
+
+import logging
+import tempfile
+import uuid
+from collections.abc import Iterable
+from dataclasses import asdict
+from pathlib import Path
+from typing import Any
+
+import lazy_object_proxy
+import orjson
+import pydantic
+from redis import Redis
+from sqlalchemy_file import File
+from sqlalchemy_file.storage import StorageManager
+
+from configs import (
+    DISTRIBUTED_RENDERING_GROUP_TIMEOUT,
+    DISTRIBUTED_RENDERING_STATE_TTL,
+    DISTRIBUTED_RENDERING_URL_EXPIRY,
+    GPU_ADMISSION_NVENC_SESSION_VRAM,
+    PROCESSING_CHECKPOINTS_STORAGE,
+    REDIS_HOST,
+    REDIS_PASSWORD,
+    REDIS_PORT,
+    REDIS_RENDER_DB,
+    REDIS_USER,
+    UNSILENCE_MIN_INTERVAL_LENGTH_FOR_LOGGING,
+)
+from libs.unsilence._typing import UpdateCallbackType
+from libs.unsilence.intervals.interval import SerializedInterval
+from libs.unsilence.render_media.options import RenderOptions
+from libs.unsilence_fast.fast_media_renderer import FastMediaRenderer
+from libs.unsilence_fast.fast_render_interval_thread import render_interval_group
+from libs.unsilence_fast.fast_render_task import InputFileInfo, IntervalGroupRenderTask
+from utils.gpu_admission import gpu_admission_controller
+from utils.video.byte_range_index import ByteRange, ByteRangeIndex
+
+from .misc import download_byte_ranges_from_s3, download_stored_file_from_s3, get_presigned_url_from_s3
+
+logger = logging.getLogger(__name__)
+
+# Отмечает отрендеренную группу
+# KEYS[1] - состояние рендеринга
+# ARGV - render_id, номер группы, путь до куска в хранилище
+# Возвращает -1, если кусок не нужен и его надо удалить, продолжение, если готовы все группы, иначе 0
+_COMPLETE_GROUP_SCRIPT = """
+if redis.call('HGET', KEYS[1], 'id') ~= ARGV[1] or redis.call('HEXISTS', KEYS[1], 'failed') == 1 then
+    return -1
+end
+local field = 'segment:' .. ARGV[2]
+if redis.call('HSETNX', KEYS[1], field, ARGV[3]) == 0 then
+    -- Повторно доставленная группа загрузила свой кусок
+    if redis.call('HGET', KEYS[1], field) ~= ARGV[3] then
+        return -1
+    end
+    return 0
+end
+if redis.call('HINCRBY', KEYS[1], 'done', 1) == tonumber(redis.call('HGET', KEYS[1], 'total')) then
+    return redis.call('HGET', KEYS[1], 'continuation') or 0
+end
+return 0
+"""
+
+# Отменяет незавершённый рендеринг и забирает куски, которые уже успели загрузить
+# ARGV - render_id
+# Возвращает продолжение (пустая строка, если его ещё нет) и пути до кусков или пустой список, если отменять нечего
+_FAIL_SCRIPT = """
+if redis.call('HGET', KEYS[1], 'id') ~= ARGV[1] or redis.call('HEXISTS', KEYS[1], 'failed') == 1 then
+    return {}
+end
+if redis.call('HGET', KEYS[1], 'done') == redis.call('HGET', KEYS[1], 'total') then
+    return {}
+end
+redis.call('HSET', KEYS[1], 'failed', 1)
+local result = {redis.call('HGET', KEYS[1], 'continuation') or ''}
+local fields = redis.call('HGETALL', KEYS[1])
+for i = 1, #fields, 2 do
+    if string.sub(fields[i], 1, 8) == 'segment:' then
+        table.insert(result, fields[i + 1])
+        redis.call('HDEL', KEYS[1], fields[i])
+    end
+end
+return result
+"""
+
+# Сохраняет, какую задачу поставить в очередь, когда рендеринг закончится
+# ARGV - продолжение
+# Возвращает 1, если рендеринг уже закончился и задачу нужно поставить сразу
+_SET_CONTINUATION_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return 1
+end
+redis.call('HSET', KEYS[1], 'continuation', ARGV[1])
+if redis.call('HEXISTS', KEYS[1], 'failed') == 1 then
+    return 1
+end
+if redis.call('HGET', KEYS[1], 'done') == redis.call('HGET', KEYS[1], 'total') then
+    return 1
+end
+return 0
+"""
+
+# ARGV - render_id
+_CLEAR_SCRIPT = """
+if redis.call('HGET', KEYS[1], 'id') == ARGV[1] then
+    redis.call('DEL', KEYS[1])
+end
+"""
+
+_SEGMENT_PREFIX = "segment:"
+
+
+class DistributedRenderPendingError(Exception):
+    """
+    Группы интервалов рендерятся на других воркерах. Этап продолжит задача, поставленная после последней группы
+    """
+
+    def __init__(self, render_key: str):  # noqa: D107
+        super().__init__(f"Interval groups of {render_key} are rendering on render workers")
+        self.render_key = render_key
+
+
+class DistributedRenderState(pydantic.BaseModel):
+    render_id: str
+    total: int
+    done: int
+    failed: bool
+    task_ids: list[str]
+    #: Путь до куска в хранилище по номеру группы. Пустая строка, если кусок повреждён и выкинут
+    segments: dict[int, str]
+
+    @property
+    def complete(self) -> bool:
+        return not self.failed and self.done == self.total
+
+
+class DistributedRenderRegistry:
+    """
+    Состояние распределённого рендеринга в redis: какие группы готовы и что поставить в очередь после них
+    """
+
+    def __init__(self, redis: Redis, ttl: int = DISTRIBUTED_RENDERING_STATE_TTL):  # noqa: D107
+        self.redis = redis
+        self.ttl = ttl
+
+        self._complete_group_script = redis.register_script(_COMPLETE_GROUP_SCRIPT)
+        self._fail_script = redis.register_script(_FAIL_SCRIPT)
+        self._set_continuation_script = redis.register_script(_SET_CONTINUATION_SCRIPT)
+        self._clear_script = redis.register_script(_CLEAR_SCRIPT)
+
+    @staticmethod
+    def _get_key(render_key: str) -> str:
+        return f"distributed_render:{render_key}"
+
+    def start(self, render_key: str, task_ids: list[str]) -> str:
+        """
+        Заводит новое состояние вместо старого и возвращает его render_id.
+        По render_id отличаются отметки групп из старых отправок
+        """
+        render_id = uuid.uuid4().hex
+        key = self._get_key(render_key)
+        pipeline = self.redis.pipeline()
+        pipeline.delete(key)
+        pipeline.hset(
+            key,
+            mapping={"id": render_id, "total": len(task_ids), "done": 0, "tasks": orjson.dumps(task_ids)},
+        )
+        pipeline.expire(key, self.ttl)
+        pipeline.execute()
+        return render_id
+
+    def get(self, render_key: str) -> DistributedRenderState | None:
+        fields = {
+            field.decode(): value.decode() for field, value in self.redis.hgetall(self._get_key(render_key)).items()
+        }
+        if "id" not in fields:
+            return None
+
+        return DistributedRenderState(
+            render_id=fields["id"],
+            total=int(fields["total"]),
+            done=int(fields["done"]),
+            failed="failed" in fields,
+            task_ids=orjson.loads(fields["tasks"]),
+            segments={
+                int(field.removeprefix(_SEGMENT_PREFIX)): value
+                for field, value in fields.items()
+                if field.startswith(_SEGMENT_PREFIX)
+            },
+        )
+
+    def complete_group(self, render_key: str, render_id: str, index: int, storage_path: str) -> tuple[bool, str | None]:
+        """
+        Возвращает, нужен ли ещё кусок, и продолжение, если это была последняя группа
+        """
+        result = self._complete_group_script(keys=[self._get_key(render_key)], args=[render_id, index, storage_path])
+        if result == -1:
+            return False, None
+
+        return True, result.decode() if isinstance(result, bytes) else None
+
+    def fail(self, render_key: str, render_id: str) -> tuple[str | None, list[str]] | None:
+        """
+        Отменяет рендеринг. Возвращает продолжение и пути до загруженных кусков или None, если отменять нечего
+        """
+        result = self._fail_script(keys=[self._get_key(render_key)], args=[render_id])
+        if len(result) == 0:
+            return None
+
+        continuation, *segments = (value.decode() for value in result)
+        return continuation or None, [segment for segment in segments if segment != ""]
+
+    def set_continuation(self, render_key: str, continuation: str) -> bool:
+        """
+        Возвращает True, если рендеринг уже закончился и продолжение нужно выполнить сразу
+        """
+        return bool(self._set_continuation_script(keys=[self._get_key(render_key)], args=[continuation]))
+
+    def clear(self, render_key: str, render_id: str) -> None:
+        self._clear_script(keys=[self._get_key(render_key)], args=[render_id])
+
+
+distributed_render_registry: DistributedRenderRegistry = lazy_object_proxy.Proxy(
+    lambda: DistributedRenderRegistry(
+        Redis(
+            host=REDIS_HOST,
+            port=REDIS_PORT,
+            username=REDIS_USER,
+            password=REDIS_PASSWORD,
+            db=REDIS_RENDER_DB,
+        ),
+    ),
+)
+
+
+def _delete_segments(storage_paths: Iterable[str]) -> None:
+    for storage_path in storage_paths:
+        if storage_path == "":
+            continue
+
+        try:
+            StorageManager.delete_file(storage_path)
+        except Exception as exc:  # noqa: BLE001
+            logger.warning("Failed to delete rendered segment %s: %s", storage_path, exc)
+
+
+def _continue_stage(continuation: str) -> None:
+    from .tasks import process_video_batch_stage_task
+
+    process_video_batch_stage_task.apply_async(args=orjson.loads(continuation))
+
+
+def set_render_continuation(render_key: str, process_video_batch_stage_args: list[Any]) -> None:
+    """
+    Запоминает аргументы process_video_batch_stage_task, с которыми продолжить этап после рендеринга групп.
+    Если группы уже готовы, то задача ставится в очередь сразу
+    """
+    continuation = orjson.dumps(process_video_batch_stage_args).decode()
+    if distributed_render_registry.set_continuation(render_key, continuation):
+        _continue_stage(continuation)
+
+
+def on_interval_group_rendered(storage_path: str | None, render_key: str, render_id: str, index: int) -> None:
+    """
+    Отмечает готовую группу. После последней группы ставит в очередь продолжение этапа
+    """
+    needed, continuation = distributed_render_registry.complete_group(render_key, render_id, index, storage_path or "")
+    if not needed:
+        logger.info("Distributed render %s was cancelled, deleting segment of interval group %s", render_key, index)
+        _delete_segments([storage_path or ""])
+        return
+
+    if continuation is not None:
+        logger.info("All interval groups of %s are rendered", render_key)
+        _continue_stage(continuation)
+
+
+def cancel_distributed_render(render_key: str, render_id: str, reason: str) -> None:
+    """
+    Отменяет рендеринг: удаляет готовые куски, снимает из очереди оставшиеся группы и продолжает этап,
+    который увидит отмену и упадёт. Куски уже запущенных групп удалятся, когда они закончатся
+    """
+    state = distributed_render_registry.get(render_key)
+    cancelled = distributed_render_registry.fail(render_key, render_id)
+    if cancelled is None:
+        return
+
+    logger.warning("Distributed render %s cancelled: %s", render_key, reason)
+    continuation, segments = cancelled
+    if state is not None:
+        from .celery_app import app
+
+        app.control.revoke(state.task_ids)
+    _delete_segments(segments)
+    if continuation is not None:
+        _continue_stage(continuation)
+
+
+def check_distributed_render(render_key: str, render_id: str, last_done: int) -> None:
+    """
+    Отменяет рендеринг, если за DISTRIBUTED_RENDERING_GROUP_TIMEOUT не стало готово ни одной группы.
+    Так не зависают видео, группы которых отозваны или потерялись
+    """
+    state = distributed_render_registry.get(render_key)
+    if state is None or state.render_id != render_id or state.failed or state.complete:
+        return
+
+    if state.done > last_done:
+        _schedule_render_check(render_key, render_id, state.done)
+        return
+
+    cancel_distributed_render(render_key, render_id, "no interval group was rendered in time")
+
+
+def _schedule_render_check(render_key: str, render_id: str, last_done: int) -> None:
+    from .tasks import check_distributed_render_task
+
+    check_distributed_render_task.apply_async(
+        (render_key, render_id, last_done),
+        countdown=DISTRIBUTED_RENDERING_GROUP_TIMEOUT,
+    )
+
+
+class RemoteSource(pydantic.BaseModel):
+    """
+    Исходный файл в хранилище, который читает воркер рендеринга
+    """
+
+    storage_path: str
+    filename: str
+    file_size: int
+    url: str
+    #: Если заданы, то скачиваются только эти куски, иначе ffmpeg читает файл по ссылке
+    byte_ranges: list[ByteRange] | None = None
+
+    @classmethod
+    def from_file(cls, file: File, byte_ranges: list[ByteRange] | None = None) -> "RemoteSource":
+        return cls(
+            storage_path=file["path"],
+            filename=file["filename"],
+            file_size=file["size"],
+            url=get_presigned_url_from_s3(file, DISTRIBUTED_RENDERING_URL_EXPIRY),
+            byte_ranges=byte_ranges,
+        )
+
+    def open(self, temp_dir: Path) -> Path | str:
+        if self.byte_ranges is None:
+            return self.url
+
+        path = temp_dir / f"source{Path(self.filename).suffix}"
+        download_byte_ranges_from_s3(self.storage_path, self.byte_ranges, self.file_size, path)
+        return path
+
+
+def render_interval_group_segment(  # noqa: PLR0913
+    input_source: dict[str, Any],
+    separated_audio_source: dict[str, Any] | None,
+    serialized_group: list[SerializedInterval],
+    render_options: dict[str, Any],
+    input_file_info: dict[str, int],
+    suffix: str,
+) -> str | None:
+    """
+    Рендерит одну группу интервалов и загружает результат в хранилище
+
+    Возвращает путь до куска в хранилище или None, если кусок исходника повреждён и его разрешено выкинуть
+    """
+    options = RenderOptions.model_validate(render_options)
+    interval_group_render_task = IntervalGroupRenderTask.deserialize(serialized_group, options)
+
+    with tempfile.TemporaryDirectory() as tempdir:
+        temp_dir = Path(tempdir)
+        output_file = temp_dir / f"segment{suffix}"
+        input_file = RemoteSource.model_validate(input_source).open(temp_dir)
+        separated_audio = (
+            RemoteSource.model_validate(separated_audio_source).open(temp_dir)
+            if separated_audio_source is not None
+            else None
+        )
+
+        nvenc_sessions = 1 if options.use_nvenc else 0
+        with gpu_admission_controller.acquire(
+            nvenc_sessions=nvenc_sessions,
+            vram=nvenc_sessions * GPU_ADMISSION_NVENC_SESSION_VRAM,
+        ):
+            completed = render_interval_group(
+                interval_group_render_task=interval_group_render_task,
+                input_file=input_file,
+                output_file=output_file,
+                input_file_info=InputFileInfo(**input_file_info),
+                render_options=options,
+                separated_audio=separated_audio,
+                progress_description=(
+                    f"Rendering interval group {{{interval_group_render_task.start_timestamp}, "
+                    f"{interval_group_render_task.end_timestamp}}}"
+                ),
+                min_interval_length_for_logging=UNSILENCE_MIN_INTERVAL_LENGTH_FOR_LOGGING,
+            )
+
+        if not completed:
+            return None
+
+        file = File(content_path=output_file.as_posix())
+        file.save_to_storage(PROCESSING_CHECKPOINTS_STORAGE)
+
+    return file["path"]
+
+
+class DistributedMediaRenderer(FastMediaRenderer):
+    """
+    Группирует интервалы и склеивает результат как FastMediaRenderer, но рендерит группы на других воркерах
+
+    Локальный input_file нужен только для ffprobe, воркеры читают исходники из хранилища сами
+    """
+
+    def __init__(  # noqa: D107
+        self,
+        temp_path: Path,
+        render_key: str,
+        input_file: File,
+        byte_range_index: ByteRangeIndex | None,
+        separated_audio: File | None,
+    ):
+        super().__init__(temp_path)
+        #: Под этим ключом в redis хранится состояние рендеринга, у разных видео он должен отличаться
+        self.render_key = render_key
+        self.input_file = input_file
+        self.byte_range_index = byte_range_index
+        self.separated_audio = separated_audio
+
+    def _get_input_source(self, task: IntervalGroupRenderTask) -> dict[str, Any]:
+        byte_ranges = (
+            self.byte_range_index.get_byte_ranges([(task.start_timestamp, task.end_timestamp)])
+            if self.byte_range_index is not None
+            else None
+        )
+        return RemoteSource.from_file(self.input_file, byte_ranges).model_dump()
+
+    def _dispatch(
+        self,
+        tasks: list[IntervalGroupRenderTask],
+        input_file: Path,
+        output_file: Path,
+        render_options: RenderOptions,
+        separated_audio: Path | None,
+    ) -> None:
+        from .tasks import on_interval_group_failed_task, on_interval_group_rendered_task, render_interval_group_task
+
+        input_file_info = asdict(self.get_input_file_info(input_file))
+        serialized_render_options = render_options.model_dump(mode="json")
+        # wav перематывается арифметически, поэтому звук читается по ссылке без индекса
+        separated_audio_source = (
+            RemoteSource.from_file(self.separated_audio).model_dump()
+            if separated_audio is not None and self.separated_audio is not None
+            else None
+        )
+        task_ids = [uuid.uuid4().hex for _ in tasks]
+        # Состояние заводится до отправки, иначе быстрая группа может закончиться раньше
+        render_id = distributed_render_registry.start(self.render_key, task_ids)
+
+        logger.info("Dispatching %s interval groups of %s to render workers", len(tasks), self.render_key)
+        for index, (task, task_id) in enumerate(zip(tasks, task_ids, strict=True)):
+            render_interval_group_task.apply_async(
+                kwargs={
+                    "input_source": self._get_input_source(task),
+                    "separated_audio_source": separated_audio_source,
+                    "serialized_group": task.serialize(),
+                    "render_options": serialized_render_options,
+                    "input_file_info": input_file_info,
+                    "suffix": output_file.suffix,
+                },
+                task_id=task_id,
+                time_limit=DISTRIBUTED_RENDERING_GROUP_TIMEOUT,
+                link=on_interval_group_rendered_task.s(render_key=self.render_key, render_id=render_id, index=index),
+                link_error=on_interval_group_failed_task.s(render_key=self.render_key, render_id=render_id),
+            )
+        _schedule_render_check(self.render_key, render_id, 0)
+
+    def _download_segments(
+        self,
+        tasks: list[IntervalGroupRenderTask],
+        state: DistributedRenderState,
+        output_file: Path,
+        on_render_progress_update: UpdateCallbackType | None,
+    ) -> list[Path]:
+        self._temp_path.mkdir(parents=True, exist_ok=True)
+        tasks_duration = sum(task.total_interval_duration for task in tasks)
+        rendered_duration = 0
+        file_list = []
+        for i, task in enumerate(tasks):
+            storage_path = state.segments[i]
+            if storage_path == "":
+                logger.warning("Interval group %s was dropped as corrupted", i)
+                continue
+
+            current_path = self._temp_path / f"out_{i}{output_file.suffix}"
+            download_stored_file_from_s3(storage_path, current_path)
+            file_list.append(current_path)
+
+            rendered_duration += task.total_interval_duration
+            if on_render_progress_update is not None:
+                on_render_progress_update(rendered_duration, tasks_duration)
+
+        return file_list
+
+    def _run_tasks(  # noqa: PLR0913
+        self,
+        tasks: list[IntervalGroupRenderTask],
+        input_file: Path,
+        output_file: Path,
+        render_options: RenderOptions,
+        separated_audio: Path | None,
+        on_render_progress_update: UpdateCallbackType | None = None,
+    ) -> list[Path]:
+        """
+        При первом вызове отправляет группы воркерам и выбрасывает DistributedRenderPendingError.
+        Когда группы готовы, этап запускается снова, и тогда куски скачиваются по порядку
+        """
+        state = distributed_render_registry.get(self.render_key)
+        if state is None:
+            self._dispatch(tasks, input_file, output_file, render_options, separated_audio)
+            raise DistributedRenderPendingError(self.render_key)
+
+        if state.failed:
+            # Куски удалены при отмене, следующая попытка этапа отправит группы заново
+            distributed_render_registry.clear(self.render_key, state.render_id)
+            raise RuntimeError(f"Distributed render of {self.render_key} failed")
+
+        if not state.complete:
+            raise DistributedRenderPendingError(self.render_key)
+
+        if state.total != len(tasks):
+            _delete_segments(state.segments.values())
+            distributed_render_registry.clear(self.render_key, state.render_id)
+            raise RuntimeError(
+                f"Distributed render of {self.render_key} has {state.total} interval groups instead of {len(tasks)}",
+            )
+
+        # Если скачать не удалось, то куски остаются для следующей попытки этапа
+        file_list = self._download_segments(tasks, state, output_file, on_render_progress_update)
+        _delete_segments(state.segments.values())
+        distributed_render_registry.clear(self.render_key, state.render_id)
+        return file_list
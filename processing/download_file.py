@@ -7,6 +7,7 @@ from typing import TYPE_CHECKING, ParamSpec, TypeVar
 from aiogram import Bot
 from aiogram.enums import ParseMode
 from sqlalchemy import delete, select, update
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.orm import selectinload
 from sqlalchemy_file import File
 
@@ -14,7 +15,8 @@ from configs import LOG_EACH_VIDEO_DOWNLOAD, VIDEO_DOWNLOAD_TIMEOUT
 from djgram.db.base import get_autocommit_session
 from djgram.db.utils import get_or_create
 from djgram.utils.download import download_file
-from tools.yt_dlp_downloader.misc import convert_entries_generator, yt_dlp_get_html_link, yt_dlp_jsonify
+from tools.yt_dlp_downloader.info_archive import YT_DLP_INFO_ARCHIVE_FILENAME, compress_yt_dlp_info, slim_yt_dlp_info
+from tools.yt_dlp_downloader.misc import convert_entries_generator, yt_dlp_get_html_link
 from tools.yt_dlp_downloader.yt_dlp_download_videos import (
     YtDlpContentType,
     YtDlpInfoDict,
@@ -22,12 +24,16 @@ from tools.yt_dlp_downloader.yt_dlp_download_videos import (
     get_url,
 )
 from utils.get_bot import get_tg_bot
+from utils.telegram_broadcast import broadcast_scheduler
 from utils.thumbnail import get_best_thumbnail
+from utils.video.byte_range_index import build_byte_range_index_safe
 from utils.video.measure import ffprobe_extract_meta
-from utils.yt_dlp_cached import extract_info_async_cached
+from utils.yt_dlp_cached import extract_metadata_async_cached
 
+from .inflight_downloads import AttachedRequest, inflight_download_registry
 from .misc import execute_file_update_statement
 from .models import Playlist, Video, Waiter
+from .models.download import playlist_video_table
 from .schema import FILE_TYPE, VideoOrPlaylistForProcessing
 
 if TYPE_CHECKING:
@@ -39,9 +45,16 @@ P = ParamSpec("P")
 
 DOWNLOAD_ATTEMPTS = 3
 
+#: Скачано ли видео в этой задаче, само видео и запросы, присоединившиеся к скачиванию через реестр
+DownloadedVideo = tuple[bool, Video, list[VideoOrPlaylistForProcessing]]
+
 logger = logging.getLogger(__name__)
 
 
+def create_yt_dlp_info_archive(yt_dlp_info: YtDlpInfoDict) -> File:
+    return File(content=compress_yt_dlp_info(yt_dlp_info), filename=YT_DLP_INFO_ARCHIVE_FILENAME)
+
+
 async def delete_downloaded_video(db_video: Video) -> None:
     async with get_autocommit_session() as db_session:
         logger.debug("Deleting not downloaded video %s", db_video.id)
@@ -91,21 +104,102 @@ async def _download_video(db_video: Video, yt_dlp_info: YtDlpInfoDict) -> Video
         else:
             thumbnail_file = None
 
+        # После скачивания информация полнее, чем при создании видео
+        yt_dlp_info_archive = create_yt_dlp_info_archive(download_data.info)
+        yt_dlp_info_archive.save_to_storage(Video.yt_dlp_info_archive.type.upload_storage)
+
         meta = ffprobe_extract_meta(video_file)
+        byte_range_index = build_byte_range_index_safe(video_file)
         # noinspection PyTypeChecker
         stmt = (
             update(Video)
             .where(Video.id == db_video.id)
-            .values(file=file, yt_dlp_info=download_data.info, meta=meta, thumbnail=thumbnail_file)
+            .values(
+                file=file,
+                yt_dlp_info=slim_yt_dlp_info(download_data.info),
+                yt_dlp_info_archive=yt_dlp_info_archive,
+                meta=meta,
+                byte_range_index=byte_range_index.model_dump() if byte_range_index is not None else None,
+                thumbnail=thumbnail_file,
+            )
             .returning(Video)
         )
-        return await execute_file_update_statement(file, stmt)
+        return await execute_file_update_statement(file, stmt, yt_dlp_info_archive, thumbnail_file)
+
+
+async def _notify_attached_download_failed(
+    attached_requests: list[AttachedRequest],
+    yt_dlp_info: YtDlpInfoDict,
+) -> None:
+    if len(attached_requests) == 0:
+        return
+
+    async with get_tg_bot() as bot:
+        await broadcast_scheduler.broadcast(
+            bot.send_message,
+            chat_ids=[attached.request.telegram_chat_id for attached in attached_requests],
+            text=f"Ошибка скачивания видео {yt_dlp_get_html_link(yt_dlp_info)}",
+            per_chat_kwargs=[
+                {"reply_to_message_id": attached.request.reply_to_message_id} for attached in attached_requests
+            ],
+            parse_mode=ParseMode.HTML,
+            disable_web_page_preview=True,
+        )
+
+
+async def _add_attached_playlists(db_video: Video, attached_requests: list[AttachedRequest]) -> None:
+    playlist_ids = {attached.playlist_id for attached in attached_requests if attached.playlist_id is not None}
+    if len(playlist_ids) == 0:
+        return
+
+    async with get_autocommit_session() as db_session:
+        await db_session.execute(
+            insert(playlist_video_table)
+            .values([{"playlist_id": playlist_id, "video_id": db_video.id} for playlist_id in playlist_ids])
+            .on_conflict_do_nothing(),
+        )
 
 
 async def _create_video(
     yt_dlp_info: YtDlpInfoDict,
     video_or_playlist_for_processing: VideoOrPlaylistForProcessing,
     playlist: Playlist | None,
+) -> DownloadedVideo | None:
+    """
+    Если видео уже скачивается в другой задаче, то запрос присоединяется к ней и возвращается None.
+    Запросы, присоединившиеся к этой задаче, возвращаются вместе с видео
+    """
+    video_id = yt_dlp_info["id"]
+    owner_id = inflight_download_registry.claim_or_attach(
+        video_id,
+        video_or_playlist_for_processing,
+        playlist.id if playlist is not None else None,
+        get_url(yt_dlp_info),
+    )
+    if owner_id is None:
+        return None
+
+    created_video = None
+    with inflight_download_registry.keep_alive(video_id, owner_id):
+        try:
+            created_video = await _get_or_download_video(yt_dlp_info, video_or_playlist_for_processing, playlist)
+        finally:
+            attached_requests = inflight_download_registry.finish(video_id, owner_id)
+            if created_video is None:
+                await _notify_attached_download_failed(attached_requests, yt_dlp_info)
+
+    if created_video is None:
+        return None
+
+    downloaded_here, db_video = created_video
+    await _add_attached_playlists(db_video, attached_requests)
+    return downloaded_here, db_video, [attached.request for attached in attached_requests]
+
+
+async def _get_or_download_video(
+    yt_dlp_info: YtDlpInfoDict,
+    video_or_playlist_for_processing: VideoOrPlaylistForProcessing,
+    playlist: Playlist | None,
 ) -> tuple[bool, Video] | None:
     video_id = yt_dlp_info["id"]
 
@@ -133,7 +227,8 @@ async def _create_video(
         db_video = Video(
             id=video_id,
             source=yt_dlp_info["extractor"],
-            yt_dlp_info=yt_dlp_jsonify(yt_dlp_info),
+            # Полная информация сохраняется в архив после скачивания
+            yt_dlp_info=slim_yt_dlp_info(yt_dlp_info),
             file=None,
             waiters=[Waiter.from_task(video_or_playlist_for_processing)],
         )
@@ -142,19 +237,24 @@ async def _create_video(
         db_session.add(db_video)
 
     try:
-        return True, await _download_video(db_video, yt_dlp_info)
+        downloaded_video = await _download_video(db_video, yt_dlp_info)
     except Exception as exc:
         logger.exception("Failed to download video %s: %s", db_video.id, exc, exc_info=exc)  # noqa: TRY401
         await delete_downloaded_video(db_video)
+        return None
+
+    # None, если не удалось скачать за DOWNLOAD_ATTEMPTS попыток
+    if downloaded_video is None:
+        return None
 
-    return None
+    return True, downloaded_video
 
 
 async def _create_playlist(
     bot: Bot,
     yt_dlp_info: YtDlpInfoDict,
     video_or_playlist_for_processing: VideoOrPlaylistForProcessing,
-) -> AsyncGenerator[tuple[bool, Video] | None]:
+) -> AsyncGenerator[DownloadedVideo | None]:
     yt_dlp_info = convert_entries_generator(yt_dlp_info)
     async with get_autocommit_session() as db_session:
         playlist, created = await get_or_create(
@@ -163,7 +263,8 @@ async def _create_playlist(
             with_for_update=False,
             defaults={
                 "source": yt_dlp_info["extractor"],
-                "yt_dlp_info": yt_dlp_jsonify(yt_dlp_info),
+                "yt_dlp_info": slim_yt_dlp_info(yt_dlp_info),
+                "yt_dlp_info_archive": create_yt_dlp_info_archive(yt_dlp_info),
             },
             id=yt_dlp_info["id"],
         )
@@ -190,19 +291,22 @@ async def _create_playlist(
             else:
                 await logging_message.edit_text(text=text, disable_web_page_preview=True, parse_mode=ParseMode.HTML)
 
-        video = await extract_info_async_cached(url=get_url(video_entry), process=False)
+        video = await extract_metadata_async_cached(url=get_url(video_entry), process=False)
         yield await _create_video(video, video_or_playlist_for_processing, playlist)
 
 
 async def get_from_url(
     bot: Bot,
     video_or_playlist_for_processing: VideoOrPlaylistForProcessing,
-) -> AsyncGenerator[tuple[bool, Video] | None]:
+) -> AsyncGenerator[DownloadedVideo | None]:
     logger.info("Downloading video or playlist")
-    yt_dlp_info = await extract_info_async_cached(url=video_or_playlist_for_processing.download_data.url, process=False)
+    yt_dlp_info = await extract_metadata_async_cached(
+        url=video_or_playlist_for_processing.download_data.url,
+        process=False,
+    )
     if yt_dlp_info["_type"] == YtDlpContentType.URL:
         logger.info('Resolving url with type "url": %s', video_or_playlist_for_processing.download_data.url)
-        yt_dlp_info = await extract_info_async_cached(url=yt_dlp_info["url"], process=False)
+        yt_dlp_info = await extract_metadata_async_cached(url=yt_dlp_info["url"], process=False)
 
     if yt_dlp_info.get("entries") is not None:
         async for video in _create_playlist(bot, yt_dlp_info, video_or_playlist_for_processing):
@@ -223,7 +327,7 @@ async def get_from_url(
 async def get_from_telegram(
     bot: Bot,
     video_or_playlist_for_processing: VideoOrPlaylistForProcessing,
-) -> tuple[bool, Video]:
+) -> DownloadedVideo:
     # Создаём видео в базе данных, если его нет
     # Иначе присоединяемся к ожидающим скачивание
     async with get_autocommit_session() as db_session:
@@ -235,7 +339,7 @@ async def get_from_telegram(
         if db_video is not None:
             logger.info("Using existing original video %s", video_id)
             await db_video.add_if_not_in_waiters_from_task(db_session, video_or_playlist_for_processing)
-            return False, db_video
+            return False, db_video, []
 
         video = video_or_playlist_for_processing.download_data.get_tg_video()
         yt_dlp_info = video.model_dump(mode="json") | {
@@ -272,13 +376,13 @@ async def get_from_telegram(
     logger.info("Uploading file to storage")
     file.save_to_storage(Video.file.type.upload_storage)
     stmt = update(Video).where(Video.id == db_video.id).values(file=file).returning(Video)
-    return True, await execute_file_update_statement(file, stmt)
+    return True, await execute_file_update_statement(file, stmt), []
 
 
 async def get_downloaded_videos(
     bot: Bot,
     video_or_playlist_for_processing: VideoOrPlaylistForProcessing,
-) -> AsyncGenerator[tuple[bool, Video] | None]:
+) -> AsyncGenerator[DownloadedVideo | None]:
     """
     Возвращает скачанные видео
     """
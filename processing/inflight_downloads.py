@@ -0,0 +1,231 @@
+"""
+Реестр скачиваемых сейчас видео
+
+Если видео уже скачивается, то повторный запрос не трогает строки в базе данных,
+а за O(1) дописывается в список в redis. Скачивающая задача после скачивания забирает этот список
+и сама продолжает обработку присоединившихся запросов
+
+Список живёт дольше записи о скачивании. Если скачивающая задача умерла, то запись пропадает,
+а отложенная проверка забирает список и снова ставит присоединившиеся запросы в очередь
+"""
+
+import logging
+import threading
+import uuid
+from collections.abc import Iterator
+from contextlib import contextmanager
+
+import lazy_object_proxy
+import pydantic
+from redis import Redis
+
+from configs import (
+    INFLIGHT_DOWNLOAD_ATTACHED_TTL,
+    INFLIGHT_DOWNLOAD_TTL,
+    REDIS_DOWNLOADS_DB,
+    REDIS_HOST,
+    REDIS_PASSWORD,
+    REDIS_PORT,
+    REDIS_USER,
+)
+
+from .schema import DownloadData, VideoOrPlaylistForProcessing
+
+logger = logging.getLogger(__name__)
+
+# Становится владельцем скачивания или присоединяется к уже идущему
+# KEYS[1] - владелец скачивания, KEYS[2] - список присоединившихся запросов
+# ARGV - owner_id, ttl, запрос, ttl списка
+# Возвращает 1, если стал владельцем, 0, если присоединился, и -1, если присоединился первым
+_CLAIM_OR_ATTACH_SCRIPT = """
+if redis.call('SET', KEYS[1], ARGV[1], 'NX', 'EX', ARGV[2]) then
+    return 1
+end
+local attached_count = redis.call('RPUSH', KEYS[2], ARGV[3])
+redis.call('EXPIRE', KEYS[2], ARGV[4])
+if attached_count == 1 then
+    return -1
+end
+return 0
+"""
+
+# Продлевает скачивание, только если владелец не сменился
+# ARGV - owner_id, ttl
+_REFRESH_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    redis.call('EXPIRE', KEYS[1], ARGV[2])
+    return 1
+end
+return 0
+"""
+
+# Забирает присоединившиеся запросы, если у скачивания больше нет владельца
+# Возвращает {1}, если скачивание ещё идёт, иначе {0, запросы...}
+_RECOVER_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    return {1}
+end
+local attached = redis.call('LRANGE', KEYS[2], 0, -1)
+redis.call('DEL', KEYS[2])
+table.insert(attached, 1, 0)
+return attached
+"""
+
+# Завершает скачивание и забирает присоединившиеся запросы
+# ARGV - owner_id
+_FINISH_SCRIPT = """
+if redis.call('GET', KEYS[1]) ~= ARGV[1] then
+    return {}
+end
+local attached = redis.call('LRANGE', KEYS[2], 0, -1)
+redis.call('DEL', KEYS[1], KEYS[2])
+return attached
+"""
+
+
+class AttachedRequest(pydantic.BaseModel):
+    request: VideoOrPlaylistForProcessing
+    #: Плейлист, из которого пришло видео, чтобы после скачивания связать их
+    playlist_id: str | None = None
+    #: Ссылка на само видео, чтобы поставить запрос в очередь заново, если скачивающая задача умерла
+    video_url: str | None = None
+
+    def get_request_for_video(self) -> VideoOrPlaylistForProcessing:
+        """
+        Запрос на одно это видео, даже если оно пришло из плейлиста
+        """
+        if self.video_url is None:
+            return self.request
+
+        return self.request.model_copy(update={"download_data": DownloadData(url=self.video_url)})
+
+
+class InFlightDownloadRegistry:
+    def __init__(  # noqa: D107
+        self,
+        redis: Redis,
+        ttl: int = INFLIGHT_DOWNLOAD_TTL,
+        attached_ttl: int = INFLIGHT_DOWNLOAD_ATTACHED_TTL,
+    ):
+        self.redis = redis
+        self.ttl = ttl
+        self.attached_ttl = attached_ttl
+
+        self._claim_or_attach_script = redis.register_script(_CLAIM_OR_ATTACH_SCRIPT)
+        self._refresh_script = redis.register_script(_REFRESH_SCRIPT)
+        self._finish_script = redis.register_script(_FINISH_SCRIPT)
+        self._recover_script = redis.register_script(_RECOVER_SCRIPT)
+
+    @staticmethod
+    def _get_keys(video_id: str) -> list[str]:
+        return [f"inflight_download:{video_id}", f"inflight_download:{video_id}:attached"]
+
+    def claim_or_attach(
+        self,
+        video_id: str,
+        request: VideoOrPlaylistForProcessing,
+        playlist_id: str | None = None,
+        video_url: str | None = None,
+    ) -> str | None:
+        """
+        Возвращает owner_id, если скачивать видео должна эта задача,
+        иначе запрос присоединяется к уже идущему скачиванию и возвращается None
+        """
+        owner_id = uuid.uuid4().hex
+        attached_request = AttachedRequest(request=request, playlist_id=playlist_id, video_url=video_url)
+        claimed = self._claim_or_attach_script(
+            keys=self._get_keys(video_id),
+            args=[owner_id, self.ttl, attached_request.model_dump_json(), self.attached_ttl],
+        )
+        if claimed == 1:
+            return owner_id
+
+        logger.info("Attached to in-flight download of video %s", video_id)
+        if claimed == -1:
+            # Одной проверки на список достаточно, следующие запросы попадут в него же
+            self.schedule_recovery(video_id)
+        return None
+
+    def schedule_recovery(self, video_id: str) -> None:
+        from .tasks import recover_attached_downloads_task
+
+        recover_attached_downloads_task.apply_async((video_id,), countdown=2 * self.ttl)
+
+    def recover(self, video_id: str) -> list[AttachedRequest] | None:
+        """
+        Если скачивающая задача умерла, то забирает присоединившиеся к ней запросы.
+        Возвращает None, если скачивание ещё идёт
+        """
+        still_running, *attached = self._recover_script(keys=self._get_keys(video_id))
+        if still_running:
+            return None
+
+        return [AttachedRequest.model_validate_json(attached_request) for attached_request in attached]
+
+    def _keep_alive(self, video_id: str, owner_id: str, stop_event: threading.Event) -> None:
+        # Скачивание блокирует event loop, поэтому продлеваем из отдельного потока
+        while not stop_event.wait(self.ttl / 3):
+            try:
+                self._refresh_script(keys=self._get_keys(video_id), args=[owner_id, self.ttl])
+            except Exception as exc:  # noqa: BLE001
+                logger.warning("Failed to refresh in-flight download of video %s: %s", video_id, exc)
+
+    @contextmanager
+    def keep_alive(self, video_id: str, owner_id: str) -> Iterator[None]:
+        stop_event = threading.Event()
+        keep_alive_thread = threading.Thread(
+            target=self._keep_alive,
+            args=(video_id, owner_id, stop_event),
+            daemon=True,
+        )
+        keep_alive_thread.start()
+        try:
+            yield
+        finally:
+            stop_event.set()
+
+    def finish(self, video_id: str, owner_id: str) -> list[AttachedRequest]:
+        """
+        Убирает видео из реестра и возвращает запросы, присоединившиеся во время скачивания
+        """
+        attached = self._finish_script(keys=self._get_keys(video_id), args=[owner_id])
+        if len(attached) > 0:
+            logger.info("%s requests attached to download of video %s", len(attached), video_id)
+
+        return [AttachedRequest.model_validate_json(attached_request) for attached_request in attached]
+
+
+inflight_download_registry: InFlightDownloadRegistry = lazy_object_proxy.Proxy(
+    lambda: InFlightDownloadRegistry(
+        Redis(
+            host=REDIS_HOST,
+            port=REDIS_PORT,
+            username=REDIS_USER,
+            password=REDIS_PASSWORD,
+            db=REDIS_DOWNLOADS_DB,
+        ),
+    ),
+)
+
+
+def recover_attached_requests(video_id: str) -> None:
+    """
+    Снова ставит в очередь запросы, присоединившиеся к скачиванию, которое никто не закончил
+    """
+    attached_requests = inflight_download_registry.recover(video_id)
+    if attached_requests is None:
+        inflight_download_registry.schedule_recovery(video_id)
+        return
+
+    if len(attached_requests) == 0:
+        return
+
+    logger.warning(
+        "Download of video %s was abandoned, re-enqueueing %s attached requests",
+        video_id,
+        len(attached_requests),
+    )
+    from .tasks import process_video_or_playlist
+
+    for attached_request in attached_requests:
+        process_video_or_playlist.delay(attached_request.get_request_for_video().model_dump(mode="json"))
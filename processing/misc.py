@@ -6,29 +6,40 @@ from sqlalchemy_file.storage import StorageManager
 
 from djgram.db.base import get_autocommit_session
 from utils.logging_tqdm import LoggingTQDM
+from utils.video.byte_range_index import ByteRange
 
 logger = logging.getLogger(__name__)
 
 
-async def execute_file_update_statement(file: File, stmt):  # noqa: ANN001, ANN201
+async def execute_file_update_statement(file: File, stmt, *extra_files: File | None):  # noqa: ANN001, ANN201
     async with get_autocommit_session() as db_session:
         try:
             db_video = await db_session.scalar(stmt)
         except Exception as exc:
             logger.exception(exc)  # noqa: TRY401
-            for path in file["files"]:
-                StorageManager.delete_file(path)
-                logger.info("Deleted %s", path)
+            for saved_file in (file, *extra_files):
+                if saved_file is None:
+                    continue
+                for path in saved_file["files"]:
+                    StorageManager.delete_file(path)
+                    logger.info("Deleted %s", path)
             raise
 
         return db_video
 
 
 def download_file_from_s3(file: File, path: Path) -> None:
-    s3_file = file.file
+    download_stored_file_from_s3(file["path"], path)
+
+
+def download_stored_file_from_s3(storage_path: str, path: Path) -> None:
+    """
+    Скачивает файл по пути в хранилище вида "<storage>/<file_id>"
+    """
+    s3_file = StorageManager.get_file(storage_path)
     pbar = LoggingTQDM(
         desc="Downloading file from S3",
-        total=file["size"],
+        total=s3_file.size,
         unit="B",
         unit_scale=True,
         unit_divisor=1024,
@@ -37,3 +48,34 @@ def download_file_from_s3(file: File, path: Path) -> None:
         for chunk in s3_file.object.as_stream():
             pbar.update(len(chunk))
             f.write(chunk)
+
+
+def download_byte_ranges_from_s3(storage_path: str, byte_ranges: list[ByteRange], file_size: int, path: Path) -> None:
+    """
+    Скачивает только byte_ranges в разреженный файл того же размера, что и оригинал
+
+    Смещения внутри файла сохраняются, поэтому ffmpeg читает его как обычный, если не лезет в дыры
+    """
+    s3_object = StorageManager.get_file(storage_path).object
+    pbar = LoggingTQDM(
+        desc="Downloading file ranges from S3",
+        total=sum(end - start for start, end in byte_ranges),
+        unit="B",
+        unit_scale=True,
+        unit_divisor=1024,
+    )
+    with open(path, "wb") as f:  # noqa: PTH123
+        f.truncate(file_size)
+        for start, end in byte_ranges:
+            f.seek(start)
+            for chunk in s3_object.driver.download_object_range_as_stream(s3_object, start_bytes=start, end_bytes=end):
+                pbar.update(len(chunk))
+                f.write(chunk)
+
+
+def get_presigned_url_from_s3(file: File, expiry_hours: float) -> str:
+    """
+    Подписанная ссылка на файл. По ней ffmpeg может читать файл кусками через HTTP Range
+    """
+    s3_object = file.file.object
+    return s3_object.driver.get_object_cdn_url(s3_object, ex_expiry=expiry_hours)
@@ -1,6 +1,6 @@
 from .common import Waiter, setup_storage
 from .download import Playlist, Video, YtDlpBase
-from .lecture_summary import LectureSummary
-from .process import ProcessedVideo, ProcessedVideoStatus
+from .lecture_summary import LectureSummary, Transcription
+from .process import ProcessedVideo, ProcessedVideoStatus, ProcessingCheckpoint, ProcessingStage
 from .profiles import AudioProcessingProfile, ProfileBase, UnsilenceProfile
 from .resource_usage import VideoProcessingResourceUsage
@@ -1,3 +1,4 @@
+import asyncio
 import logging
 from abc import abstractmethod
 from typing import Any
@@ -17,13 +18,16 @@ from configs import (
     LECTURES_SUMMARY_STORAGE,
     ORIGINAL_VIDEO_STORAGE,
     PROCESSED_VIDEO_STORAGE,
+    PROCESSING_CHECKPOINTS_STORAGE,
     S3_DRIVER,
     THUMBNAILS_STORAGE,
+    YT_DLP_INFO_STORAGE,
 )
-from djgram.contrib.communication.broadcast import broadcast
 from djgram.db.base import get_autocommit_session
 from djgram.db.pydantic_field import ImmutablePydanticField
 from utils.minio_utils import get_container_safe
+from utils.progress_events import progress_bus
+from utils.telegram_broadcast import broadcast_scheduler
 
 from ..schema import VideoOrPlaylistForProcessing  # noqa: TID252
 
@@ -35,8 +39,13 @@ def setup_storage() -> None:
 
     StorageManager.add_storage(ORIGINAL_VIDEO_STORAGE, get_container_safe(S3_DRIVER, ORIGINAL_VIDEO_STORAGE))
     StorageManager.add_storage(THUMBNAILS_STORAGE, get_container_safe(S3_DRIVER, THUMBNAILS_STORAGE))
+    StorageManager.add_storage(YT_DLP_INFO_STORAGE, get_container_safe(S3_DRIVER, YT_DLP_INFO_STORAGE))
     StorageManager.add_storage(PROCESSED_VIDEO_STORAGE, get_container_safe(S3_DRIVER, PROCESSED_VIDEO_STORAGE))
     StorageManager.add_storage(LECTURES_SUMMARY_STORAGE, get_container_safe(S3_DRIVER, LECTURES_SUMMARY_STORAGE))
+    StorageManager.add_storage(
+        PROCESSING_CHECKPOINTS_STORAGE,
+        get_container_safe(S3_DRIVER, PROCESSING_CHECKPOINTS_STORAGE),
+    )
 
 
 class Waiter(pydantic.BaseModel):
@@ -96,28 +105,47 @@ class Waitable:
     ) -> bool:
         return await self.add_if_not_in_waiters(db_session, Waiter.from_task(video_or_playlist_for_processing))
 
-    async def broadcast_text_for_waiters(
+    async def broadcast_text_for_waiters(  # noqa: PLR0913
         self,
         bot: Bot,
         text: str,
         *,
         parse_mode: ParseMode = ParseMode.HTML,
         disable_web_page_preview: bool = True,
+        status: bool = False,
+        progress_key: str | None = None,
         **kwargs,
     ) -> int:
+        """
+        Если status, то в чаты, куда недавно уже отправлялся такой же текст, он не отправляется.
+        Если задан progress_key, то отправленные сообщения дополняются ходом этой обработки
+        """
         chat_ids = []
         per_chat_kwargs = []
 
-        for waiter in self.waiters:
+        if status:
+            should_send = await asyncio.gather(
+                *(broadcast_scheduler.should_send_status(waiter.telegram_chat_id, text) for waiter in self.waiters),
+            )
+        else:
+            should_send = [True] * len(self.waiters)
+
+        for waiter, send in zip(self.waiters, should_send, strict=True):
+            if not send:
+                continue
+
             chat_ids.append(waiter.telegram_chat_id)
             per_chat_kwargs.append({"reply_to_message_id": waiter.reply_to_message_id})
 
-        return await broadcast(
+        def on_sent(chat_id: int | str, message: Message) -> None:
+            progress_bus.register_status_message(progress_key, chat_id, message.message_id, text)
+
+        return await broadcast_scheduler.broadcast(
             bot.send_message,
             chat_ids=chat_ids,
-            count=len(self.waiters),
             text=text,
             per_chat_kwargs=per_chat_kwargs,
+            on_sent=on_sent if progress_key is not None else None,
             parse_mode=parse_mode,
             disable_web_page_preview=disable_web_page_preview,
             **kwargs,
@@ -133,23 +161,31 @@ class Waitable:
     async def broadcast_for_waiters(self, bot: Bot) -> None:
         """
         Рассылает содержимое все ожидающим
-        """
 
-        chat_ids = []
-        per_chat_kwargs = []
-
-        for waiter in self.waiters:
-            chat_ids.append(waiter.telegram_chat_id)
-            per_chat_kwargs.append({"reply_to_message_id": waiter.reply_to_message_id})
+        Первая успешная отправка загружает файл в telegram, остальным он рассылается по file_id
+        """
 
         async def send_method(chat_id: int | str, reply_to_message_id: int | None = None) -> None:
             await self.send(bot=bot, chat_id=chat_id, reply_to_message_id=reply_to_message_id)
 
-        await broadcast(
-            send_method=send_method,
-            chat_ids=chat_ids,
-            count=len(chat_ids),
-            per_chat_kwargs=per_chat_kwargs,
+        waiters = list(self.waiters)
+        while len(waiters) > 0:
+            waiter = waiters.pop(0)
+            try:
+                await broadcast_scheduler.send(
+                    send_method,
+                    waiter.telegram_chat_id,
+                    reply_to_message_id=waiter.reply_to_message_id,
+                )
+            except Exception as exc:  # noqa: BLE001
+                logger.warning("Failed to send %s to %s: %s", self, waiter.telegram_chat_id, exc)
+            else:
+                break
+
+        await broadcast_scheduler.broadcast(
+            send_method,
+            chat_ids=[waiter.telegram_chat_id for waiter in waiters],
+            per_chat_kwargs=[{"reply_to_message_id": waiter.reply_to_message_id} for waiter in waiters],
         )
 
     @abstractmethod
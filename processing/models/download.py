@@ -1,4 +1,4 @@
-from typing import Any
+from typing import Any, ClassVar
 
 from sqlalchemy import Column, ForeignKey, Table
 from sqlalchemy.dialects.postgresql import JSONB
@@ -6,9 +6,10 @@ from sqlalchemy.orm import Mapped, mapped_column, relationship
 from sqlalchemy.sql import sqltypes
 from sqlalchemy_file import File, FileField
 
-from configs import ORIGINAL_VIDEO_STORAGE, THUMBNAILS_STORAGE
+from configs import ORIGINAL_VIDEO_STORAGE, THUMBNAILS_STORAGE, YT_DLP_INFO_STORAGE
 from djgram.db.models import BaseModel, TimeTrackableBaseModel
 from tools.yt_dlp_downloader.yt_dlp_download_videos import YtDlpInfoDict
+from utils.video.byte_range_index import ByteRangeIndex
 
 from .common import Waitable
 
@@ -21,7 +22,15 @@ class YtDlpBase:
         "Полный список https://github.com/yt-dlp/yt-dlp/tree/master/yt_dlp/extractor",
     )
 
-    yt_dlp_info: Mapped[YtDlpInfoDict] = mapped_column(JSONB(), nullable=False, doc="Информация из yt dlp")
+    yt_dlp_info: Mapped[YtDlpInfoDict] = mapped_column(
+        JSONB(),
+        nullable=False,
+        doc="Информация из yt dlp: поля из slim_yt_dlp_info. У старых записей полная",
+    )
+    yt_dlp_info_archive: Mapped[File | None] = mapped_column(
+        FileField(upload_storage=YT_DLP_INFO_STORAGE),
+        doc="Полная информация из yt dlp, сжатая zstd. Нет у файлов из telegram и старых записей",
+    )
 
     def get_title_for_admin(self) -> str:
         return f"{self.source}: {self.yt_dlp_info['title']}"
@@ -51,6 +60,10 @@ class Playlist(YtDlpBase, TimeTrackableBaseModel):
 
 
 class Video(Waitable, YtDlpBase, TimeTrackableBaseModel):
+    #: Откладываются в запросах для проверки состояния и рассылки, см. loading.defer_heavy_columns.
+    #: yt_dlp_info нужен почти везде для ссылки на видео
+    heavy_columns: ClassVar[tuple[str, ...]] = ("meta", "byte_range_index")
+
     id: Mapped[str] = mapped_column(
         sqltypes.String,
         nullable=False,
@@ -73,3 +86,13 @@ class Video(Waitable, YtDlpBase, TimeTrackableBaseModel):
         doc="Лучшая миниатюра для видео в формате jpg",
     )
     meta: Mapped[dict[str, Any] | None] = mapped_column(JSONB())
+    byte_range_index: Mapped[dict[str, Any] | None] = mapped_column(
+        JSONB(),
+        doc="utils.video.byte_range_index.ByteRangeIndex. Позволяет скачивать из хранилища только нужные куски файла",
+    )
+
+    def get_byte_range_index(self) -> ByteRangeIndex | None:
+        if self.byte_range_index is None:
+            return None
+
+        return ByteRangeIndex.model_validate(self.byte_range_index)
@@ -9,7 +9,8 @@ from aiogram.enums import ChatAction, ParseMode
 from aiogram.types import Message
 from aiogram.utils.chat_action import ChatActionSender
 from openai.types.chat import ChatCompletion
-from sqlalchemy import ForeignKey, and_, func
+from sqlalchemy import ForeignKey, UniqueConstraint, and_, func
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.ext.hybrid import hybrid_property
 from sqlalchemy.orm import Mapped, mapped_column, relationship
@@ -37,20 +38,80 @@ class TranscriptionStats(pydantic.BaseModel):
     transcription_info: dict[str, Any]  # TranscriptionInfo
 
 
+class TranscriptionSegment(pydantic.BaseModel):
+    start: float
+    end: float
+    text: str
+
+
+class LlmChunkStats(pydantic.BaseModel):
+    chunk: int
+    processing_time: float
+
+    transcription_start: float
+    transcription_end: float
+
+    prompt_tokens: int | None = None
+    completion_tokens: int | None = None
+
+
 class LlmStats(pydantic.BaseModel):
     processing_time: float
 
     open_ai_response: ChatCompletion
+    # Заполняется только при конспектировании по частям
+    chunks: list[LlmChunkStats] = pydantic.Field(default_factory=list)
+    # Промежуточные объединения частичных конспектов, если все они не влезли в один запрос
+    reduce_chunks: list[LlmChunkStats] = pydantic.Field(default_factory=list)
 
 
 class SummarizationStats(pydantic.BaseModel):
     processing_time: float
 
     transcription_stats: TranscriptionStats
+    transcription_cached: bool = False
     llm_stats: LlmStats
     compile_time: float
 
 
+class Transcription(TimeTrackableBaseModel):
+    """
+    Кэш результатов транскрибации
+
+    Транскрибация самая дорогая часть конспектирования, поэтому сохраняем её отдельно от конспекта.
+    Так при повторном конспектировании (например, не скомпилировался latex или поменялся промпт)
+    можно сразу переходить к llm.
+    """
+
+    __table_args__ = (
+        UniqueConstraint(
+            "original_video_id",
+            "whisper_model_size",
+            "whisper_compute_type",
+            name="uniq_transcription",
+        ),
+    )
+
+    original_video_id: Mapped[str] = mapped_column(ForeignKey(Video.id, ondelete="CASCADE"), index=True)
+    original_video: Mapped[Video] = relationship(Video)
+
+    whisper_model_size: Mapped[str] = mapped_column(doc="Размер модели whisper")
+    whisper_compute_type: Mapped[str] = mapped_column(doc="Тип вычислений whisper")
+
+    text: Mapped[str] = mapped_column(doc="Полный текст транскрибации")
+    segments: Mapped[list[dict[str, Any]]] = mapped_column(
+        JSONB(),
+        doc="Сегменты транскрибации с временными метками в формате TranscriptionSegment",
+    )
+    stats: Mapped[TranscriptionStats] = mapped_column(
+        ImmutablePydanticField(TranscriptionStats, should_frozen=False),
+        doc="Статистика транскрибации",
+    )
+
+    def get_segments(self) -> list[TranscriptionSegment]:
+        return [TranscriptionSegment.model_validate(segment) for segment in self.segments]
+
+
 class LectureSummary(HasTelegramFileAndOriginalVideo, TimeTrackableBaseModel):
     original_video_id: Mapped[str] = mapped_column(ForeignKey(Video.id), index=True)
     original_video: Mapped[Video] = relationship(Video)
@@ -0,0 +1,34 @@
+"""
+Отложенная загрузка тяжёлых колонок
+
+JSONB со статистикой, профилями и метаданными занимают большую часть строки, а колонки ImmutablePydanticField
+ещё и проходят валидацию pydantic при загрузке. Для проверки состояния и рассылки они не нужны, поэтому такие
+запросы откладывают их через defer_heavy_columns, а нужное догружается через load_deferred.
+Обращение к отложенной и не догруженной колонке сразу бросает исключение, а не делает запрос
+"""
+
+from collections.abc import Iterable
+from typing import Any
+
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import defer
+from sqlalchemy.orm.interfaces import LoaderOption
+
+
+def defer_heavy_columns(model: type, keep: Iterable[str] = ()) -> list[LoaderOption]:
+    """
+    Откладывает колонки из model.heavy_columns, кроме keep. Для selectinload(...).options(...) тоже подходит
+    """
+    keep = set(keep)
+    return [
+        defer(getattr(model, column), raiseload=True)
+        for column in getattr(model, "heavy_columns", ())
+        if column not in keep
+    ]
+
+
+async def load_deferred(db_session: AsyncSession, obj: Any, *columns: str) -> None:  # noqa: ANN401
+    """
+    Догружает отложенные колонки объекта
+    """
+    await db_session.refresh(obj, attribute_names=columns)
@@ -2,7 +2,7 @@
 import enum
 import logging
 from pathlib import Path
-from typing import Any
+from typing import Any, ClassVar
 
 import aiogram
 from aiogram import Bot
@@ -15,7 +15,7 @@ from sqlalchemy.orm import Mapped, mapped_column, relationship
 from sqlalchemy.sql import sqltypes
 from sqlalchemy_file import File, FileField
 
-from configs import PROCESSED_VIDEO_STORAGE, VIDEO_UPLOAD_TIMEOUT
+from configs import PROCESSED_VIDEO_STORAGE, PROCESSING_CHECKPOINTS_STORAGE, VIDEO_UPLOAD_TIMEOUT
 from djgram.db.models import TimeTrackableBaseModel
 from djgram.db.pydantic_field import ImmutablePydanticField
 from djgram.utils.input_file_ext import S3FileInput
@@ -52,6 +52,14 @@ class ProcessedVideo(HasTelegramFileAndOriginalVideo, TimeTrackableBaseModel):
         # CheckConstraint("(status = 'processed') = (file is not null)", name="check_status"),
         # CheckConstraint("(status = 'impossible') = (impossible_reason is not null)", name="check_impossible_status"),
     )
+    #: Откладываются в запросах для проверки состояния и рассылки, см. loading.defer_heavy_columns
+    heavy_columns: ClassVar[tuple[str, ...]] = (
+        "audio_pipeline_json",
+        "unsilence_action_json",
+        "processing_stats",
+        "meta",
+        "telegram_rendition_meta",
+    )
 
     status: Mapped[ProcessedVideoStatus] = mapped_column(
         sqltypes.Enum(ProcessedVideoStatus),
@@ -84,12 +92,23 @@ class ProcessedVideo(HasTelegramFileAndOriginalVideo, TimeTrackableBaseModel):
         FileField(upload_storage=PROCESSED_VIDEO_STORAGE),
         doc="Сам видеофайл. None в случае, когда видео в процессе обработки",
     )
+    telegram_rendition: Mapped[File | None] = mapped_column(
+        FileField(upload_storage=PROCESSED_VIDEO_STORAGE),
+        doc="Версия видео в H.264 под лимит telegram на отправку. None, если подходит сам file",
+    )
     meta: Mapped[dict[str, Any] | None] = mapped_column(JSONB())
+    telegram_rendition_meta: Mapped[dict[str, Any] | None] = mapped_column(
+        JSONB(),
+        doc="ffprobe telegram_rendition. Её размеры и длительность отличаются от file",
+    )
     telegram_file: Mapped[aiogram.types.Video | None] = mapped_column(
         ImmutablePydanticField(aiogram.types.Video),
         doc="Отправленный файл в телеграм",
     )
 
+    def get_progress_key(self) -> str:
+        return f"processed_video:{self.id}"
+
     def get_caption(self) -> str:
         yt_dlp_info = self.original_video.yt_dlp_info
 
@@ -120,8 +139,10 @@ class ProcessedVideo(HasTelegramFileAndOriginalVideo, TimeTrackableBaseModel):
         )
 
     async def get_kwargs_for_first_send_to_telegram(self) -> dict[str, int | str | None]:
-        if self.meta is not None:
-            stream = next(stream for stream in self.meta["streams"] if stream["codec_type"] == "video")
+        # Загружается telegram_rendition, если она есть, и размеры должны быть её
+        meta = self.telegram_rendition_meta if self.telegram_rendition is not None else self.meta
+        if meta is not None:
+            stream = next(stream for stream in meta["streams"] if stream["codec_type"] == "video")
             kwargs = {
                 "duration": round(float(stream.get("duration", 0))) or None,
                 "width": int(stream.get("width", 0)) or None,
@@ -155,10 +176,11 @@ class ProcessedVideo(HasTelegramFileAndOriginalVideo, TimeTrackableBaseModel):
                 kwargs = {}
             else:
                 logger.info("Uploading video %s to telegram", self.id)
-                ext = Path(self.file["filename"]).suffix
+                file = self.telegram_rendition if self.telegram_rendition is not None else self.file
+                ext = Path(file["filename"]).suffix
                 video = LoggingInputFile(
                     S3FileInput(
-                        obj=self.file.file.object,
+                        obj=file.file.object,
                         filename=f"processed{ext}",
                     ),
                 )
@@ -179,3 +201,31 @@ class ProcessedVideo(HasTelegramFileAndOriginalVideo, TimeTrackableBaseModel):
                 self.telegram_file = message.video
 
             return message
+
+
+class ProcessingStage(enum.Enum):
+    """
+    Этапы обработки видео в порядке выполнения
+    """
+
+    AUDIO = "audio"
+    DETECTION = "detection"
+    RENDER = "render"
+
+
+class ProcessingCheckpoint(TimeTrackableBaseModel):
+    """
+    Результат завершённого этапа обработки видео
+
+    Позволяет продолжить обработку с последнего завершённого этапа, в том числе на другом узле
+    """
+
+    __table_args__ = (UniqueConstraint("processed_video_id", "stage", name="uniq_processing_checkpoint"),)
+
+    processed_video_id: Mapped[int] = mapped_column(ForeignKey(ProcessedVideo.id, ondelete="CASCADE"), index=True)
+    stage: Mapped[ProcessingStage] = mapped_column(sqltypes.Enum(ProcessingStage))
+    file: Mapped[File | None] = mapped_column(
+        FileField(upload_storage=PROCESSING_CHECKPOINTS_STORAGE),
+        doc="Файл, полученный на этапе (например, обработанный звук)",
+    )
+    data: Mapped[dict[str, Any]] = mapped_column(JSONB(), doc="Статистика и результаты этапа")
@@ -13,8 +13,10 @@ class VideoProcessingResourceUsage(TimeTrackableBaseModel):
     processed_video_id: Mapped[int] = mapped_column(ForeignKey(ProcessedVideo.id, ondelete="CASCADE"))
     processed_video: Mapped[ProcessedVideo] = relationship()
 
-    # TODO: Научиться нормально считать это
-    total_cpu_time: Mapped[float] = mapped_column(default=0, doc="Процессорное время, потраченное на обработку")
+    total_cpu_time: Mapped[float] = mapped_column(
+        default=0,
+        doc="Процессорное время, потраченное на обработку, включая ffmpeg. 0, если видео не обрабатывалось заново",
+    )
     real_processed: Mapped[bool] = mapped_column(
         doc="Если True, то этот пользователь был инициатором обработки. Иначе видео было взято из уже обработанных.",
     )
@@ -10,6 +10,7 @@ from configs import LOGGING_CONFIG
 from djgram.db import async_session_maker
 from processing.models import AudioProcessingProfile, UnsilenceProfile
 from processing.predefined_profile import predefined_audio_pipelines, predefined_unsilence_profiles
+from processing.profile_catalogue import bump_profile_catalogue_version
 
 
 async def load_audio_processing_profiles() -> None:
@@ -121,6 +122,8 @@ async def load_unsilence_profiles() -> None:
 async def main() -> None:
     await load_audio_processing_profiles()
     await load_unsilence_profiles()
+    # Процессы перечитают профили при следующей проверке версии каталога
+    await bump_profile_catalogue_version()
 
 
 if __name__ == "__main__":
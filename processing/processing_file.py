@@ -1,66 +1,462 @@
+import functools
 import logging
 import tempfile
+import time
+from collections import defaultdict
+from collections.abc import Iterator
+from contextlib import contextmanager
 from pathlib import Path
 
-from sqlalchemy import update
+from sqlalchemy import select, update
 from sqlalchemy.orm import selectinload
 from sqlalchemy_file import File
 
-from configs import FORCE_AUDIO_CODEC, FORCE_VIDEO_CODEC, PROCESSED_EXT, TORCH_DEVICE, USE_NISQA, USE_NVENC
+from configs import (
+    DISTRIBUTED_RENDERING,
+    DISTRIBUTED_RENDERING_MIN_DURATION,
+    FORCE_AUDIO_CODEC,
+    FORCE_VIDEO_CODEC,
+    GPU_ADMISSION_DEEPFILTERNET_VRAM,
+    GPU_ADMISSION_NVENC_SESSION_VRAM,
+    PROCESSED_EXT,
+    TORCH_DEVICE,
+    USE_NISQA,
+    USE_NVENC,
+)
+from djgram.db.base import get_autocommit_session
 from libs.nisqa.model import NisqaModel
-from tools.video_processing.pipeline import VideoPipeline
+from tools.audio_processing.actions.deepfilternet_actions import CUDA_MEMORY_STATS_KEY
+from tools.audio_processing.prefix_cache import audio_prefix_cache
+from tools.video_processing.actions.unsilence_actions import SilenceDetectionResult
+from tools.video_processing.pipeline import AudioStageStatistics, VideoPipeline, VideoPipelineStatistics
+from utils.disk_budget import TempDiskUsageMonitor, disk_budget_controller
+from utils.gpu_admission import gpu_admission_controller
+from utils.metrics import CUDA_MEMORY_PEAK, STAGE_REALTIME_FACTOR, CpuTimer
+from utils.progress_events import progress_bus
+from utils.video.byte_range_index import build_byte_range_index_safe
 from utils.video.measure import ffprobe_extract_meta
+from utils.video.telegram_rendition import create_telegram_rendition
 
-from .misc import download_file_from_s3, execute_file_update_statement
-from .models import ProcessedVideo, ProcessedVideoStatus
+from .disk_budget import estimate_temp_disk_usage
+from .distributed_render import DistributedMediaRenderer, DistributedRenderPendingError
+from .misc import download_byte_ranges_from_s3, download_file_from_s3, execute_file_update_statement
+from .models import ProcessedVideo, ProcessedVideoStatus, ProcessingCheckpoint, ProcessingStage, Video
 
 logger = logging.getLogger(__name__)
 
+PROCESSED_AUDIO_FILENAME = "processed_audio.wav"
 
-async def run_video_pipeline(processed_video: ProcessedVideo) -> ProcessedVideo:
-    logger.info(
-        "Start processing video %s (audio profile %s, unsilence profile %s). Result will be in processed video %s",
-        processed_video.original_video_id,
-        processed_video.audio_processing_profile_id,
-        processed_video.unsilence_profile_id,
-        processed_video.id,
+#: Результат этапа для одного видео пакета: обработанное видео после последнего этапа, ошибка или None.
+#: DistributedRenderPendingError означает, что этап продолжит задача, поставленная после рендеринга групп
+StageResult = ProcessedVideo | Exception | None
+
+#: Названия этапов в сообщениях о состоянии
+STAGE_TITLES = {
+    ProcessingStage.AUDIO: "Обработка звука",
+    ProcessingStage.DETECTION: "Поиск тишины",
+    ProcessingStage.RENDER: "Сборка видео",
+}
+
+
+def _create_video_pipeline(processed_video: ProcessedVideo) -> VideoPipeline:
+    return VideoPipeline(
+        audio_pipeline=processed_video.audio_processing_profile.audio_pipeline,
+        unsilence_action=processed_video.unsilence_profile.unsilence_action,
+        use_nvenc=USE_NVENC,
+        force_video_codec=FORCE_VIDEO_CODEC,
+        force_audio_codec=FORCE_AUDIO_CODEC,
     )
-    with tempfile.TemporaryDirectory() as tempdir:
-        temp_dir = Path(tempdir)
-
-        logger.info("Downloading video %s from storage to temporary directory", processed_video.original_video_id)
-        file = processed_video.original_video.file
-        input_file = temp_dir / file.file.filename
-        download_file_from_s3(file, input_file)
-
-        logger.info("Start processing")
-        video_pipeline = VideoPipeline(
-            audio_pipeline=processed_video.audio_processing_profile.audio_pipeline,
-            unsilence_action=processed_video.unsilence_profile.unsilence_action,
-            use_nvenc=USE_NVENC,
-            force_video_codec=FORCE_VIDEO_CODEC,
-            force_audio_codec=FORCE_AUDIO_CODEC,
+
+
+def _observe_realtime_factor(stage: ProcessingStage, processed_videos: list[ProcessedVideo], wall_time: float) -> None:
+    meta = processed_videos[0].original_video.meta
+    if meta is None or wall_time <= 0:
+        return
+
+    # Все видео пакета из одного оригинала, и каждое проходит этап целиком
+    media_duration = float(meta["format"].get("duration", 0)) * len(processed_videos)
+    STAGE_REALTIME_FACTOR.labels(stage.value).observe(media_duration / wall_time)
+
+
+def _observe_cuda_memory_peaks(audio_stage_stats: AudioStageStatistics) -> None:
+    for step_stats in audio_stage_stats.audio_pipeline_stats.step_statistics:
+        if step_stats.cached or step_stats.action_stats is None:
+            continue
+
+        cuda_memory = step_stats.action_stats.get(CUDA_MEMORY_STATS_KEY)
+        if cuda_memory is None or len(cuda_memory["trace"]) == 0:
+            continue
+
+        CUDA_MEMORY_PEAK.labels(step_stats.step_name).observe(
+            max(usage["max_allocated"] for usage in cuda_memory["trace"]),
         )
-        if USE_NISQA:
-            logger.info("Initializing nisqa model")
-            nisqa_model = NisqaModel(TORCH_DEVICE, warmup=True)
-        else:
-            nisqa_model = None
-        output_file = temp_dir / f"processed{PROCESSED_EXT}"
-        processing_temp_dir = temp_dir / "processing"
-        processing_temp_dir.mkdir(exist_ok=True)
-
-        processing_stats = video_pipeline.run(
+
+
+def _create_nisqa_model() -> NisqaModel | None:
+    if not USE_NISQA:
+        return None
+
+    logger.info("Initializing nisqa model")
+    return NisqaModel(TORCH_DEVICE, warmup=True)
+
+
+def _download_original_video(
+    processed_video: ProcessedVideo,
+    temp_dir: Path,
+    spans: list[tuple[float, float]] | None = None,
+) -> Path:
+    """
+    Скачивает оригинальное видео. Если заданы spans и у видео есть индекс,
+    то скачиваются только заголовок и куски, нужные для этих отрезков времени
+    """
+    file = processed_video.original_video.file
+    input_file = temp_dir / file.file.filename
+    byte_range_index = processed_video.original_video.get_byte_range_index()
+
+    if spans is not None and byte_range_index is not None:
+        byte_ranges = byte_range_index.get_byte_ranges(spans)
+        logger.info(
+            "Downloading %s of %s bytes of video %s from storage to temporary directory",
+            sum(end - start for start, end in byte_ranges),
+            byte_range_index.file_size,
+            processed_video.original_video_id,
+        )
+        download_byte_ranges_from_s3(file["path"], byte_ranges, byte_range_index.file_size, input_file)
+        return input_file
+
+    logger.info("Downloading video %s from storage to temporary directory", processed_video.original_video_id)
+    download_file_from_s3(file, input_file)
+    return input_file
+
+
+async def _ensure_byte_range_index(processed_video: ProcessedVideo, input_file: Path) -> None:
+    """
+    Строит индекс для видео, скачанных до его появления
+    """
+    if processed_video.original_video.byte_range_index is not None:
+        return
+
+    byte_range_index = build_byte_range_index_safe(input_file)
+    if byte_range_index is None:
+        return
+
+    async with get_autocommit_session() as db_session:
+        # noinspection PyTypeChecker
+        await db_session.execute(
+            update(Video)
+            .where(Video.id == processed_video.original_video_id)
+            .values(byte_range_index=byte_range_index.model_dump()),
+        )
+
+
+def _download_processed_audio(checkpoints: dict[ProcessingStage, ProcessingCheckpoint], temp_dir: Path) -> Path:
+    logger.info("Downloading processed audio from checkpoint")
+    processed_audio_file = temp_dir / PROCESSED_AUDIO_FILENAME
+    download_file_from_s3(checkpoints[ProcessingStage.AUDIO].file, processed_audio_file)
+    return processed_audio_file
+
+
+def _use_distributed_rendering(processed_video: ProcessedVideo) -> bool:
+    if not DISTRIBUTED_RENDERING:
+        return False
+
+    meta = processed_video.original_video.meta
+    if meta is None:
+        return False
+
+    return float(meta["format"].get("duration", 0)) >= DISTRIBUTED_RENDERING_MIN_DURATION
+
+
+@contextmanager
+def _stage_temp_dir(
+    processed_video: ProcessedVideo,
+    stage: ProcessingStage,
+    batch_size: int = 1,
+) -> Iterator[TempDiskUsageMonitor]:
+    """
+    Временная папка этапа. Ждёт, пока на диске узла хватит места под оценку этапа, и замеряет реальный пик
+    """
+    with (
+        disk_budget_controller.acquire(estimate_temp_disk_usage(processed_video.original_video, stage, batch_size)),
+        tempfile.TemporaryDirectory() as tempdir,
+        TempDiskUsageMonitor(Path(tempdir)) as monitor,
+    ):
+        yield monitor
+
+
+async def get_checkpoints(processed_video_id: int) -> dict[ProcessingStage, ProcessingCheckpoint]:
+    async with get_autocommit_session() as db_session:
+        # noinspection PyTypeChecker
+        checkpoints = await db_session.scalars(
+            select(ProcessingCheckpoint).where(ProcessingCheckpoint.processed_video_id == processed_video_id),
+        )
+        return {checkpoint.stage: checkpoint for checkpoint in checkpoints}
+
+
+def get_next_stage(checkpoints: dict[ProcessingStage, ProcessingCheckpoint]) -> ProcessingStage:
+    return next(stage for stage in ProcessingStage if stage not in checkpoints)
+
+
+async def save_checkpoint(
+    processed_video_id: int,
+    stage: ProcessingStage,
+    data: dict,
+    file_path: Path | None = None,
+) -> None:
+    logger.info("Saving checkpoint %s for processed video %s", stage.value, processed_video_id)
+    async with get_autocommit_session() as db_session:
+        db_session.add(
+            ProcessingCheckpoint(
+                processed_video_id=processed_video_id,
+                stage=stage,
+                file=File(content_path=file_path.as_posix()) if file_path is not None else None,
+                data=data,
+            ),
+        )
+
+
+async def delete_checkpoints(processed_video_id: int) -> None:
+    """
+    Удаляет промежуточные результаты обработки вместе с файлами в хранилище
+    """
+    async with get_autocommit_session() as db_session:
+        # noinspection PyTypeChecker
+        checkpoints = await db_session.scalars(
+            select(ProcessingCheckpoint).where(ProcessingCheckpoint.processed_video_id == processed_video_id),
+        )
+        for checkpoint in checkpoints:
+            logger.info("Deleting checkpoint %s of processed video %s", checkpoint.stage.value, processed_video_id)
+            await db_session.delete(checkpoint)
+
+
+@contextmanager
+def _collect_stage_errors(
+    results: dict[int, StageResult],
+    processed_videos: list[ProcessedVideo],
+) -> Iterator[None]:
+    """
+    Ошибка одного видео пакета не должна останавливать этап для остальных, поэтому она сохраняется в results
+    """
+    try:
+        yield
+    except DistributedRenderPendingError as exc:
+        for processed_video in processed_videos:
+            results[processed_video.id] = exc
+    except Exception as exc:  # noqa: BLE001
+        logger.warning(
+            "Stage failed for processed videos %s: %r",
+            [processed_video.id for processed_video in processed_videos],
+            exc,
+        )
+        for processed_video in processed_videos:
+            results[processed_video.id] = exc
+
+
+async def run_audio_stage(processed_videos: list[ProcessedVideo]) -> dict[int, StageResult]:
+    """
+    Скачивает оригинал и извлекает из него звук один раз на весь пакет, потом обрабатывает звук для каждого видео.
+    Одинаковые начала AudioPipeline разных профилей берутся из audio_prefix_cache
+    """
+    first_video = processed_videos[0]
+    results: dict[int, StageResult] = {}
+    with _stage_temp_dir(first_video, ProcessingStage.AUDIO, len(processed_videos)) as disk_usage_monitor:
+        temp_dir = disk_usage_monitor.path
+        with CpuTimer(ProcessingStage.AUDIO.value) as shared_cpu_timer:
+            input_file = _download_original_video(first_video, temp_dir)
+            await _ensure_byte_range_index(first_video, input_file)
+
+            extracted_audio_file = temp_dir / "extracted_audio.wav"
+            extract_audio_stats = VideoPipeline.extract_audio(input_file, extracted_audio_file)
+            input_file.unlink()
+        nisqa_model = _create_nisqa_model()
+
+        for processed_video in processed_videos:
+            with (
+                _collect_stage_errors(results, [processed_video]),
+                tempfile.TemporaryDirectory(dir=temp_dir) as video_temp_dir,
+                # Звук для видео пакета обрабатывается по очереди, поэтому прогресс относится только к текущему
+                progress_bus.track(
+                    [processed_video.get_progress_key()],
+                    "audio_video",
+                    STAGE_TITLES[ProcessingStage.AUDIO],
+                ),
+            ):
+                processing_temp_dir = Path(video_temp_dir) / "processing"
+                processing_temp_dir.mkdir()
+                processed_audio_file = Path(video_temp_dir) / PROCESSED_AUDIO_FILENAME
+
+                with (
+                    gpu_admission_controller.acquire(vram=GPU_ADMISSION_DEEPFILTERNET_VRAM),
+                    CpuTimer(ProcessingStage.AUDIO.value) as cpu_timer,
+                ):
+                    audio_stage_stats = _create_video_pipeline(processed_video).run_audio_pipeline(
+                        extracted_audio_file=extracted_audio_file,
+                        extract_audio_stats=extract_audio_stats,
+                        processed_audio_file=processed_audio_file,
+                        tempdir=processing_temp_dir,
+                        nisqa_model=nisqa_model,
+                        cache=audio_prefix_cache,
+                        # Звук извлекается из оригинала всегда одинаково, поэтому файл не нужно хешировать
+                        input_key=processed_video.original_video.file["file_id"],
+                    )
+                audio_stage_stats.peak_temp_disk_usage = disk_usage_monitor.measure()
+                audio_stage_stats.cpu_time = cpu_timer.total + shared_cpu_timer.total / len(processed_videos)
+                _observe_cuda_memory_peaks(audio_stage_stats)
+
+                await save_checkpoint(
+                    processed_video.id,
+                    ProcessingStage.AUDIO,
+                    audio_stage_stats.model_dump(mode="json"),
+                    processed_audio_file,
+                )
+                results[processed_video.id] = None
+
+    return results
+
+
+async def run_detection_stage(
+    processed_videos: list[ProcessedVideo],
+    checkpoints: dict[int, dict[ProcessingStage, ProcessingCheckpoint]],
+) -> dict[int, StageResult]:
+    """
+    Ищет тишину один раз для каждой группы видео с одинаковым VideoPipeline.get_detection_key
+    """
+    groups: dict[str, list[ProcessedVideo]] = defaultdict(list)
+    for processed_video in processed_videos:
+        groups[_create_video_pipeline(processed_video).get_detection_key()].append(processed_video)
+
+    first_video = processed_videos[0]
+    results: dict[int, StageResult] = {}
+    with _stage_temp_dir(first_video, ProcessingStage.DETECTION) as disk_usage_monitor:
+        temp_dir = disk_usage_monitor.path
+        for group in groups.values():
+            with (
+                _collect_stage_errors(results, group),
+                tempfile.TemporaryDirectory(dir=temp_dir) as group_temp_dir,
+            ):
+                with CpuTimer(ProcessingStage.DETECTION.value) as cpu_timer:
+                    # Тишина ищется только по обработанному звуку, поэтому видео не скачиваем
+                    processed_audio_file = _download_processed_audio(checkpoints[group[0].id], Path(group_temp_dir))
+                    detection = _create_video_pipeline(group[0]).run_detection_stage(
+                        input_file=Path(group_temp_dir) / first_video.original_video.file.file.filename,
+                        processed_audio_file=processed_audio_file,
+                    )
+                detection.peak_temp_disk_usage = disk_usage_monitor.measure()
+                detection.cpu_time = cpu_timer.total / len(group)
+
+                if len(group) > 1:
+                    logger.info("Sharing silence detection between processed videos %s", [pv.id for pv in group])
+                for processed_video in group:
+                    await save_checkpoint(
+                        processed_video.id,
+                        ProcessingStage.DETECTION,
+                        detection.model_dump(mode="json"),
+                    )
+                    results[processed_video.id] = None
+
+    return results
+
+
+async def _render_processed_video(  # noqa: PLR0913
+    processed_video: ProcessedVideo,
+    checkpoints: dict[ProcessingStage, ProcessingCheckpoint],
+    input_file: Path,
+    temp_dir: Path,
+    disk_usage_monitor: TempDiskUsageMonitor,
+    nisqa_model: NisqaModel | None,
+    distributed: bool,  # noqa: FBT001
+    cpu_timer: CpuTimer,
+    shared_cpu_time: float,
+) -> ProcessedVideo:
+    """
+    :param cpu_timer: запущенный на время рендеринга этого видео
+    :param shared_cpu_time: доля процессорного времени общих для пакета действий
+    """
+    video_pipeline = _create_video_pipeline(processed_video)
+    audio_stage_stats = AudioStageStatistics.model_validate(checkpoints[ProcessingStage.AUDIO].data)
+    detection = SilenceDetectionResult.model_validate(checkpoints[ProcessingStage.DETECTION].data)
+
+    processed_audio_file = _download_processed_audio(checkpoints, temp_dir)
+    output_file = temp_dir / f"processed{PROCESSED_EXT}"
+    processing_temp_dir = temp_dir / "processing"
+    processing_temp_dir.mkdir(exist_ok=True)
+
+    if distributed:
+        media_renderer_factory = functools.partial(
+            DistributedMediaRenderer,
+            render_key=str(processed_video.id),
+            input_file=processed_video.original_video.file,
+            byte_range_index=processed_video.original_video.get_byte_range_index(),
+            separated_audio=checkpoints[ProcessingStage.AUDIO].file,
+        )
+        # nvenc занимают воркеры рендеринга
+        nvenc_sessions = 0
+    else:
+        media_renderer_factory = None
+        nvenc_sessions = video_pipeline.unsilence_action.render_options.threads if USE_NVENC else 0
+
+    with gpu_admission_controller.acquire(
+        nvenc_sessions=nvenc_sessions,
+        vram=nvenc_sessions * GPU_ADMISSION_NVENC_SESSION_VRAM,
+    ):
+        unsilence_stats = video_pipeline.run_render_stage(
             input_file=input_file,
+            processed_audio_file=processed_audio_file,
             output_file=output_file,
             tempdir=processing_temp_dir,
+            detection=detection,
             nisqa_model=nisqa_model,
+            media_renderer_factory=media_renderer_factory,
         )
-        meta = ffprobe_extract_meta(output_file)
+    meta = ffprobe_extract_meta(output_file)
+
+    telegram_rendition_file = temp_dir / f"telegram{PROCESSED_EXT}"
+    telegram_nvenc_sessions = 1 if USE_NVENC else 0
+    with gpu_admission_controller.acquire(
+        nvenc_sessions=telegram_nvenc_sessions,
+        vram=telegram_nvenc_sessions * GPU_ADMISSION_NVENC_SESSION_VRAM,
+    ):
+        has_telegram_rendition = create_telegram_rendition(meta, output_file, telegram_rendition_file)
+    render_peak_temp_disk_usage = disk_usage_monitor.measure()
+
+    render_cpu_time = cpu_timer.measure() + shared_cpu_time
+
+    logger.info("Uploading processed video %s to storage", processed_video.id)
+    file = File(content_path=output_file.as_posix())
+    file.save_to_storage(ProcessedVideo.file.type.upload_storage)
+    if has_telegram_rendition:
+        telegram_rendition_meta = ffprobe_extract_meta(telegram_rendition_file)
+        telegram_rendition = File(content_path=telegram_rendition_file.as_posix())
+        telegram_rendition.save_to_storage(ProcessedVideo.telegram_rendition.type.upload_storage)
+    else:
+        telegram_rendition_meta = None
+        telegram_rendition = None
 
-        logger.info("Uploading processed video to storage")
-        file = File(content_path=output_file.as_posix())
-        file.save_to_storage(ProcessedVideo.file.type.upload_storage)
+    processing_stats = VideoPipelineStatistics(
+        total_time=(
+            audio_stage_stats.extract_audio_stats.time
+            + audio_stage_stats.audio_pipeline_stats.total_time
+            + unsilence_stats.time
+        ),
+        extract_audio_stats=audio_stage_stats.extract_audio_stats,
+        audio_pipeline_stats=audio_stage_stats.audio_pipeline_stats,
+        unsilence_stats=unsilence_stats,
+        # Этапы идут по очереди в разных папках, поэтому пик задачи — максимальный из пиков этапов
+        peak_temp_disk_usage=max(
+            peak
+            for peak in (
+                audio_stage_stats.peak_temp_disk_usage,
+                detection.peak_temp_disk_usage,
+                render_peak_temp_disk_usage,
+            )
+            if peak is not None
+        ),
+        cpu_time=sum(
+            cpu_time
+            for cpu_time in (audio_stage_stats.cpu_time, detection.cpu_time, render_cpu_time)
+            if cpu_time is not None
+        ),
+    )
 
     # noinspection PyTypeChecker
     stmt = (
@@ -68,6 +464,8 @@ async def run_video_pipeline(processed_video: ProcessedVideo) -> ProcessedVideo:
         .where(ProcessedVideo.id == processed_video.id)
         .values(
             file=file,
+            telegram_rendition=telegram_rendition,
+            telegram_rendition_meta=telegram_rendition_meta,
             processing_stats=processing_stats,
             meta=meta,
             status=ProcessedVideoStatus.PROCESSED,
@@ -78,4 +476,116 @@ async def run_video_pipeline(processed_video: ProcessedVideo) -> ProcessedVideo:
         .options(selectinload(ProcessedVideo.original_video))
     )
 
-    return await execute_file_update_statement(file, stmt)
+    return await execute_file_update_statement(file, stmt, telegram_rendition)
+
+
+async def run_render_stage(
+    processed_videos: list[ProcessedVideo],
+    checkpoints: dict[int, dict[ProcessingStage, ProcessingCheckpoint]],
+) -> dict[int, StageResult]:
+    """
+    Скачивает оригинал один раз на весь пакет и по очереди рендерит каждое видео
+    """
+    first_video = processed_videos[0]
+    # Зависит только от оригинала, поэтому одинаково для всего пакета
+    distributed = _use_distributed_rendering(first_video)
+
+    results: dict[int, StageResult] = {}
+    with _stage_temp_dir(first_video, ProcessingStage.RENDER) as disk_usage_monitor:
+        temp_dir = disk_usage_monitor.path
+        with CpuTimer(ProcessingStage.RENDER.value) as shared_cpu_timer:
+            if distributed:
+                logger.info("Rendering interval groups on render workers")
+                # Самому нужен только заголовок для ffprobe
+                input_file = _download_original_video(first_video, temp_dir, spans=[])
+            else:
+                # Перерывы вырезаются целиком, поэтому их можно не скачивать
+                input_file = _download_original_video(
+                    first_video,
+                    temp_dir,
+                    spans=[
+                        (interval.start, interval.end)
+                        for processed_video in processed_videos
+                        for interval in SilenceDetectionResult.model_validate(
+                            checkpoints[processed_video.id][ProcessingStage.DETECTION].data,
+                        )
+                        .get_intervals()
+                        .intervals_without_breaks
+                    ],
+                )
+            nisqa_model = _create_nisqa_model()
+
+        for processed_video in processed_videos:
+            with (
+                _collect_stage_errors(results, [processed_video]),
+                tempfile.TemporaryDirectory(dir=temp_dir) as video_temp_dir,
+                # Видео пакета рендерятся по очереди, поэтому прогресс относится только к текущему
+                progress_bus.track(
+                    [processed_video.get_progress_key()],
+                    "render_video",
+                    STAGE_TITLES[ProcessingStage.RENDER],
+                ),
+                CpuTimer(ProcessingStage.RENDER.value) as cpu_timer,
+            ):
+                results[processed_video.id] = await _render_processed_video(
+                    processed_video,
+                    checkpoints[processed_video.id],
+                    input_file=input_file,
+                    temp_dir=Path(video_temp_dir),
+                    disk_usage_monitor=disk_usage_monitor,
+                    nisqa_model=nisqa_model,
+                    distributed=distributed,
+                    cpu_timer=cpu_timer,
+                    shared_cpu_time=shared_cpu_timer.total / len(processed_videos),
+                )
+
+    return results
+
+
+async def run_video_pipeline_stage(processed_videos: list[ProcessedVideo]) -> dict[int, StageResult]:
+    """
+    Выполняет самый ранний незавершённый этап обработки для всех видео пакета, которые до него дошли.
+    Все видео пакета сделаны из одного оригинала, поэтому скачивание и общие результаты переиспользуются
+
+    Возвращает для каждого видео, участвовавшего в этапе, обработанное видео после последнего этапа,
+    ошибку этого видео или None, если остались ещё этапы. Видео, не дошедшие до этапа, в результат не попадают
+    """
+    checkpoints: dict[int, dict[ProcessingStage, ProcessingCheckpoint]] = {}
+    next_stages: dict[int, ProcessingStage] = {}
+    for processed_video in processed_videos:
+        checkpoints[processed_video.id] = await get_checkpoints(processed_video.id)
+        next_stages[processed_video.id] = get_next_stage(checkpoints[processed_video.id])
+    stage = next(stage for stage in ProcessingStage if stage in next_stages.values())
+    stage_videos = [processed_video for processed_video in processed_videos if next_stages[processed_video.id] == stage]
+    for processed_video in stage_videos:
+        logger.info(
+            "Running stage %s for video %s (audio profile %s, unsilence profile %s). "
+            "Result will be in processed video %s",
+            stage.value,
+            processed_video.original_video_id,
+            processed_video.audio_processing_profile_id,
+            processed_video.unsilence_profile_id,
+            processed_video.id,
+        )
+
+    progress_keys = [processed_video.get_progress_key() for processed_video in stage_videos]
+    start = time.perf_counter()
+    with progress_bus.track(progress_keys, stage.value, STAGE_TITLES[stage]):
+        match stage:
+            case ProcessingStage.AUDIO:
+                results = await run_audio_stage(stage_videos)
+
+            case ProcessingStage.DETECTION:
+                results = await run_detection_stage(stage_videos, checkpoints)
+
+            case ProcessingStage.RENDER:
+                results = await run_render_stage(stage_videos, checkpoints)
+                for processed_video_id, result in results.items():
+                    if isinstance(result, ProcessedVideo):
+                        await delete_checkpoints(processed_video_id)
+
+            case _:
+                raise ValueError(f"Unknown processing stage {stage}")
+
+    _observe_realtime_factor(stage, stage_videos, time.perf_counter() - start)
+    return results
@@ -1,4 +1,4 @@
 from .download import process_video_or_playlist
-from .process_unsilence import process_video
+from .process_unsilence import process_video, process_video_batch_stage, process_video_stage
 from .summarize_lecture import summarize_lecture
 from .upload import upload_to_telegram
@@ -78,16 +78,19 @@ async def process_video_or_playlist(video_or_playlist_for_processing: VideoOrPla
 
     async with get_tg_bot() as bot:
         async for db_video_repr in get_downloaded_videos(bot, video_or_playlist_for_processing):
-            # Проблемы с загрузкой, логируется в get_downloaded_videos
+            # Проблемы с загрузкой (логируется в get_downloaded_videos)
+            # или видео скачивается в другой задаче, которая сама продолжит обработку этого запроса
             if db_video_repr is None:
                 continue
 
-            downloaded_here, db_video = db_video_repr
-
-            await download_observer.publish(
-                VideoDownloadEvent(
-                    video_or_playlist_for_processing=video_or_playlist_for_processing,
-                    downloaded_here=downloaded_here,
-                    db_video=db_video,
-                ),
-            )
+            downloaded_here, db_video, attached_requests = db_video_repr
+
+            # Присоединившиеся к скачиванию запросы обрабатываются так же, как если бы пришли в эту задачу
+            for request in (video_or_playlist_for_processing, *attached_requests):
+                await download_observer.publish(
+                    VideoDownloadEvent(
+                        video_or_playlist_for_processing=request,
+                        downloaded_here=downloaded_here,
+                        db_video=db_video,
+                    ),
+                )
@@ -1,3 +1,4 @@
+import asyncio
 import logging
 from typing import Any
 
@@ -6,12 +7,15 @@ from sqlalchemy import delete, select, update
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import selectinload
 
+from configs import PROCESSING_STAGE_MAX_RETRIES, PROCESSING_STAGE_RETRY_BACKOFF
 from djgram.db.base import get_autocommit_session
 from tools.audio_processing.actions.abstract import ProcessingImpossibleError
 from tools.video_processing.actions.unsilence_actions import SilenceOnlyError
 from tools.yt_dlp_downloader.misc import yt_dlp_get_html_link
 from utils.get_bot import get_tg_bot
+from utils.telegram_broadcast import broadcast_scheduler
 
+from ..distributed_render import DistributedRenderPendingError, set_render_continuation  # noqa: TID252
 from ..models import (  # noqa: TID252
     AudioProcessingProfile,
     ProcessedVideo,
@@ -21,7 +25,9 @@ from ..models import (  # noqa: TID252
     VideoProcessingResourceUsage,
     Waiter,
 )
-from ..processing_file import run_video_pipeline  # noqa: TID252
+from ..models.loading import defer_heavy_columns, load_deferred  # noqa: TID252
+from ..processing_file import delete_checkpoints, run_video_pipeline_stage  # noqa: TID252
+from ..profile_catalogue import profile_catalogue  # noqa: TID252
 from ..schema import VideoOrPlaylistForProcessing  # noqa: TID252
 from .download import VideoDownloadEvent, download_observer
 from .error_texts import get_generic_error_text, get_silence_only_error_text, get_unable_to_process_text
@@ -30,7 +36,7 @@ logger = logging.getLogger(__name__)
 
 
 @download_observer.subscribe(retries=3)
-async def process_unsilence(video_download_event: VideoDownloadEvent) -> None:
+async def process_unsilence(video_download_event: VideoDownloadEvent) -> None:  # noqa: C901
     video_or_playlist_for_processing = video_download_event.video_or_playlist_for_processing
 
     if video_or_playlist_for_processing.unsilence_data is None:
@@ -61,15 +67,19 @@ async def process_unsilence(video_download_event: VideoDownloadEvent) -> None:
                 case ProcessedVideoStatus.PROCESSING:
                     # Не обработано, значит пользователь в очереди на рассылку
                     logger.info("Video %s is processing", processed_video.id)
-                    async with get_tg_bot() as bot:
-                        await bot.send_message(
-                            text=f"Обрабатываю {yt_dlp_get_html_link(processed_video.original_video.yt_dlp_info)}",
-                            chat_id=video_or_playlist_for_processing.telegram_chat_id,
-                            reply_to_message_id=video_or_playlist_for_processing.reply_to_message_id,
-                            disable_notification=True,
-                            disable_web_page_preview=True,
-                            parse_mode=ParseMode.HTML,
-                        )
+                    text = f"Обрабатываю {yt_dlp_get_html_link(processed_video.original_video.yt_dlp_info)}"
+                    chat_id = video_or_playlist_for_processing.telegram_chat_id
+                    if await broadcast_scheduler.should_send_status(chat_id, text):
+                        async with get_tg_bot() as bot:
+                            await broadcast_scheduler.send(
+                                bot.send_message,
+                                chat_id,
+                                text=text,
+                                reply_to_message_id=video_or_playlist_for_processing.reply_to_message_id,
+                                disable_notification=True,
+                                disable_web_page_preview=True,
+                                parse_mode=ParseMode.HTML,
+                            )
 
                 case ProcessedVideoStatus.PROCESSED:
                     db_session.add(
@@ -83,6 +93,8 @@ async def process_unsilence(video_download_event: VideoDownloadEvent) -> None:
                     # Отправляем обработанное видео
                     if processed_video.telegram_file is not None:
                         logger.info("Sending video %s", processed_video.id)
+                        # Для подписи
+                        await load_deferred(db_session, processed_video, "processing_stats")
                         async with get_tg_bot() as bot:
                             await processed_video.send(
                                 bot=bot,
@@ -149,24 +161,15 @@ async def ensure_video_and_profiles_exist(
     db_video_id: str,
     video_or_playlist_for_processing: VideoOrPlaylistForProcessing,
 ) -> None:
-    # noinspection PyTypeChecker
-    stmt = select(AudioProcessingProfile).where(
-        AudioProcessingProfile.id == video_or_playlist_for_processing.unsilence_data.audio_processing_profile_id,
-    )
-    audio_processing_profile: AudioProcessingProfile | None = await db_session.scalar(stmt)
-    if audio_processing_profile is None:
-        audio_processing_profile_id = video_or_playlist_for_processing.unsilence_data.audio_processing_profile_id
+    audio_processing_profile_id = video_or_playlist_for_processing.unsilence_data.audio_processing_profile_id
+    if await profile_catalogue.get(db_session, AudioProcessingProfile, audio_processing_profile_id) is None:
         msg = f"Audio processing profile {audio_processing_profile_id} not found"
         logger.error(msg)
         raise ValueError(msg)
 
-    # noinspection PyTypeChecker
-    stmt = select(UnsilenceProfile).where(
-        UnsilenceProfile.id == video_or_playlist_for_processing.unsilence_data.unsilence_profile_id,
-    )
-    unsilence_profile: UnsilenceProfile | None = await db_session.scalar(stmt)
-    if unsilence_profile is None:
-        msg = f"Unsilence profile {video_or_playlist_for_processing.unsilence_data.unsilence_profile_id} not found"
+    unsilence_profile_id = video_or_playlist_for_processing.unsilence_data.unsilence_profile_id
+    if await profile_catalogue.get(db_session, UnsilenceProfile, unsilence_profile_id) is None:
+        msg = f"Unsilence profile {unsilence_profile_id} not found"
         logger.error(msg)
         raise ValueError(msg)
 
@@ -189,6 +192,7 @@ async def create_processed_video_initial_and_add_waiter(
     # noinspection PyTypeChecker
     stmt = (
         select(ProcessedVideo)
+        .options(*defer_heavy_columns(ProcessedVideo))
         .with_for_update()
         .where(
             ProcessedVideo.original_video_id == db_video_id,
@@ -198,7 +202,7 @@ async def create_processed_video_initial_and_add_waiter(
         )
     )
     if select_with_original_video:
-        stmt = stmt.options(selectinload(ProcessedVideo.original_video))
+        stmt = stmt.options(selectinload(ProcessedVideo.original_video).options(*defer_heavy_columns(Video)))
     processed_video: ProcessedVideo | None = await db_session.scalar(stmt)
 
     if processed_video is not None:
@@ -229,7 +233,8 @@ async def get_video_for_processing(processed_video_id: int, waiter: Waiter) -> P
         # noinspection PyTypeChecker
         processed_video: ProcessedVideo | None = await db_session.scalar(
             select(ProcessedVideo)
-            .options(selectinload(ProcessedVideo.original_video))
+            .options(*defer_heavy_columns(ProcessedVideo))
+            .options(selectinload(ProcessedVideo.original_video).options(*defer_heavy_columns(Video)))
             .options(selectinload(ProcessedVideo.audio_processing_profile))
             .options(selectinload(ProcessedVideo.unsilence_profile))
             .where(ProcessedVideo.id == processed_video_id),
@@ -254,6 +259,8 @@ async def get_video_for_processing(processed_video_id: int, waiter: Waiter) -> P
                 logger.warning("Video %s already processed", processed_video.id)
                 await processed_video.add_if_not_in_waiters(db_session, waiter)
                 if processed_video.telegram_file is not None:
+                    # Для подписи
+                    await load_deferred(db_session, processed_video, "processing_stats")
                     async with get_tg_bot() as bot:
                         await processed_video.send(
                             bot=bot,
@@ -289,24 +296,29 @@ async def get_video_for_processing(processed_video_id: int, waiter: Waiter) -> P
                 return None
 
 
-async def run_video_processing(processed_video: ProcessedVideo, waiter: Waiter) -> None:
-    async with get_tg_bot() as bot:
-        await processed_video.broadcast_text_for_waiters(
-            bot=bot,
-            text=f"Обрабатываю {yt_dlp_get_html_link(processed_video.original_video.yt_dlp_info)}",
-            disable_notification=True,
-        )
-
-    processed_video = await run_video_pipeline(processed_video)
+async def get_video_for_stage(processed_video_id: int) -> ProcessedVideo | None:
     async with get_autocommit_session() as db_session:
-        db_session.add(
-            VideoProcessingResourceUsage(
-                user_id=waiter.user_id,
-                processed_video_id=processed_video.id,
-                real_processed=True,
-            ),
+        # noinspection PyTypeChecker
+        processed_video: ProcessedVideo | None = await db_session.scalar(
+            select(ProcessedVideo)
+            # Колонки оригинала (meta, byte_range_index) нужны для обработки, а свои появятся только после неё
+            .options(*defer_heavy_columns(ProcessedVideo))
+            .options(selectinload(ProcessedVideo.original_video))
+            .options(selectinload(ProcessedVideo.audio_processing_profile))
+            .options(selectinload(ProcessedVideo.unsilence_profile))
+            .where(ProcessedVideo.id == processed_video_id),
         )
 
+    if processed_video is None:
+        logger.error("Processed video %s not found", processed_video_id)
+        return None
+
+    if processed_video.status != ProcessedVideoStatus.PROCESSING:
+        logger.warning("Processed video %s has status %s, skipping stage", processed_video.id, processed_video.status)
+        return None
+
+    return processed_video
+
 
 async def two_step_broadcast_text(processed_video: ProcessedVideo, text: str) -> None:
     async with get_tg_bot() as bot:
@@ -346,6 +358,8 @@ async def mark_processing_impossible(processed_video: ProcessedVideo, exc: Proce
 
 
 async def cleanup_failed_processing(processed_video: ProcessedVideo) -> None:
+    await delete_checkpoints(processed_video.id)
+
     async with get_autocommit_session() as db_session:
         logger.info("Deleting not processed video %s", processed_video.id)
         # noinspection PyTypeChecker
@@ -354,6 +368,36 @@ async def cleanup_failed_processing(processed_video: ProcessedVideo) -> None:
     await two_step_broadcast_text(processed_video, get_generic_error_text(processed_video))
 
 
+async def claim_pending_siblings(processed_video: ProcessedVideo) -> list[ProcessedVideo]:
+    """
+    Забирает в пакет ещё не начатые обработанные видео из того же оригинала с другими профилями
+
+    Их собственные process_video_task увидят статус PROCESSING и ничего не сделают
+    """
+    async with get_autocommit_session() as db_session:
+        # noinspection PyTypeChecker
+        siblings = list(
+            await db_session.scalars(
+                select(ProcessedVideo)
+                .with_for_update(skip_locked=True)
+                .options(*defer_heavy_columns(ProcessedVideo))
+                .options(selectinload(ProcessedVideo.original_video))
+                .options(selectinload(ProcessedVideo.audio_processing_profile))
+                .options(selectinload(ProcessedVideo.unsilence_profile))
+                .where(
+                    ProcessedVideo.original_video_id == processed_video.original_video_id,
+                    ProcessedVideo.id != processed_video.id,
+                    ProcessedVideo.status == ProcessedVideoStatus.TASK_CREATED,
+                ),
+            ),
+        )
+        for sibling in siblings:
+            logger.info("Processing %s in batch with %s", sibling.id, processed_video.id)
+            sibling.status = ProcessedVideoStatus.PROCESSING
+
+    return siblings
+
+
 async def process_video(processed_video_id: int, waiter_dict: dict[str, Any]) -> None:
     """
     Обрабатывает видео, согласно выбранным профилям
@@ -361,6 +405,9 @@ async def process_video(processed_video_id: int, waiter_dict: dict[str, Any]) ->
     При вызове этой функции должно гарантироваться гарантируется, что:
     1) Видео скачано
     2) Функция вызывается в первый раз для данного видео и профиля обработки, если статус TASK_CREATED
+
+    Вместе с видео обрабатываются все ожидающие видео из того же оригинала.
+    Сама обработка идёт по этапам в process_video_batch_stage
     """
 
     waiter = Waiter.model_validate(waiter_dict)
@@ -370,17 +417,153 @@ async def process_video(processed_video_id: int, waiter_dict: dict[str, Any]) ->
     if processed_video is None:
         return
 
+    batch = [processed_video, *await claim_pending_siblings(processed_video)]
+    waiter_dicts = {str(processed_video.id): waiter_dict}
+    for sibling in batch[1:]:
+        if len(sibling.waiters) > 0:
+            waiter_dicts[str(sibling.id)] = sibling.waiters[0].model_dump(mode="json")
+
+    async with get_tg_bot() as bot:
+        for batch_video in batch:
+            await batch_video.broadcast_text_for_waiters(
+                bot=bot,
+                text=f"Обрабатываю {yt_dlp_get_html_link(batch_video.original_video.yt_dlp_info)}",
+                disable_notification=True,
+                status=True,
+                progress_key=batch_video.get_progress_key(),
+            )
+
+    from ..tasks import process_video_batch_stage_task  # noqa: TID252
+
+    process_video_batch_stage_task.delay([batch_video.id for batch_video in batch], waiter_dicts)
+
+
+async def process_video_stage(processed_video_id: int, waiter_dict: dict[str, Any], attempt: int = 0) -> None:
+    """
+    Этап обработки одного видео. Оставлено для задач, поставленных до появления пакетов
+    """
+    await process_video_batch_stage(
+        [processed_video_id],
+        {str(processed_video_id): waiter_dict},
+        {str(processed_video_id): attempt},
+    )
+
+
+def get_stage_retry_countdown(attempt: int) -> float:
+    """
+    Задержка перед повтором упавшего этапа. Растёт экспоненциально с номером попытки
+    """
+    return PROCESSING_STAGE_RETRY_BACKOFF * 2**attempt
+
+
+async def process_video_batch_stage(  # noqa: C901, PLR0912
+    processed_video_ids: list[int],
+    waiter_dicts: dict[str, dict[str, Any]],
+    attempts: dict[str, int] | int | None = None,
+) -> None:
+    """
+    Выполняет следующий этап обработки пакета видео из одного оригинала и ставит в очередь задачу
+    для следующего этапа
+
+    Результат каждого этапа сохраняется, поэтому при ошибке этап повторяется,
+    а не вся обработка начинается заново. Ошибка одного видео не мешает остальным видео пакета.
+
+    attempts -- сколько раз у каждого видео уже упал его текущий этап. Счётчик сбрасывается,
+    только когда видео проходит этап, поэтому один этап не повторяется больше PROCESSING_STAGE_MAX_RETRIES раз.
+    Упавшие видео ставятся в очередь отдельно с задержкой, остальные продолжают сразу
+    """
+    from ..tasks import process_video_batch_stage_task, upload_video_task  # noqa: TID252
+
+    processed_videos = []
+    for processed_video_id in processed_video_ids:
+        processed_video = await get_video_for_stage(processed_video_id)
+        if processed_video is not None:
+            processed_videos.append(processed_video)
+
+    if len(processed_videos) == 0:
+        return
+
+    if not isinstance(attempts, dict):
+        # Задачи, поставленные до появления счётчика для каждого видео
+        attempts = dict.fromkeys((str(processed_video_id) for processed_video_id in processed_video_ids), attempts or 0)
+
     try:
-        await run_video_processing(processed_video, waiter)
+        results = await run_video_pipeline_stage(processed_videos)
+    except Exception as exc:  # noqa: BLE001
+        # Ошибка в общей части этапа, например при скачивании оригинала
+        results = dict.fromkeys((processed_video.id for processed_video in processed_videos), exc)
+
+    continuing_ids = []
+    failed_ids = []
+    for processed_video in processed_videos:
+        result = results.get(processed_video.id)
+        waiter_dict = waiter_dicts.get(str(processed_video.id))
+
+        attempt = attempts.get(str(processed_video.id), 0)
+
+        if isinstance(result, ProcessingImpossibleError):
+            logger.error("Impossible to process video %s", processed_video)
+            await delete_checkpoints(processed_video.id)
+            await mark_processing_impossible(processed_video, result)
+
+        elif isinstance(result, DistributedRenderPendingError):
+            logger.info("Waiting for render workers to finish video %s", processed_video.id)
+            await asyncio.to_thread(
+                set_render_continuation,
+                result.render_key,
+                [
+                    [processed_video.id],
+                    {str(processed_video.id): waiter_dict} if waiter_dict is not None else {},
+                    {str(processed_video.id): attempt},
+                ],
+            )
+            continue
 
-    except ProcessingImpossibleError as exc:
-        logger.error("Impossible to process video %s", processed_video)  # noqa: TRY400
-        await mark_processing_impossible(processed_video, exc)
+        elif isinstance(result, Exception):
+            if attempt < PROCESSING_STAGE_MAX_RETRIES:
+                logger.error(
+                    "Failed to process stage of video %s (attempt %s), retrying: %s",
+                    processed_video.id,
+                    attempt + 1,
+                    result,
+                    exc_info=result,
+                )
+                attempts[str(processed_video.id)] = attempt + 1
+                failed_ids.append(processed_video.id)
+                continue
 
-    except Exception as exc:
-        logger.exception("Failed to process video %s: %s", processed_video.id, exc, exc_info=exc)  # noqa: TRY401
-        await cleanup_failed_processing(processed_video)
+            logger.error("Failed to process video %s: %s", processed_video.id, result, exc_info=result)
+            await cleanup_failed_processing(processed_video)
 
-    from ..tasks import upload_video_task  # noqa: TID252
+        elif isinstance(result, ProcessedVideo):
+            if waiter_dict is not None:
+                async with get_autocommit_session() as db_session:
+                    db_session.add(
+                        VideoProcessingResourceUsage(
+                            user_id=Waiter.model_validate(waiter_dict).user_id,
+                            processed_video_id=result.id,
+                            total_cpu_time=result.processing_stats.cpu_time or 0,
+                            real_processed=True,
+                        ),
+                    )
 
-    upload_video_task.delay(processed_video.id)
+        else:
+            # Этап пройден или видео ещё не дошло до этапа, который выполнялся
+            if processed_video.id in results:
+                attempts.pop(str(processed_video.id), None)
+            continuing_ids.append(processed_video.id)
+            continue
+
+        upload_video_task.delay(processed_video.id)
+
+    if len(continuing_ids) > 0:
+        process_video_batch_stage_task.delay(
+            continuing_ids,
+            waiter_dicts,
+            {str(video_id): attempts[str(video_id)] for video_id in continuing_ids if str(video_id) in attempts},
+        )
+    if len(failed_ids) > 0:
+        process_video_batch_stage_task.apply_async(
+            (failed_ids, waiter_dicts, {str(video_id): attempts[str(video_id)] for video_id in failed_ids}),
+            countdown=get_stage_retry_countdown(max(attempts[str(video_id)] for video_id in failed_ids) - 1),
+        )
@@ -5,21 +5,31 @@ from pathlib import Path
 
 from aiogram.types import BufferedInputFile
 from sqlalchemy import select, update
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.orm import selectinload
 from sqlalchemy_file import File
 
-from djgram.contrib.communication.broadcast import broadcast
+from configs import GPU_ADMISSION_WHISPER_VRAM, WHISPER_COMPUTE_TYPE, WHISPER_MODEL_SIZE
 from djgram.db.base import get_autocommit_session
-from processing.models import LectureSummary, Video, Waiter
+from processing.models import LectureSummary, Transcription, Video, Waiter
 from processing.schema import VideoOrPlaylistForProcessing
 from tools.audio_processing.actions.ffmpeg_actions import ExtractAudioFromVideo
 from tools.yt_dlp_downloader.misc import yt_dlp_get_html_link
 from utils.get_bot import get_tg_bot
+from utils.gpu_admission import gpu_admission_controller
+from utils.metrics import observe_cache
+from utils.progress_events import progress_bus
+from utils.telegram_broadcast import broadcast_scheduler
 
 from ..misc import download_file_from_s3  # noqa: TID252
-from ..models.lecture_summary import LlmStats, SummarizationStats  # noqa: TID252
-from ..summary import transcribe, transcription_to_summary  # noqa: TID252
-from ..summary.lecture_to_summary import extract_latex_from_llm_answer, markdown_parser, render_latex  # noqa: TID252
+from ..models.lecture_summary import SummarizationStats  # noqa: TID252
+from ..summary import summarize_transcription, transcribe  # noqa: TID252
+from ..summary.lecture_to_summary import (  # noqa: TID252
+    extract_latex_from_llm_answer,
+    latex_compile_service,
+    markdown_parser,
+    render_latex_async,
+)
 from .download import VideoDownloadEvent, download_observer
 
 logger = logging.getLogger(__name__)
@@ -94,12 +104,19 @@ async def summarize_lecture(
             )
 
 
-async def process_summarization(  # noqa: PLR0915
-    downloaded_video_id: str,
-    lecture_summary: LectureSummary,
-    video: Video,
-) -> None:
-    global_start = time.perf_counter()
+async def get_cached_transcription(downloaded_video_id: str) -> Transcription | None:
+    async with get_autocommit_session() as db_session:
+        # noinspection PyTypeChecker
+        return await db_session.scalar(
+            select(Transcription).where(
+                Transcription.original_video_id == downloaded_video_id,
+                Transcription.whisper_model_size == WHISPER_MODEL_SIZE,
+                Transcription.whisper_compute_type == WHISPER_COMPUTE_TYPE,
+            ),
+        )
+
+
+async def transcribe_video(downloaded_video_id: str, video: Video) -> Transcription:
     with tempfile.TemporaryDirectory() as tmp_dir:
         temp_dir = Path(tmp_dir)
         logger.info("Downloading video %s to temporary folder fot summarization", downloaded_video_id)
@@ -111,29 +128,71 @@ async def process_summarization(  # noqa: PLR0915
         ExtractAudioFromVideo(to_mono=True, output_config={"ar": 16000}).run(video_file, wav_file)
 
         logger.info("Transcribing")
-        transcription, transcription_stats = transcribe(wav_file)
+        with (
+            gpu_admission_controller.acquire(vram=GPU_ADMISSION_WHISPER_VRAM),
+            progress_bus.track([f"transcription:{downloaded_video_id}"], "transcription", "Расшифровка"),
+        ):
+            text, segments, transcription_stats = transcribe(wav_file)
+
+    async with get_autocommit_session() as db_session:
+        logger.info("Saving transcription of video %s to cache", downloaded_video_id)
+        # Одно и то же видео могут одновременно транскрибировать две задачи.
+        # Тогда сохраняется первая транскрибация, а вторая задача использует её
+        await db_session.execute(
+            insert(Transcription)
+            .values(
+                original_video_id=downloaded_video_id,
+                whisper_model_size=transcription_stats.whisper_model_size,
+                whisper_compute_type=transcription_stats.whisper_compute_type,
+                text=text,
+                segments=[segment.model_dump(mode="json") for segment in segments],
+                stats=transcription_stats,
+            )
+            .on_conflict_do_nothing(constraint="uniq_transcription"),
+        )
+
+    transcription = await get_cached_transcription(downloaded_video_id)
+    if transcription is None:
+        raise RuntimeError(f"Transcription of video {downloaded_video_id} was not saved")
+
+    return transcription
+
+
+async def process_summarization(
+    downloaded_video_id: str,
+    lecture_summary: LectureSummary,
+    video: Video,
+) -> None:
+    global_start = time.perf_counter()
+    # Пока идёт транскрибация, собираем преамбулу latex
+    latex_compile_service.warm_up()
+
+    cached_transcription = await get_cached_transcription(downloaded_video_id)
+    observe_cache("transcription", hit=cached_transcription is not None)
+    if cached_transcription is not None:
+        logger.info("Using cached transcription %s for video %s", cached_transcription.id, downloaded_video_id)
+        transcription_obj = cached_transcription
+    else:
+        transcription_obj = await transcribe_video(downloaded_video_id, video)
+
+    transcription = transcription_obj.text
+    transcription_stats = transcription_obj.stats
 
     logger.info("Asking llm to generate summary")
     title = video.yt_dlp_info.get("title", "")
     description = video.yt_dlp_info.get("description", "")
-    llm_start = time.perf_counter()
-    llm_summary = transcription_to_summary(
+    llm_answer_with_latex, llm_stats = await summarize_transcription(
         title=title,
         description=description,
         transcription=transcription,
+        segments=transcription_obj.get_segments(),
     )
-    llm_end = time.perf_counter()
-    llm_stats = LlmStats(
-        processing_time=llm_end - llm_start,
-        open_ai_response=llm_summary,
-    )
-    llm_answer_with_latex = llm_summary.choices[0].message.content
 
     compile_start = time.perf_counter()
     logger.info("Compiling latex to pdf")
     latex = extract_latex_from_llm_answer(markdown_parser, llm_answer_with_latex)
     try:
-        pdf = render_latex(latex)
+        pdf = await render_latex_async(latex)
     except Exception as exc:
         compile_end = time.perf_counter()
         logger.exception("Failed render pdf: %s", exc, exc_info=exc)  # noqa: TRY401
@@ -157,6 +216,7 @@ async def process_summarization(  # noqa: PLR0915
                 stats=SummarizationStats(
                     processing_time=global_end - global_start,
                     transcription_stats=transcription_stats,
+                    transcription_cached=cached_transcription is not None,
                     llm_stats=llm_stats,
                     compile_time=compile_end - compile_start,
                 ),
@@ -197,10 +257,9 @@ async def process_summarization(  # noqa: PLR0915
                     reply_to_message_id=reply_to_message_id,
                 )
 
-            await broadcast(
-                send_method=send_method,
+            await broadcast_scheduler.broadcast(
+                send_method,
                 chat_ids=chat_ids,
-                count=len(chat_ids),
                 per_chat_kwargs=per_chat_kwargs,
             )
         else:
@@ -4,7 +4,8 @@ from sqlalchemy import select
 from sqlalchemy.orm import selectinload
 
 from djgram.db.base import get_autocommit_session
-from processing.models import ProcessedVideo
+from processing.models import ProcessedVideo, Video
+from processing.models.loading import defer_heavy_columns
 from utils.get_bot import get_tg_bot
 
 logger = logging.getLogger(__name__)
@@ -15,7 +16,11 @@ async def upload_to_telegram(processed_video_id: int) -> None:
         # noinspection PyTypeChecker
         processed_video: ProcessedVideo | None = await db_session.scalar(
             select(ProcessedVideo)
-            .options(selectinload(ProcessedVideo.original_video))
+            # Подписи нужна статистика, а первой загрузке в telegram — метаданные загружаемого файла
+            .options(
+                *defer_heavy_columns(ProcessedVideo, keep=("processing_stats", "meta", "telegram_rendition_meta")),
+            )
+            .options(selectinload(ProcessedVideo.original_video).options(*defer_heavy_columns(Video)))
             .where(ProcessedVideo.id == processed_video_id),
         )
         if processed_video is None:
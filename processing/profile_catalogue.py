@@ -0,0 +1,185 @@
+"""
+Каталог профилей обработки в памяти процесса
+
+Профили меняются только через predefined_profile/load_to_db.py, а читаются на каждой отрисовке диалога
+и в каждой задаче. Поэтому названия, описания и уже провалидированные настройки хранятся в памяти,
+а load_to_db увеличивает версию в redis. Версия проверяется не чаще раза в PROFILE_CATALOGUE_CHECK_INTERVAL,
+и только при её изменении профили заново читаются из базы данных
+"""
+
+import asyncio
+import logging
+import time
+import weakref
+from collections.abc import Callable, Sequence
+from dataclasses import dataclass, field
+
+import lazy_object_proxy
+from redis.asyncio.client import Redis as AsyncRedis
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from configs import (
+    PROFILE_CATALOGUE_CHECK_INTERVAL,
+    PROFILE_CATALOGUE_FORCE_RELOAD_INTERVAL,
+    REDIS_HOST,
+    REDIS_PASSWORD,
+    REDIS_PORT,
+    REDIS_PROFILES_DB,
+    REDIS_USER,
+)
+from tools.audio_processing.pipeline import AudioPipeline
+from tools.video_processing.actions.unsilence_actions import UnsilenceAction
+
+from .models import AudioProcessingProfile, ProfileBase, UnsilenceProfile
+
+logger = logging.getLogger(__name__)
+
+PROFILE_CATALOGUE_VERSION_KEY = "profile_catalogue:version"
+
+#: Поле с настройками обработки для каждой модели профиля
+_SETTINGS_ATTRIBUTES: dict[type[ProfileBase], str] = {
+    AudioProcessingProfile: "audio_pipeline",
+    UnsilenceProfile: "unsilence_action",
+}
+
+
+@dataclass(frozen=True, slots=True)
+class CachedProfile:
+    id: int
+    slug: str
+    name: str
+    description: str
+    #: AudioPipeline для AudioProcessingProfile, UnsilenceAction для UnsilenceProfile
+    settings: AudioPipeline | UnsilenceAction
+
+
+@dataclass
+class _LoopState:
+    redis: AsyncRedis
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+
+
+class ProfileCatalogue:
+    def __init__(  # noqa: D107
+        self,
+        redis_factory: Callable[[], AsyncRedis],
+        check_interval: float = PROFILE_CATALOGUE_CHECK_INTERVAL,
+        force_reload_interval: float = PROFILE_CATALOGUE_FORCE_RELOAD_INTERVAL,
+    ):
+        self.redis_factory = redis_factory
+        self.check_interval = check_interval
+        self.force_reload_interval = force_reload_interval
+
+        self._profiles: dict[type[ProfileBase], tuple[CachedProfile, ...]] | None = None
+        self._version: bytes | None = None
+        self._checked = 0.0
+        self._force_reloaded = float("-inf")
+        # Задачи celery запускают свои event loop, а asyncio.Lock и соединения redis привязываются к первому из них
+        self._loop_states: weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, _LoopState] = (
+            weakref.WeakKeyDictionary()
+        )
+
+    def _get_loop_state(self) -> _LoopState:
+        loop = asyncio.get_running_loop()
+        loop_state = self._loop_states.get(loop)
+        if loop_state is None:
+            loop_state = _LoopState(redis=self.redis_factory())
+            self._loop_states[loop] = loop_state
+        return loop_state
+
+    def get_redis(self) -> AsyncRedis:
+        return self._get_loop_state().redis
+
+    async def _get_version(self) -> bytes | None:
+        try:
+            return await self.get_redis().get(PROFILE_CATALOGUE_VERSION_KEY)
+        except Exception as exc:  # noqa: BLE001
+            logger.warning("Failed to get profile catalogue version: %s", exc)
+            return None
+
+    async def _load(self, db_session: AsyncSession, version: bytes | None) -> None:
+        profiles = {}
+        for model, settings_attribute in _SETTINGS_ATTRIBUTES.items():
+            # noinspection PyTypeChecker
+            rows = await db_session.scalars(select(model).order_by(model.id))
+            profiles[model] = tuple(
+                CachedProfile(
+                    id=row.id,
+                    slug=row.slug,
+                    name=row.name,
+                    description=row.description,
+                    settings=getattr(row, settings_attribute),
+                )
+                for row in rows
+            )
+
+        self._profiles = profiles
+        self._version = version
+        logger.info("Loaded profile catalogue version %s", version)
+
+    async def refresh(self, db_session: AsyncSession, *, force: bool = False) -> None:
+        """
+        Перечитывает профили, если изменилась версия. Если redis недоступен, то перечитывает каждую проверку
+        """
+        now = time.monotonic()
+        if not force and self._profiles is not None and now - self._checked < self.check_interval:
+            return
+
+        async with self._get_loop_state().lock:
+            # Пока ждали блокировку, профили мог перечитать другой запрос
+            if not force and self._profiles is not None and now < self._checked:
+                return
+
+            version = await self._get_version()
+            self._checked = time.monotonic()
+            if force or self._profiles is None or version is None or version != self._version:
+                await self._load(db_session, version)
+
+    async def get_profiles(self, db_session: AsyncSession, model: type[ProfileBase]) -> Sequence[CachedProfile]:
+        await self.refresh(db_session)
+        return self._profiles[model]  # pyright: ignore [reportOptionalSubscript]
+
+    async def get(self, db_session: AsyncSession, model: type[ProfileBase], profile_id: int) -> CachedProfile | None:
+        """
+        Профиль по id. Если его нет, то профили перечитываются: он мог появиться после последней проверки версии.
+        Чтобы запросы несуществующих id не перечитывали каталог каждый раз,
+        между перечитываниями проходит не меньше force_reload_interval
+        """
+        for profile in await self.get_profiles(db_session, model):
+            if profile.id == profile_id:
+                return profile
+
+        now = time.monotonic()
+        if now - self._force_reloaded < self.force_reload_interval:
+            return None
+
+        self._force_reloaded = now
+        await self.refresh(db_session, force=True)
+        return next((profile for profile in self._profiles[model] if profile.id == profile_id), None)  # pyright: ignore [reportOptionalSubscript]
+
+    async def get_by_slug(self, db_session: AsyncSession, model: type[ProfileBase], slug: str) -> CachedProfile | None:
+        return next((profile for profile in await self.get_profiles(db_session, model) if profile.slug == slug), None)
+
+
+async def bump_profile_catalogue_version(redis: AsyncRedis | None = None) -> None:
+    """
+    Сообщает всем процессам, что профили изменились. Вызывается после изменения профилей в базе данных
+    """
+    if redis is None:
+        redis = profile_catalogue.get_redis()
+
+    await redis.incr(PROFILE_CATALOGUE_VERSION_KEY)
+
+
+profile_catalogue: ProfileCatalogue = lazy_object_proxy.Proxy(
+    lambda: ProfileCatalogue(
+        lambda: AsyncRedis(
+            host=REDIS_HOST,
+            port=REDIS_PORT,
+            username=REDIS_USER,
+            password=REDIS_PASSWORD,
+            db=REDIS_PROFILES_DB,
+        ),
+    ),
+)
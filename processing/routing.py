@@ -0,0 +1,103 @@
+"""
+Маршрутизация задач по очередям в зависимости от того, какой ресурс они нагружают
+"""
+
+import logging
+from enum import StrEnum
+from typing import Any, NamedTuple
+
+from configs import (
+    LECTURES_SUMMARIZE_QUEUE,
+    VIDEO_DOWNLOAD_QUEUE,
+    VIDEO_PROCESS_QUEUE,
+    VIDEO_RENDER_QUEUE,
+    VIDEO_UPLOAD_QUEUE,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class ResourceClass(StrEnum):
+    GPU_HEAVY = "gpu_heavy"
+    IO_BOUND = "io_bound"
+
+
+class WorkerSettings(NamedTuple):
+    concurrency: int
+    prefetch_multiplier: int
+
+
+#: Очередь для каждой задачи
+TASK_ROUTES: dict[str, dict[str, str]] = {
+    "processing.tasks.process_video_or_playlist": {"queue": VIDEO_DOWNLOAD_QUEUE},
+    "processing.tasks.recover_attached_downloads_task": {"queue": VIDEO_DOWNLOAD_QUEUE},
+    "processing.tasks.process_video_task": {"queue": VIDEO_PROCESS_QUEUE},
+    "processing.tasks.process_video_stage_task": {"queue": VIDEO_PROCESS_QUEUE},
+    "processing.tasks.process_video_batch_stage_task": {"queue": VIDEO_PROCESS_QUEUE},
+    "processing.tasks.render_interval_group_task": {"queue": VIDEO_RENDER_QUEUE},
+    # Короткие задачи распределённого рендеринга не должны ждать в очереди за группами интервалов
+    "processing.tasks.on_interval_group_rendered_task": {"queue": VIDEO_UPLOAD_QUEUE},
+    "processing.tasks.on_interval_group_failed_task": {"queue": VIDEO_UPLOAD_QUEUE},
+    "processing.tasks.check_distributed_render_task": {"queue": VIDEO_UPLOAD_QUEUE},
+    "processing.tasks.upload_video_task": {"queue": VIDEO_UPLOAD_QUEUE},
+    "processing.tasks.summarize_lecture_task": {"queue": LECTURES_SUMMARIZE_QUEUE},
+}
+
+#: Какой ресурс нагружают задачи из очереди
+QUEUE_RESOURCE_CLASSES: dict[str, ResourceClass] = {
+    VIDEO_DOWNLOAD_QUEUE: ResourceClass.IO_BOUND,
+    # Шумоподавление и рендеринг через nvenc
+    VIDEO_PROCESS_QUEUE: ResourceClass.GPU_HEAVY,
+    # Одна группа интервалов через nvenc. Должна быть отдельной от VIDEO_PROCESS_QUEUE,
+    # иначе рендер ждёт свои же группы, занимая единственный слот воркера
+    VIDEO_RENDER_QUEUE: ResourceClass.GPU_HEAVY,
+    VIDEO_UPLOAD_QUEUE: ResourceClass.IO_BOUND,
+    # whisper
+    LECTURES_SUMMARIZE_QUEUE: ResourceClass.GPU_HEAVY,
+}
+
+# Тяжёлые задачи не должны забирать себе задачи из очереди впрок,
+# иначе они будут ждать на занятом воркере, пока соседний простаивает
+RESOURCE_CLASS_WORKER_SETTINGS: dict[ResourceClass, WorkerSettings] = {
+    # Внутри и так используется многопоточность, а видеокарта одна
+    ResourceClass.GPU_HEAVY: WorkerSettings(concurrency=1, prefetch_multiplier=1),
+    # Воркеры этих очередей запускаются с --pool=prefork, чтобы задачи выполнялись параллельно
+    ResourceClass.IO_BOUND: WorkerSettings(concurrency=8, prefetch_multiplier=4),
+}
+
+
+def get_worker_settings(queues: list[str]) -> WorkerSettings:
+    """
+    Возвращает настройки воркера, слушающего очереди queues
+
+    Если воркер слушает очереди разных классов, то берутся самые строгие настройки
+    """
+    settings = [
+        RESOURCE_CLASS_WORKER_SETTINGS[QUEUE_RESOURCE_CLASSES[queue]]
+        for queue in queues
+        if queue in QUEUE_RESOURCE_CLASSES
+    ]
+    if len(settings) == 0:
+        settings = list(RESOURCE_CLASS_WORKER_SETTINGS.values())
+
+    return WorkerSettings(
+        concurrency=min(setting.concurrency for setting in settings),
+        prefetch_multiplier=min(setting.prefetch_multiplier for setting in settings),
+    )
+
+
+def configure_worker(conf: Any, options: dict[str, Any]) -> None:  # noqa: ANN401
+    """
+    Выставляет concurrency и prefetch воркера по очередям, которые он слушает
+
+    Параметры, явно переданные в командной строке, имеют приоритет
+    """
+    queues = options.get("queues") or []
+    if isinstance(queues, str):
+        queues = queues.split(",")
+
+    settings = get_worker_settings([queue.strip() for queue in queues])
+    logger.info("Worker for queues %s uses %s", queues, settings)
+
+    conf.worker_concurrency = settings.concurrency
+    conf.worker_prefetch_multiplier = settings.prefetch_multiplier
@@ -1,3 +1,3 @@
 from .lecture_to_summary import llm_answer_to_pdf
-from .llm_summarizer import transcription_to_summary
+from .llm_summarizer import summarize_transcription
 from .transcribe import transcribe
@@ -1,15 +1,40 @@
+import asyncio
+import functools
+import hashlib
 import logging
+import re
+import shutil
 import subprocess
 import tempfile
+import threading
+import time
+from collections.abc import Sequence
+from concurrent.futures import Future, ThreadPoolExecutor
 from pathlib import Path
 
+import lazy_object_proxy
 from markdown_it import MarkdownIt
 
-from configs import PDFLATEX_EXECUTABLE, REQUIRED_LATEX_PACKAGES
+from configs import (
+    LATEX_CACHE_FOLDER,
+    LATEX_FORMAT_CACHE_MAX_FILES,
+    LATEX_MAX_CONCURRENT_COMPILATIONS,
+    LATEX_MAX_PASSES,
+    LATEX_PDF_CACHE_MAX_FILES,
+    PDFLATEX_EXECUTABLE,
+    REQUIRED_LATEX_PACKAGES,
+)
+from utils.metrics import observe_cache
 
 logger = logging.getLogger(__name__)
 markdown_parser = MarkdownIt("commonmark")
 
+_DEFAULT_DOCUMENTCLASS = r"\documentclass{article}"
+_DEFAULT_PREAMBLE = f"{_DEFAULT_DOCUMENTCLASS}\n" + "\n".join(REQUIRED_LATEX_PACKAGES) + "\n"
+# Файлы, которые pdflatex пишет на одном проходе и читает на следующем
+_RERUN_IF_CHANGED_SUFFIXES = (".toc", ".out", ".lof", ".lot")
+_RERUN_REGEX = re.compile(r"Rerun to get|Label\(s\) may have changed")
+
 
 def _add_required_latex_packages(latex: str) -> str:
     _for_add = [pkg for pkg in REQUIRED_LATEX_PACKAGES if pkg not in latex]
@@ -45,9 +70,17 @@ def extract_latex_from_llm_answer(parser: MarkdownIt, llm_answer: str) -> str |
     return llm_answer
 
 
-def _run_pdflatex(out_dir: Path, temp_latex: Path, out_pdf: Path, executable: str = "pdflatex") -> None:
+def _run_pdflatex(  # noqa: PLR0913
+    out_dir: Path,
+    temp_latex: Path,
+    out_pdf: Path,
+    executable: str = "pdflatex",
+    extra_args: Sequence[str] = (),
+    cwd: Path | None = None,
+) -> None:
     command = [
         executable,
+        *extra_args,
         "-halt-on-error",
         "-interaction=nonstopmode",
         "-synctex=1",
@@ -61,6 +94,7 @@ def _run_pdflatex(out_dir: Path, temp_latex: Path, out_pdf: Path, executable: st
         stdin=subprocess.PIPE,
         stdout=subprocess.PIPE,
         stderr=subprocess.PIPE,
+        cwd=cwd,
         # universal_newlines=True,  # noqa: ERA001
     )
     buffer = []
@@ -75,25 +109,281 @@ def _run_pdflatex(out_dir: Path, temp_latex: Path, out_pdf: Path, executable: st
         raise RuntimeError(f"Failed to render pdf: {'\n'.join(map(str, buffer))}")
 
 
+def _hash(*parts: str) -> str:
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def _split_preamble(latex: str) -> str | None:
+    idx = latex.find(r"\begin{document}")
+    if idx == -1:
+        return None
+
+    return latex[:idx]
+
+
+def _rewrite_for_default_format(latex: str) -> str | None:
+    r"""
+    Переносит стандартную преамбулу в начало документа и отделяет её \endofdump
+
+    Так документ компилируется с format файлом стандартной преамбулы: mylatexformat пропускает всё до
+    \endofdump, а остальные пакеты из преамбулы документа загружаются как обычно.
+    Возвращает None, если документ не начинается со стандартного \documentclass или в нём нет
+    какого-то из REQUIRED_LATEX_PACKAGES
+    """
+    preamble = _split_preamble(latex)
+    if preamble is None:
+        return None
+
+    lines = preamble.splitlines()
+    documentclass_lines = [line.strip() for line in lines if line.lstrip().startswith(r"\documentclass")]
+    if documentclass_lines != [_DEFAULT_DOCUMENTCLASS]:
+        return None
+
+    stripped_lines = {line.strip() for line in lines}
+    if any(package not in stripped_lines for package in REQUIRED_LATEX_PACKAGES):
+        return None
+
+    default_lines = {_DEFAULT_DOCUMENTCLASS, *REQUIRED_LATEX_PACKAGES}
+    extra_lines = [line for line in lines if line.strip() not in default_lines]
+    return f"{_DEFAULT_PREAMBLE}\\endofdump\n" + "\n".join(extra_lines) + "\n" + latex[len(preamble) :]
+
+
+def _read_auxiliary_files(out_dir: Path, temp_name: str) -> dict[str, bytes]:
+    result = {}
+    for suffix in _RERUN_IF_CHANGED_SUFFIXES:
+        file = out_dir / f"{temp_name}{suffix}"
+        if file.exists():
+            result[suffix] = file.read_bytes()
+
+    return result
+
+
+def _need_rerun(out_dir: Path, temp_name: str, aux_before: dict[str, bytes], aux_after: dict[str, bytes]) -> bool:
+    """
+    Нужен ли ещё один проход pdflatex
+
+    Ещё один проход нужен, если latex сам об этом попросил или изменились файлы,
+    которые читаются на следующем проходе (оглавление, закладки, метки).
+    """
+    log_file = out_dir / f"{temp_name}.log"
+    if log_file.exists() and _RERUN_REGEX.search(log_file.read_text(encoding="utf-8", errors="ignore")):
+        return True
+
+    for suffix in _RERUN_IF_CHANGED_SUFFIXES:
+        if aux_after.get(suffix, b"").strip() != aux_before.get(suffix, b"").strip():
+            return True
+
+    return False
+
+
+def _prune_folder(folder: Path, pattern: str, max_files: int) -> None:
+    files = sorted(folder.glob(pattern), key=lambda file: file.stat().st_mtime, reverse=True)
+    for file in files[max_files:]:
+        logger.debug("Removing %s from latex cache", file)
+        file.unlink(missing_ok=True)
+
+
+class LatexCompileService:
+    """
+    Компилирует latex в pdf
+
+    * Стандартная преамбула (REQUIRED_LATEX_PACKAGES) прекомпилируется в format файл (mylatexformat),
+      и все документы, которые её содержат, компилируются с ним, поэтому эти пакеты не загружаются заново.
+      Остальные документы и документы, которые не скомпилировались с format файлом, компилируются как обычно.
+    * Второй проход запускается, только если изменились ссылки или оглавление.
+    * Одновременно выполняется не более max_workers компиляций.
+    * Готовые pdf кешируются на диске по хешу latex кода.
+    """
+
+    def __init__(  # noqa: D107
+        self,
+        cache_folder: Path = LATEX_CACHE_FOLDER,
+        max_workers: int = LATEX_MAX_CONCURRENT_COMPILATIONS,
+        pdflatex_executable: str = PDFLATEX_EXECUTABLE,
+        max_passes: int = LATEX_MAX_PASSES,
+    ):
+        self.pdflatex_executable = pdflatex_executable
+        self.max_passes = max_passes
+
+        self.formats_folder = cache_folder / "formats"
+        self.pdf_folder = cache_folder / "pdf"
+        self.formats_folder.mkdir(parents=True, exist_ok=True)
+        self.pdf_folder.mkdir(parents=True, exist_ok=True)
+
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="latex")
+        # Разные format файлы собираются параллельно, а один и тот же - только один раз
+        self._format_locks: dict[str, threading.Lock] = {}
+        self._format_locks_lock = threading.Lock()
+
+    def warm_up(self) -> Future[Path | None]:
+        """
+        Прекомпилирует преамбулу со стандартными пакетами в фоне
+        """
+        return self._executor.submit(self.get_format, _DEFAULT_PREAMBLE)
+
+    def _build_format(self, preamble: str, fmt_name: str) -> Path | None:
+        with tempfile.TemporaryDirectory() as _tmpdir:
+            temp_dir = Path(_tmpdir)
+            temp_latex = temp_dir / f"{fmt_name}.tex"
+            temp_latex.write_text(f"{preamble}\\begin{{document}}\n\\end{{document}}\n", encoding="utf-8")
+
+            command = [
+                self.pdflatex_executable,
+                "-ini",
+                "-halt-on-error",
+                "-interaction=nonstopmode",
+                f"-jobname={fmt_name}",
+                "&pdflatex",
+                "mylatexformat.ltx",
+                temp_latex.name,
+            ]
+            process = subprocess.run(  # noqa: S603 # nosec: B603, B607
+                command,
+                cwd=temp_dir,
+                capture_output=True,
+                check=False,
+            )
+            fmt_file = temp_dir / f"{fmt_name}.fmt"
+            if process.returncode != 0 or not fmt_file.exists():
+                logger.warning("Failed to build latex format %s: %s", fmt_name, process.stdout.decode(errors="ignore"))
+                return None
+
+            # Папка с кешем может быть на другом диске, поэтому сначала копируем рядом, а потом атомарно переименовываем
+            result = self.formats_folder / fmt_file.name
+            temp_result = result.with_name(f"{result.name}.{threading.get_ident()}.tmp")
+            shutil.copyfile(fmt_file, temp_result)
+            temp_result.replace(result)
+
+        _prune_folder(self.formats_folder, "*.fmt", LATEX_FORMAT_CACHE_MAX_FILES)
+        return result
+
+    def get_format(self, preamble: str) -> Path | None:
+        """
+        Возвращает format файл для преамбулы, при необходимости собирая его
+
+        Если собрать не получилось, то возвращает None, и компиляция идёт без format файла
+        """
+        fmt_name = f"preamble_{_hash(self.pdflatex_executable, preamble)[:16]}"
+        fmt_file = self.formats_folder / f"{fmt_name}.fmt"
+        failed_marker = self.formats_folder / f"{fmt_name}.failed"
+
+        with self._format_locks_lock:
+            format_lock = self._format_locks.setdefault(fmt_name, threading.Lock())
+
+        with format_lock:
+            if fmt_file.exists():
+                fmt_file.touch()
+                return fmt_file
+
+            if failed_marker.exists():
+                return None
+
+            logger.info("Building latex format %s", fmt_name)
+            start = time.perf_counter()
+            result = self._build_format(preamble, fmt_name)
+            if result is None:
+                failed_marker.touch()
+                _prune_folder(self.formats_folder, "*.failed", LATEX_FORMAT_CACHE_MAX_FILES)
+            else:
+                logger.info("Latex format %s built in %.2f s", fmt_name, time.perf_counter() - start)
+
+            return result
+
+    def _compile(self, latex: str) -> bytes:
+        document = _rewrite_for_default_format(latex)
+        fmt_file = self.get_format(_DEFAULT_PREAMBLE) if document is not None else None
+        if fmt_file is None:
+            observe_cache("latex_format", hit=False)
+            return self._compile_document(latex)
+
+        observe_cache("latex_format", hit=True)
+        try:
+            return self._compile_document(document, fmt_file)
+        except RuntimeError as exc:
+            logger.warning("Failed to compile latex with format %s, compiling without it: %s", fmt_file.name, exc)
+            return self._compile_document(latex)
+
+    def _compile_document(self, latex: str, fmt_file: Path | None = None) -> bytes:
+        temp_name = "temp"
+        with tempfile.TemporaryDirectory() as _tmpdir:
+            temp_dir = Path(_tmpdir)
+            temp_latex = temp_dir / f"{temp_name}.tex"
+            with temp_latex.open("wb") as f:
+                f.write(latex.encode("utf-8"))
+
+            out_dir = temp_dir / "out"
+            out_dir.mkdir(exist_ok=True)
+            out_pdf = out_dir / f"{temp_name}.pdf"
+
+            extra_args = []
+            if fmt_file is not None:
+                # pdflatex ищет format файлы в текущей папке
+                shutil.copyfile(fmt_file, temp_dir / fmt_file.name)
+                extra_args.append(f"-fmt={fmt_file.stem}")
+
+            aux_before: dict[str, bytes] = {}
+            for pass_number in range(1, self.max_passes + 1):
+                logger.info("Compiling latex: %s pass", pass_number)
+                _run_pdflatex(out_dir, temp_latex, out_pdf, self.pdflatex_executable, extra_args, temp_dir)
+
+                aux_after = _read_auxiliary_files(out_dir, temp_name)
+                if not _need_rerun(out_dir, temp_name, aux_before, aux_after):
+                    break
+                aux_before = aux_after
+
+            with out_pdf.open("rb") as f:
+                return f.read()
+
+    def _render(self, latex: str) -> bytes:
+        latex_hash = _hash(self.pdflatex_executable, latex)
+        cached_pdf = self.pdf_folder / f"{latex_hash}.pdf"
+        if cached_pdf.exists():
+            logger.info("Using cached pdf %s", latex_hash)
+            observe_cache("latex_pdf", hit=True)
+            cached_pdf.touch()
+            return cached_pdf.read_bytes()
+
+        observe_cache("latex_pdf", hit=False)
+        pdf = self._compile(latex)
+
+        temp_pdf = cached_pdf.with_name(f"{cached_pdf.name}.{threading.get_ident()}.tmp")
+        temp_pdf.write_bytes(pdf)
+        temp_pdf.replace(cached_pdf)
+        _prune_folder(self.pdf_folder, "*.pdf", LATEX_PDF_CACHE_MAX_FILES)
+
+        return pdf
+
+    def render(self, latex: str) -> bytes:
+        return self._executor.submit(self._render, latex).result()
+
+    async def render_async(self, latex: str) -> bytes:
+        return await asyncio.wrap_future(self._executor.submit(self._render, latex))
+
+
+latex_compile_service: LatexCompileService = lazy_object_proxy.Proxy(LatexCompileService)
+
+
+@functools.cache
+def get_latex_compile_service(pdflatex_executable: str) -> LatexCompileService:
+    """
+    Сервис для pdflatex_executable, один на процесс, чтобы не плодить пулы потоков
+    """
+    if pdflatex_executable == latex_compile_service.pdflatex_executable:
+        return latex_compile_service
+
+    return LatexCompileService(pdflatex_executable=pdflatex_executable)
+
+
 def render_latex(latex: str, pdflatex_executable: str = PDFLATEX_EXECUTABLE) -> bytes:
-    temp_name = "temp"
-    with tempfile.TemporaryDirectory() as _tmpdir:
-        temp_dir = Path(_tmpdir)
-        temp_latex = temp_dir / f"{temp_name}.tex"
-        with temp_latex.open("wb") as f:
-            f.write(latex.encode("utf-8"))
-
-        out_dir = temp_dir / "out"
-        out_dir.mkdir(exist_ok=True)
-        out_pdf = out_dir / f"{temp_name}.pdf"
-
-        logger.info("Compiling latex: 1 pass")
-        _run_pdflatex(out_dir, temp_latex, out_pdf, pdflatex_executable)
-        logger.info("Compiling latex: 2 pass")
-        _run_pdflatex(out_dir, temp_latex, out_pdf, pdflatex_executable)
-
-        with out_pdf.open("rb") as f:
-            return f.read()
+    return get_latex_compile_service(pdflatex_executable).render(latex)
+
+
+async def render_latex_async(latex: str) -> bytes:
+    return await latex_compile_service.render_async(latex)
 
 
 def llm_answer_to_pdf(llm_answer: str, pdflatex_executable: str = PDFLATEX_EXECUTABLE) -> tuple[str, bytes]:
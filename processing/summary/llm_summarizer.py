@@ -1,14 +1,49 @@
+import asyncio
+import logging
+import math
+import time
+from typing import NamedTuple
+
 import httpx
-from openai import OpenAI
+from openai import AsyncOpenAI
 from openai.types.chat import ChatCompletion
 
-from configs import OPENAI_API_KEY, OPENAI_BASE_URL, OPENAI_MODEL, OPENAI_PROXY_URL
-
-client = OpenAI(
-    api_key=OPENAI_API_KEY,
-    base_url=OPENAI_BASE_URL,
-    http_client=httpx.Client(proxy=OPENAI_PROXY_URL or None),
+from configs import (
+    OPENAI_API_KEY,
+    OPENAI_BASE_URL,
+    OPENAI_CHARS_PER_TOKEN,
+    OPENAI_CHUNK_MAX_TOKENS,
+    OPENAI_MAX_CONCURRENT_REQUESTS,
+    OPENAI_MODEL,
+    OPENAI_PROXY_URL,
+    OPENAI_SINGLE_REQUEST_MAX_TOKENS,
 )
+from processing.models.lecture_summary import LlmChunkStats, LlmStats, TranscriptionSegment
+
+logger = logging.getLogger(__name__)
+
+
+class PartialSummary(NamedTuple):
+    """
+    Конспект непрерывного участка транскрипции
+    """
+
+    text: str
+    transcription_start: float
+    transcription_end: float
+
+
+def create_llm_client() -> AsyncOpenAI:
+    """
+    Новый клиент openai. Задачи celery выполняются каждая в своём event loop, а соединения httpx
+    привязаны к loop, в котором открыты, поэтому клиент создаётся на каждое конспектирование
+    """
+    return AsyncOpenAI(
+        api_key=OPENAI_API_KEY,
+        base_url=OPENAI_BASE_URL,
+        http_client=httpx.AsyncClient(proxy=OPENAI_PROXY_URL or None),
+    )
+
 
 prompt_template = r"""Представь себя профессиональным составителем конспектов.
 Сейчас тебе будет передана транскрипция лекции.
@@ -29,15 +64,319 @@ prompt_template = r"""Представь себя профессиональны
 {transcription}
 </transcription>"""
 
+map_prompt_template = r"""Представь себя профессиональным составителем конспектов.
+Сейчас тебе будет передана часть {chunk}/{total_chunks} транскрипции лекции.
+Она была сделана с помощью от нейросетевой модели whisper large v3 в теге <transcription></transcription>.
+В самой транскрипции могут быть небольшие неточности (не правильно распознанные слова), постарайся их исправить.
+Название лекции название будет передано в теге <title></title>.
+Описание лекции будет передано в теге <description></description>. В описании может быть не очень много информации.
+ТВОЯ ЗАДАЧУ БУДЕТ СОСТАВИТЬ НА ОСНОВЕ ЭТОЙ ЧАСТИ ТРАНСКРИБАЦИИ ПОДРОБНЫЙ КОНСПЕКТ В ВИДЕ ФРАГМЕНТА LATEX.
+НЕ ПИШИ ПРЕАМБУЛУ, \documentclass И \begin{{document}}, ТОЛЬКО СОДЕРЖИМОЕ.
+СТАРАЙСЯ СОХРАНИТЬ ВСЕ ДЕТАЛИ И ПЕРЕДАТЬ ВСЕ МЫСЛИ ЛЕКТОРА.
+
+<title>
+{title}
+</title>
+<description>
+{description}
+</description>
+<transcription>
+{transcription}
+</transcription>"""
+
+reduce_prompt_template = r"""Представь себя профессиональным составителем конспектов.
+Сейчас тебе будут переданы конспекты последовательных частей одной лекции в тегах <part></part>.
+Название лекции название будет передано в теге <title></title>.
+Описание лекции будет передано в теге <description></description>. В описании может быть не очень много информации.
+ТВОЯ ЗАДАЧУ БУДЕТ ОБЪЕДИНИТЬ ИХ В ОДИН ПОДРОБНЫЙ КОНСПЕКТ LATEX.
+Убери повторы на стыках частей и выстрой единую структуру разделов.
+СТАРАЙСЯ СОХРАНИТЬ ВСЕ ДЕТАЛИ И ПЕРЕДАТЬ ВСЕ МЫСЛИ ЛЕКТОРА.
+
+<title>
+{title}
+</title>
+<description>
+{description}
+</description>
+{parts}"""
+
+intermediate_reduce_prompt_template = r"""Представь себя профессиональным составителем конспектов.
+Сейчас тебе будут переданы конспекты последовательных частей одного фрагмента лекции в тегах <part></part>.
+Название лекции название будет передано в теге <title></title>.
+Описание лекции будет передано в теге <description></description>. В описании может быть не очень много информации.
+ТВОЯ ЗАДАЧУ БУДЕТ ОБЪЕДИНИТЬ ИХ В ОДИН ПОДРОБНЫЙ КОНСПЕКТ В ВИДЕ ФРАГМЕНТА LATEX.
+НЕ ПИШИ ПРЕАМБУЛУ, \documentclass И \begin{{document}}, ТОЛЬКО СОДЕРЖИМОЕ.
+Убери повторы на стыках частей.
+СТАРАЙСЯ СОХРАНИТЬ ВСЕ ДЕТАЛИ И ПЕРЕДАТЬ ВСЕ МЫСЛИ ЛЕКТОРА.
+
+<title>
+{title}
+</title>
+<description>
+{description}
+</description>
+{parts}"""
+
+
+def estimate_tokens(text: str, chars_per_token: float = OPENAI_CHARS_PER_TOKEN) -> int:
+    """
+    Грубо оценивает число токенов в тексте
+    """
+    return math.ceil(len(text) / chars_per_token)
+
 
-def transcription_to_summary(title: str, description: str, transcription: str) -> ChatCompletion:
-    prompt = prompt_template.format(
+def split_segments_to_chunks(
+    segments: list[TranscriptionSegment],
+    max_tokens: int = OPENAI_CHUNK_MAX_TOKENS,
+    chars_per_token: float = OPENAI_CHARS_PER_TOKEN,
+) -> list[list[TranscriptionSegment]]:
+    """
+    Разбивает транскрипцию на части по границам сегментов так, чтобы каждая часть влезала в max_tokens
+
+    Сегмент, который сам по себе длиннее max_tokens, попадает в отдельную часть.
+    """
+    chunks: list[list[TranscriptionSegment]] = []
+    current_chunk: list[TranscriptionSegment] = []
+    current_tokens = 0
+
+    for segment in segments:
+        segment_tokens = estimate_tokens(segment.text, chars_per_token)
+
+        if len(current_chunk) > 0 and current_tokens + segment_tokens > max_tokens:
+            chunks.append(current_chunk)
+            current_chunk = []
+            current_tokens = 0
+
+        current_chunk.append(segment)
+        current_tokens += segment_tokens
+
+    if len(current_chunk) > 0:
+        chunks.append(current_chunk)
+
+    return chunks
+
+
+def group_parts_for_reduce(
+    parts: list[PartialSummary],
+    max_tokens: int = OPENAI_SINGLE_REQUEST_MAX_TOKENS,
+    chars_per_token: float = OPENAI_CHARS_PER_TOKEN,
+) -> list[list[PartialSummary]]:
+    """
+    Разбивает последовательные частичные конспекты на группы, которые объединяются одним запросом
+
+    В группе не меньше двух конспектов, даже если вместе они длиннее max_tokens,
+    иначе объединение может не сократить число конспектов. Последняя группа может состоять из одного.
+    """
+    groups: list[list[PartialSummary]] = []
+    current_group: list[PartialSummary] = []
+    current_tokens = 0
+
+    for part in parts:
+        part_tokens = estimate_tokens(part.text, chars_per_token)
+
+        if len(current_group) > 1 and current_tokens + part_tokens > max_tokens:
+            groups.append(current_group)
+            current_group = []
+            current_tokens = 0
+
+        current_group.append(part)
+        current_tokens += part_tokens
+
+    if len(current_group) > 0:
+        groups.append(current_group)
+
+    return groups
+
+
+async def _ask_llm(llm_client: AsyncOpenAI, prompt: str, model: str) -> ChatCompletion:
+    return await llm_client.chat.completions.create(
+        model=model,
+        messages=[{"role": "user", "content": prompt}],
+    )
+
+
+async def _summarize_chunk(  # noqa: PLR0913
+    llm_client: AsyncOpenAI,
+    semaphore: asyncio.Semaphore,
+    model: str,
+    title: str,
+    description: str,
+    chunk: list[TranscriptionSegment],
+    chunk_idx: int,
+    total_chunks: int,
+) -> tuple[PartialSummary, LlmChunkStats]:
+    prompt = map_prompt_template.format(
+        chunk=chunk_idx,
+        total_chunks=total_chunks,
         title=title,
         description=description,
-        transcription=transcription,
+        transcription="\n".join(segment.text for segment in chunk),
     )
 
-    return client.chat.completions.create(
-        model=OPENAI_MODEL,
-        messages=[{"role": "user", "content": prompt}],
+    async with semaphore:
+        logger.info("Summarizing chunk %s/%s", chunk_idx, total_chunks)
+        start = time.perf_counter()
+        response = await _ask_llm(llm_client, prompt, model)
+        end = time.perf_counter()
+
+    partial_summary = PartialSummary(response.choices[0].message.content, chunk[0].start, chunk[-1].end)
+    return partial_summary, _get_chunk_stats(response, chunk_idx, end - start, partial_summary)
+
+
+async def _reduce_group(  # noqa: PLR0913
+    llm_client: AsyncOpenAI,
+    semaphore: asyncio.Semaphore,
+    model: str,
+    title: str,
+    description: str,
+    group: list[PartialSummary],
+    group_idx: int,
+) -> tuple[PartialSummary, LlmChunkStats | None]:
+    if len(group) == 1:
+        return group[0], None
+
+    prompt = intermediate_reduce_prompt_template.format(
+        title=title,
+        description=description,
+        parts=_format_parts(group),
+    )
+
+    async with semaphore:
+        logger.info("Merging group %s of %s partial summaries", group_idx, len(group))
+        start = time.perf_counter()
+        response = await _ask_llm(llm_client, prompt, model)
+        end = time.perf_counter()
+
+    partial_summary = PartialSummary(
+        response.choices[0].message.content,
+        group[0].transcription_start,
+        group[-1].transcription_end,
+    )
+    return partial_summary, _get_chunk_stats(response, group_idx, end - start, partial_summary)
+
+
+def _get_chunk_stats(
+    response: ChatCompletion,
+    chunk_idx: int,
+    processing_time: float,
+    partial_summary: PartialSummary,
+) -> LlmChunkStats:
+    usage = response.usage
+    return LlmChunkStats(
+        chunk=chunk_idx,
+        processing_time=processing_time,
+        transcription_start=partial_summary.transcription_start,
+        transcription_end=partial_summary.transcription_end,
+        prompt_tokens=usage.prompt_tokens if usage is not None else None,
+        completion_tokens=usage.completion_tokens if usage is not None else None,
+    )
+
+
+def _format_parts(parts: list[PartialSummary]) -> str:
+    return "\n".join(f"<part>\n{part.text}\n</part>" for part in parts)
+
+
+async def transcription_to_summary_map_reduce(  # noqa: PLR0913
+    title: str,
+    description: str,
+    segments: list[TranscriptionSegment],
+    *,
+    llm_client: AsyncOpenAI,
+    model: str = OPENAI_MODEL,
+    max_chunk_tokens: int = OPENAI_CHUNK_MAX_TOKENS,
+    max_concurrent_requests: int = OPENAI_MAX_CONCURRENT_REQUESTS,
+    max_reduce_tokens: int = OPENAI_SINGLE_REQUEST_MAX_TOKENS,
+) -> tuple[str, LlmStats]:
+    """
+    Конспектирует длинную транскрипцию по частям
+
+    Части конспектируются параллельно (не более max_concurrent_requests запросов одновременно).
+    Затем частичные конспекты объединяются группами не длиннее max_reduce_tokens, пока не останется
+    одна группа, и она отдельным запросом объединяется в итоговый latex.
+    """
+    start = time.perf_counter()
+    chunks = split_segments_to_chunks(segments, max_chunk_tokens)
+    logger.info("Transcription split into %s chunks", len(chunks))
+
+    semaphore = asyncio.Semaphore(max_concurrent_requests)
+    results = await asyncio.gather(
+        *(
+            _summarize_chunk(
+                llm_client=llm_client,
+                semaphore=semaphore,
+                model=model,
+                title=title,
+                description=description,
+                chunk=chunk,
+                chunk_idx=idx,
+                total_chunks=len(chunks),
+            )
+            for idx, chunk in enumerate(chunks, start=1)
+        ),
+    )
+
+    parts = [partial_summary for partial_summary, _ in results]
+    reduce_chunks: list[LlmChunkStats] = []
+    groups = group_parts_for_reduce(parts, max_reduce_tokens)
+    while len(groups) > 1:
+        logger.info("Merging %s partial summaries in %s groups", len(parts), len(groups))
+        reduce_results = await asyncio.gather(
+            *(
+                _reduce_group(
+                    llm_client=llm_client,
+                    semaphore=semaphore,
+                    model=model,
+                    title=title,
+                    description=description,
+                    group=group,
+                    group_idx=idx,
+                )
+                for idx, group in enumerate(groups, start=1)
+            ),
+        )
+        parts = [partial_summary for partial_summary, _ in reduce_results]
+        reduce_chunks.extend(chunk_stats for _, chunk_stats in reduce_results if chunk_stats is not None)
+        groups = group_parts_for_reduce(parts, max_reduce_tokens)
+
+    logger.info("Merging %s partial summaries", len(parts))
+    reduce_response = await _ask_llm(
+        llm_client,
+        reduce_prompt_template.format(title=title, description=description, parts=_format_parts(parts)),
+        model,
     )
+    end = time.perf_counter()
+
+    return reduce_response.choices[0].message.content, LlmStats(
+        processing_time=end - start,
+        open_ai_response=reduce_response,
+        chunks=[chunk_stats for _, chunk_stats in results],
+        reduce_chunks=reduce_chunks,
+    )
+
+
+async def summarize_transcription(
+    title: str,
+    description: str,
+    transcription: str,
+    segments: list[TranscriptionSegment],
+) -> tuple[str, LlmStats]:
+    """
+    Возвращает ответ llm с конспектом и статистику
+
+    Короткие транскрипции отправляются одним запросом, длинные конспектируются по частям
+    """
+    async with create_llm_client() as llm_client:
+        if estimate_tokens(transcription) <= OPENAI_SINGLE_REQUEST_MAX_TOKENS or len(segments) == 0:
+            start = time.perf_counter()
+            response = await _ask_llm(
+                llm_client,
+                prompt_template.format(title=title, description=description, transcription=transcription),
+                OPENAI_MODEL,
+            )
+            end = time.perf_counter()
+            return response.choices[0].message.content, LlmStats(
+                processing_time=end - start,
+                open_ai_response=response,
+            )
+
+        return await transcription_to_summary_map_reduce(title, description, segments, llm_client=llm_client)
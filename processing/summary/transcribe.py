@@ -15,7 +15,7 @@ from configs import (
     WHISPER_MIN_SILENCE_DURATION_MS,
     WHISPER_MODEL_SIZE,
 )
-from processing.models.lecture_summary import TranscriptionStats
+from processing.models.lecture_summary import TranscriptionSegment, TranscriptionStats
 from utils.torch_utils import is_cuda
 
 whisper_model: WhisperModel = lazy_object_proxy.Proxy(
@@ -30,7 +30,7 @@ whisper_model: WhisperModel = lazy_object_proxy.Proxy(
 )
 
 
-def transcribe(audio_file: Path) -> tuple[str, TranscriptionStats]:
+def transcribe(audio_file: Path) -> tuple[str, list[TranscriptionSegment], TranscriptionStats]:
     try:
         start = time.perf_counter()
         segments, info = whisper_model.transcribe(
@@ -44,9 +44,13 @@ def transcribe(audio_file: Path) -> tuple[str, TranscriptionStats]:
         pbar = tqdm(total=info.duration, desc="Transcribing")
 
         texts = []
+        transcription_segments = []
         for segment in segments:
             pbar.update(segment.end - pbar.n)
             texts.append(segment.text)
+            transcription_segments.append(
+                TranscriptionSegment(start=segment.start, end=segment.end, text=segment.text),
+            )
 
         if pbar.n < info.duration:
             pbar.update(info.duration - pbar.n)
@@ -55,14 +59,18 @@ def transcribe(audio_file: Path) -> tuple[str, TranscriptionStats]:
         end = time.perf_counter()
 
         # noinspection PyProtectedMember
-        return joined_texts, TranscriptionStats(
-            processing_time=end - start,
-            whisper_model_size=WHISPER_MODEL_SIZE,
-            whisper_compute_type=WHISPER_COMPUTE_TYPE,
-            # Convert NamedTuple to dict
-            # https://stackoverflow.com/questions/26180528/convert-a-namedtuple-into-a-dictionary
-            # https://stackforgeeks.com/blog/convert-a-namedtuple-into-a-dictionary
-            transcription_info=asdict(info),
+        return (
+            joined_texts,
+            transcription_segments,
+            TranscriptionStats(
+                processing_time=end - start,
+                whisper_model_size=WHISPER_MODEL_SIZE,
+                whisper_compute_type=WHISPER_COMPUTE_TYPE,
+                # Convert NamedTuple to dict
+                # https://stackoverflow.com/questions/26180528/convert-a-namedtuple-into-a-dictionary
+                # https://stackforgeeks.com/blog/convert-a-namedtuple-into-a-dictionary
+                transcription_info=asdict(info),
+            ),
         )
     finally:
         if is_cuda(TORCH_DEVICE):
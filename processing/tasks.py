@@ -2,7 +2,6 @@ import sys
 from pathlib import Path
 from typing import TYPE_CHECKING, Any
 
-from configs import VIDEO_DOWNLOAD_QUEUE, VIDEO_PROCESS_QUEUE, VIDEO_UPLOAD_QUEUE
 from djgram.utils.async_tools import run_async_in_sync
 from processing.celery_app import app
 
@@ -10,6 +9,8 @@ from .schema import VideoOrPlaylistForProcessing
 
 sys.path.append(str(Path(__file__).resolve().parent.parent))
 
+# Очереди задач задаются в processing.routing
+
 if TYPE_CHECKING:
     from . import processors
 else:
@@ -24,7 +25,7 @@ def ensure_processors() -> None:
         globals()["processors"] = _processors
 
 
-@app.task(queue=VIDEO_DOWNLOAD_QUEUE)
+@app.task
 def process_video_or_playlist(video_or_playlist_for_processing: dict[str, Any]) -> None:
     # TODO: начало обработки здесь
 
@@ -37,22 +38,95 @@ def process_video_or_playlist(video_or_playlist_for_processing: dict[str, Any])
     )
 
 
-@app.task(queue=VIDEO_PROCESS_QUEUE)
+@app.task
+def recover_attached_downloads_task(video_id: str) -> None:
+    # lazy import
+    from .inflight_downloads import recover_attached_requests
+
+    recover_attached_requests(video_id)
+
+
+@app.task
 def process_video_task(process_video_id: int, waiter_dict: dict[str, Any]) -> None:
     ensure_processors()
 
     run_async_in_sync(processors.process_video(process_video_id, waiter_dict))
 
 
-@app.task(queue=VIDEO_UPLOAD_QUEUE)
+@app.task
+def process_video_stage_task(processed_video_id: int, waiter_dict: dict[str, Any], attempt: int = 0) -> None:
+    ensure_processors()
+
+    run_async_in_sync(processors.process_video_stage(processed_video_id, waiter_dict, attempt))
+
+
+@app.task
+def process_video_batch_stage_task(
+    processed_video_ids: list[int],
+    waiter_dicts: dict[str, dict[str, Any]],
+    attempts: dict[str, int] | int | None = None,
+) -> None:
+    ensure_processors()
+
+    run_async_in_sync(processors.process_video_batch_stage(processed_video_ids, waiter_dicts, attempts))
+
+
+@app.task
+def render_interval_group_task(  # noqa: PLR0913
+    input_source: dict[str, Any],
+    separated_audio_source: dict[str, Any] | None,
+    serialized_group: list[Any],
+    render_options: dict[str, Any],
+    input_file_info: dict[str, int],
+    suffix: str,
+) -> str | None:
+    # lazy import
+    from .distributed_render import render_interval_group_segment
+
+    return render_interval_group_segment(
+        input_source=input_source,
+        separated_audio_source=separated_audio_source,
+        serialized_group=serialized_group,
+        render_options=render_options,
+        input_file_info=input_file_info,
+        suffix=suffix,
+    )
+
+
+@app.task
+def on_interval_group_rendered_task(storage_path: str | None, render_key: str, render_id: str, index: int) -> None:
+    # lazy import
+    from .distributed_render import on_interval_group_rendered
+
+    on_interval_group_rendered(storage_path, render_key, render_id, index)
+
+
+@app.task
+def on_interval_group_failed_task(*args: Any, render_key: str, render_id: str) -> None:  # noqa: ANN401
+    # lazy import
+    from .distributed_render import cancel_distributed_render
+
+    # celery передаёт в errback запрос, ошибку и traceback упавшей группы
+    exc = next((arg for arg in args if isinstance(arg, BaseException)), None)
+    cancel_distributed_render(render_key, render_id, f"interval group failed: {exc!r}")
+
+
+@app.task
+def check_distributed_render_task(render_key: str, render_id: str, last_done: int) -> None:
+    # lazy import
+    from .distributed_render import check_distributed_render
+
+    check_distributed_render(render_key, render_id, last_done)
+
+
+@app.task
 def upload_video_task(processed_video_id: int) -> None:
     ensure_processors()
 
     run_async_in_sync(processors.upload_to_telegram(processed_video_id))
 
 
-# @app.task(queue=LECTURES_SUMMARIZE_QUEUE)
-@app.task(queue=VIDEO_PROCESS_QUEUE)
+@app.task
 def summarize_lecture_task(downloaded_video_id: str, video_or_playlist_for_processing: dict[str, Any]) -> None:
     ensure_processors()
 
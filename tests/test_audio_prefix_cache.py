@@ -0,0 +1,55 @@
+import os
+import tempfile
+import unittest
+from pathlib import Path
+
+from tools.audio_processing.actions import ffmpeg_actions
+from tools.audio_processing.pipeline import StepStatistics
+from tools.audio_processing.prefix_cache import AudioPrefixCache
+
+
+class TestAudioPrefixCache(unittest.TestCase):
+    def setUp(self) -> None:
+        self._tempdir = tempfile.TemporaryDirectory()
+        self.tempdir = Path(self._tempdir.name)
+        self.cache = AudioPrefixCache(self.tempdir / "cache", max_size_bytes=10)
+        self.actions = [
+            ffmpeg_actions.SimpleFFMpegAction(output_options={"af": "highpass=f=80"}),
+            ffmpeg_actions.SimpleFFMpegAction(output_options={"af": "lowpass=f=8000"}),
+        ]
+
+    def tearDown(self) -> None:
+        self._tempdir.cleanup()
+
+    def _put(self, prefix_length: int, content: bytes) -> None:
+        result_file = self.tempdir / f"result_{prefix_length}.wav"
+        result_file.write_bytes(content)
+        # Файл кладётся в кеш жёсткой ссылкой, поэтому mtime записи совпадает с mtime результата
+        os.utime(result_file, (prefix_length, prefix_length))
+        stats = [
+            StepStatistics(step=i, step_name="SimpleFFMpegAction", time=1.0, rms_db=None) for i in range(prefix_length)
+        ]
+        self.cache.put("input", self.actions[:prefix_length], result_file, stats)
+
+    def test_returns_longest_prefix(self) -> None:
+        output_file = self.tempdir / "output.wav"
+        self.assertIsNone(self.cache.get_longest_prefix("input", self.actions, output_file))
+
+        self._put(1, b"1")
+        self._put(2, b"12")
+
+        prefix_length, stats = self.cache.get_longest_prefix("input", self.actions, output_file)
+        self.assertEqual(prefix_length, 2)
+        self.assertEqual(len(stats), 2)
+        self.assertEqual(output_file.read_bytes(), b"12")
+
+        self.assertIsNone(self.cache.get_longest_prefix("other input", self.actions, output_file))
+
+    def test_evicts_least_recently_used(self) -> None:
+        self._put(1, b"123456")
+        self._put(2, b"123456")
+
+        prefix = self.cache.get_longest_prefix("input", self.actions, self.tempdir / "output.wav")
+        self.assertIsNotNone(prefix)
+        self.assertEqual(prefix[0], 2)
+        self.assertEqual(len(list(self.cache.folder.glob("*.wav"))), 1)
@@ -0,0 +1,36 @@
+import unittest
+
+from utils.video.byte_range_index import ByteRangeIndex, merge_byte_ranges
+
+
+class TestByteRangeIndex(unittest.TestCase):
+    def setUp(self) -> None:
+        # Ключевой кадр каждые 10 секунд, 1000 байт на 10 секунд, заголовок 100 байт, хвост 50 байт
+        self.index = ByteRangeIndex(
+            file_size=10150,
+            header_end=100,
+            trailer_start=10100,
+            times=[10.0 * i for i in range(10)],
+            start_offsets=[100 + 1000 * i for i in range(10)],
+            end_offsets=[100 + 1000 * (i + 1) for i in range(10)],
+        )
+
+    def test_merge_byte_ranges(self) -> None:
+        self.assertEqual(
+            merge_byte_ranges([(50, 60), (0, 10), (10, 20), (30, 40), (35, 36), (70, 70)], merge_gap=5),
+            [(0, 20), (30, 40), (50, 60)],
+        )
+
+    def test_byte_range_has_margin(self) -> None:
+        self.assertEqual(self.index.get_byte_range(35, 45), (2100, 7100))
+
+    def test_byte_range_at_edges(self) -> None:
+        self.assertEqual(self.index.get_byte_range(0, 5), (100, 3100))
+        self.assertEqual(self.index.get_byte_range(85, 100), (7100, 10100))
+
+    def test_byte_ranges_include_header_and_trailer(self) -> None:
+        self.assertEqual(
+            self.index.get_byte_ranges([(35, 45)], merge_gap=0),
+            [(0, 100), (2100, 7100), (10100, 10150)],
+        )
+        self.assertEqual(self.index.get_byte_ranges([], merge_gap=0), [(0, 100), (10100, 10150)])
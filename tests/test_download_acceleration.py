@@ -0,0 +1,57 @@
+import unittest
+from unittest import mock
+
+from tools.yt_dlp_downloader import acceleration
+from utils.download_connections import HostConnectionLimiter
+
+
+class TestDownloadAcceleration(unittest.TestCase):
+    def test_site(self) -> None:
+        self.assertEqual(acceleration.get_site("https://m.vk.com/video1_2"), "vk.com")
+        self.assertEqual(acceleration.get_site("https://www.youtube.com/watch?v=abc"), "youtube.com")
+        self.assertEqual(acceleration.get_site("https://example.com/lecture.mp4"), "example.com")
+
+    def test_options(self) -> None:
+        with mock.patch.object(acceleration, "ARIA2C_PATH", "/usr/bin/aria2c"):
+            options = acceleration.get_acceleration_options("https://vk.com/video1_2")
+
+        connections = acceleration.get_host_connections("https://vk.com/video1_2")
+        self.assertEqual(options["concurrent_fragment_downloads"], connections)
+        self.assertEqual(options["external_downloader"], {"http": "aria2c"})
+        self.assertIn(f"--split={connections}", options["external_downloader_args"]["aria2c"])
+
+    def test_without_aria2c(self) -> None:
+        with mock.patch.object(acceleration, "ARIA2C_PATH", None):
+            options = acceleration.get_acceleration_options("https://vk.com/video1_2")
+
+        self.assertNotIn("external_downloader", options)
+
+    def test_connections(self) -> None:
+        options = acceleration.get_acceleration_options("https://vk.com/video1_2", connections=2)
+
+        self.assertEqual(options["concurrent_fragment_downloads"], 2)
+
+
+class TestHostConnectionLimiter(unittest.TestCase):
+    def setUp(self) -> None:
+        self.redis = mock.MagicMock()
+        self.acquire_script = mock.MagicMock()
+        self.redis.register_script.side_effect = [self.acquire_script, mock.MagicMock()]
+        self.limiter = HostConnectionLimiter(self.redis, poll_interval=0)
+
+    def test_waits_for_free_connection(self) -> None:
+        self.acquire_script.side_effect = [0, 2]
+
+        with self.limiter.acquire("vk.com", 8, 8) as connections:
+            self.assertEqual(connections, 2)
+
+        self.assertEqual(self.acquire_script.call_count, 2)
+        self.redis.hdel.assert_called_once()
+
+    def test_redis_unavailable(self) -> None:
+        self.acquire_script.side_effect = ConnectionError
+
+        with self.limiter.acquire("vk.com", 8, 4) as connections:
+            self.assertEqual(connections, 4)
+
+        self.redis.hdel.assert_not_called()
@@ -0,0 +1,87 @@
+import unittest
+from dataclasses import replace
+
+from tools.yt_dlp_downloader.yt_dlp_format_select import (
+    DEFAULT_FORMAT_SCORE_WEIGHTS,
+    get_codec_family,
+    select_best_video,
+    select_format,
+)
+
+
+def _video(format_id: str, vcodec: str, width: int, height: int, vbr: float, ext: str = "mp4") -> dict:  # noqa: PLR0913
+    return {
+        "format_id": format_id,
+        "format": f"{format_id} - {width}x{height}",
+        "ext": ext,
+        "protocol": "https",
+        "vcodec": vcodec,
+        "acodec": "none",
+        "width": width,
+        "height": height,
+        "fps": 30,
+        "vbr": vbr,
+    }
+
+
+def _audio(format_id: str, acodec: str, abr: float, ext: str) -> dict:
+    return {
+        "format_id": format_id,
+        "format": f"{format_id} - audio only",
+        "ext": ext,
+        "protocol": "https",
+        "vcodec": "none",
+        "acodec": acodec,
+        "abr": abr,
+    }
+
+
+# Форматы youtube-лекции в порядке yt-dlp (от худшего к лучшему), оставлены только читаемые поля
+YOUTUBE_LECTURE_FORMATS = [
+    _audio("140", "mp4a.40.2", 129.5, "m4a"),
+    _audio("251", "opus", 135.1, "webm"),
+    _video("160", "avc1.4d400c", 256, 144, 61.2),
+    _video("134", "avc1.4d401e", 640, 360, 251.8),
+    _video("243", "vp09.00.21.08", 640, 360, 203.4, "webm"),
+    _video("136", "avc1.4d401f", 1280, 720, 1105.7),
+    _video("247", "vp09.00.31.08", 1280, 720, 702.9, "webm"),
+    _video("398", "av01.0.05M.08", 1280, 720, 598.3),
+    _video("137", "avc1.640028", 1920, 1080, 2204.6),
+    _video("248", "vp09.00.40.08", 1920, 1080, 1498.2, "webm"),
+    _video("399", "av01.0.08M.08", 1920, 1080, 1102.5),
+    _video("401", "av01.0.12M.08", 3840, 2160, 7011.9),
+]
+
+# Форматы vk: один кодек, несколько битрейтов одного разрешения
+VK_LECTURE_FORMATS = [
+    _video("hls-1100", "avc1.64001f", 1280, 720, 1100),
+    _video("dash-1080-2000", "avc1.640028", 1920, 1080, 2000),
+    _video("hls-5200", "avc1.640028", 1920, 1080, 5200),
+]
+
+
+class TestFormatSelect(unittest.TestCase):
+    def test_codec_family(self) -> None:
+        self.assertEqual(get_codec_family("avc1.640028"), "h264")
+        self.assertEqual(get_codec_family("vp09.00.40.08"), "vp9")
+        self.assertEqual(get_codec_family("av01.0.08M.08"), "av1")
+        self.assertEqual(get_codec_family(None), "unknown")
+
+    def test_prefers_hardware_decodable_codec(self) -> None:
+        best_video = select_best_video(YOUTUBE_LECTURE_FORMATS[::-1], hardware_decodable_codecs=("h264", "hevc"))
+        self.assertEqual(best_video["format_id"], "137")
+
+    def test_weights(self) -> None:
+        # Если важен только размер, а декодирование бесплатно, то выбирается av1
+        weights = replace(DEFAULT_FORMAT_SCORE_WEIGHTS, size=4.0, decode_cost=0.0, hardware_decode=0.0)
+        best_video = select_best_video(YOUTUBE_LECTURE_FORMATS[::-1], weights, hardware_decodable_codecs=())
+        self.assertEqual(best_video["format_id"], "399")
+
+    def test_prefers_sufficient_bitrate(self) -> None:
+        best_video = select_best_video(VK_LECTURE_FORMATS[::-1], hardware_decodable_codecs=())
+        self.assertEqual(best_video["format_id"], "dash-1080-2000")
+
+    def test_select_format(self) -> None:
+        # 1080p h264 выигрывает и без декодирования на gpu
+        selected = next(select_format({"formats": YOUTUBE_LECTURE_FORMATS}))
+        self.assertEqual(selected["format_id"], "137+251")
@@ -0,0 +1,142 @@
+import unittest
+
+import numpy as np
+import pytest
+
+from libs.unsilence import Interval, Intervals
+from libs.unsilence.intervals.interval_array import IntervalArray
+from tools.video_processing.vad.vad_unsilence import intervals_collapse, intervals_or
+
+DURATIONS = (0.05, 0.2, 0.7, 0.1, 1.5, 0.3, 4.0, 0.25, 0.9, 2.5, 0.15)
+
+
+def _make_intervals(count: int, shift: int = 0) -> list[Interval]:
+    intervals = []
+    start = 0.0
+    for i in range(shift, shift + count):
+        end = start + DURATIONS[i * 7 % len(DURATIONS)]
+        intervals.append(Interval(start, end, is_silent=i * i % 3 == 0))
+        start = end
+    return intervals
+
+
+def _combine_reference(interval_list: list[Interval], short_interval_threshold: float) -> list[Interval]:
+    # Прежняя реализация Intervals.__combine_intervals
+    intervals = []
+    current_interval = Interval(is_silent=None)
+    for interval in interval_list:
+        if interval.duration <= short_interval_threshold or current_interval.is_silent == interval.is_silent:
+            current_interval.end = interval.end
+        elif current_interval.is_silent is None:
+            current_interval.is_silent = interval.is_silent
+            current_interval.end = interval.end
+        else:
+            intervals.append(current_interval)
+            current_interval = interval.copy()
+
+    if current_interval.is_silent is None:
+        current_interval.is_silent = False
+
+    intervals.append(current_interval)
+    return intervals
+
+
+def _or_reference(intervals1: list[Interval], intervals2: list[Interval]) -> list[Interval]:
+    # Прежняя реализация intervals_or
+    result = []
+    idx2 = 0
+    for interval1 in intervals1:
+        while True:
+            if idx2 >= len(intervals2):
+                return result
+
+            interval2 = intervals2[idx2]
+            if interval2.start > interval1.end:
+                break
+
+            result.append(
+                Interval(
+                    start=max(interval1.start, interval2.start),
+                    end=min(interval1.end, interval2.end),
+                    is_silent=interval1.is_silent or interval2.is_silent,
+                ),
+            )
+            if interval2.end > interval1.end:
+                break
+
+            idx2 += 1
+
+    return result
+
+
+def _as_tuples(intervals: list[Interval]) -> list[tuple[float, float, bool]]:
+    return [(interval.start, interval.end, interval.is_silent) for interval in intervals]
+
+
+class TestIntervalArray(unittest.TestCase):
+    def test_combine_matches_loop(self) -> None:
+        for count in (0, 1, 2, 10, 500):
+            interval_list = _make_intervals(count)
+            combined = IntervalArray.from_intervals(interval_list).combine(0.3)
+            self.assertEqual(
+                _as_tuples(combined.to_intervals()),
+                _as_tuples(_combine_reference([interval.copy() for interval in interval_list], 0.3)),
+            )
+
+    def test_optimize_matches_loop(self) -> None:
+        interval_list = _make_intervals(1000)
+        expected = _combine_reference([interval.copy() for interval in interval_list], 0.3)
+        for i, interval in enumerate(expected):
+            interval.enlarge_audible_interval(0.25, is_start_interval=i == 0, is_end_interval=i == len(expected) - 1)
+        expected_without_breaks = [
+            interval
+            for interval in expected
+            if not (interval.is_silent and interval.duration >= 2)  # noqa: PLR2004
+        ]
+
+        intervals = Intervals(interval_list)
+        intervals.optimize(0.3, 0.25, 2)
+
+        self.assertEqual(_as_tuples(intervals.intervals), _as_tuples(expected))
+        self.assertEqual(_as_tuples(intervals.intervals_without_breaks), _as_tuples(expected_without_breaks))
+
+    def test_enlarge_raises_on_short_interval(self) -> None:
+        array = IntervalArray.from_intervals([Interval(0, 1, is_silent=False), Interval(1, 1.1, is_silent=True)])
+        with pytest.raises(ValueError, match="Stretch time to large"):
+            array.enlarge_audible(0.25)
+
+    def test_or_matches_loop(self) -> None:
+        intervals1 = _make_intervals(300)
+        intervals2 = _make_intervals(400, shift=5)
+
+        merged = intervals_or(Intervals(intervals1), Intervals(intervals2))
+
+        self.assertEqual(_as_tuples(merged.intervals), _as_tuples(_or_reference(intervals1, intervals2)))
+
+    def test_collapse(self) -> None:
+        collapsed = intervals_collapse(
+            Intervals(
+                [
+                    Interval(0, 1, is_silent=False),
+                    Interval(1, 2, is_silent=False),
+                    Interval(2, 3, is_silent=True),
+                    Interval(3, 4, is_silent=False),
+                    Interval(4, 5, is_silent=False),
+                ],
+            ),
+        )
+
+        self.assertEqual(_as_tuples(collapsed.intervals), [(0, 2, False), (2, 3, True), (3, 5, False)])
+
+    def test_bytes_round_trip(self) -> None:
+        array = IntervalArray.from_intervals(_make_intervals(77))
+
+        restored = IntervalArray.from_base64(array.to_base64())
+
+        self.assertEqual(len(restored), len(array))
+        self.assertTrue(np.allclose(restored.starts, array.starts, rtol=0, atol=1e-5))
+        self.assertTrue(np.allclose(restored.ends, array.ends, rtol=0, atol=1e-5))
+        self.assertTrue(np.array_equal(restored.silent, array.silent))
+        # Повторное кодирование восстановленных границ ничего не меняет
+        self.assertEqual(IntervalArray.from_bytes(restored.to_bytes()), restored)
+        self.assertEqual(IntervalArray.from_bytes(IntervalArray.empty().to_bytes()), IntervalArray.empty())
@@ -0,0 +1,130 @@
+import asyncio
+import json
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+from openai import AsyncOpenAI
+
+from processing.models.lecture_summary import TranscriptionSegment
+from processing.summary.llm_summarizer import split_segments_to_chunks, transcription_to_summary_map_reduce
+
+STUB_PROMPT_TOKENS = 10
+
+
+class _StubChatCompletionsHandler(BaseHTTPRequestHandler):
+    prompts: list[str]
+
+    def do_POST(self) -> None:  # noqa: N802
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        prompt = body["messages"][0]["content"]
+        self.server.prompts.append(prompt)  # type: ignore[attr-defined]
+
+        content = "merged" if "<part>" in prompt else f"partial {len(self.server.prompts)}"  # type: ignore[attr-defined]
+        response = json.dumps(
+            {
+                "id": "chatcmpl-stub",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": body["model"],
+                "choices": [
+                    {
+                        "index": 0,
+                        "finish_reason": "stop",
+                        "message": {"role": "assistant", "content": content},
+                    },
+                ],
+                "usage": {"prompt_tokens": STUB_PROMPT_TOKENS, "completion_tokens": 5, "total_tokens": 15},
+            },
+        ).encode()
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(response)))
+        self.end_headers()
+        self.wfile.write(response)
+
+    def log_message(self, *args, **kwargs) -> None:
+        pass
+
+
+class TestLlmMapReduce(unittest.TestCase):
+    def setUp(self) -> None:
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), _StubChatCompletionsHandler)
+        self.server.prompts = []
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def tearDown(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_split_segments_to_chunks(self) -> None:
+        segments = [TranscriptionSegment(start=i, end=i + 1, text="a" * 10) for i in range(10)]
+
+        chunks = split_segments_to_chunks(segments, max_tokens=30, chars_per_token=1)
+
+        self.assertEqual([len(chunk) for chunk in chunks], [3, 3, 3, 1])
+        self.assertEqual([segment for chunk in chunks for segment in chunk], segments)
+
+    def test_oversize_segment_gets_own_chunk(self) -> None:
+        segments = [
+            TranscriptionSegment(start=0, end=1, text="a"),
+            TranscriptionSegment(start=1, end=2, text="b" * 100),
+            TranscriptionSegment(start=2, end=3, text="c"),
+        ]
+
+        chunks = split_segments_to_chunks(segments, max_tokens=10, chars_per_token=1)
+
+        self.assertEqual([len(chunk) for chunk in chunks], [1, 1, 1])
+
+    def _run_map_reduce(self, segments: list[TranscriptionSegment], **kwargs) -> tuple:
+        host, port = self.server.server_address
+
+        async def run() -> tuple:
+            async with httpx.AsyncClient() as http_client:
+                llm_client = AsyncOpenAI(api_key="stub", base_url=f"http://{host}:{port}/v1", http_client=http_client)
+                return await transcription_to_summary_map_reduce(
+                    "title",
+                    "description",
+                    segments,
+                    llm_client=llm_client,
+                    model="stub",
+                    max_chunk_tokens=8,
+                    max_concurrent_requests=2,
+                    **kwargs,
+                )
+
+        return asyncio.run(run())
+
+    def test_map_reduce(self) -> None:
+        segments = [TranscriptionSegment(start=i, end=i + 1, text="a" * 10) for i in range(10)]
+
+        summary, llm_stats = self._run_map_reduce(segments)
+
+        self.assertEqual(summary, "merged")
+        self.assertEqual(len(self.server.prompts), 6)
+        self.assertEqual(len(llm_stats.chunks), 5)
+        self.assertEqual([chunk.chunk for chunk in llm_stats.chunks], [1, 2, 3, 4, 5])
+        self.assertEqual(llm_stats.chunks[0].transcription_start, 0)
+        self.assertEqual(llm_stats.chunks[-1].transcription_end, 10)
+        self.assertTrue(all(chunk.prompt_tokens == STUB_PROMPT_TOKENS for chunk in llm_stats.chunks))
+        self.assertEqual(llm_stats.reduce_chunks, [])
+
+    def test_hierarchical_reduce(self) -> None:
+        segments = [TranscriptionSegment(start=i, end=i + 1, text="a" * 10) for i in range(10)]
+
+        # Частичный конспект оценивается в 4 токена, поэтому в группу попадают по два конспекта
+        parts_per_group = 2
+        summary, llm_stats = self._run_map_reduce(segments, max_reduce_tokens=8)
+
+        self.assertEqual(summary, "merged")
+        # 5 частей, затем группы [1, 2] и [3, 4], затем [12, 34], и итоговое объединение [1234, 5]
+        self.assertEqual(len(self.server.prompts), 9)
+        self.assertEqual(
+            [(chunk.transcription_start, chunk.transcription_end) for chunk in llm_stats.reduce_chunks],
+            [(0, 4), (4, 8), (0, 8)],
+        )
+        self.assertTrue(all(prompt.count("<part>\n") <= parts_per_group for prompt in self.server.prompts))
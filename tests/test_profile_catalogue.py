@@ -0,0 +1,66 @@
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+from processing.models import AudioProcessingProfile, UnsilenceProfile
+from processing.profile_catalogue import ProfileCatalogue
+
+
+def _make_session(names: list[str]) -> mock.AsyncMock:
+    rows = [
+        SimpleNamespace(
+            id=profile_id,
+            slug=name,
+            name=name,
+            description="",
+            audio_pipeline=None,
+            unsilence_action=None,
+        )
+        for profile_id, name in enumerate(names, start=1)
+    ]
+    db_session = mock.AsyncMock()
+    db_session.scalars.return_value = rows
+    return db_session
+
+
+class TestProfileCatalogue(unittest.IsolatedAsyncioTestCase):
+    def setUp(self) -> None:
+        self.redis = mock.AsyncMock()
+        self.redis.get.return_value = b"1"
+        self.catalogue = ProfileCatalogue(lambda: self.redis, check_interval=30)
+
+    async def test_served_from_memory(self) -> None:
+        db_session = _make_session(["normal", "good"])
+
+        for _ in range(3):
+            profiles = await self.catalogue.get_profiles(db_session, AudioProcessingProfile)
+
+        self.assertEqual([profile.slug for profile in profiles], ["normal", "good"])
+        # По запросу на каждую модель профиля
+        self.assertEqual(db_session.scalars.await_count, 2)
+        self.assertEqual(self.redis.get.call_count, 1)
+
+    async def test_reloaded_on_version_change(self) -> None:
+        catalogue = ProfileCatalogue(lambda: self.redis, check_interval=0)
+        await catalogue.get_profiles(_make_session(["normal"]), UnsilenceProfile)
+
+        self.redis.get.return_value = b"2"
+        profile = await catalogue.get_by_slug(_make_session(["normal", "terrible"]), UnsilenceProfile, "terrible")
+
+        self.assertEqual(profile.id, 2)
+
+    async def test_missing_profile_forces_reload(self) -> None:
+        await self.catalogue.get_profiles(_make_session(["normal"]), AudioProcessingProfile)
+
+        self.assertIsNotNone(await self.catalogue.get(_make_session(["normal", "good"]), AudioProcessingProfile, 2))
+        self.assertIsNone(await self.catalogue.get(_make_session(["normal"]), AudioProcessingProfile, 3))
+
+    async def test_forced_reloads_throttled(self) -> None:
+        await self.catalogue.get_profiles(_make_session(["normal"]), AudioProcessingProfile)
+
+        db_session = _make_session(["normal"])
+        for _ in range(3):
+            self.assertIsNone(await self.catalogue.get(db_session, AudioProcessingProfile, 2))
+
+        # Одно перечитывание: по запросу на каждую модель профиля
+        self.assertEqual(db_session.scalars.await_count, 2)
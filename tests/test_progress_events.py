@@ -0,0 +1,59 @@
+import asyncio
+import unittest
+from unittest import mock
+
+from utils.progress_events import ProgressBus, ProgressEvent, StatusMessageEditor, format_progress_status
+
+
+class TestProgressBus(unittest.TestCase):
+    def setUp(self) -> None:
+        self.bus = ProgressBus(mock.MagicMock(), publish_interval=5)
+        self.events: list[ProgressEvent] = []
+        self.bus.add_listener(self.events.append)
+
+    def test_not_tracked(self) -> None:
+        self.bus.report("step", 1, 10)
+        self.assertEqual(self.events, [])
+
+    def test_throttled_until_done(self) -> None:
+        with (
+            mock.patch("utils.progress_events.time.perf_counter", return_value=100.0),
+            self.bus.track(["processed_video:1"], "render", "Сборка видео"),
+        ):
+            self.bus.report("step", 1, 10, rate=1)
+            self.bus.report("step", 2, 10, rate=1)
+            self.bus.report("step", 10, 10, rate=1)
+
+        self.assertEqual([event.fraction for event in self.events], [0.1, 1.0, 1.0])
+        self.assertEqual(self.events[0].eta, 9)
+        self.assertTrue(self.events[-1].finished)
+
+    def test_format(self) -> None:
+        event = ProgressEvent(key="k", stage="render", title="Сборка видео", step="", fraction=0.42, eta=300, elapsed=1)
+        self.assertEqual(
+            format_progress_status("Обрабатываю", event),
+            "Обрабатываю\n\nСборка видео: 42%, осталось примерно 5 мин",
+        )
+
+
+class TestStatusMessageEditor(unittest.IsolatedAsyncioTestCase):
+    async def test_superseded_edits_dropped(self) -> None:
+        sent: list[tuple[int, int, str]] = []
+        release = asyncio.Event()
+
+        async def send(_method: object, chat_id: int, message_id: int, text: str, **_kwargs: object) -> None:
+            await release.wait()
+            sent.append((chat_id, message_id, text))
+
+        editor = StatusMessageEditor(mock.MagicMock())
+        with mock.patch("utils.progress_events.broadcast_scheduler.send", side_effect=send):
+            editor.edit(1, 10, "1%")
+            editor.edit(2, 20, "1%")
+            await asyncio.sleep(0)
+            # Пока первая правка ждёт отправки, приходят новые, и отправится только последняя из них
+            editor.edit(1, 10, "2%")
+            editor.edit(1, 10, "3%")
+            release.set()
+            await editor.join()
+
+        self.assertEqual(sorted(sent), [(1, 10, "1%"), (1, 10, "3%"), (2, 20, "1%")])
@@ -0,0 +1,26 @@
+import unittest
+
+from libs.unsilence import Interval
+from libs.unsilence.render_media.options import RenderOptions
+from libs.unsilence_fast.fast_render_task import IntervalGroupRenderTask, IntervalRenderTask
+
+
+class TestSerializationIntervalGroupRenderTask(unittest.TestCase):
+    def test_serialization_deserialization(self) -> None:
+        render_options = RenderOptions(silent_speed=6, silent_volume=0.5)
+        group = IntervalGroupRenderTask()
+        for interval in (
+            Interval(0, 1.5, is_silent=False),
+            Interval(1.5, 4, is_silent=True),
+            Interval(4, 10.25, is_silent=False),
+        ):
+            group.add(IntervalRenderTask.create(interval, render_options))
+
+        restored = IntervalGroupRenderTask.deserialize(group.serialize(), render_options)
+
+        self.assertEqual(restored.serialize(), group.serialize())
+        self.assertAlmostEqual(restored.total_interval_duration, group.total_interval_duration)
+        self.assertEqual(
+            [(task.video_filter, task.audio_filter) for task in restored.interval_render_tasks],
+            [(task.video_filter, task.audio_filter) for task in group.interval_render_tasks],
+        )
@@ -1,8 +1,8 @@
 import unittest
 
-from libs.unsilence import Unsilence
+from libs.unsilence import Interval, Unsilence
 from libs.unsilence.render_media.options import RenderOptions
-from tools.video_processing.actions.unsilence_actions import UnsilenceAction
+from tools.video_processing.actions.unsilence_actions import SilenceDetectionResult, UnsilenceAction
 from tools.video_processing.vad.vad_unsilence import UnsilenceAndVad, Vad
 
 
@@ -100,3 +100,27 @@ class TestSerializationUnsilenceAction(unittest.TestCase):
         )
         dumped = action.model_dump_json()
         action.model_validate_json(dumped)
+
+    def test_silence_detection_result_legacy_interval_list(self) -> None:
+        interval_list = [
+            Interval(0, 1.5, is_silent=False),
+            Interval(1.5, 40, is_silent=True),
+            Interval(40, 41.25, is_silent=False),
+        ]
+        detection = SilenceDetectionResult.model_validate(
+            {
+                "detection_time": 1,
+                "time_savings_estimation": {},
+                "interval_list": [interval.serialize() for interval in interval_list],
+                "interval_list_without_breaks": [interval_list[0].serialize(), interval_list[2].serialize()],
+            },
+        )
+
+        self.assertIsInstance(detection.interval_list, str)
+        restored = SilenceDetectionResult.model_validate_json(detection.model_dump_json())
+        intervals = restored.get_intervals()
+        self.assertEqual(
+            [interval.serialize() for interval in intervals.intervals],
+            [interval.serialize() for interval in interval_list],
+        )
+        self.assertEqual(len(intervals.intervals_without_breaks), 2)
@@ -0,0 +1,28 @@
+import unittest
+
+from utils.video.telegram_rendition import choose_rendition_rung
+
+LADDER = ((1080, 4_000_000), (720, 2_000_000), (360, 500_000))
+MAX_SIZE = 50 * 2**20
+
+
+def _choose(duration: float, height: int = 1080) -> tuple[int, int] | None:
+    return choose_rendition_rung(duration, height, max_size=MAX_SIZE, ladder=LADDER, audio_bitrate=100_000)
+
+
+class TestChooseRenditionRung(unittest.TestCase):
+    def test_highest_rung_that_fits(self) -> None:
+        self.assertEqual(_choose(60), (1080, 4_000_000))
+        self.assertEqual(_choose(10 * 60), (360, 500_000))
+
+    def test_result_fits_limit(self) -> None:
+        for duration in (30, 3 * 60, 10 * 60):
+            _, video_bitrate = _choose(duration)
+            self.assertLessEqual((video_bitrate + 100_000) * duration / 8, MAX_SIZE)
+
+    def test_too_long(self) -> None:
+        self.assertIsNone(_choose(2 * 3600))
+
+    def test_no_upscale(self) -> None:
+        self.assertEqual(_choose(60, height=720), (720, 2_000_000))
+        self.assertEqual(_choose(60, height=240), (240, 500_000))
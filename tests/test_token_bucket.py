@@ -0,0 +1,25 @@
+import unittest
+from unittest import mock
+
+from utils.telegram_broadcast import TokenBucket
+
+
+class TestTokenBucket(unittest.TestCase):
+    def test_reserve_spreads_sends(self) -> None:
+        with mock.patch("utils.telegram_broadcast.time.monotonic", return_value=100.0):
+            bucket = TokenBucket(rate=2, capacity=2)
+            self.assertEqual(
+                [bucket.reserve() for _ in range(5)],
+                [0.0, 0.0, 0.5, 1.0, 1.5],
+            )
+
+    def test_refill_is_capped(self) -> None:
+        with mock.patch("utils.telegram_broadcast.time.monotonic") as monotonic:
+            monotonic.return_value = 0.0
+            bucket = TokenBucket(rate=1, capacity=1)
+            self.assertEqual(bucket.reserve(), 0.0)
+
+            monotonic.return_value = 100.0
+            self.assertTrue(bucket.is_full())
+            self.assertEqual(bucket.reserve(), 0.0)
+            self.assertEqual(bucket.reserve(), 1.0)
@@ -0,0 +1,32 @@
+import unittest
+
+from libs.unsilence.render_media.options import RenderOptions
+from tools.audio_processing.actions import ffmpeg_actions
+from tools.audio_processing.pipeline import AudioPipeline
+from tools.video_processing.actions.unsilence_actions import UnsilenceAction
+from tools.video_processing.pipeline import VideoPipeline
+from tools.video_processing.vad.vad_unsilence import UnsilenceAndVad
+
+
+def _create_video_pipeline(af: str = "highpass=f=80", **render_options) -> VideoPipeline:
+    return VideoPipeline(
+        audio_pipeline=AudioPipeline().add(ffmpeg_actions.SimpleFFMpegAction(output_options={"af": af})),
+        unsilence_action=UnsilenceAction(
+            unsilence_class=UnsilenceAndVad,
+            detect_silence_options={"silence_level": -35.0, "silence_time_threshold": 0.5},
+            render_options=RenderOptions(**render_options),
+        ),
+    )
+
+
+class TestVideoPipelineDetectionKey(unittest.TestCase):
+    def test_same_key_for_different_encoding(self) -> None:
+        self.assertEqual(
+            _create_video_pipeline(silent_speed=4).get_detection_key(),
+            _create_video_pipeline(silent_speed=4, force_video_codec="hevc", silent_volume=0).get_detection_key(),
+        )
+
+    def test_different_key_for_different_audio_or_speed(self) -> None:
+        key = _create_video_pipeline().get_detection_key()
+        self.assertNotEqual(key, _create_video_pipeline(af="lowpass=f=8000").get_detection_key())
+        self.assertNotEqual(key, _create_video_pipeline(silent_speed=4).get_detection_key())
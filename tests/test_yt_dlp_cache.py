@@ -0,0 +1,98 @@
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from unittest import mock
+
+import pytest
+from yt_dlp.utils import DownloadError
+
+from utils.yt_dlp_cached import YtDlpInfoCache, canonicalize_url, strip_media_urls
+
+
+class TestCanonicalizeUrl(unittest.TestCase):
+    def test_youtube_short_links(self) -> None:
+        canonical_url = "https://www.youtube.com/watch?v=abc"
+        for url in (
+            "https://youtu.be/abc?si=tracking",
+            "https://m.youtube.com/watch?v=abc&feature=share",
+            "https://www.youtube.com/shorts/abc",
+            "https://youtube.com/watch?t=42&v=abc&utm_source=telegram",
+        ):
+            with self.subTest(url=url):
+                self.assertEqual(canonicalize_url(url), canonical_url)
+
+    def test_keeps_meaningful_parts(self) -> None:
+        self.assertEqual(
+            canonicalize_url("https://vk.com/video1_2?utm_medium=x&list=ln-abc"),
+            "https://vk.com/video1_2?list=ln-abc",
+        )
+        self.assertEqual(
+            canonicalize_url("https://lectoriyfopf.ru/course#tlection=1_2"),
+            "https://lectoriyfopf.ru/course#tlection=1_2",
+        )
+
+    def test_ports(self) -> None:
+        self.assertEqual(canonicalize_url("https://Example.com:443/video"), "https://example.com/video")
+        self.assertEqual(canonicalize_url("http://example.com:8080/video"), "http://example.com:8080/video")
+        self.assertEqual(canonicalize_url("https://example.com:80/video"), "https://example.com:80/video")
+
+
+class TestStripMediaUrls(unittest.TestCase):
+    def test_strips_entries(self) -> None:
+        info = {
+            "title": "Курс",
+            "formats": [{"url": "https://example.com/signed"}],
+            "entries": [{"title": "Лекция", "url": "https://example.com/1", "http_headers": {}}],
+        }
+
+        self.assertEqual(
+            strip_media_urls(info),
+            {"title": "Курс", "entries": [{"title": "Лекция", "url": "https://example.com/1"}]},
+        )
+
+
+class TestYtDlpInfoCache(unittest.IsolatedAsyncioTestCase):
+    def setUp(self) -> None:
+        self.redis = mock.MagicMock()
+        self.redis.pipeline.return_value.execute.return_value = [None, -2]
+        self.function = mock.MagicMock(return_value={"id": "abc", "title": "Лекция"})
+        self.cache = YtDlpInfoCache(
+            self.redis,
+            "test",
+            self.function,
+            ThreadPoolExecutor(max_workers=1),
+            ttl=timedelta(minutes=1),
+        )
+
+    async def test_memory_hit_returns_copy(self) -> None:
+        info = await self.cache("https://youtu.be/abc")
+        info["title"] = "Изменено"
+
+        self.assertEqual(await self.cache("https://www.youtube.com/watch?v=abc"), {"id": "abc", "title": "Лекция"})
+        self.function.assert_called_once()
+        self.redis.set.assert_called_once()
+
+    async def test_negative_cache(self) -> None:
+        self.function.side_effect = DownloadError("ERROR: Unsupported URL: https://example.com")
+
+        for _ in range(2):
+            with pytest.raises(DownloadError, match="Unsupported URL"):
+                await self.cache("https://example.com")
+
+        self.function.assert_called_once()
+
+    async def test_live_short_ttl(self) -> None:
+        self.function.return_value = {"id": "abc", "live_status": "is_upcoming"}
+
+        await self.cache("https://youtu.be/abc")
+
+        self.assertEqual(self.redis.set.call_args.kwargs["ex"], self.cache.live_ttl)
+
+    async def test_redis_hit_keeps_remaining_ttl(self) -> None:
+        self.redis.pipeline.return_value.execute.return_value = [b'{"info": {"id": "abc"}}', 500]
+
+        with mock.patch("utils.yt_dlp_cached.time.monotonic", return_value=100.0):
+            self.assertEqual(await self.cache("https://youtu.be/abc"), {"id": "abc"})
+
+        self.assertEqual(self.cache._memory[self.cache.make_key("https://youtu.be/abc")][0], 100.5)  # noqa: SLF001
+        self.function.assert_not_called()
@@ -0,0 +1,39 @@
+import unittest
+
+from yt_dlp.utils import LazyList
+
+from tools.yt_dlp_downloader.info_archive import compress_yt_dlp_info, decompress_yt_dlp_info, slim_yt_dlp_info
+from tools.yt_dlp_downloader.misc import yt_dlp_get_html_link
+
+
+class TestYtDlpInfoArchive(unittest.TestCase):
+    info = {  # noqa: RUF012
+        "id": "abc",
+        "_type": "video",
+        "extractor": "youtube",
+        "title": "Лекция 1",
+        "description": "Описание",
+        "webpage_url": "https://www.youtube.com/watch?v=abc",
+        "duration": 5400,
+        "formats": [{"format_id": str(i), "url": f"https://example.com/{i}", "http_headers": {}} for i in range(50)],
+        "requested_formats": [{"format_id": "1"}],
+        "thumbnails": LazyList(
+            [{"url": "https://example.com/thumb.jpg", "height": 720, "width": 1280, "preference": -1, "id": "0"}],
+        ),
+    }
+
+    def test_slim_keeps_only_used_fields(self) -> None:
+        slim_info = slim_yt_dlp_info(self.info)
+
+        self.assertNotIn("formats", slim_info)
+        self.assertNotIn("requested_formats", slim_info)
+        self.assertEqual(slim_info["description"], "Описание")
+        thumbnail = {"url": "https://example.com/thumb.jpg", "width": 1280, "height": 720}
+        self.assertEqual(slim_info["thumbnails"], [thumbnail])
+        self.assertEqual(yt_dlp_get_html_link(slim_info), yt_dlp_get_html_link(self.info))
+
+    def test_archive_round_trip(self) -> None:
+        restored = decompress_yt_dlp_info(compress_yt_dlp_info(self.info))
+
+        self.assertEqual(restored["formats"], self.info["formats"])
+        self.assertEqual(restored["thumbnails"], list(self.info["thumbnails"]))
@@ -0,0 +1,36 @@
+import unittest
+
+from tools.yt_dlp_downloader.preview import slim_preview_info
+
+
+class TestSlimPreviewInfo(unittest.TestCase):
+    def test_entries_limited_and_slimmed(self) -> None:
+        entries = (
+            {
+                "_type": "url",
+                "ie_key": "Youtube",
+                "id": str(i),
+                "url": f"https://www.youtube.com/watch?v={i}",
+                "title": "[Private video]" if i == 1 else f"Лекция {i}",
+                "duration": 60 * i,
+                "thumbnails": [{"url": f"https://example.com/{i}.jpg", "height": 90}],
+            }
+            for i in range(10)
+        )
+        info = {
+            "_type": "playlist",
+            "extractor": "youtube:tab",
+            "title": "Курс",
+            "webpage_url": "https://www.youtube.com/playlist?list=abc",
+            "live_status": "not_live",
+            "formats": [],
+            "entries": entries,
+        }
+
+        preview_info = slim_preview_info(info, max_entries=3)
+
+        self.assertEqual([entry["title"] for entry in preview_info["entries"]], ["Лекция 0", "Лекция 2", "Лекция 3"])
+        self.assertNotIn("thumbnails", preview_info["entries"][0])
+        self.assertNotIn("formats", preview_info)
+        self.assertEqual(preview_info["live_status"], "not_live")
+        self.assertIsNone(preview_info["playlist_count"])
@@ -2,6 +2,7 @@
 Администрирование
 """
 
+import asyncio
 import json
 from typing import Any
 
@@ -13,20 +14,31 @@ from djgram.contrib.admin import AppAdmin, ModelAdmin
 from djgram.contrib.admin.action_buttons import AbstractObjectActionButton, DownloadJsonActionButton
 from djgram.contrib.admin.rendering import OneLineTextRenderer
 from processing.models import Playlist, ProcessedVideo, Video, VideoProcessingResourceUsage, YtDlpBase
+from tools.yt_dlp_downloader.info_archive import decompress_yt_dlp_info
 
 app = AppAdmin(verbose_name="Обработка лекций")
 
 
 class DownloadYtDlpInfoButton(AbstractObjectActionButton):
+    """
+    Отправляет полную информацию из архива, а если его нет, то сохранённую в базе
+    """
+
     async def click(self, obj: YtDlpBase, callback_query: CallbackQuery, middleware_data: dict[str, Any]) -> None:
         async with ChatActionSender(
             bot=callback_query.bot,
             chat_id=callback_query.message.chat.id,
             action=ChatAction.TYPING,
         ):
+            if obj.yt_dlp_info_archive is not None:
+                archive = await asyncio.to_thread(obj.yt_dlp_info_archive.file.read)
+                yt_dlp_info = decompress_yt_dlp_info(archive)
+            else:
+                yt_dlp_info = obj.yt_dlp_info
+
             await callback_query.message.answer_document(
                 document=BufferedInputFile(
-                    file=json.dumps(obj.yt_dlp_info, ensure_ascii=False, indent=2).encode("utf8"),
+                    file=json.dumps(yt_dlp_info, ensure_ascii=False, indent=2).encode("utf8"),
                     filename="yt_dlp_info.json",
                 ),
             )
@@ -39,13 +51,13 @@ class VideoAdmin(ModelAdmin):
     list_display = ("call:get_title_for_admin",)
     exclude_fields = (
         "yt_dlp_info",
+        "yt_dlp_info_archive",
         "meta",
     )
     object_action_buttons = (
-        DownloadJsonActionButton(
+        DownloadYtDlpInfoButton(
             button_id="download_yt_dlp_info",
             title="📥 Получить дополнительную информация",
-            field_name="yt_dlp_info",
         ),
         DownloadJsonActionButton(
             button_id="download_processing_stats",
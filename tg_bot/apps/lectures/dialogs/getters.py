@@ -5,10 +5,10 @@
 from typing import Any
 
 from aiogram_dialog import DialogManager
-from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from processing.models import AudioProcessingProfile, ProfileBase, UnsilenceProfile
+from processing.profile_catalogue import profile_catalogue
 
 from .callbacks import AUDIO_PROCESSING_PROFILE_ID_KEY, UNSILENCE_PROFILE_ID_KEY
 
@@ -27,13 +27,13 @@ DEFAULT_UNSILENCE_PROFILE_SLUG = "unsilence_and_vad_profile"
 
 
 async def get_audio_processing_profiles(db_session: AsyncSession, **kwargs) -> dict[str, Any]:
-    profiles = await db_session.scalars(select(AudioProcessingProfile))
+    profiles = await profile_catalogue.get_profiles(db_session, AudioProcessingProfile)
 
     return {AUDIO_PROCESSING_PROFILES_KEY: [(profile.id, profile.name) for profile in profiles]}
 
 
 async def get_audio_processing_profiles_description(db_session: AsyncSession, **kwargs) -> dict[str, Any]:
-    profiles = await db_session.scalars(select(AudioProcessingProfile))
+    profiles = await profile_catalogue.get_profiles(db_session, AudioProcessingProfile)
 
     text = [
         "Описание профилей:",
@@ -47,13 +47,13 @@ async def get_audio_processing_profiles_description(db_session: AsyncSession, **
 
 
 async def get_unsilence_profiles(db_session: AsyncSession, **kwargs) -> dict[str, Any]:
-    profiles = await db_session.scalars(select(UnsilenceProfile))
+    profiles = await profile_catalogue.get_profiles(db_session, UnsilenceProfile)
 
     return {UNSILENCE_PROFILES_KEY: [(profile.id, profile.name) for profile in profiles]}
 
 
 async def get_unsilence_profiles_description(db_session: AsyncSession, **kwargs) -> dict[str, Any]:
-    profiles = await db_session.scalars(select(UnsilenceProfile))
+    profiles = await profile_catalogue.get_profiles(db_session, UnsilenceProfile)
 
     text = [
         "Описание профилей:",
@@ -74,10 +74,9 @@ async def get_profile(
     default_profile_slug: str,
 ):
     if profile_id_key in dialog_manager.dialog_data:
-        return await db_session.scalar(select(model).where(model.id == dialog_manager.dialog_data[profile_id_key]))
+        return await profile_catalogue.get(db_session, model, dialog_manager.dialog_data[profile_id_key])
 
-    # noinspection PyTypeChecker
-    profile = await db_session.scalar(select(model).where(model.slug == default_profile_slug))
+    profile = await profile_catalogue.get_by_slug(db_session, model, default_profile_slug)
     dialog_manager.dialog_data[profile_id_key] = profile.id
 
     return profile
@@ -11,7 +11,7 @@ from yt_dlp.utils import YoutubeDLError
 
 from tools.yt_dlp_downloader.yt_dlp_download_videos import YtDlpContentType, YtDlpInfoDict
 from utils.thumbnail import get_best_thumbnail
-from utils.yt_dlp_cached import extract_info_async_cached
+from utils.yt_dlp_cached import extract_preview_info_async_cached
 
 from ..formating import format_as_playlist_html, format_as_video_html  # noqa: TID252
 
@@ -26,7 +26,7 @@ logger = logging.getLogger(__name__)
 async def send_preview(  # noqa: D103
     message: Message,
     msg: str,
-    thumbnail: InputFile,
+    thumbnail: InputFile | None,
     parse_mode: ParseMode | None = None,
 ) -> None:
     if thumbnail is not None:
@@ -40,6 +40,14 @@ async def send_preview(  # noqa: D103
     await message.reply(msg, parse_mode=parse_mode, disable_web_page_preview=True)
 
 
+async def get_thumbnail_input_file(info: YtDlpInfoDict) -> InputFile | None:  # noqa: D103
+    thumbnail = await get_best_thumbnail(info)
+    if thumbnail is None:
+        return None
+
+    return BufferedInputFile(file=thumbnail, filename="thumbnail.jpg")
+
+
 async def handle_unsupported_url(exc: YoutubeDLError, message: Message) -> None:  # noqa: D103
     logger.warning(exc.msg)
     await message.reply("Эта ссылка не поддерживается")
@@ -70,8 +78,9 @@ async def is_user_error(message: Message, exc: YoutubeDLError) -> bool:  # noqa:
 
 async def try_get_info(url: str, message: Message) -> YtDlpInfoDict | None:  # noqa: D103
     try:
-        # TODO: почему-то это блокирует event loop
-        return await extract_info_async_cached(url, process=False, convert_entries_to_list=True)
+        # Полная информация со всеми записями и форматами долго извлекается и долго сериализуется в кеш,
+        # поэтому для предпросмотра извлекается сокращённая, а полная - при скачивании
+        return await extract_preview_info_async_cached(url)
     except yt_dlp.utils.UnsupportedError as exc:
         await handle_unsupported_url(exc, message)
         return None
@@ -117,11 +126,7 @@ async def handle_url(message: Message, manager: DialogManager) -> YtDlpContentTy
 
         match _type:
             case YtDlpContentType.VIDEO:
-                thumbnail = BufferedInputFile(
-                    file=await get_best_thumbnail(info),
-                    filename="thumbnail.jpg",
-                )
-
+                thumbnail = await get_thumbnail_input_file(info)
                 await send_preview(
                     message,
                     f"По ссылке находиться видео\n{format_as_video_html(info)}",
@@ -130,12 +135,7 @@ async def handle_url(message: Message, manager: DialogManager) -> YtDlpContentTy
                 )
 
             case YtDlpContentType.PLAYLIST:
-                thumbnail = BufferedInputFile(
-                    file=await get_best_thumbnail(info),
-                    filename="thumbnail.jpg",
-                )
-
-                info["entries"] = list(info["entries"])  # Превращает итератор в список
+                thumbnail = await get_thumbnail_input_file(info)
                 playlist_desc = f"По ссылке находиться плейлист\n{format_as_playlist_html(info)}"
                 await send_preview(message, playlist_desc, thumbnail, parse_mode=ParseMode.HTML)
 
@@ -3,17 +3,32 @@ from tools.yt_dlp_downloader.misc import get_playlist_duration, yt_dlp_get_html_
 from tools.yt_dlp_downloader.yt_dlp_download_videos import YtDlpInfoDict
 
 
+def format_duration(duration: float | None) -> str:  # noqa: D103
+    if duration is None:
+        return "длительность неизвестна"
+
+    return seconds_to_human_readable(duration)
+
+
 def format_as_video_html(info: YtDlpInfoDict) -> str:  # noqa: D103
-    return f"{yt_dlp_get_html_link(info)} - {seconds_to_human_readable(info['duration'])}"
+    return f"{yt_dlp_get_html_link(info)} - {format_duration(info.get('duration'))}"
 
 
 def format_as_playlist_html(info: YtDlpInfoDict) -> str:  # noqa: D103
+    entries = info["entries"]
+    # В предпросмотре показываются не все записи, и длительность некоторых может быть неизвестна
+    hidden_count = (info.get("playlist_count") or len(entries)) - len(entries)
+    is_duration_partial = hidden_count > 0 or any(video.get("duration") is None for video in entries)
+
     playlist_desc = (
         f"{yt_dlp_get_html_link(info)}\n"
-        f"Общая продолжительность - {seconds_to_human_readable(get_playlist_duration(info))}"
+        f"Общая продолжительность - {'не меньше ' if is_duration_partial else ''}"
+        f"{seconds_to_human_readable(get_playlist_duration(info))}"
     )
     videos_desc = "\n●".join(
-        f"{yt_dlp_get_html_link(video)} - {seconds_to_human_readable(video['duration'])}" for video in info["entries"]
+        f"{yt_dlp_get_html_link(video)} - {format_duration(video.get('duration'))}" for video in entries
     )
+    if hidden_count > 0:
+        videos_desc += f"\n… и ещё {hidden_count} видео"
 
     return f"{playlist_desc}\n\nСписок видео:\n●{videos_desc}"
@@ -9,7 +9,7 @@ from djgram.contrib.admin.action_buttons import (
     DownloadStringAsFileActionButton,
 )
 from djgram.contrib.admin.rendering import OneLineTextRenderer
-from processing.models import LectureSummary
+from processing.models import LectureSummary, Transcription
 
 app = AppAdmin(verbose_name="Коспектирование")
 
@@ -42,3 +42,38 @@ class LectureSummaryAdmin(ModelAdmin):
             filename="stats.json",
         ),
     )
+
+
+@app.register
+class TranscriptionAdmin(ModelAdmin):
+    model = Transcription
+    name = "Транскрибации"
+    list_display = ["id", "original_video_id", "whisper_model_size"]
+    exclude_fields = (
+        "text",
+        "segments",
+        "stats",
+    )
+    widgets_override = {
+        "original_video_id": OneLineTextRenderer,
+    }
+    object_action_buttons = (
+        DownloadStringAsFileActionButton(
+            "download_transcription_text",
+            "📥 Скачать текст",
+            field_name="text",
+            filename="transcription.txt",
+        ),
+        DownloadJsonActionButton(
+            "download_segments",
+            "📥 Скачать сегменты",
+            field_name="segments",
+            filename="segments.json",
+        ),
+        DownloadJsonActionButton(
+            "download_stats",
+            "📊 Скачать статистику транскрибации",
+            field_name="stats",
+            filename="stats.json",
+        ),
+    )
@@ -38,6 +38,7 @@ from tg_bot.apps.lectures import router as lectures_router
 from tg_bot.apps.menu import router as menu_router
 from tg_bot.apps.menu.dialogs import MenuStates
 from tg_bot.apps.summary import router as summary_router
+from utils.progress_events import run_progress_status_updates_in_background
 from utils.system_init import system_init
 
 logging.config.dictConfig(LOGGING_CONFIG)
@@ -120,4 +121,6 @@ async def main() -> None:
     setup_routers(dp)
 
     await run_telegram_local_server_stats_collection_in_background()
+    # Ссылка нужна, чтобы задачу не собрал сборщик мусора
+    progress_status_updates_task = run_progress_status_updates_in_background(bot)  # noqa: F841
     await dp.start_polling(bot, skip_updates=False, allowed_updates=list(UpdateType))
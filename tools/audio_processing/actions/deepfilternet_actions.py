@@ -24,6 +24,9 @@ from .abstract import Action, ActionStatsType
 
 logger = logging.getLogger(__name__)
 
+#: Ключ CudaMemoryUsageStats в статистике шага
+CUDA_MEMORY_STATS_KEY = "cuda_memory"
+
 
 class CudaMemoryUsageAtStep(pydantic.BaseModel):
     measure_time: float
@@ -133,7 +136,7 @@ class DeepFilterNet3Denoise(Action):
     # 4 GiB
     chunk_max_size_bytes: float = Field(MAX_DEEPFILTERNET_CHUNK_SIZE_BYTES, exclude=True)
     _cuda_memory_warning_threshold = 0.01
-    _CUDA_MEMORY_KEY = "cuda_memory"
+    _CUDA_MEMORY_KEY = CUDA_MEMORY_STATS_KEY
 
     def load_model(self) -> Self:
         self.model, self.df_state, self.df_model_name = init_df(default_model=self.df_model_name)
@@ -13,6 +13,7 @@ from utils.audio import measure_volume_if_enabled
 from utils.misc import get_all_subclasses
 
 from .actions.abstract import Action, ActionStatsType
+from .prefix_cache import AudioPrefixCache, hash_file
 
 logger = logging.getLogger(__name__)
 
@@ -24,6 +25,8 @@ class StepStatistics(pydantic.BaseModel):
     action_stats: ActionStatsType | None = None
     nisqa: NisqaMetrics | None = None
     rms_db: float | None
+    #: Результат шага взят из AudioPrefixCache, а не посчитан заново
+    cached: bool = False
 
     @property
     def repr_for_logging(self) -> str:
@@ -69,12 +72,47 @@ class AudioPipeline(pydantic.BaseModel):
     def _generate_temp_file_name(self, step: int, action: Action, ext: str) -> str:
         return f"step_{step}_{action.__class__.__name__.lower()}.{ext}"
 
-    def _run(
+    def _load_cached_prefix(
+        self,
+        cache: AudioPrefixCache,
+        input_key: str,
+        output_file: Path,
+        tempdir: Path,
+    ) -> tuple[Path, list[StepStatistics]] | None:
+        """
+        Достаёт из кеша результат самого длинного посчитанного префикса пайплайна
+        """
+        last_step = len(self.pipeline)
+        # Результат промежуточного шага кладётся туда же, куда его положил бы сам шаг
+        cached = cache.get_longest_prefix(input_key, self.pipeline, output_file)
+        if cached is None:
+            return None
+
+        prefix_length, cached_stats = cached
+        steps_stats = [
+            StepStatistics.model_validate(step_stats).model_copy(update={"time": 0, "cached": True})
+            for step_stats in cached_stats
+        ]
+        if prefix_length == last_step:
+            return output_file, steps_stats
+
+        prefix_file = tempdir / self._generate_temp_file_name(
+            prefix_length,
+            self.pipeline[prefix_length - 1],
+            self._in_working_ext,
+        )
+        output_file.rename(prefix_file)
+        return prefix_file, steps_stats
+
+    def _run(  # noqa: C901, PLR0912, PLR0913, PLR0915
         self,
         input_file: Path,
         output_file: Path,
         tempdir: Path,
         nisqa_model: NisqaModel | None,
+        keep_intermediate_files: bool,  # noqa: FBT001
+        cache: AudioPrefixCache | None,
+        input_key: str | None,
     ) -> list[StepStatistics]:
         if len(self.pipeline) == 0:
             raise ValueError("No actions defined")
@@ -87,14 +125,37 @@ class AudioPipeline(pydantic.BaseModel):
                 input_stats.nisqa = nisqa_model.measure_from_path_chunked(input_file, NISQA_MAX_MEMORY)
         logger.info("Input: %s", input_stats.repr_for_logging)
 
+        if cache is not None and input_key is None:
+            input_key = hash_file(input_file)
+
+        cached_steps = 0
+        input_is_intermediate = False
+        if cache is not None:
+            cached = self._load_cached_prefix(cache, input_key, output_file, tempdir)
+            if cached is not None:
+                input_file, cached_stats = cached
+                cached_steps = len(cached_stats)
+                pipeline_stats.extend(cached_stats)
+                input_is_intermediate = True
+
+        if cached_steps == len(self.pipeline):
+            return pipeline_stats
+
         for step, action in enumerate(self.pipeline[:-1], start=1):
+            if step <= cached_steps:
+                continue
+
             logger.info("Running step %s/%s - %s", step, len(self.pipeline), action.__class__.__name__)
             temp_file_name = tempdir / self._generate_temp_file_name(step, action, self._in_working_ext)
             start = time.perf_counter()
             action_stats = action.run(input_file, temp_file_name)
             end = time.perf_counter()
 
+            if input_is_intermediate and not keep_intermediate_files:
+                # Выход прошлого шага больше не нужен, а для длинных видео это гигабайты
+                input_file.unlink()
             input_file = temp_file_name
+            input_is_intermediate = True
 
             step_stats = StepStatistics(
                 step=step,
@@ -110,6 +171,9 @@ class AudioPipeline(pydantic.BaseModel):
                     step_stats.nisqa = nisqa_model.measure_from_path_chunked(input_file, NISQA_MAX_MEMORY)
             logger.info("Step %s: %s done in %s", step, step_stats.repr_for_logging, end - start)
 
+            if cache is not None:
+                cache.put(input_key, self.pipeline[:step], input_file, pipeline_stats[1:])
+
         logger.info(
             "Running step %s/%s - %s",
             len(self.pipeline),
@@ -120,6 +184,9 @@ class AudioPipeline(pydantic.BaseModel):
         action_stats = self.pipeline[-1].run(input_file, output_file)
         end = time.perf_counter()
 
+        if input_is_intermediate and not keep_intermediate_files:
+            input_file.unlink()
+
         final_stats = StepStatistics(
             step=len(self.pipeline),
             step_name=self.pipeline[-1].__class__.__name__,
@@ -134,17 +201,40 @@ class AudioPipeline(pydantic.BaseModel):
                 final_stats.nisqa = nisqa_model.measure_from_path_chunked(output_file, NISQA_MAX_MEMORY)
         logger.info("Final step %s: %s done in %s sec", len(self.pipeline), final_stats.repr_for_logging, end - start)
 
+        if cache is not None:
+            cache.put(input_key, self.pipeline, output_file, pipeline_stats[1:])
+
         return pipeline_stats
 
-    def run(
+    def run(  # noqa: PLR0913
         self,
         input_file: Path,
         output_file: Path,
         tempdir: Path,
         nisqa_model: NisqaModel | None,
+        keep_intermediate_files: bool = False,  # noqa: FBT001, FBT002
+        cache: AudioPrefixCache | None = None,
+        input_key: str | None = None,
     ) -> AudioPipelineStatistics:
+        """
+        Прогоняет звук через все действия
+
+        Выходы промежуточных шагов удаляются сразу после того, как их прочитал следующий шаг,
+        если не задан keep_intermediate_files. Вход и выход пайплайна не удаляются
+
+        Если задан cache, то пайплайн продолжает с самого длинного закешированного префикса.
+        input_key идентифицирует вход, без него хешируется сам файл
+        """
         start = time.perf_counter()
-        step_statistics = self._run(input_file, output_file, tempdir, nisqa_model)
+        step_statistics = self._run(
+            input_file,
+            output_file,
+            tempdir,
+            nisqa_model,
+            keep_intermediate_files,
+            cache,
+            input_key,
+        )
         end = time.perf_counter()
 
         return AudioPipelineStatistics(
@@ -0,0 +1,131 @@
+"""
+Кеш результатов префиксов AudioPipeline на диске узла
+
+Разные профили часто начинаются с одних и тех же действий. Результат префикса хранится по ключу
+(хеш входа, хеш действий префикса), поэтому другой профиль того же видео продолжает с самого длинного
+уже посчитанного префикса.
+
+Файлы попадают в кеш и достаются из него жёсткими ссылками, поэтому в пределах одной файловой системы
+ничего не копируется. Размер кеша ограничивается удалением давно не использованных записей
+"""
+
+import fcntl
+import hashlib
+import logging
+import os
+import shutil
+from collections.abc import Iterator, Sequence
+from contextlib import contextmanager
+from pathlib import Path
+
+import orjson
+import pydantic
+
+from configs import AUDIO_PREFIX_CACHE_FOLDER, AUDIO_PREFIX_CACHE_MAX_SIZE
+from utils.metrics import observe_cache
+
+from .actions.abstract import Action
+
+logger = logging.getLogger(__name__)
+
+
+def hash_file(path: Path) -> str:
+    with open(path, "rb") as f:  # noqa: PTH123
+        return hashlib.file_digest(f, "sha256").hexdigest()
+
+
+def hash_actions(actions: Sequence[Action]) -> str:
+    return hashlib.sha256(
+        orjson.dumps([action.model_dump(mode="json") for action in actions], option=orjson.OPT_SORT_KEYS),
+    ).hexdigest()
+
+
+def _link_or_copy(src: Path, dst: Path) -> None:
+    """
+    Жёсткая ссылка, а если кеш на другой файловой системе, то копия
+    """
+    dst.unlink(missing_ok=True)
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copyfile(src, dst)
+
+
+class AudioPrefixCache:
+    def __init__(  # noqa: D107
+        self,
+        folder: Path = AUDIO_PREFIX_CACHE_FOLDER,
+        max_size_bytes: int = AUDIO_PREFIX_CACHE_MAX_SIZE,
+    ):
+        self.folder = folder
+        self.max_size_bytes = max_size_bytes
+
+    @contextmanager
+    def _lock(self) -> Iterator[None]:
+        """
+        Кеш общий для всех воркеров узла
+        """
+        self.folder.mkdir(parents=True, exist_ok=True)
+        with open(self.folder / ".lock", "w") as lock_file:  # noqa: PTH123
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _get_paths(self, input_key: str, actions: Sequence[Action]) -> tuple[Path, Path]:
+        key = hashlib.sha256(f"{input_key}:{hash_actions(actions)}".encode()).hexdigest()
+        return self.folder / f"{key}.wav", self.folder / f"{key}.json"
+
+    def get_longest_prefix(
+        self,
+        input_key: str,
+        actions: Sequence[Action],
+        output_file: Path,
+    ) -> tuple[int, list[dict]] | None:
+        """
+        Ищет самый длинный закешированный префикс actions и кладёт его результат в output_file
+
+        Возвращает длину префикса и сохранённую вместе с результатом статистику его шагов
+        """
+        with self._lock():
+            for prefix_length in range(len(actions), 0, -1):
+                data_file, meta_file = self._get_paths(input_key, actions[:prefix_length])
+                if not data_file.exists() or not meta_file.exists():
+                    continue
+
+                _link_or_copy(data_file, output_file)
+                # mtime используется как время последнего использования
+                data_file.touch()
+                logger.info("Reusing cached result of first %s audio pipeline steps", prefix_length)
+                observe_cache("audio_prefix", hit=True)
+                return prefix_length, orjson.loads(meta_file.read_bytes())
+
+        observe_cache("audio_prefix", hit=False)
+        return None
+
+    def put(
+        self,
+        input_key: str,
+        actions: Sequence[Action],
+        result_file: Path,
+        steps_stats: Sequence[pydantic.BaseModel],
+    ) -> None:
+        data_file, meta_file = self._get_paths(input_key, actions)
+        with self._lock():
+            _link_or_copy(result_file, data_file)
+            meta_file.write_bytes(orjson.dumps([stats.model_dump(mode="json") for stats in steps_stats]))
+            self._evict()
+
+    def _evict(self) -> None:
+        data_files = sorted(self.folder.glob("*.wav"), key=lambda file: file.stat().st_mtime, reverse=True)
+        total_size = 0
+        for data_file in data_files:
+            total_size += data_file.stat().st_size
+            if total_size > self.max_size_bytes:
+                logger.debug("Removing %s from audio prefix cache", data_file)
+                data_file.unlink(missing_ok=True)
+                data_file.with_suffix(".json").unlink(missing_ok=True)
+
+
+audio_prefix_cache = AudioPrefixCache()
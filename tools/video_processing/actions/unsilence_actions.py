@@ -1,15 +1,21 @@
 import logging
 import time
+from collections.abc import Callable
 from pathlib import Path
-from typing import Any, Literal, Self
+from typing import Any, Literal, Self, TypeAlias
 
 import pydantic
 from pydantic import ConfigDict, Field, model_validator
 
 from configs import TQDM_LOGGING_INTERVAL, VAD_MODEL
+from libs.unsilence.intervals.interval import SerializedInterval
+from libs.unsilence.intervals.interval_array import IntervalArray
+from libs.unsilence.intervals.intervals import Intervals
+from libs.unsilence.intervals.time_calculations import TimeData
 from libs.unsilence.pretty_time_estimate import pretty_time_estimate
 from libs.unsilence.render_media.options import RenderOptions
 from libs.unsilence_fast import unsilence
+from libs.unsilence_fast.fast_media_renderer import FastMediaRenderer
 from tools.audio_processing.actions.abstract import Action, ActionStatsType, ProcessingImpossibleError
 from tools.video_processing.vad.calculate_time_savings import calculate_time_savings
 from tools.video_processing.vad.vad_unsilence import Vad
@@ -24,15 +30,67 @@ INTERVAL_LIST_KEY = "interval_list"
 INTERVAL_LIST_WITHOUT_BREAKS_KEY = "interval_list_without_breaks"
 INTERVAL_GROUPS_KEY = "interval_groups"
 
+#: Интервалы в виде IntervalArray.to_base64. В JSON занимают в несколько раз меньше списка словарей
+PackedIntervals: TypeAlias = str
+
 logger = logging.getLogger(__name__)
 
 
+def pack_intervals(intervals: IntervalArray | list[SerializedInterval]) -> PackedIntervals:
+    if not isinstance(intervals, IntervalArray):
+        intervals = IntervalArray.from_serialized(intervals)
+
+    return intervals.to_base64()
+
+
+def unpack_intervals(packed: PackedIntervals | list[SerializedInterval]) -> IntervalArray:
+    """
+    Принимает и списки словарей, в которых интервалы сохранялись раньше
+    """
+    if isinstance(packed, str):
+        return IntervalArray.from_base64(packed)
+
+    return IntervalArray.from_serialized(packed)
+
+
 class SilenceOnlyError(ProcessingImpossibleError):
     """
     Только тишина в видео
     """
 
 
+class SilenceDetectionResult(pydantic.BaseModel):
+    """
+    Результат поиска тишины, по которому можно отрендерить видео без повторного поиска
+    """
+
+    detection_time: float
+    time_savings_estimation: TimeData
+    interval_list: PackedIntervals
+    interval_list_without_breaks: PackedIntervals
+    #: Пик занятого этапом временного диска в байтах. Заполняется тем, кто выделял временную папку
+    peak_temp_disk_usage: int | None = None
+    #: Процессорное время поиска на одно видео. Заполняется тем, кто запускал
+    cpu_time: float | None = None
+
+    @pydantic.field_validator("interval_list", "interval_list_without_breaks", mode="before")
+    @classmethod
+    def pack_legacy_interval_list(cls, interval_list: Any) -> Any:  # noqa: ANN401
+        if isinstance(interval_list, list):
+            return pack_intervals(interval_list)
+
+        return interval_list
+
+    def get_intervals(self) -> Intervals:
+        """
+        Интервалы распаковываются только здесь, а не при загрузке результата
+        """
+        return Intervals.from_array(
+            unpack_intervals(self.interval_list),
+            unpack_intervals(self.interval_list_without_breaks),
+        )
+
+
 class UnsilenceAction(Action):
     model_config = ConfigDict(arbitrary_types_allowed=True)
 
@@ -44,6 +102,8 @@ class UnsilenceAction(Action):
 
     temp_dir: Path = Field(Path(".tmp"), exclude=True)
     separated_audio: Path | None = Field(None, exclude=True)
+    # Позволяет рендерить группы интервалов не в потоках на этой машине
+    media_renderer_factory: Callable[[Path], FastMediaRenderer] | None = Field(None, exclude=True)
 
     @pydantic.field_serializer("unsilence_class")
     def serialize_unsilence_class(
@@ -82,23 +142,30 @@ class UnsilenceAction(Action):
 
         return self
 
-    def run(self, input_file: Path, output_file: Path) -> ActionStatsType | None:
+    def _create_unsilence(self, input_file: Path) -> unsilence.Unsilence:
         init_additional_options = {}
-        detect_additional_options = {}
-
-        silence_detect_progress = ProgressBar("Detecting silence", mininterval=TQDM_LOGGING_INTERVAL)
-        detect_additional_options["on_silence_detect_progress_update"] = silence_detect_progress.update_unsilence
 
         # Так делать плохо, но можно
         # SOLID вышел из чата
         if issubclass(self.unsilence_class, Vad):
             init_additional_options["model"] = VAD_MODEL
 
+        return self.unsilence_class(input_file, **init_additional_options)
+
+    def detect(self, input_file: Path) -> SilenceDetectionResult:
+        """
+        Ищет тишину. Результат можно сохранить и потом отрендерить через render
+        """
+        detect_additional_options = {}
+
+        silence_detect_progress = ProgressBar("Detecting silence", mininterval=TQDM_LOGGING_INTERVAL)
+        detect_additional_options["on_silence_detect_progress_update"] = silence_detect_progress.update_unsilence
+
+        if issubclass(self.unsilence_class, Vad):
             vad_progress = ProgressBar("Detecting voice activity", mininterval=TQDM_LOGGING_INTERVAL)
             detect_additional_options["on_vad_progress_update"] = vad_progress.update_unsilence
 
-        # ----------------- Detecting ----------------- #
-        u = self.unsilence_class(input_file, **init_additional_options)
+        u = self._create_unsilence(input_file)
 
         logger.debug("Running silence detection")
         detection_start = time.perf_counter()
@@ -117,11 +184,31 @@ class UnsilenceAction(Action):
         )
         logger.info("Estimated time savings\n%s", pretty_time_estimate(time_savings_estimation))
 
-        # ----------------- Rendering ----------------- #
+        interval_list, interval_list_without_breaks = intervals.to_array()
+        return SilenceDetectionResult(
+            detection_time=detection_end - detection_start,
+            time_savings_estimation=time_savings_estimation,
+            interval_list=pack_intervals(interval_list),
+            interval_list_without_breaks=pack_intervals(interval_list_without_breaks),
+        )
+
+    def render(self, input_file: Path, output_file: Path, detection: SilenceDetectionResult) -> ActionStatsType:
+        """
+        Рендерит видео по найденным в detect интервалам
+        """
+        intervals = detection.get_intervals()
+
         logger.info("Rendering %s intervals", len(intervals.intervals))
         if len(intervals.intervals) == 1 and intervals.intervals[0].is_silent:
             raise SilenceOnlyError("Only silence in video")
 
+        u = self._create_unsilence(input_file)
+        u.set_intervals(intervals)
+
+        render_additional_options = {}
+        if self.media_renderer_factory is not None:
+            render_additional_options["media_renderer_factory"] = self.media_renderer_factory
+
         render_progress = ProgressBar("Rendering intervals", mininterval=TQDM_LOGGING_INTERVAL)
         concat_progress = ProgressBar("Concatenating intervals", mininterval=TQDM_LOGGING_INTERVAL)
 
@@ -133,19 +220,22 @@ class UnsilenceAction(Action):
             render_options=self.render_options,
             on_render_progress_update=render_progress.update_unsilence,
             on_concat_progress_update=concat_progress.update_unsilence,
+            **render_additional_options,
         )
         rendering_end = time.perf_counter()
 
         time_savings_real = calculate_time_savings(input_file, output_file)
         logger.info("Got time savings\n%s", pretty_time_estimate(time_savings_real))
 
-        interval_list, interval_list_without_breaks = intervals.serialize()
         return {
-            DETECTION_TIME_KEY: detection_end - detection_start,
+            DETECTION_TIME_KEY: detection.detection_time,
             RENDERING_TIME_KEY: rendering_end - rendering_start,
-            TIME_SAVINGS_ESTIMATION_KEY: time_savings_estimation,
+            TIME_SAVINGS_ESTIMATION_KEY: detection.time_savings_estimation,
             TIME_SAVINGS_REAL_KEY: time_savings_real,
-            INTERVAL_LIST_KEY: interval_list,
-            INTERVAL_LIST_WITHOUT_BREAKS_KEY: interval_list_without_breaks,
-            INTERVAL_GROUPS_KEY: interval_groups,
+            INTERVAL_LIST_KEY: detection.interval_list,
+            INTERVAL_LIST_WITHOUT_BREAKS_KEY: detection.interval_list_without_breaks,
+            INTERVAL_GROUPS_KEY: [pack_intervals(interval_group) for interval_group in interval_groups],
         }
+
+    def run(self, input_file: Path, output_file: Path) -> ActionStatsType | None:
+        return self.render(input_file, output_file, self.detect(input_file))
@@ -1,28 +1,46 @@
 # ruff: noqa: ERA001
+import hashlib
 import logging
 import time
+from collections.abc import Callable
 from pathlib import Path
 from typing import Self
 
+import orjson
 import pydantic
 
 from configs import NISQA_MAX_MEMORY
 from libs.nisqa.model import NisqaModel
+from libs.unsilence_fast.fast_media_renderer import FastMediaRenderer
 from tools.audio_processing.actions.ffmpeg_actions import ExtractAudioFromVideo
 from tools.audio_processing.pipeline import AudioPipeline, AudioPipelineStatistics, StepStatistics
+from tools.audio_processing.prefix_cache import AudioPrefixCache
 from utils.audio import ffmpeg_transcode, measure_volume_if_enabled
 
-from .actions.unsilence_actions import UnsilenceAction
+from .actions.unsilence_actions import SilenceDetectionResult, UnsilenceAction
 
 logger = logging.getLogger(__name__)
 
 
+class AudioStageStatistics(pydantic.BaseModel):
+    extract_audio_stats: StepStatistics
+    audio_pipeline_stats: AudioPipelineStatistics
+    #: Пик занятого этапом временного диска в байтах. Заполняется тем, кто выделял временную папку
+    peak_temp_disk_usage: int | None = None
+    #: Процессорное время этапа с ffmpeg и долей общих для пакета действий. Заполняется тем, кто запускал
+    cpu_time: float | None = None
+
+
 class VideoPipelineStatistics(pydantic.BaseModel):
     total_time: float
 
     extract_audio_stats: StepStatistics
     audio_pipeline_stats: AudioPipelineStatistics
     unsilence_stats: StepStatistics
+    #: Пик занятого временного диска в байтах по всем этапам
+    peak_temp_disk_usage: int | None = None
+    #: Процессорное время всех этапов, включая ffmpeg. Без воркеров распределённого рендеринга
+    cpu_time: float | None = None
 
     def get_nisqa_time(self) -> float:
         """
@@ -75,41 +93,145 @@ class VideoPipeline(pydantic.BaseModel):
 
         return self
 
-    def run(
+    @staticmethod
+    def extract_audio(input_file: Path, extracted_audio_file: Path) -> StepStatistics:
+        """
+        Извлекает звук из видео. Результат не зависит от профилей, поэтому его можно использовать для нескольких
+        """
+        logger.info("Extracting audio")
+        extract_audio_start = time.perf_counter()
+        extract_audio_stats = ExtractAudioFromVideo().run(input_file, extracted_audio_file)
+        extract_audio_end = time.perf_counter()
+
+        return StepStatistics(
+            step=0,
+            step_name="extract audio",
+            time=extract_audio_end - extract_audio_start,
+            action_stats=extract_audio_stats,
+            nisqa=None,
+            rms_db=0,
+        )
+
+    def run_audio_pipeline(  # noqa: PLR0913
+        self,
+        extracted_audio_file: Path,
+        extract_audio_stats: StepStatistics,
+        processed_audio_file: Path,
+        tempdir: Path,
+        nisqa_model: NisqaModel | None = None,
+        cache: AudioPrefixCache | None = None,
+        input_key: str | None = None,
+    ) -> AudioStageStatistics:
+        """
+        Обрабатывает извлечённый через extract_audio звук. Сам извлечённый звук не удаляется
+        """
+        logger.info("Running audio pipeline")
+        audio_pipeline_stats = self.audio_pipeline.run(
+            extracted_audio_file,
+            processed_audio_file,
+            tempdir,
+            nisqa_model,
+            cache=cache,
+            input_key=input_key,
+        )
+
+        return AudioStageStatistics(
+            extract_audio_stats=extract_audio_stats,
+            audio_pipeline_stats=audio_pipeline_stats,
+        )
+
+    def run_audio_stage(  # noqa: PLR0913
         self,
         input_file: Path,
-        output_file: Path,
+        processed_audio_file: Path,
         tempdir: Path,
         nisqa_model: NisqaModel | None = None,
-    ) -> VideoPipelineStatistics:
-        pipeline_start = time.perf_counter()
+        delete_input_file: bool = False,  # noqa: FBT001, FBT002
+        cache: AudioPrefixCache | None = None,
+        input_key: str | None = None,
+    ) -> AudioStageStatistics:
+        """
+        Извлекает звук из видео и обрабатывает его
 
-        ###############################
-        logger.info("Extracting audio")
-        extract_audio_start = time.perf_counter()
+        Если задан delete_input_file, то видео удаляется сразу после извлечения звука.
+        cache и input_key передаются в AudioPipeline.run
+        """
         extracted_audio_file = tempdir / "step_0_extract_audio.wav"
-        extract_audio_stats = ExtractAudioFromVideo().run(input_file, extracted_audio_file)
-        extract_audio_end = time.perf_counter()
+        extract_audio_stats = self.extract_audio(input_file, extracted_audio_file)
+        if delete_input_file:
+            input_file.unlink()
 
-        ###############################
-        logger.info("Running audio pipeline")
-        processed_audio_file = tempdir / "processed_audio.wav"
-        audio_pipeline_stats = self.audio_pipeline.run(extracted_audio_file, processed_audio_file, tempdir, nisqa_model)
+        audio_stage_stats = self.run_audio_pipeline(
+            extracted_audio_file,
+            extract_audio_stats,
+            processed_audio_file,
+            tempdir,
+            nisqa_model,
+            cache=cache,
+            input_key=input_key,
+        )
+        extracted_audio_file.unlink()
+
+        return audio_stage_stats
+
+    def get_detection_key(self) -> str:
+        """
+        Ключ, одинаковый у пайплайнов с одинаковым результатом run_detection_stage
 
-        ###############################
+        Тишина ищется по обработанному звуку, а в оценку экономии времени входят скорости из render_options
+        """
+        render_options = self.unsilence_action.render_options
+        return hashlib.sha256(
+            orjson.dumps(
+                {
+                    "audio_pipeline": self.audio_pipeline.model_dump(mode="json"),
+                    "unsilence_class": self.unsilence_action.unsilence_class.__name__,
+                    "detect_silence_options": self.unsilence_action.detect_silence_options,
+                    "audible_speed": render_options.audible_speed,
+                    "silent_speed": render_options.silent_speed,
+                    "minimum_interval_duration": render_options.minimum_interval_duration,
+                },
+                option=orjson.OPT_SORT_KEYS,
+            ),
+        ).hexdigest()
+
+    def run_detection_stage(self, input_file: Path, processed_audio_file: Path) -> SilenceDetectionResult:
+        """
+        Ищет тишину по обработанному звуку
+        """
+        logger.info("Detecting silence")
+        self.unsilence_action.separated_audio = processed_audio_file
+        return self.unsilence_action.detect(input_file)
+
+    def run_render_stage(  # noqa: PLR0913
+        self,
+        input_file: Path,
+        processed_audio_file: Path,
+        output_file: Path,
+        tempdir: Path,
+        detection: SilenceDetectionResult,
+        nisqa_model: NisqaModel | None = None,
+        media_renderer_factory: Callable[[Path], FastMediaRenderer] | None = None,
+    ) -> StepStatistics:
+        """
+        Рендерит видео без тишины
+        """
         logger.info("Unsilencing")
         unsilence_start = time.perf_counter()
         self.unsilence_action.temp_dir = tempdir / "unsilence"
         self.unsilence_action.separated_audio = processed_audio_file
-        unsilence_stats = self.unsilence_action.run(
+        self.unsilence_action.media_renderer_factory = media_renderer_factory
+        unsilence_stats = self.unsilence_action.render(
             input_file=input_file,
             output_file=output_file,
+            detection=detection,
         )
         if nisqa_model is not None:
-            processed_audio = tempdir / "processed_audio.wav"
-            ffmpeg_transcode(output_file, processed_audio, {"ac": 1, "ar": 48000})
+            unsilenced_audio = tempdir / "unsilenced_audio.wav"
+            ffmpeg_transcode(output_file, unsilenced_audio, {"ac": 1, "ar": 48000})
             with nisqa_model.cleanup_cuda():
-                unsilence_nisqa = nisqa_model.measure_from_path_chunked(processed_audio, NISQA_MAX_MEMORY)
+                unsilence_nisqa = nisqa_model.measure_from_path_chunked(unsilenced_audio, NISQA_MAX_MEMORY)
+            unsilenced_audio.unlink()
         else:
             unsilence_nisqa = None
         unsilence_rms_db = measure_volume_if_enabled(output_file)
@@ -117,25 +239,40 @@ class VideoPipeline(pydantic.BaseModel):
         unsilence_stats = StepStatistics(
             step=self.audio_pipeline.get_steps_count(),
             step_name="unsilence",
-            time=unsilence_end - unsilence_start,
+            time=unsilence_end - unsilence_start + detection.detection_time,
             action_stats=unsilence_stats,
             nisqa=unsilence_nisqa,
             rms_db=unsilence_rms_db,
         )
         logger.info("Unsilence: %s done in %s", unsilence_stats.repr_for_logging, unsilence_stats.time)
 
-        pipeline_end = unsilence_end
-        ###############################
+        return unsilence_stats
+
+    def run(
+        self,
+        input_file: Path,
+        output_file: Path,
+        tempdir: Path,
+        nisqa_model: NisqaModel | None = None,
+    ) -> VideoPipelineStatistics:
+        pipeline_start = time.perf_counter()
+
+        processed_audio_file = tempdir / "processed_audio.wav"
+        audio_stage_stats = self.run_audio_stage(input_file, processed_audio_file, tempdir, nisqa_model)
+        detection = self.run_detection_stage(input_file, processed_audio_file)
+        unsilence_stats = self.run_render_stage(
+            input_file,
+            processed_audio_file,
+            output_file,
+            tempdir,
+            detection,
+            nisqa_model,
+        )
+
+        pipeline_end = time.perf_counter()
         return VideoPipelineStatistics(
             total_time=pipeline_end - pipeline_start,
-            extract_audio_stats=StepStatistics(
-                step=0,
-                step_name="extract audio",
-                time=extract_audio_end - extract_audio_start,
-                action_stats=extract_audio_stats,
-                nisqa=None,
-                rms_db=0,
-            ),
-            audio_pipeline_stats=audio_pipeline_stats,
+            extract_audio_stats=audio_stage_stats.extract_audio_stats,
+            audio_pipeline_stats=audio_stage_stats.audio_pipeline_stats,
             unsilence_stats=unsilence_stats,
         )
@@ -164,35 +164,9 @@ def intervals_or(intervals1: Intervals, intervals2: Intervals) -> Intervals:
     """
     Применяет логическое или к 2 последовательностям интервалов
     """
-    intervals1: list[Interval] = intervals1.intervals
-    intervals2: list[Interval] = intervals2.intervals
-
-    result = Intervals()
-    idx2 = 0
-    for interval1 in intervals1:
-        while True:
-            if idx2 >= len(intervals2):
-                return result
-
-            interval2 = intervals2[idx2]
-
-            if interval2.start > interval1.end:
-                break
-
-            result.add_interval(
-                Interval(
-                    start=max(interval1.start, interval2.start),
-                    end=min(interval1.end, interval2.end),
-                    is_silent=interval1.is_silent or interval2.is_silent,
-                ),
-            )
-
-            if interval2.end > interval1.end:
-                break
-
-            idx2 += 1
-
-    return result
+    array1, _ = intervals1.to_array()
+    array2, _ = intervals2.to_array()
+    return Intervals.from_array(array1.or_merge(array2))
 
 
 def intervals_collapse(intervals: Intervals) -> Intervals:
@@ -204,25 +178,8 @@ def intervals_collapse(intervals: Intervals) -> Intervals:
     if len(intervals.intervals) < 2:  # noqa: PLR2004
         return intervals
 
-    result = Intervals()
-    current_interval: Interval = intervals.intervals[0]
-
-    for interval in intervals.intervals[1:]:
-        interval: Interval
-        if interval.is_silent == current_interval.is_silent:
-            current_interval.end = interval.end
-        else:
-            result.add_interval(current_interval)
-            current_interval = interval
-
-    if len(result.intervals) == 0:
-        result.add_interval(current_interval)
-
-    if result.intervals[-1].end < intervals.intervals[-1].end:
-        current_interval.end = intervals.intervals[-1].end
-        result.add_interval(current_interval)
-
-    return result
+    array, _ = intervals.to_array()
+    return Intervals.from_array(array.collapse())
 
 
 class UnsilenceAndVad(Vad):
@@ -0,0 +1,110 @@
+"""
+Ускорение скачивания yt-dlp
+
+Фрагменты DASH и HLS скачиваются параллельно (concurrent_fragment_downloads), а цельные файлы -
+через aria2c в несколько соединений с разными диапазонами байт. Число соединений ограничено
+для каждого сайта сразу на все процессы (utils.download_connections), некоторые сайты замедляют
+или блокируют слишком много соединений.
+Скорость каждого скачанного файла пишется в лог и в метрики
+"""
+
+import logging
+import shutil
+import time
+from typing import Any
+from urllib.parse import urlsplit
+
+from configs import (
+    YT_DLP_ARIA2C_MIN_SPLIT_SIZE,
+    YT_DLP_DEFAULT_HOST_CONNECTIONS,
+    YT_DLP_HOST_CONNECTIONS,
+    YT_DLP_MULTI_CONNECTION,
+)
+from utils.metrics import DOWNLOAD_THROUGHPUT
+
+logger = logging.getLogger(__name__)
+
+ARIA2C_PATH = shutil.which("aria2c")
+
+if YT_DLP_MULTI_CONNECTION and ARIA2C_PATH is None:
+    logger.warning("aria2c is not installed, files without fragments are downloaded in one connection")
+
+
+def get_site(url: str) -> str:
+    """
+    Сайт из YT_DLP_HOST_CONNECTIONS, которому принадлежит ссылка, или её хост
+    """
+    host = (urlsplit(url).hostname or "").removeprefix("www.")
+    for site in YT_DLP_HOST_CONNECTIONS:
+        if host == site or host.endswith(f".{site}"):
+            return site
+
+    return host
+
+
+def get_host_connections(url: str) -> int:
+    return YT_DLP_HOST_CONNECTIONS.get(get_site(url), YT_DLP_DEFAULT_HOST_CONNECTIONS)
+
+
+def get_acceleration_options(url: str, connections: int | None = None) -> dict[str, Any]:
+    """
+    Настройки yt-dlp для параллельного скачивания с сайта, на который ведёт url, в connections соединений.
+    По умолчанию во все соединения, которые допускает сайт
+    """
+    if connections is None:
+        connections = get_host_connections(url)
+    options: dict[str, Any] = {"concurrent_fragment_downloads": connections}
+
+    if YT_DLP_MULTI_CONNECTION and ARIA2C_PATH is not None and connections > 1:
+        # Только для протокола http: фрагменты DASH и HLS остаются у встроенного загрузчика
+        options["external_downloader"] = {"http": "aria2c"}
+        options["external_downloader_args"] = {
+            "aria2c": [
+                f"--max-connection-per-server={connections}",
+                f"--split={connections}",
+                f"--min-split-size={YT_DLP_ARIA2C_MIN_SPLIT_SIZE}",
+                "--file-allocation=none",
+                "--summary-interval=0",
+            ],
+        }
+
+    return options
+
+
+class ThroughputLogger:
+    """
+    Progress hook yt-dlp, который пишет скорость скачивания каждого файла
+    """
+
+    def __init__(self, url: str):  # noqa: D107
+        self.site = get_site(url)
+        self._started: dict[str, float] = {}
+
+    def __call__(self, progress: dict[str, Any]) -> None:
+        filename = progress.get("filename", "")
+        if progress["status"] == "downloading":
+            self._started.setdefault(filename, time.perf_counter())
+            return
+
+        if progress["status"] != "finished":
+            return
+
+        started = self._started.pop(filename, None)
+        elapsed = progress.get("elapsed")
+        if elapsed is None and started is not None:
+            elapsed = time.perf_counter() - started
+
+        downloaded_bytes = progress.get("downloaded_bytes") or progress.get("total_bytes")
+        if not elapsed or not downloaded_bytes:
+            return
+
+        throughput = downloaded_bytes / elapsed
+        logger.info(
+            "Downloaded %.1f MB from %s in %.1f s: %.1f MB/s",
+            downloaded_bytes / 2**20,
+            self.site,
+            elapsed,
+            throughput / 2**20,
+        )
+        # Неизвестные сайты объединяются, чтобы не плодить метки
+        DOWNLOAD_THROUGHPUT.labels(self.site if self.site in YT_DLP_HOST_CONNECTIONS else "other").observe(throughput)
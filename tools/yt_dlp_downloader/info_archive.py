@@ -0,0 +1,61 @@
+"""
+Сокращённая информация yt-dlp для базы данных и сжатый архив полной
+
+Полная информация содержит все форматы, миниатюры и, у плейлистов, все записи. Код читает из неё только
+несколько полей, поэтому в базе хранится проекция, а полная информация сжимается zstd в хранилище
+"""
+
+import orjson
+import zstandard
+
+from tools.yt_dlp_downloader.misc import Json, yt_dlp_jsonify
+from tools.yt_dlp_downloader.yt_dlp_download_videos import YtDlpInfoDict
+
+#: Поля, которые остаются в базе данных
+SLIM_YT_DLP_INFO_KEYS = (
+    "id",
+    "_type",
+    "ie_key",
+    "extractor",
+    "extractor_key",
+    "title",
+    "description",
+    "webpage_url",
+    "url",
+    "original_url",
+    "duration",
+    "uploader",
+    "channel",
+    "upload_date",
+    "timestamp",
+    "playlist_count",
+)
+SLIM_THUMBNAIL_KEYS = ("url", "width", "height")
+
+YT_DLP_INFO_ARCHIVE_FILENAME = "yt_dlp_info.json.zst"
+ZSTD_LEVEL = 10
+
+
+def slim_yt_dlp_info(info: YtDlpInfoDict) -> YtDlpInfoDict:
+    """
+    Проекция информации yt-dlp на поля, которые читает код
+    """
+    slim_info = {key: yt_dlp_jsonify(info[key]) for key in SLIM_YT_DLP_INFO_KEYS if key in info}
+
+    thumbnails = info.get("thumbnails")
+    if thumbnails is not None:
+        slim_info["thumbnails"] = [
+            {key: thumbnail[key] for key in SLIM_THUMBNAIL_KEYS if key in thumbnail} for thumbnail in thumbnails
+        ]
+
+    return slim_info
+
+
+def compress_yt_dlp_info(info: YtDlpInfoDict) -> bytes:
+    return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(
+        orjson.dumps(yt_dlp_jsonify(info), option=orjson.OPT_NON_STR_KEYS),
+    )
+
+
+def decompress_yt_dlp_info(data: bytes) -> Json:
+    return orjson.loads(zstandard.ZstdDecompressor().decompress(data))
@@ -10,13 +10,15 @@ Json: TypeAlias = dict | list | str | float | int | bool | None
 
 
 def get_playlist_duration(info: YtDlpInfoDict) -> float:
-    return sum([x["duration"] for x in info["entries"]])
+    # В предпросмотре у записей, извлечённых не полностью, длительность может быть неизвестна
+    return sum([x.get("duration") or 0 for x in info["entries"]])
 
 
 def yt_dlp_get_html_link(info: YtDlpInfoDict) -> str:
     title = info["title"]
 
-    if info["extractor"] == FILE_TYPE:
+    # У записей плейлиста, извлечённых не полностью, нет extractor
+    if info.get("extractor") == FILE_TYPE:
         return f"загруженный видеофайл {title}"
 
     url = get_url(info)
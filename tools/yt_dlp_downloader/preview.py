@@ -0,0 +1,52 @@
+"""
+Быстрое получение информации для предпросмотра ссылки в боте
+
+Для предпросмотра нужны только название, длительность и миниатюра. Записи плейлистов не извлекаются
+полностью (extract_flat), их число ограничено, а результат сокращается до полей предпросмотра,
+поэтому его дёшево кешировать. Полная информация извлекается при скачивании
+"""
+
+import itertools
+
+from configs import YT_DLP_PREVIEW_MAX_ENTRIES
+
+from .info_archive import slim_yt_dlp_info
+from .yt_dlp_download_videos import COMMON_YT_DLP_OPTIONS, YoutubeDL, YtDlpInfoDict, filtered_entries, resolve_type
+
+#: Поля для проверки прямой трансляции, которых нет в сокращённой информации
+PREVIEW_LIVE_KEYS = ("is_live", "live_status")
+
+PREVIEW_YT_DLP_OPTIONS = COMMON_YT_DLP_OPTIONS | {
+    # Записи плейлистов остаются ссылками, а не извлекаются по одной. Своими экстракторами проверяется через get_param
+    "extract_flat": "in_playlist",
+    "lazy_playlist": True,
+}
+
+
+def slim_preview_info(info: YtDlpInfoDict, max_entries: int = YT_DLP_PREVIEW_MAX_ENTRIES) -> YtDlpInfoDict:
+    """
+    Сокращённая информация с не более чем max_entries записями. У записей миниатюры не нужны
+    """
+    preview_info = slim_yt_dlp_info(info)
+    preview_info.update({key: info[key] for key in PREVIEW_LIVE_KEYS if key in info})
+
+    entries = info.get("entries")
+    if entries is not None:
+        preview_info["entries"] = [
+            {key: value for key, value in slim_yt_dlp_info(entry).items() if key != "thumbnails"}
+            for entry in itertools.islice(filtered_entries(entries), max_entries)
+        ]
+        preview_info.setdefault("playlist_count", info.get("playlist_count"))
+
+    return preview_info
+
+
+def extract_preview_info(url: str) -> YtDlpInfoDict:
+    """
+    Извлекает информацию для предпросмотра ссылки
+    """
+    with YoutubeDL(PREVIEW_YT_DLP_OPTIONS) as ydl:
+        info = ydl.extract_info(url, download=False, process=False)
+        info["_type"] = resolve_type(info)
+
+        return slim_preview_info(info)
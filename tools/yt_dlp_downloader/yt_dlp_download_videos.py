@@ -12,7 +12,9 @@ from yt_dlp.downloader import FileDownloader
 from yt_dlp.extractor.common import InfoExtractor
 
 from configs import YT_DLP_HTTP_CHUNK_SIZE, YT_DLP_LOGGING_DEBOUNCE_TIME, YT_DLP_YOUTUBE_FORMATS_DASHY
+from utils.download_connections import host_connection_limiter
 
+from .acceleration import ThroughputLogger, get_acceleration_options, get_host_connections, get_site
 from .yt_dlp_extractors import CUSTOM_EXTRACTORS
 from .yt_dlp_format_select import select_format
 
@@ -226,13 +228,15 @@ if YT_DLP_YOUTUBE_FORMATS_DASHY:
     }
 
 
-def download(url: str, output_dir: str, **additional_ydl_opts) -> DownloadData:
+def download(url: str, output_dir: str, *, accelerate: bool = True, **additional_ydl_opts) -> DownloadData:
     """
     Скачивает видео или плейлист с youtube
 
     Args:
         url: Ссылка на видео или плейлист на youtube
         output_dir: Папка для скачивания файлов
+        accelerate: скачивать в несколько соединений, см. acceleration.get_acceleration_options.
+            Соединения с сайтом делятся между всеми процессами, без ускорения занимается одно
         additional_ydl_opts: дополнительные настройки yt_dlp
             https://github.com/yt-dlp/yt-dlp?tab=readme-ov-file#usage-and-options
     Returns:
@@ -245,21 +249,29 @@ def download(url: str, output_dir: str, **additional_ydl_opts) -> DownloadData:
         _id = rel_filename.split(".", 1)[0]
         data.filenames[_id] = filename
 
-    ydl_opts = (
-        COMMON_YT_DLP_OPTIONS
-        | {
-            "post_hooks": [get_file_name],
-            "outtmpl": os.path.join(output_dir, "%(id)s.%(ext)s"),  # noqa: PTH118
-        }
-        | additional_ydl_opts
-    )
-
-    with YoutubeDL(ydl_opts) as ydl:
-        ydl.add_post_processor(RecalcIds(), when="pre_process")
-        ydl.add_post_processor(RecalcIds(), when="playlist")
-        ydl.add_post_processor(SaveInfo(data), when="pre_process")
-        ydl.add_post_processor(SaveInfo(data), when="playlist")
-        ydl.download([url])
+    max_connections = get_host_connections(url)
+    with host_connection_limiter.acquire(
+        get_site(url),
+        max_connections if accelerate else 1,
+        max_connections,
+    ) as connections:
+        ydl_opts = (
+            COMMON_YT_DLP_OPTIONS
+            | (get_acceleration_options(url, connections) if accelerate else {})
+            | {
+                "post_hooks": [get_file_name],
+                "progress_hooks": [ThroughputLogger(url)],
+                "outtmpl": os.path.join(output_dir, "%(id)s.%(ext)s"),  # noqa: PTH118
+            }
+            | additional_ydl_opts
+        )
+
+        with YoutubeDL(ydl_opts) as ydl:
+            ydl.add_post_processor(RecalcIds(), when="pre_process")
+            ydl.add_post_processor(RecalcIds(), when="playlist")
+            ydl.add_post_processor(SaveInfo(data), when="pre_process")
+            ydl.add_post_processor(SaveInfo(data), when="playlist")
+            ydl.download([url])
 
     return data
 
@@ -1,10 +1,56 @@
 import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from typing import Any
 
+import lazy_object_proxy
+import orjson
+from redis import Redis
+from yt_dlp import YoutubeDL
 from yt_dlp.downloader import FileDownloader
 from yt_dlp.extractor.common import InfoExtractor
 from yt_dlp.extractor.youtube import YoutubeIE
-from yt_dlp.utils import ExtractorError
+from yt_dlp.utils import ExtractorError, LazyList
+
+from configs import (
+    LECTORIYFOPF_EXTRACT_WORKERS,
+    REDIS_HOST,
+    REDIS_PASSWORD,
+    REDIS_PORT,
+    REDIS_USER,
+    REDIS_YT_DLP_CACHE_DB,
+    YT_DLP_MEDIA_CACHE_TTL,
+)
+
+#: Информация с youtube кешируется по видео: одна лекция извлекается и со страницей курса, и по своей ссылке
+YOUTUBE_INFO_CACHE_PREFIX = "lectoriyfopf:youtube:"
+
+_youtube_info_cache: Redis = lazy_object_proxy.Proxy(
+    lambda: Redis(
+        host=REDIS_HOST,
+        port=REDIS_PORT,
+        username=REDIS_USER,
+        password=REDIS_PASSWORD,
+        db=REDIS_YT_DLP_CACHE_DB,
+    ),
+)
+
+
+def _to_cacheable(obj: Any) -> Any:  # noqa: ANN401
+    """
+    Сырой результат извлечения, который переживает json, вместе с приватными ключами.
+    В отличие от sanitize_info, значения, которые нельзя сохранить (например, функция в __post_extractor),
+    выкидываются, а не превращаются в строки
+    """
+    if isinstance(obj, dict):
+        return {key: _to_cacheable(value) for key, value in obj.items() if _is_cacheable(value)}
+    if isinstance(obj, list | tuple | set | LazyList):
+        return [_to_cacheable(value) for value in obj if _is_cacheable(value)]
+    return obj
+
+
+def _is_cacheable(obj: Any) -> bool:  # noqa: ANN401
+    return obj is None or isinstance(obj, str | int | float | bool | dict | list | tuple | set | LazyList)
 
 
 class LectoriyFopfIE(InfoExtractor):
@@ -51,6 +97,40 @@ class LectoriyFopfIE(InfoExtractor):
 
         return list(zip(urls, names, strict=True))
 
+    def _extract_youtube_info(self, video_url: str, youtube_extractor: InfoExtractor | None = None) -> dict[str, Any]:
+        """
+        youtube_extractor нужен, если вызывается из другого потока: YoutubeIE и YoutubeDL не потокобезопасны
+        """
+        if youtube_extractor is None:
+            youtube_extractor = self._youtube_extractor
+
+        if self.get_param("getcomments"):
+            # Комментарии извлекаются функцией из __post_extractor, а её не сохранить в кеш
+            return youtube_extractor.extract(video_url)
+
+        key = f"{YOUTUBE_INFO_CACHE_PREFIX}{video_url}"
+        try:
+            cached_info = _youtube_info_cache.get(key)
+        except Exception as exc:  # noqa: BLE001
+            self.report_warning(f"Failed to get cached youtube info: {exc}")
+            cached_info = None
+
+        if cached_info is not None:
+            return orjson.loads(cached_info)  # pyright: ignore [reportArgumentType]
+
+        youtube_info = youtube_extractor.extract(video_url)
+        try:
+            # Кешируется сырой результат: после sanitize_info форматы теряли бы приватные ключи
+            _youtube_info_cache.set(
+                key,
+                orjson.dumps(_to_cacheable(youtube_info), option=orjson.OPT_NON_STR_KEYS),
+                ex=YT_DLP_MEDIA_CACHE_TTL,
+            )
+        except Exception as exc:  # noqa: BLE001
+            self.report_warning(f"Failed to cache youtube info: {exc}")
+
+        return youtube_info
+
     def _extract_video(
         self,
         video_url: str,
@@ -58,8 +138,9 @@ class LectoriyFopfIE(InfoExtractor):
         _id: str,
         playlist_title: str,
         webpage_url: str,
+        youtube_extractor: InfoExtractor | None = None,
     ) -> dict[str, Any]:
-        youtube_info = self._youtube_extractor.extract(video_url)
+        youtube_info = self._extract_youtube_info(video_url, youtube_extractor)
 
         youtube_info["title"] = f"{playlist_title}. {name}"
         youtube_info["id"] = _id
@@ -67,6 +148,51 @@ class LectoriyFopfIE(InfoExtractor):
 
         return youtube_info
 
+    def _extract_entries(
+        self,
+        urls: list[tuple[str, str]],
+        playlist_id: str,
+        playlist_title: str,
+        webpage_url: str,
+    ) -> list[dict[str, Any]]:
+        # YoutubeIE и YoutubeDL хранят cookies, кеш и другое состояние и не потокобезопасны,
+        # поэтому у каждого потока свои
+        thread_local = threading.local()
+        thread_youtube_dls: list[YoutubeDL] = []
+
+        def get_thread_youtube_extractor() -> InfoExtractor:
+            youtube_dl = getattr(thread_local, "youtube_dl", None)
+            if youtube_dl is None:
+                youtube_dl = YoutubeDL(dict(self._downloader.params))
+                thread_local.youtube_dl = youtube_dl
+                thread_youtube_dls.append(youtube_dl)
+            return youtube_dl.get_info_extractor(YoutubeIE.ie_key())
+
+        def extract_entry(idx: int, video_url: str, name: str) -> dict[str, Any]:
+            _id = f"{playlist_id}_{idx}"
+            entry = self._extract_video(
+                video_url=video_url,
+                name=name,
+                playlist_title=playlist_title,
+                webpage_url=webpage_url,
+                _id=_id,
+                youtube_extractor=get_thread_youtube_extractor(),
+            )
+            self.to_screen(f"Downloaded {idx}/{len(urls)}: {_id}")
+            return entry
+
+        # Лекции извлекаются с youtube независимо друг от друга
+        try:
+            with ThreadPoolExecutor(max_workers=LECTORIYFOPF_EXTRACT_WORKERS) as executor:
+                futures = [
+                    executor.submit(extract_entry, idx, video_url, name)
+                    for idx, (video_url, name) in enumerate(urls, start=1)
+                ]
+                return [future.result() for future in futures]
+        finally:
+            for youtube_dl in thread_youtube_dls:
+                youtube_dl.close()
+
     def _real_extract(self, url: str) -> dict[str, Any]:
         mobj = re.match(self._VALID_URL, url)
         playlist_id = mobj.group("playlist_id")
@@ -104,19 +230,19 @@ class LectoriyFopfIE(InfoExtractor):
             video_info["lectoriyfopf_id"] = mobj.group("lectoriyfopf_id")
             return video_info
 
-        entries = []
-
-        for idx, (video_url, name) in enumerate(urls, start=1):
-            _id = f"{playlist_id}_{idx}"
-            entry = self._extract_video(
-                video_url=video_url,
-                name=name,
-                playlist_title=playlist_title_no_dot,
-                webpage_url=url,
-                _id=_id,
-            )
-            self.to_screen(f"Downloaded {idx}/{len(urls)}: {_id}")
-            entries.append(entry)
+        if self.get_param("extract_flat"):
+            # Для предпросмотра достаточно ссылок и названий, без извлечения с youtube
+            entries = [
+                self.url_result(
+                    video_url,
+                    ie=YoutubeIE.ie_key(),
+                    video_id=f"{playlist_id}_{idx}",
+                    video_title=f"{playlist_title_no_dot}. {name}",
+                )
+                for idx, (video_url, name) in enumerate(urls, start=1)
+            ]
+        else:
+            entries = self._extract_entries(urls, playlist_id, playlist_title_no_dot, url)
 
         playlist_info = self.playlist_result(
             entries=entries,
@@ -1,10 +1,48 @@
 import logging
+from collections.abc import Collection
+from dataclasses import dataclass
 from typing import Any, Literal
 
-from configs import YT_DLP_VIDEO_MAX_HEIGHT, YT_DLP_VIDEO_MAX_WIDTH
+from configs import (
+    YT_DLP_CODEC_DECODE_COST,
+    YT_DLP_FORMAT_SCORE_WEIGHTS,
+    YT_DLP_HARDWARE_DECODABLE_CODECS,
+    YT_DLP_SUFFICIENT_BITS_PER_PIXEL,
+    YT_DLP_VIDEO_MAX_HEIGHT,
+    YT_DLP_VIDEO_MAX_WIDTH,
+)
 
 logger = logging.getLogger(__name__)
 
+#: Семейства кодеков по началу vcodec в yt-dlp, например avc1.640028 или vp09.00.40.08
+CODEC_FAMILIES = {
+    "avc1": "h264",
+    "avc3": "h264",
+    "h264": "h264",
+    "hvc1": "hevc",
+    "hev1": "hevc",
+    "hevc": "hevc",
+    "h265": "hevc",
+    "vp09": "vp9",
+    "vp9": "vp9",
+    "av01": "av1",
+    "av1": "av1",
+}
+#: Частота кадров, если yt-dlp её не знает
+DEFAULT_FPS = 30
+
+
+@dataclass(frozen=True)
+class FormatScoreWeights:
+    resolution: float
+    bitrate_sufficiency: float
+    size: float
+    decode_cost: float
+    hardware_decode: float
+
+
+DEFAULT_FORMAT_SCORE_WEIGHTS = FormatScoreWeights(**YT_DLP_FORMAT_SCORE_WEIGHTS)
+
 
 def get_video_format_repr(video_format: dict[str, Any]) -> str:
     return f"{video_format.get('format')} - {video_format.get('vbr', 0) or 0:.0f} kb/s - {video_format['ext']}"
@@ -28,6 +66,51 @@ def has_bitrate(format_: dict, key: Literal["abr", "vbr", "tbe"]) -> bool:
     return value > 0
 
 
+def get_codec_family(vcodec: str | None) -> str:
+    if not vcodec:
+        return "unknown"
+
+    prefix = vcodec.split(".", 1)[0].lower()
+    return CODEC_FAMILIES.get(prefix, prefix)
+
+
+def get_bits_per_pixel(video_format: dict[str, Any]) -> float:
+    height = video_format["height"]
+    width = video_format.get("width") or height * 16 / 9
+    fps = video_format.get("fps") or DEFAULT_FPS
+
+    return video_format["vbr"] * 1000 / (width * height * fps)
+
+
+def score_video_format(
+    video_format: dict[str, Any],
+    max_vbr: float,
+    weights: FormatScoreWeights = DEFAULT_FORMAT_SCORE_WEIGHTS,
+    hardware_decodable_codecs: Collection[str] = YT_DLP_HARDWARE_DECODABLE_CODECS,
+) -> float:
+    """
+    Оценка видеоформата, чем больше, тем лучше. Каждая часть от 0 до 1 умножается на свой вес:
+    + разрешение относительно YT_DLP_VIDEO_MAX_HEIGHT
+    + бит на пиксель относительно YT_DLP_SUFFICIENT_BITS_PER_PIXEL, больше достаточного не ценится
+    - битрейт относительно самого большого max_vbr: дольше скачивание и декодирование
+    - стоимость программного декодирования кодека
+    + рендеринг декодирует кодек на gpu
+
+    Видео всё равно перекодируется в FORCE_VIDEO_CODEC, поэтому из форматов одного разрешения
+    выбирается самый дешёвый в скачивании и декодировании, если его битрейта достаточно
+    """
+    codec = get_codec_family(video_format.get("vcodec"))
+    bits_per_pixel = get_bits_per_pixel(video_format)
+
+    return (
+        weights.resolution * min(1.0, video_format["height"] / YT_DLP_VIDEO_MAX_HEIGHT)
+        + weights.bitrate_sufficiency * min(1.0, bits_per_pixel / YT_DLP_SUFFICIENT_BITS_PER_PIXEL)
+        - weights.size * video_format["vbr"] / max_vbr
+        - weights.decode_cost * YT_DLP_CODEC_DECODE_COST.get(codec, 1.0)
+        + weights.hardware_decode * (codec in hardware_decodable_codecs)
+    )
+
+
 def fallback_any_audio(formats: list[dict[str, Any]]) -> dict | None:
     """
     Пытается найти любое аудио
@@ -77,11 +160,16 @@ def merge_formats(*formats_: dict[str, Any]) -> dict[str, Any]:
     }
 
 
-def select_best_video(formats: list[dict[str, Any]]) -> dict[str, Any]:
-    # Сортируем по битрейту
-    # В yt-dlp есть эвристики по сортировки по качеству,
-    # поэтому ещё применяем stable sort (в питоне по умолчанию)
+def select_best_video(
+    formats: list[dict[str, Any]],
+    weights: FormatScoreWeights = DEFAULT_FORMAT_SCORE_WEIGHTS,
+    hardware_decodable_codecs: Collection[str] = YT_DLP_HARDWARE_DECODABLE_CODECS,
+) -> dict[str, Any]:
+    """
+    Выбирает видеоформат с наибольшей score_video_format
 
+    :param formats: форматы от лучшего к худшему по мнению yt-dlp. При равной оценке выбирается первый
+    """
     video_formats = [
         format_
         for format_ in formats
@@ -98,7 +186,16 @@ def select_best_video(formats: list[dict[str, Any]]) -> dict[str, Any]:
     if len(video_formats) == 0:
         return fallback_any_video(formats)
 
-    return video_formats[0]
+    max_vbr = max(format_["vbr"] for format_ in video_formats)
+    scores = [score_video_format(format_, max_vbr, weights, hardware_decodable_codecs) for format_ in video_formats]
+    # max возвращает первый из равных
+    best_index = max(range(len(video_formats)), key=scores.__getitem__)
+    logger.debug(
+        "Video format scores: %s",
+        ", ".join(f"{format_['format_id']}={score:.2f}" for format_, score in zip(video_formats, scores, strict=True)),
+    )
+
+    return video_formats[best_index]
 
 
 def select_best_audio(formats: list[dict[str, Any]]) -> dict[str, Any]:
@@ -116,7 +213,7 @@ def select_best_audio(formats: list[dict[str, Any]]) -> dict[str, Any]:
 
 def select_format(ctx: dict[str, Any]) -> dict[str, Any]:
     """
-    Выбирает mp4 или mkv с разрешением не более 1080p
+    Выбирает видео с разрешением не более 1080p с наибольшей score_video_format и лучшее аудио
 
     https://github.com/yt-dlp/yt-dlp?tab=readme-ov-file#use-a-custom-format-selector
     """
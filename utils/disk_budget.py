@@ -0,0 +1,215 @@
+"""
+Бюджет временного диска
+
+Несколько воркеров на одном узле пишут промежуточные файлы на один диск.
+Каждая задача перед работой арендует оценку своего пика на диске, аренды хранятся в redis так же,
+как аренды видеокарты в utils.gpu_admission
+"""
+
+import logging
+import os
+import threading
+import time
+import uuid
+from collections.abc import Iterator
+from contextlib import contextmanager
+from pathlib import Path
+from types import TracebackType
+from typing import Self
+
+import lazy_object_proxy
+from redis import Redis
+
+from configs import (
+    REDIS_GPU_ADMISSION_DB,
+    REDIS_HOST,
+    REDIS_PASSWORD,
+    REDIS_PORT,
+    REDIS_USER,
+    TEMP_DISK_BUDGET,
+    TEMP_DISK_LEASE_TTL,
+    TEMP_DISK_NODE_NAME,
+    TEMP_DISK_POLL_INTERVAL,
+    TEMP_DISK_USAGE_POLL_INTERVAL,
+)
+
+logger = logging.getLogger(__name__)
+
+# Атомарно чистит протухшие аренды и выдаёт новую, если хватает места
+# KEYS[1] - hash аренд узла, значение аренды - "size:expire_at"
+# ARGV - lease_id, size, budget, now, expire_at
+_ACQUIRE_SCRIPT = """
+local now = tonumber(ARGV[4])
+local used = 0
+local leases = redis.call('HGETALL', KEYS[1])
+for i = 1, #leases, 2 do
+    local size, expire_at = string.match(leases[i + 1], '([^:]+):([^:]+)')
+    if tonumber(expire_at) < now then
+        redis.call('HDEL', KEYS[1], leases[i])
+    else
+        used = used + tonumber(size)
+    end
+end
+if used + tonumber(ARGV[2]) <= tonumber(ARGV[3]) then
+    redis.call('HSET', KEYS[1], ARGV[1], ARGV[2] .. ':' .. ARGV[5])
+    return 1
+end
+return 0
+"""
+
+# Продлевает аренду, только если она ещё не была удалена
+_REFRESH_SCRIPT = """
+if redis.call('HEXISTS', KEYS[1], ARGV[1]) == 1 then
+    redis.call('HSET', KEYS[1], ARGV[1], ARGV[2])
+    return 1
+end
+return 0
+"""
+
+
+class DiskBudgetController:
+    def __init__(  # noqa: D107
+        self,
+        redis: Redis,
+        node_name: str = TEMP_DISK_NODE_NAME,
+        budget: float = TEMP_DISK_BUDGET,
+        lease_ttl: float = TEMP_DISK_LEASE_TTL,
+        poll_interval: float = TEMP_DISK_POLL_INTERVAL,
+    ):
+        self.redis = redis
+        self.key = f"temp_disk_budget:{node_name}"
+        self.budget = int(budget)
+        self.lease_ttl = lease_ttl
+        self.poll_interval = poll_interval
+
+        self._acquire_script = redis.register_script(_ACQUIRE_SCRIPT)
+        self._refresh_script = redis.register_script(_REFRESH_SCRIPT)
+
+    def try_acquire(self, lease_id: str, size: int) -> bool:
+        now = time.time()
+        return bool(
+            self._acquire_script(
+                keys=[self.key],
+                args=[lease_id, size, self.budget, now, now + self.lease_ttl],
+            ),
+        )
+
+    def _keep_alive(self, lease_id: str, size: int, stop_event: threading.Event) -> None:
+        while not stop_event.wait(self.lease_ttl / 3):
+            try:
+                self._refresh_script(keys=[self.key], args=[lease_id, f"{size}:{time.time() + self.lease_ttl}"])
+            except Exception as exc:  # noqa: BLE001
+                logger.warning("Failed to refresh temp disk lease %s: %s", lease_id, exc)
+
+    @contextmanager
+    def acquire(self, size: float, timeout: float | None = None) -> Iterator[None]:
+        """
+        Ждёт, пока на временном диске узла освободится size байт
+
+        Запрос больше бюджета урезается до бюджета, чтобы задача могла выполниться хотя бы одна
+        """
+        size = min(int(size), self.budget)
+        lease_id = uuid.uuid4().hex
+
+        start = time.perf_counter()
+        waiting_logged = False
+        while not self.try_acquire(lease_id, size):
+            if not waiting_logged:
+                logger.info("Waiting for %.2f GB of temp disk on %s", size / 2**30, self.key)
+                waiting_logged = True
+
+            if timeout is not None and time.perf_counter() - start > timeout:
+                raise TimeoutError(f"Failed to acquire temp disk in {timeout} seconds")
+
+            time.sleep(self.poll_interval)
+
+        logger.info(
+            "Acquired temp disk lease %s for %.2f GB in %.2f s",
+            lease_id,
+            size / 2**30,
+            time.perf_counter() - start,
+        )
+
+        stop_event = threading.Event()
+        keep_alive_thread = threading.Thread(
+            target=self._keep_alive,
+            args=(lease_id, size, stop_event),
+            daemon=True,
+        )
+        keep_alive_thread.start()
+        try:
+            yield
+        finally:
+            stop_event.set()
+            self.redis.hdel(self.key, lease_id)
+            logger.info("Released temp disk lease %s", lease_id)
+
+
+def get_disk_usage(path: Path) -> int:
+    """
+    Сколько места реально занимают файлы в папке. Дыры разреженных файлов не считаются
+    """
+    total = 0
+    for dirpath, _dirnames, filenames in os.walk(path):
+        for filename in filenames:
+            try:
+                total += os.stat(os.path.join(dirpath, filename)).st_blocks * 512  # noqa: PTH118, PTH116
+            except FileNotFoundError:
+                # Файл удалили, пока обходили папку
+                continue
+
+    return total
+
+
+class TempDiskUsageMonitor:
+    """
+    Периодически замеряет размер папки в фоне и запоминает пик
+    """
+
+    def __init__(self, path: Path, poll_interval: float = TEMP_DISK_USAGE_POLL_INTERVAL):  # noqa: D107
+        self.path = path
+        self.poll_interval = poll_interval
+        self.peak = 0
+
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def measure(self) -> int:
+        """
+        Замеряет размер прямо сейчас и возвращает пик с начала наблюдения
+        """
+        self.peak = max(self.peak, get_disk_usage(self.path))
+        return self.peak
+
+    def _run(self) -> None:
+        while not self._stop_event.wait(self.poll_interval):
+            self.measure()
+
+    def __enter__(self) -> Self:
+        self._thread.start()
+        return self
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc_val: BaseException | None,
+        exc_tb: TracebackType | None,
+    ) -> None:
+        self._stop_event.set()
+        self._thread.join()
+        self.measure()
+        logger.info("Peak temp disk usage in %s: %.2f GB", self.path, self.peak / 2**30)
+
+
+# Аренды диска хранятся рядом с арендами видеокарты
+disk_budget_controller: DiskBudgetController = lazy_object_proxy.Proxy(
+    lambda: DiskBudgetController(
+        Redis(
+            host=REDIS_HOST,
+            port=REDIS_PORT,
+            username=REDIS_USER,
+            password=REDIS_PASSWORD,
+            db=REDIS_GPU_ADMISSION_DB,
+        ),
+    ),
+)
@@ -0,0 +1,178 @@
+"""
+Соединения скачивания с одного сайта
+
+Сайты ограничивают число соединений с одного адреса, а скачивают одновременно несколько воркеров.
+Поэтому соединения с сайтом (YT_DLP_HOST_CONNECTIONS) - общий пул для всех процессов: каждое скачивание
+арендует в redis часть пула так же, как аренды видеокарты в utils.gpu_admission, и скачивает не больше
+чем в столько соединений, сколько получило
+"""
+
+import logging
+import threading
+import time
+import uuid
+from collections.abc import Iterator
+from contextlib import contextmanager
+
+import lazy_object_proxy
+from redis import Redis
+
+from configs import (
+    DOWNLOAD_CONNECTIONS_LEASE_TTL,
+    DOWNLOAD_CONNECTIONS_POLL_INTERVAL,
+    REDIS_DOWNLOADS_DB,
+    REDIS_HOST,
+    REDIS_PASSWORD,
+    REDIS_PORT,
+    REDIS_USER,
+)
+
+logger = logging.getLogger(__name__)
+
+# Атомарно чистит протухшие аренды и выдаёт столько свободных соединений, сколько есть, но не больше запрошенных
+# KEYS[1] - hash аренд сайта, значение аренды - "connections:expire_at"
+# ARGV - lease_id, connections, max_connections, now, expire_at
+# Возвращает число выданных соединений, 0 - свободных нет
+_ACQUIRE_SCRIPT = """
+local now = tonumber(ARGV[4])
+local used = 0
+local leases = redis.call('HGETALL', KEYS[1])
+for i = 1, #leases, 2 do
+    local connections, expire_at = string.match(leases[i + 1], '([^:]+):([^:]+)')
+    if tonumber(expire_at) < now then
+        redis.call('HDEL', KEYS[1], leases[i])
+    else
+        used = used + tonumber(connections)
+    end
+end
+local granted = math.min(tonumber(ARGV[2]), tonumber(ARGV[3]) - used)
+if granted > 0 then
+    redis.call('HSET', KEYS[1], ARGV[1], granted .. ':' .. ARGV[5])
+    return granted
+end
+return 0
+"""
+
+# Продлевает аренду, только если она ещё не была удалена
+_REFRESH_SCRIPT = """
+if redis.call('HEXISTS', KEYS[1], ARGV[1]) == 1 then
+    redis.call('HSET', KEYS[1], ARGV[1], ARGV[2])
+    return 1
+end
+return 0
+"""
+
+
+class HostConnectionLimiter:
+    def __init__(  # noqa: D107
+        self,
+        redis: Redis,
+        lease_ttl: float = DOWNLOAD_CONNECTIONS_LEASE_TTL,
+        poll_interval: float = DOWNLOAD_CONNECTIONS_POLL_INTERVAL,
+    ):
+        self.redis = redis
+        self.lease_ttl = lease_ttl
+        self.poll_interval = poll_interval
+
+        self._acquire_script = redis.register_script(_ACQUIRE_SCRIPT)
+        self._refresh_script = redis.register_script(_REFRESH_SCRIPT)
+
+    @staticmethod
+    def make_key(site: str) -> str:
+        return f"download_connections:{site}"
+
+    def try_acquire(self, site: str, lease_id: str, connections: int, max_connections: int) -> int:
+        now = time.time()
+        return int(
+            self._acquire_script(  # pyright: ignore [reportArgumentType]
+                keys=[self.make_key(site)],
+                args=[lease_id, connections, max_connections, now, now + self.lease_ttl],
+            ),
+        )
+
+    def _keep_alive(self, key: str, lease_id: str, connections: int, stop_event: threading.Event) -> None:
+        while not stop_event.wait(self.lease_ttl / 3):
+            try:
+                self._refresh_script(keys=[key], args=[lease_id, f"{connections}:{time.time() + self.lease_ttl}"])
+            except Exception as exc:  # noqa: BLE001
+                logger.warning("Failed to refresh download connections lease %s: %s", lease_id, exc)
+
+    @contextmanager
+    def acquire(
+        self,
+        site: str,
+        connections: int,
+        max_connections: int,
+        timeout: float | None = None,
+    ) -> Iterator[int]:
+        """
+        Ждёт, пока у сайта освободится хотя бы одно из max_connections соединений, и арендует до connections
+
+        Возвращает число полученных соединений. Если redis недоступен, соединения не делятся между процессами,
+        скачивание не должно падать из-за ограничителя
+        """
+        connections = max(1, min(connections, max_connections))
+        key = self.make_key(site)
+        lease_id = uuid.uuid4().hex
+
+        start = time.perf_counter()
+        waiting_logged = False
+        while True:
+            try:
+                granted = self.try_acquire(site, lease_id, connections, max_connections)
+            except Exception as exc:  # noqa: BLE001
+                logger.warning("Failed to acquire download connections to %s, not sharing them: %s", site, exc)
+                granted = None
+
+            if granted is None or granted > 0:
+                break
+
+            if not waiting_logged:
+                logger.info("Waiting for a free download connection to %s", site)
+                waiting_logged = True
+
+            if timeout is not None and time.perf_counter() - start > timeout:
+                raise TimeoutError(f"Failed to acquire download connections to {site} in {timeout} seconds")
+
+            time.sleep(self.poll_interval)
+
+        if granted is None:
+            yield connections
+            return
+
+        logger.info(
+            "Acquired %s of %s download connections to %s in %.2f s",
+            granted,
+            max_connections,
+            site,
+            time.perf_counter() - start,
+        )
+
+        stop_event = threading.Event()
+        keep_alive_thread = threading.Thread(
+            target=self._keep_alive,
+            args=(key, lease_id, granted, stop_event),
+            daemon=True,
+        )
+        keep_alive_thread.start()
+        try:
+            yield granted
+        finally:
+            stop_event.set()
+            try:
+                self.redis.hdel(key, lease_id)
+            except Exception as exc:  # noqa: BLE001
+                logger.warning("Failed to release download connections lease %s: %s", lease_id, exc)
+
+
+host_connection_limiter: HostConnectionLimiter = lazy_object_proxy.Proxy(
+    lambda: HostConnectionLimiter(
+        Redis(
+            host=REDIS_HOST,
+            port=REDIS_PORT,
+            username=REDIS_USER,
+            password=REDIS_PASSWORD,
+            db=REDIS_DOWNLOADS_DB,
+        ),
+    ),
+)
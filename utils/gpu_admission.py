@@ -0,0 +1,177 @@
+"""
+Допуск задач к видеокарте
+
+Несколько воркеров на одной машине (в том числе в разных контейнерах) делят одну видеокарту.
+Чтобы они не превышали лимит сессий nvenc и не упирались в видеопамять, каждая задача
+перед работой с gpu арендует ресурсы узла. Аренды хранятся в redis и продлеваются, пока задача жива.
+"""
+
+import logging
+import threading
+import time
+import uuid
+from collections.abc import Iterator
+from contextlib import contextmanager
+
+import lazy_object_proxy
+from redis import Redis
+
+from configs import (
+    GPU_ADMISSION_LEASE_TTL,
+    GPU_ADMISSION_MAX_VRAM,
+    GPU_ADMISSION_POLL_INTERVAL,
+    GPU_NODE_NAME,
+    REDIS_GPU_ADMISSION_DB,
+    REDIS_HOST,
+    REDIS_PASSWORD,
+    REDIS_PORT,
+    REDIS_USER,
+    USE_CUDA,
+)
+from utils.video.misc import NVENC_MAX_CONCURRENT_SESSIONS
+
+logger = logging.getLogger(__name__)
+
+# Атомарно чистит протухшие аренды и выдаёт новую, если хватает ресурсов
+# KEYS[1] - hash аренд узла, значение аренды - "nvenc_sessions:vram:expire_at"
+# ARGV - lease_id, nvenc_sessions, vram, max_nvenc_sessions, max_vram, now, expire_at
+_ACQUIRE_SCRIPT = """
+local now = tonumber(ARGV[6])
+local used_nvenc = 0
+local used_vram = 0
+local leases = redis.call('HGETALL', KEYS[1])
+for i = 1, #leases, 2 do
+    local nvenc, vram, expire_at = string.match(leases[i + 1], '([^:]+):([^:]+):([^:]+)')
+    if tonumber(expire_at) < now then
+        redis.call('HDEL', KEYS[1], leases[i])
+    else
+        used_nvenc = used_nvenc + tonumber(nvenc)
+        used_vram = used_vram + tonumber(vram)
+    end
+end
+if used_nvenc + tonumber(ARGV[2]) <= tonumber(ARGV[4]) and used_vram + tonumber(ARGV[3]) <= tonumber(ARGV[5]) then
+    redis.call('HSET', KEYS[1], ARGV[1], ARGV[2] .. ':' .. ARGV[3] .. ':' .. ARGV[7])
+    return 1
+end
+return 0
+"""
+
+# Продлевает аренду, только если она ещё не была удалена
+_REFRESH_SCRIPT = """
+if redis.call('HEXISTS', KEYS[1], ARGV[1]) == 1 then
+    redis.call('HSET', KEYS[1], ARGV[1], ARGV[2])
+    return 1
+end
+return 0
+"""
+
+
+class GpuAdmissionController:
+    def __init__(  # noqa: D107, PLR0913
+        self,
+        redis: Redis,
+        node_name: str = GPU_NODE_NAME,
+        max_nvenc_sessions: int = NVENC_MAX_CONCURRENT_SESSIONS,
+        max_vram: float = GPU_ADMISSION_MAX_VRAM,
+        lease_ttl: float = GPU_ADMISSION_LEASE_TTL,
+        poll_interval: float = GPU_ADMISSION_POLL_INTERVAL,
+        enabled: bool = USE_CUDA,  # noqa: FBT001
+    ):
+        self.redis = redis
+        self.key = f"gpu_admission:{node_name}"
+        self.max_nvenc_sessions = max_nvenc_sessions
+        self.max_vram = int(max_vram)
+        self.lease_ttl = lease_ttl
+        self.poll_interval = poll_interval
+        self.enabled = enabled
+
+        self._acquire_script = redis.register_script(_ACQUIRE_SCRIPT)
+        self._refresh_script = redis.register_script(_REFRESH_SCRIPT)
+
+    def _lease_value(self, nvenc_sessions: int, vram: int) -> str:
+        return f"{nvenc_sessions}:{vram}:{time.time() + self.lease_ttl}"
+
+    def try_acquire(self, lease_id: str, nvenc_sessions: int, vram: int) -> bool:
+        now = time.time()
+        return bool(
+            self._acquire_script(
+                keys=[self.key],
+                args=[
+                    lease_id,
+                    nvenc_sessions,
+                    vram,
+                    self.max_nvenc_sessions,
+                    self.max_vram,
+                    now,
+                    now + self.lease_ttl,
+                ],
+            ),
+        )
+
+    def _keep_alive(self, lease_id: str, nvenc_sessions: int, vram: int, stop_event: threading.Event) -> None:
+        while not stop_event.wait(self.lease_ttl / 3):
+            try:
+                self._refresh_script(keys=[self.key], args=[lease_id, self._lease_value(nvenc_sessions, vram)])
+            except Exception as exc:  # noqa: BLE001
+                logger.warning("Failed to refresh gpu lease %s: %s", lease_id, exc)
+
+    @contextmanager
+    def acquire(self, nvenc_sessions: int = 0, vram: float = 0, timeout: float | None = None) -> Iterator[None]:
+        """
+        Ждёт, пока на видеокарте освободится nvenc_sessions сессий nvenc и vram байт видеопамяти
+
+        Запрос больше лимитов узла урезается до лимитов, чтобы задача могла выполниться хотя бы одна
+        """
+        if not self.enabled:
+            yield
+            return
+
+        nvenc_sessions = min(nvenc_sessions, self.max_nvenc_sessions)
+        vram = min(int(vram), self.max_vram)
+        lease_id = uuid.uuid4().hex
+
+        start = time.perf_counter()
+        waiting_logged = False
+        while not self.try_acquire(lease_id, nvenc_sessions, vram):
+            if not waiting_logged:
+                logger.info(
+                    "Waiting for gpu on %s: nvenc sessions %s, vram %.2f GB",
+                    self.key,
+                    nvenc_sessions,
+                    vram / 2**30,
+                )
+                waiting_logged = True
+
+            if timeout is not None and time.perf_counter() - start > timeout:
+                raise TimeoutError(f"Failed to acquire gpu resources in {timeout} seconds")
+
+            time.sleep(self.poll_interval)
+
+        logger.info("Acquired gpu lease %s in %.2f s", lease_id, time.perf_counter() - start)
+
+        stop_event = threading.Event()
+        keep_alive_thread = threading.Thread(
+            target=self._keep_alive,
+            args=(lease_id, nvenc_sessions, vram, stop_event),
+            daemon=True,
+        )
+        keep_alive_thread.start()
+        try:
+            yield
+        finally:
+            stop_event.set()
+            self.redis.hdel(self.key, lease_id)
+            logger.info("Released gpu lease %s", lease_id)
+
+
+gpu_admission_controller: GpuAdmissionController = lazy_object_proxy.Proxy(
+    lambda: GpuAdmissionController(
+        Redis(
+            host=REDIS_HOST,
+            port=REDIS_PORT,
+            username=REDIS_USER,
+            password=REDIS_PASSWORD,
+            db=REDIS_GPU_ADMISSION_DB,
+        ),
+    ),
+)
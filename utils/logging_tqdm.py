@@ -4,6 +4,8 @@ from functools import wraps
 
 from tqdm import tqdm
 
+from utils.progress_events import progress_bus
+
 DEFAULT_TQDM_LOGGING_INTERVAL = 5.0
 
 
@@ -90,6 +92,7 @@ class LoggingTQDM(tqdm):
     def update(self, n: float = 1) -> bool | None:
         updated = self._old_update(n)
         # updated = super().update(n)  # noqa: ERA001
+        progress_bus.report(self.desc, self.n, self.total, self.format_dict.get("rate"))
         if updated:
             return None
 
@@ -0,0 +1,171 @@
+"""
+Метрики для prometheus
+
+Каждый воркер celery и бот отдают /metrics на METRICS_PORT. Задачи celery выполняются в дочерних процессах,
+поэтому значения пишутся в файлы в PROMETHEUS_MULTIPROC_DIR, а основной процесс собирает их при запросе
+"""
+
+import logging
+import os
+import resource
+from types import TracebackType
+from typing import Self
+
+# configs выставляет PROMETHEUS_MULTIPROC_DIR, а prometheus_client читает его один раз при импорте
+from configs import METRICS_PORT, PROMETHEUS_MULTIPROC_DIR  # isort: skip
+
+import prometheus_client
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram, multiprocess
+
+logger = logging.getLogger(__name__)
+
+DURATION_BUCKETS = (1, 5, 15, 30, 60, 2 * 60, 5 * 60, 10 * 60, 20 * 60, 40 * 60, 3600, 2 * 3600, 4 * 3600)
+REALTIME_FACTOR_BUCKETS = (0.25, 0.5, 1, 2, 4, 8, 16, 32, 64, 128)
+VRAM_BUCKETS = tuple(2**power * 2**20 for power in range(6, 16))
+
+STAGE_DURATION = Histogram(
+    "processing_stage_duration_seconds",
+    "Длительность этапа обработки",
+    ["stage"],
+    buckets=DURATION_BUCKETS,
+)
+STAGE_REALTIME_FACTOR = Histogram(
+    "processing_stage_realtime_factor",
+    "Сколько секунд видео обрабатывается за секунду этапа",
+    ["stage"],
+    buckets=REALTIME_FACTOR_BUCKETS,
+)
+STAGE_CPU_TIME = Counter(
+    "processing_stage_cpu_seconds",
+    "Процессорное время этапа: самого процесса (self) и завершившихся дочерних процессов, в основном ffmpeg (children)",
+    ["stage", "process"],
+)
+CUDA_MEMORY_PEAK = Histogram(
+    "cuda_memory_peak_bytes",
+    "Пик выделенной видеопамяти за шаг обработки звука",
+    ["step"],
+    buckets=VRAM_BUCKETS,
+)
+TASK_QUEUE_WAIT = Histogram(
+    "celery_task_queue_wait_seconds",
+    "Сколько задача ждала в очереди",
+    ["task"],
+    buckets=DURATION_BUCKETS,
+)
+TASK_DURATION = Histogram(
+    "celery_task_duration_seconds",
+    "Длительность выполнения задачи",
+    ["task", "state"],
+    buckets=DURATION_BUCKETS,
+)
+CACHE_REQUESTS = Counter(
+    "cache_requests",
+    "Обращения к кешам",
+    ["cache", "result"],
+)
+DOWNLOAD_THROUGHPUT = Histogram(
+    "download_throughput_bytes_per_second",
+    "Скорость скачивания файла через yt-dlp",
+    ["site"],
+    buckets=tuple(2**power * 2**20 for power in range(-2, 10)),
+)
+TELEGRAM_SENDS = Counter(
+    "telegram_sends",
+    "Отправки в telegram через BroadcastScheduler",
+    ["result"],
+)
+TELEGRAM_SEND_LATENCY = Histogram(
+    "telegram_send_latency_seconds",
+    "Время от постановки отправки в очередь до её завершения",
+    buckets=(0.1, 0.5, 1, 2, 5, 10, 30, 60, 5 * 60, 20 * 60),
+)
+TELEGRAM_QUEUE_DEPTH = Gauge(
+    "telegram_send_queue_depth",
+    "Сколько отправок ждут токен или отправляются",
+    multiprocess_mode="livesum",
+)
+
+
+def observe_cache(cache: str, *, hit: bool) -> None:
+    CACHE_REQUESTS.labels(cache, "hit" if hit else "miss").inc()
+
+
+def observe_stage_duration(stage: str, duration: float) -> None:
+    STAGE_DURATION.labels(stage).observe(duration)
+
+
+class CpuTimer:
+    """
+    Процессорное время блока: всех потоков процесса и дочерних процессов, завершившихся за это время
+
+    Если задан stage, то время добавляется в метрики этого этапа
+    """
+
+    def __init__(self, stage: str | None = None):  # noqa: D107
+        self.stage = stage
+        self.self_time = 0.0
+        self.children_time = 0.0
+        self._start_self = 0.0
+        self._start_children = 0.0
+
+    @property
+    def total(self) -> float:
+        return self.self_time + self.children_time
+
+    def measure(self) -> float:
+        """
+        Время с начала блока, не дожидаясь его конца
+        """
+        return (
+            self._measure(resource.RUSAGE_SELF)
+            - self._start_self
+            + self._measure(resource.RUSAGE_CHILDREN)
+            - self._start_children
+        )
+
+    @staticmethod
+    def _measure(who: int) -> float:
+        usage = resource.getrusage(who)
+        return usage.ru_utime + usage.ru_stime
+
+    def __enter__(self) -> Self:
+        self._start_self = self._measure(resource.RUSAGE_SELF)
+        self._start_children = self._measure(resource.RUSAGE_CHILDREN)
+        return self
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc_val: BaseException | None,
+        exc_tb: TracebackType | None,
+    ) -> None:
+        self.self_time = self._measure(resource.RUSAGE_SELF) - self._start_self
+        self.children_time = self._measure(resource.RUSAGE_CHILDREN) - self._start_children
+
+        if self.stage is not None:
+            STAGE_CPU_TIME.labels(self.stage, "self").inc(self.self_time)
+            STAGE_CPU_TIME.labels(self.stage, "children").inc(self.children_time)
+
+
+def start_metrics_server(port: int = METRICS_PORT) -> None:
+    """
+    Запускает /metrics. Вызывается в основном процессе до создания дочерних
+    """
+    if port == 0 or PROMETHEUS_MULTIPROC_DIR is None:
+        return
+
+    # Файлы прошлого запуска относятся к уже завершённым процессам.
+    # Свои файлы процесс открыл ещё при импорте, когда создавались метрики, поэтому их не трогаем
+    for path in PROMETHEUS_MULTIPROC_DIR.glob("*.db"):
+        if path.stem.rsplit("_", 1)[-1] != str(os.getpid()):
+            path.unlink(missing_ok=True)
+
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry, path=PROMETHEUS_MULTIPROC_DIR.as_posix())
+    prometheus_client.start_http_server(port, registry=registry)
+    logger.info("Serving metrics on port %s", port)
+
+
+def mark_process_dead(pid: int) -> None:
+    if PROMETHEUS_MULTIPROC_DIR is not None:
+        multiprocess.mark_process_dead(pid, PROMETHEUS_MULTIPROC_DIR.as_posix())
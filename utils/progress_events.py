@@ -0,0 +1,321 @@
+"""
+Шина событий о ходе обработки
+
+Любой LoggingTQDM (а после patch_tqdm и любой tqdm) внутри progress_bus.track публикует в redis событие
+(этап, доля выполненного шага, оставшееся время) не чаще раза в PROGRESS_PUBLISH_INTERVAL. Так прогресс
+рендеринга, поиска тишины, шумоподавления и транскрибации попадает в бота без изменений в самих инструментах.
+
+Бот подписан на события и редактирует зарегистрированные сообщения о состоянии.
+Внутри процесса на события подписываются метрики через add_listener
+"""
+
+import asyncio
+import logging
+import threading
+import time
+from collections.abc import Callable, Iterator, Sequence
+from contextlib import contextmanager
+from dataclasses import dataclass
+
+import lazy_object_proxy
+import orjson
+import pydantic
+from aiogram import Bot
+from aiogram.enums import ParseMode
+from redis import Redis
+from redis.asyncio.client import Redis as AsyncRedis
+
+from configs import (
+    PROGRESS_PUBLISH_INTERVAL,
+    PROGRESS_STATUS_EDIT_INTERVAL,
+    PROGRESS_TTL,
+    REDIS_HOST,
+    REDIS_PASSWORD,
+    REDIS_PORT,
+    REDIS_PROGRESS_DB,
+    REDIS_USER,
+)
+from utils.telegram_broadcast import broadcast_scheduler
+
+logger = logging.getLogger(__name__)
+
+PROGRESS_CHANNEL = "progress"
+
+
+class ProgressEvent(pydantic.BaseModel):
+    #: Что обрабатывается, например processed_video:1
+    key: str
+    #: Этап для метрик
+    stage: str
+    #: Этап для пользователя
+    title: str
+    #: Текущий шаг этапа (описание progress bar)
+    step: str
+    #: Доля выполненного шага
+    fraction: float
+    #: Сколько секунд осталось до конца шага, если известно
+    eta: float | None = None
+    #: Сколько секунд идёт этап
+    elapsed: float
+    #: Этап завершён, elapsed — его полная длительность
+    finished: bool = False
+
+
+@dataclass
+class _TrackedStage:
+    keys: Sequence[str]
+    stage: str
+    title: str
+    start: float
+
+
+def format_progress_status(text: str, event: ProgressEvent) -> str:
+    """
+    Дописывает ход обработки к исходному тексту сообщения о состоянии
+    """
+    if event.finished:
+        return f"{text}\n\n{event.title}: готово"
+
+    status = f"{text}\n\n{event.title}: {round(100 * event.fraction)}%"
+    if event.eta is not None:
+        status += f", осталось примерно {max(1, round(event.eta / 60))} мин"
+
+    return status
+
+
+class ProgressBus:
+    def __init__(self, redis: Redis, publish_interval: float = PROGRESS_PUBLISH_INTERVAL, ttl: int = PROGRESS_TTL):  # noqa: D107
+        self.redis = redis
+        self.publish_interval = publish_interval
+        self.ttl = ttl
+
+        # Прогресс приходит и из потоков ffmpeg, поэтому состояние общее на процесс, а не contextvars
+        self._lock = threading.Lock()
+        self._tracked: _TrackedStage | None = None
+        self._last_published: dict[str, float] = {}
+        self._listeners: list[Callable[[ProgressEvent], None]] = []
+
+    def add_listener(self, listener: Callable[[ProgressEvent], None]) -> None:
+        """
+        Вызывает listener для каждого события в этом процессе, даже если redis недоступен
+        """
+        self._listeners.append(listener)
+
+    @contextmanager
+    def track(self, keys: Sequence[str], stage: str, title: str) -> Iterator[None]:
+        """
+        Прогресс внутри блока относится к этапу stage обработки keys. Блоки можно вкладывать
+        """
+        with self._lock:
+            previous = self._tracked
+            tracked = _TrackedStage(keys=keys, stage=stage, title=title, start=time.perf_counter())
+            self._tracked = tracked
+            self._last_published = {}
+
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._tracked = previous
+                self._last_published = {}
+
+            self._publish(
+                tracked,
+                ProgressEvent(
+                    key="",
+                    stage=stage,
+                    title=title,
+                    step=title,
+                    fraction=1,
+                    elapsed=time.perf_counter() - tracked.start,
+                    finished=True,
+                ),
+            )
+
+    def report(self, step: str, current: float, total: float | None, rate: float | None = None) -> None:
+        """
+        Вызывается на каждом обновлении progress bar, поэтому без отслеживаемого этапа ничего не делает
+        """
+        tracked = self._tracked
+        if tracked is None:
+            return
+
+        now = time.perf_counter()
+        done = total is not None and total > 0 and current >= total
+        with self._lock:
+            if not done and now - self._last_published.get(step, 0) < self.publish_interval:
+                return
+            self._last_published[step] = now
+
+        fraction = min(1.0, current / total) if total else 0.0
+        eta = (total - current) / rate if total and rate else None
+        self._publish(
+            tracked,
+            ProgressEvent(
+                key="",
+                stage=tracked.stage,
+                title=tracked.title,
+                step=step,
+                fraction=fraction,
+                eta=eta,
+                elapsed=now - tracked.start,
+            ),
+        )
+
+    def _publish(self, tracked: _TrackedStage, event: ProgressEvent) -> None:
+        for listener in self._listeners:
+            try:
+                listener(event)
+            except Exception as exc:  # noqa: BLE001
+                logger.warning("Progress listener failed: %s", exc)
+
+        try:
+            pipeline = self.redis.pipeline(transaction=False)
+            for key in tracked.keys:
+                data = event.model_copy(update={"key": key}).model_dump_json()
+                pipeline.set(f"progress:{key}", data, ex=self.ttl)
+                pipeline.publish(PROGRESS_CHANNEL, data)
+            pipeline.execute()
+        except Exception as exc:  # noqa: BLE001
+            # Прогресс не должен ломать обработку
+            logger.warning("Failed to publish progress: %s", exc)
+
+    def get(self, key: str) -> ProgressEvent | None:
+        data = self.redis.get(f"progress:{key}")
+        if data is None:
+            return None
+
+        return ProgressEvent.model_validate_json(data)
+
+    def register_status_message(self, key: str, chat_id: int | str, message_id: int, text: str) -> None:
+        """
+        Сообщение будет редактироваться по ходу обработки key
+        """
+        try:
+            self.redis.hset(
+                f"progress:{key}:messages",
+                f"{chat_id}:{message_id}",
+                orjson.dumps({"chat_id": chat_id, "message_id": message_id, "text": text}),
+            )
+            self.redis.expire(f"progress:{key}:messages", self.ttl)
+        except Exception as exc:  # noqa: BLE001
+            logger.warning("Failed to register status message for %s: %s", key, exc)
+
+
+class StatusMessageEditor:
+    """
+    Редактирует сообщения о состоянии в отдельных задачах, по одной на сообщение.
+    Для сообщения хранится только последний текст, поэтому правки, устаревшие, пока ждали лимит telegram,
+    выкидываются, а чтение событий не ждёт отправку
+    """
+
+    def __init__(self, bot: Bot):  # noqa: D107
+        self.bot = bot
+        self._pending: dict[tuple[int | str, int], str] = {}
+        self._tasks: dict[tuple[int | str, int], asyncio.Task] = {}
+
+    def edit(self, chat_id: int | str, message_id: int, text: str) -> None:
+        key = (chat_id, message_id)
+        self._pending[key] = text
+        if key not in self._tasks:
+            self._tasks[key] = asyncio.create_task(self._run(key))
+
+    async def _run(self, key: tuple[int | str, int]) -> None:
+        chat_id, message_id = key
+        try:
+            while (text := self._pending.pop(key, None)) is not None:
+                try:
+                    await broadcast_scheduler.send(
+                        self.bot.edit_message_text,
+                        chat_id,
+                        message_id=message_id,
+                        text=text,
+                        parse_mode=ParseMode.HTML,
+                        disable_web_page_preview=True,
+                    )
+                except Exception as exc:  # noqa: BLE001
+                    # Например, сообщение удалили или текст не изменился
+                    logger.debug("Failed to edit status message in %s: %s", chat_id, exc)
+        finally:
+            self._tasks.pop(key, None)
+
+    async def join(self) -> None:
+        while len(self._tasks) > 0:
+            await asyncio.gather(*self._tasks.values())
+
+
+async def run_progress_status_updates(
+    bot: Bot,
+    redis: AsyncRedis,
+    edit_interval: float = PROGRESS_STATUS_EDIT_INTERVAL,
+) -> None:
+    """
+    Редактирует сообщения о состоянии по событиям из шины, не чаще раза в edit_interval на обработку
+    """
+    last_edit: dict[str, float] = {}
+    editor = StatusMessageEditor(bot)
+    pubsub = redis.pubsub()
+    await pubsub.subscribe(PROGRESS_CHANNEL)
+    async for message in pubsub.listen():
+        if message["type"] != "message":
+            continue
+
+        try:
+            event = ProgressEvent.model_validate_json(message["data"])
+        except pydantic.ValidationError as exc:
+            logger.warning("Invalid progress event: %s", exc)
+            continue
+
+        now = time.monotonic()
+        if not event.finished and now - last_edit.get(event.key, 0) < edit_interval:
+            continue
+        last_edit[event.key] = now
+
+        try:
+            status_messages = await redis.hvals(f"progress:{event.key}:messages")
+        except Exception as exc:  # noqa: BLE001
+            logger.warning("Failed to get status messages for %s: %s", event.key, exc)
+            continue
+
+        for status_message in map(orjson.loads, status_messages):
+            editor.edit(
+                status_message["chat_id"],
+                status_message["message_id"],
+                format_progress_status(status_message["text"], event),
+            )
+
+        if len(last_edit) > 1000:  # noqa: PLR2004
+            last_edit = {key: value for key, value in last_edit.items() if now - value < edit_interval}
+
+
+def run_progress_status_updates_in_background(bot: Bot) -> asyncio.Task:
+    redis = AsyncRedis(
+        host=REDIS_HOST,
+        port=REDIS_PORT,
+        username=REDIS_USER,
+        password=REDIS_PASSWORD,
+        db=REDIS_PROGRESS_DB,
+    )
+
+    async def _run() -> None:
+        while True:
+            try:
+                await run_progress_status_updates(bot, redis)
+            except Exception as exc:
+                logger.exception("Progress status updates failed, restarting: %s", exc)  # noqa: TRY401
+                await asyncio.sleep(PROGRESS_STATUS_EDIT_INTERVAL)
+
+    return asyncio.create_task(_run())
+
+
+progress_bus: ProgressBus = lazy_object_proxy.Proxy(
+    lambda: ProgressBus(
+        Redis(
+            host=REDIS_HOST,
+            port=REDIS_PORT,
+            username=REDIS_USER,
+            password=REDIS_PASSWORD,
+            db=REDIS_PROGRESS_DB,
+        ),
+    ),
+)
@@ -3,10 +3,19 @@ import logging.config
 from configs import LOGGING_CONFIG
 from processing.models import setup_storage
 from utils.logging_tqdm import patch_tqdm
+from utils.metrics import observe_stage_duration, start_metrics_server
+from utils.progress_events import ProgressEvent, progress_bus
+
+
+def _observe_progress_event(event: ProgressEvent) -> None:
+    if event.finished:
+        observe_stage_duration(event.stage, event.elapsed)
 
 
 def system_init() -> None:
     logging.config.dictConfig(LOGGING_CONFIG)
     patch_tqdm()
+    progress_bus.add_listener(_observe_progress_event)
+    start_metrics_server()
 
     setup_storage()
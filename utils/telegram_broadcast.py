@@ -0,0 +1,244 @@
+"""
+Рассылка в telegram с учётом лимитов
+
+Каждая отправка ждёт токен в общем ведре процесса и в ведре своего чата, поэтому большая рассылка
+не упирается в TelegramRetryAfter. Одинаковые сообщения о состоянии (например, «Обрабатываю …»)
+не отправляются в один чат повторно, даже из разных задач
+"""
+
+import asyncio
+import hashlib
+import logging
+import time
+from collections.abc import Awaitable, Callable, Sequence
+from dataclasses import dataclass
+from typing import Any, TypeVar
+
+import lazy_object_proxy
+from aiogram.exceptions import TelegramRetryAfter
+from redis import Redis
+
+from configs import (
+    REDIS_HOST,
+    REDIS_PASSWORD,
+    REDIS_PORT,
+    REDIS_TELEGRAM_DB,
+    REDIS_USER,
+    TELEGRAM_GLOBAL_RATE,
+    TELEGRAM_GROUP_CHAT_RATE,
+    TELEGRAM_PRIVATE_CHAT_RATE,
+    TELEGRAM_SEND_RETRIES,
+    TELEGRAM_STATUS_COALESCE_WINDOW,
+)
+from utils.metrics import TELEGRAM_QUEUE_DEPTH, TELEGRAM_SEND_LATENCY, TELEGRAM_SENDS
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+#: Ведра чатов, которые давно не использовались, удаляются, когда их становится больше
+MAX_CHAT_BUCKETS = 1000
+
+
+class TokenBucket:
+    """
+    Ведро токенов без блокировок: reserve сразу забирает токен и возвращает, сколько ждать.
+    Токенов может стать меньше нуля, тогда следующие ждут дольше. Event loop однопоточный,
+    поэтому между чтением и изменением никто не вклинится
+    """
+
+    def __init__(self, rate: float, capacity: float = 1):  # noqa: D107
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self) -> float:
+        self._refill()
+        self.tokens -= 1
+        return max(0.0, -self.tokens / self.rate)
+
+    def is_full(self) -> bool:
+        self._refill()
+        return self.tokens >= self.capacity
+
+
+@dataclass
+class BroadcastMetrics:
+    #: Сколько отправок сейчас ждут токен или отправляются
+    queue_depth: int = 0
+    sent: int = 0
+    failed: int = 0
+    retried: int = 0
+    #: Время от постановки в очередь до конца отправки, в секундах
+    total_latency: float = 0.0
+    max_latency: float = 0.0
+
+    def observe(self, latency: float, *, ok: bool) -> None:
+        if ok:
+            self.sent += 1
+        else:
+            self.failed += 1
+        self.total_latency += latency
+        self.max_latency = max(self.max_latency, latency)
+
+        TELEGRAM_SENDS.labels("sent" if ok else "failed").inc()
+        TELEGRAM_SEND_LATENCY.observe(latency)
+
+    @property
+    def mean_latency(self) -> float:
+        count = self.sent + self.failed
+        return self.total_latency / count if count > 0 else 0.0
+
+
+class BroadcastScheduler:
+    def __init__(  # noqa: D107, PLR0913
+        self,
+        redis: Redis,
+        global_rate: float = TELEGRAM_GLOBAL_RATE,
+        private_chat_rate: float = TELEGRAM_PRIVATE_CHAT_RATE,
+        group_chat_rate: float = TELEGRAM_GROUP_CHAT_RATE,
+        retries: int = TELEGRAM_SEND_RETRIES,
+        status_coalesce_window: int = TELEGRAM_STATUS_COALESCE_WINDOW,
+    ):
+        self.redis = redis
+        self.private_chat_rate = private_chat_rate
+        self.group_chat_rate = group_chat_rate
+        self.retries = retries
+        self.status_coalesce_window = status_coalesce_window
+
+        self.global_bucket = TokenBucket(global_rate, capacity=global_rate)
+        self.chat_buckets: dict[int | str, TokenBucket] = {}
+        self.metrics = BroadcastMetrics()
+
+    def _get_chat_bucket(self, chat_id: int | str) -> TokenBucket:
+        bucket = self.chat_buckets.get(chat_id)
+        if bucket is not None:
+            return bucket
+
+        if len(self.chat_buckets) >= MAX_CHAT_BUCKETS:
+            self.chat_buckets = {key: value for key, value in self.chat_buckets.items() if not value.is_full()}
+
+        # У групп и каналов отрицательные id или @username
+        is_group = isinstance(chat_id, str) or chat_id < 0
+        bucket = TokenBucket(self.group_chat_rate if is_group else self.private_chat_rate)
+        self.chat_buckets[chat_id] = bucket
+        return bucket
+
+    async def send(self, send_method: Callable[..., Awaitable[T]], chat_id: int | str, **kwargs: Any) -> T:  # noqa: ANN401
+        """
+        Вызывает send_method(chat_id=chat_id, **kwargs), дождавшись токенов, и повторяет после TelegramRetryAfter
+        """
+        enqueued = time.perf_counter()
+        self.metrics.queue_depth += 1
+        TELEGRAM_QUEUE_DEPTH.inc()
+        ok = False
+        try:
+            attempt = 1
+            while True:
+                delay = max(self.global_bucket.reserve(), self._get_chat_bucket(chat_id).reserve())
+                if delay > 0:
+                    await asyncio.sleep(delay)
+
+                try:
+                    result = await send_method(chat_id=chat_id, **kwargs)
+                except TelegramRetryAfter as exc:
+                    if attempt >= self.retries:
+                        raise
+
+                    logger.warning("Telegram asked to retry sending to %s after %s s", chat_id, exc.retry_after)
+                    self.metrics.retried += 1
+                    TELEGRAM_SENDS.labels("retried").inc()
+                    attempt += 1
+                    await asyncio.sleep(exc.retry_after)
+                    continue
+
+                ok = True
+                return result
+        finally:
+            self.metrics.queue_depth -= 1
+            TELEGRAM_QUEUE_DEPTH.dec()
+            self.metrics.observe(time.perf_counter() - enqueued, ok=ok)
+
+    async def _send_safe(
+        self,
+        send_method: Callable[..., Awaitable[Any]],
+        chat_id: int | str,
+        on_sent: Callable[[int | str, Any], None] | None = None,
+        **kwargs: Any,  # noqa: ANN401
+    ) -> bool:
+        try:
+            result = await self.send(send_method, chat_id, **kwargs)
+        except Exception as exc:  # noqa: BLE001
+            logger.warning("Failed to send message to %s: %s", chat_id, exc)
+            return False
+
+        if on_sent is not None:
+            on_sent(chat_id, result)
+        return True
+
+    async def broadcast(
+        self,
+        send_method: Callable[..., Awaitable[Any]],
+        chat_ids: Sequence[int | str],
+        per_chat_kwargs: Sequence[dict[str, Any]] | None = None,
+        on_sent: Callable[[int | str, Any], None] | None = None,
+        **kwargs: Any,  # noqa: ANN401
+    ) -> int:
+        """
+        Отправляет во все чаты одновременно, насколько позволяют лимиты. Возвращает число успешных отправок
+
+        on_sent вызывается с chat_id и результатом send_method после каждой успешной отправки
+        """
+        if per_chat_kwargs is None:
+            per_chat_kwargs = [{}] * len(chat_ids)
+
+        start = time.perf_counter()
+        results = await asyncio.gather(
+            *(
+                self._send_safe(send_method, chat_id, on_sent, **kwargs, **chat_kwargs)
+                for chat_id, chat_kwargs in zip(chat_ids, per_chat_kwargs, strict=True)
+            ),
+        )
+        sent = sum(results)
+        logger.info(
+            "Broadcast to %s chats: %s sent in %.2f s (queue depth %s, mean send latency %.2f s, max %.2f s)",
+            len(chat_ids),
+            sent,
+            time.perf_counter() - start,
+            self.metrics.queue_depth,
+            self.metrics.mean_latency,
+            self.metrics.max_latency,
+        )
+        return sent
+
+    async def should_send_status(self, chat_id: int | str, text: str) -> bool:
+        """
+        Возвращает False, если такое же сообщение о состоянии недавно уже отправлялось в этот чат
+        """
+        key = f"telegram_status:{chat_id}:{hashlib.sha256(text.encode()).hexdigest()}"
+        try:
+            # Клиент синхронный, потому что scheduler общий для процесса, а у задач celery может быть свой event loop
+            return bool(await asyncio.to_thread(self.redis.set, key, 1, nx=True, ex=self.status_coalesce_window))
+        except Exception as exc:  # noqa: BLE001
+            # Лучше отправить лишнее сообщение, чем не отправить нужное
+            logger.warning("Failed to check recent status messages for %s: %s", chat_id, exc)
+            return True
+
+
+broadcast_scheduler: BroadcastScheduler = lazy_object_proxy.Proxy(
+    lambda: BroadcastScheduler(
+        Redis(
+            host=REDIS_HOST,
+            port=REDIS_PORT,
+            username=REDIS_USER,
+            password=REDIS_PASSWORD,
+            db=REDIS_TELEGRAM_DB,
+        ),
+    ),
+)
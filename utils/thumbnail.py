@@ -54,6 +54,9 @@ async def get_best_thumbnail(info: YtDlpInfoDict) -> bytes | None:
             max_height = height
             thumbnail_with_max_height = thumbnail
 
+    if thumbnail_with_max_height is None:
+        return None
+
     thumbnail_url = thumbnail_with_max_height["url"]
     image_bytes = await download_thumbnail(thumbnail_url)
 
@@ -0,0 +1,184 @@
+"""
+Индекс байтовых диапазонов медиафайла по времени
+
+Позволяет скачать из хранилища только те куски файла, которые нужны для рендеринга отрезка по времени.
+Остальная часть файла остаётся дырой в разреженном файле, ffmpeg туда не заглядывает
+"""
+
+import bisect
+import logging
+import os
+import subprocess
+from pathlib import Path
+
+import pydantic
+from ffmpeg import FFmpegError
+
+logger = logging.getLogger(__name__)
+
+#: Минимальное расстояние между точками индекса в секундах. Ограничивает размер индекса для длинных видео
+INDEX_MIN_STEP = 5.0
+
+#: Диапазоны с промежутком меньше этого склеиваются в один, чтобы не делать много мелких запросов
+MERGE_GAP_BYTES = 2 * 2**20
+
+ByteRange = tuple[int, int]
+
+
+class ByteRangeIndex(pydantic.BaseModel):
+    """
+    Для каждой точки индекса (ключевого кадра) хранится:
+
+    * start_offsets — минимальный адрес пакета, начиная с которого лежат все пакеты не раньше точки
+    * end_offsets — максимальный конец пакета среди всех пакетов не позже точки
+
+    Пакеты разных потоков перемешаны, поэтому это не просто адрес ключевого кадра
+    """
+
+    file_size: int
+    #: Конец заголовка: всё до первого пакета (например, moov в начале mp4)
+    header_end: int
+    #: Начало хвоста: всё после последнего пакета (например, moov в конце mp4 или cues в mkv)
+    trailer_start: int
+
+    times: list[float]
+    start_offsets: list[int]
+    end_offsets: list[int]
+
+    def get_byte_range(self, start: float, end: float) -> ByteRange:
+        """
+        Диапазон байт, в котором лежат все пакеты между start и end (в секундах)
+
+        Берётся на одну точку индекса больше с каждой стороны, чтобы декодер нашёл ключевой кадр
+        """
+        start_idx = bisect.bisect_right(self.times, start) - 2
+        start_byte = self.start_offsets[start_idx] if start_idx >= 0 else self.header_end
+
+        end_idx = bisect.bisect_left(self.times, end) + 1
+        end_byte = self.end_offsets[end_idx] if end_idx < len(self.times) else self.trailer_start
+
+        return start_byte, max(start_byte, end_byte)
+
+    def get_byte_ranges(self, spans: list[tuple[float, float]], merge_gap: int = MERGE_GAP_BYTES) -> list[ByteRange]:
+        """
+        Диапазоны байт, которых достаточно, чтобы прочитать все spans. Заголовок и хвост файла включаются всегда
+        """
+        ranges = [
+            (0, self.header_end),
+            *(self.get_byte_range(start, end) for start, end in spans),
+            (self.trailer_start, self.file_size),
+        ]
+        return merge_byte_ranges(ranges, merge_gap)
+
+
+def merge_byte_ranges(ranges: list[ByteRange], merge_gap: int = 0) -> list[ByteRange]:
+    merged: list[ByteRange] = []
+    for start, end in sorted(ranges):
+        if start >= end:
+            continue
+
+        if merged and start - merged[-1][1] <= merge_gap:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+
+    return merged
+
+
+def _read_packets(input_file: Path) -> tuple[list[tuple[float, int, int]], list[float]]:
+    """
+    Возвращает все пакеты (время, начало, конец) и времена ключевых кадров видео
+    """
+    command = [
+        "ffprobe",
+        "-v",
+        "error",
+        "-show_entries",
+        "packet=codec_type,pts_time,dts_time,size,pos,flags",
+        "-of",
+        "compact=p=0",
+        os.fspath(input_file),
+    ]
+    process = subprocess.Popen(  # noqa: S603 # nosec: B603, B607
+        command,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        text=True,
+    )
+
+    packets: list[tuple[float, int, int]] = []
+    keyframe_times: list[float] = []
+    for line in process.stdout:
+        fields = dict(field.split("=", 1) for field in line.strip().split("|") if "=" in field)
+        time = fields.get("pts_time", "N/A")
+        if time == "N/A":
+            time = fields.get("dts_time", "N/A")
+        pos = fields.get("pos", "N/A")
+        if time == "N/A" or pos == "N/A":
+            continue
+
+        packet_time = float(time)
+        packet_pos = int(pos)
+        packets.append((packet_time, packet_pos, packet_pos + int(fields["size"])))
+        if fields.get("codec_type") == "video" and fields.get("flags", "").startswith("K"):
+            keyframe_times.append(packet_time)
+
+    err = process.stderr.read()
+    retcode = process.wait()
+    if retcode:
+        raise FFmpegError.create(f"ffprobe return code {retcode}: {err}", command)
+
+    return packets, keyframe_times
+
+
+def build_byte_range_index(input_file: Path) -> ByteRangeIndex:
+    packets, keyframe_times = _read_packets(input_file)
+    if len(packets) == 0:
+        raise ValueError(f"No packets with known position in {input_file}")
+
+    packets.sort()
+    packet_times = [packet[0] for packet in packets]
+
+    # Минимальное начало среди пакетов не раньше i-го и максимальный конец среди пакетов не позже i-го
+    suffix_min_start = [packet[1] for packet in packets]
+    for i in range(len(packets) - 2, -1, -1):
+        suffix_min_start[i] = min(suffix_min_start[i], suffix_min_start[i + 1])
+    prefix_max_end = [packet[2] for packet in packets]
+    for i in range(1, len(packets)):
+        prefix_max_end[i] = max(prefix_max_end[i], prefix_max_end[i - 1])
+
+    # Для файлов без видео все пакеты можно считать ключевыми
+    candidates = sorted(keyframe_times) if len(keyframe_times) > 0 else packet_times
+
+    times: list[float] = []
+    start_offsets: list[int] = []
+    end_offsets: list[int] = []
+    for time in candidates:
+        if times and time - times[-1] < INDEX_MIN_STEP:
+            continue
+
+        times.append(time)
+        start_offsets.append(suffix_min_start[bisect.bisect_left(packet_times, time)])
+        end_offsets.append(prefix_max_end[bisect.bisect_right(packet_times, time) - 1])
+
+    index = ByteRangeIndex(
+        file_size=input_file.stat().st_size,
+        header_end=suffix_min_start[0],
+        trailer_start=prefix_max_end[-1],
+        times=times,
+        start_offsets=start_offsets,
+        end_offsets=end_offsets,
+    )
+    logger.info("Built byte range index of %s with %s points", input_file, len(times))
+    return index
+
+
+def build_byte_range_index_safe(input_file: Path) -> ByteRangeIndex | None:
+    """
+    Без индекса файл просто скачивается целиком, поэтому ошибка построения не критична
+    """
+    try:
+        return build_byte_range_index(input_file)
+    except (FFmpegError, ValueError) as exc:
+        logger.warning("Failed to build byte range index of %s: %s", input_file, exc, exc_info=exc)
+        return None
@@ -0,0 +1,106 @@
+"""
+Версия видео для отправки в telegram
+
+H.264 с битрейтом, подобранным так, чтобы файл влез в лимит бота на отправку.
+Она меньше исходного результата, быстрее загружается и воспроизводится всеми клиентами
+"""
+
+import logging
+import shlex
+from collections.abc import Sequence
+from pathlib import Path
+from typing import Any
+
+from configs import (
+    TELEGRAM_RENDITION_AUDIO_BITRATE,
+    TELEGRAM_RENDITION_LADDER,
+    TELEGRAM_RENDITION_MAX_SIZE,
+    TELEGRAM_RENDITION_VIDEO_CODEC,
+)
+from utils.fixed_ffmpeg import FixedFFmpeg
+from utils.progress_bar import setup_progress_for_ffmpeg
+
+logger = logging.getLogger(__name__)
+
+TELEGRAM_RENDITION_CODEC_NAME = "h264"
+
+
+def choose_rendition_rung(
+    duration: float,
+    height: int,
+    max_size: int = TELEGRAM_RENDITION_MAX_SIZE,
+    ladder: Sequence[tuple[int, int]] = TELEGRAM_RENDITION_LADDER,
+    audio_bitrate: int = TELEGRAM_RENDITION_AUDIO_BITRATE,
+) -> tuple[int, int] | None:
+    """
+    Выбирает ступень лестницы (высота кадра, битрейт видео), с которой видео влезает в max_size байт
+
+    Ступени выше исходного кадра пропускаются, видео не увеличивается. Возвращает None, если не влезает ни одна
+    """
+    if duration <= 0:
+        return None
+
+    available_video_bitrate = max_size * 8 / duration - audio_bitrate
+    for rung_height, video_bitrate in ladder:
+        if rung_height > height and rung_height != ladder[-1][0]:
+            continue
+
+        if video_bitrate <= available_video_bitrate:
+            return min(rung_height, height), video_bitrate
+
+    return None
+
+
+def create_telegram_rendition(meta: dict[str, Any], input_file: Path, output_file: Path) -> bool:
+    """
+    Кодирует версию для telegram в output_file
+
+    Возвращает False, если она не нужна (исходный файл уже H.264 и влезает в лимит) или её не сделать
+    (видео слишком длинное для самой низкой ступени). Тогда отправляется исходный файл
+
+    :param meta: метаданные input_file из ffprobe_extract_meta
+    """
+    video_stream = next((stream for stream in meta["streams"] if stream["codec_type"] == "video"), None)
+    if video_stream is None:
+        return False
+
+    if (
+        video_stream.get("codec_name") == TELEGRAM_RENDITION_CODEC_NAME
+        and input_file.stat().st_size <= TELEGRAM_RENDITION_MAX_SIZE
+    ):
+        logger.info("Processed video is already suitable for telegram")
+        return False
+
+    duration = float(meta["format"].get("duration", 0))
+    rung = choose_rendition_rung(duration, int(video_stream.get("height", 0)))
+    if rung is None:
+        logger.warning("Video of %.0f s is too long to fit telegram upload limit", duration)
+        return False
+
+    height, video_bitrate = rung
+    logger.info("Creating telegram rendition %sp at %s kbit/s", height, video_bitrate // 1000)
+    ffmpeg = (
+        FixedFFmpeg()
+        .option("y")
+        .input(input_file.as_posix())
+        .output(
+            output_file.as_posix(),
+            {
+                "c:v": TELEGRAM_RENDITION_VIDEO_CODEC,
+                "b:v": video_bitrate,
+                "maxrate": video_bitrate,
+                "bufsize": 2 * video_bitrate,
+                # Ширина должна быть чётной для yuv420p
+                "vf": f"scale=-2:{height}",
+                "pix_fmt": "yuv420p",
+                "c:a": "aac",
+                "b:a": TELEGRAM_RENDITION_AUDIO_BITRATE,
+                "movflags": "+faststart",
+            },
+        )
+    )
+    setup_progress_for_ffmpeg(ffmpeg, duration, "Creating telegram rendition")
+    logger.debug("Call: %s", shlex.join(ffmpeg.arguments))
+    ffmpeg.execute()
+
+    return True
@@ -1,6 +1,29 @@
-from concurrent.futures import ThreadPoolExecutor
+"""
+Кеш информации yt-dlp
 
-from cashews import Cache
+Два уровня: LRU в памяти процесса и redis, общий для бота и воркеров. Ключ строится по канонической ссылке,
+поэтому youtu.be, shorts и ссылки с метками отслеживания попадают в одну запись. Хранятся только метаданные
+без подписанных ссылок на форматы, поэтому они живут долго (YT_DLP_METADATA_CACHE_TTL), а форматы извлекаются
+заново при скачивании. Трансляции хранятся недолго (YT_DLP_LIVE_CACHE_TTL), их статус быстро меняется.
+Ссылки, которые yt-dlp не поддерживает или считает неправильными, тоже кешируются, чтобы не извлекать их заново
+на каждое сообщение
+"""
+
+import asyncio
+import logging
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Callable
+from concurrent.futures import Executor, ThreadPoolExecutor
+from datetime import timedelta
+from typing import Any
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import lazy_object_proxy
+import orjson
+from redis import Redis
+from yt_dlp.utils import DownloadError, LazyList, YoutubeDLError
 
 from configs import (
     REDIS_HOST,
@@ -8,16 +31,299 @@ from configs import (
     REDIS_PORT,
     REDIS_USER,
     REDIS_YT_DLP_CACHE_DB,
-    YT_DLP_EXTRACT_INFO_CACHE_TTL,
+    YT_DLP_INFO_MEMORY_CACHE_SIZE,
+    YT_DLP_LIVE_CACHE_TTL,
+    YT_DLP_METADATA_CACHE_TTL,
+    YT_DLP_NEGATIVE_CACHE_TTL,
+    YT_DLP_PREVIEW_WORKERS,
 )
-from djgram.utils.async_tools import run_async_wrapper
-from tools.yt_dlp_downloader.yt_dlp_download_videos import extract_info
+from tools.yt_dlp_downloader.preview import extract_preview_info
+from tools.yt_dlp_downloader.yt_dlp_download_videos import YtDlpInfoDict, extract_info
+from utils.metrics import observe_cache
 
-thread_executor = ThreadPoolExecutor()
+logger = logging.getLogger(__name__)
+
+#: Параметры ссылок, которые не влияют на содержимое
+TRACKING_QUERY_PARAMS = frozenset(
+    ("fbclid", "gclid", "yclid", "igshid", "si", "feature", "pp", "ab_channel", "app", "ref", "ref_src"),
+)
+#: У youtube ещё и время начала воспроизведения не влияет на информацию
+YOUTUBE_IGNORED_QUERY_PARAMS = frozenset(("t", "start", "index"))
+YOUTUBE_HOSTS = frozenset(("youtube.com", "www.youtube.com", "m.youtube.com", "music.youtube.com"))
+#: Пути youtube вида /shorts/<id>, которые ведут на то же видео, что и /watch?v=<id>
+YOUTUBE_VIDEO_PATH_PREFIXES = ("/shorts/", "/live/", "/embed/", "/v/")
+
+#: Поля с подписанными ссылками на форматы и субтитры. Они быстро устаревают и не нужны до скачивания
+MEDIA_KEYS = (
+    "formats",
+    "requested_formats",
+    "requested_downloads",
+    "requested_subtitles",
+    "subtitles",
+    "automatic_captions",
+    "manifest_url",
+    "fragments",
+    "http_headers",
+)
+#: Стандартные порты, которые не входят в каноническую ссылку
+DEFAULT_PORTS = {"http": 80, "https": 443}
+#: Значения live_status, при которых информация уже не изменится
+FINISHED_LIVE_STATUSES = frozenset(("not_live", "was_live"))
+#: Ошибки, которые повторятся при повторном извлечении
+NEGATIVE_CACHE_ERROR_PATTERNS = ("unsupported url", "is not a valid url")
+
+
+def _canonical_youtube_url(video_id: str, query: list[tuple[str, str]]) -> str:
+    query = [("v", video_id), *((key, value) for key, value in query if key != "v")]
+    return urlunsplit(("https", "www.youtube.com", "/watch", urlencode(query), ""))
+
+
+def canonicalize_url(url: str) -> str:
+    """
+    Каноническая ссылка для ключа кеша: без меток отслеживания, с упорядоченными параметрами,
+    короткие ссылки и shorts youtube приводятся к /watch?v=<id>. Фрагмент сохраняется, по нему lectoriyfopf.ru
+    различает лекции. Отбрасывается только стандартный порт схемы, остальные различают сайты
+    """
+    parts = urlsplit(url.strip())
+    scheme = (parts.scheme or "https").lower()
+    host = parts.hostname or ""
+    netloc = parts.netloc.lower()
+    try:
+        port = parts.port
+    except ValueError:
+        port = None
+    if port is not None and port == DEFAULT_PORTS.get(scheme):
+        netloc = netloc.removesuffix(f":{port}")
+    query = sorted(
+        (key, value)
+        for key, value in parse_qsl(parts.query, keep_blank_values=True)
+        if key not in TRACKING_QUERY_PARAMS and not key.startswith("utm_")
+    )
+
+    is_youtube = host == "youtu.be" or host in YOUTUBE_HOSTS
+    if is_youtube:
+        query = [(key, value) for key, value in query if key not in YOUTUBE_IGNORED_QUERY_PARAMS]
+
+        if host == "youtu.be" and parts.path.strip("/"):
+            return _canonical_youtube_url(parts.path.strip("/"), query)
+
+        for prefix in YOUTUBE_VIDEO_PATH_PREFIXES:
+            if parts.path.startswith(prefix) and parts.path[len(prefix) :].strip("/"):
+                return _canonical_youtube_url(parts.path[len(prefix) :].strip("/"), query)
+
+        netloc = "www.youtube.com"
+
+    return urlunsplit((scheme, netloc, parts.path, urlencode(query), parts.fragment))
+
+
+def strip_media_urls(info: YtDlpInfoDict) -> YtDlpInfoDict:
+    """
+    Информация без полей с подписанными ссылками, у плейлистов и у записей
+    """
+    info = {key: value for key, value in info.items() if key not in MEDIA_KEYS}
+
+    entries = info.get("entries")
+    if entries is not None:
+        info["entries"] = [strip_media_urls(entry) if isinstance(entry, dict) else entry for entry in entries]
+
+    return info
+
+
+def is_live(info: YtDlpInfoDict) -> bool:
+    """
+    Идёт или ещё только будет трансляция, то есть информация о ней скоро изменится
+    """
+    live_status = info.get("live_status")
+    return bool(info.get("is_live")) or (live_status is not None and live_status not in FINISHED_LIVE_STATUSES)
+
+
+def _json_default(obj: Any) -> Any:  # noqa: ANN401
+    if isinstance(obj, LazyList | set | frozenset):
+        return list(obj)
+
+    raise TypeError(f"Object of type {obj.__class__.__name__} is not JSON serializable")
+
+
+class YtDlpInfoCache:
+    """
+    Кеширует функцию извлечения информации yt-dlp, вызывая её в executor
+
+    В памяти и в redis хранятся сериализованные значения, поэтому каждый вызов получает свою копию информации
+    """
 
-yt_dlp_cache = Cache()
-yt_dlp_cache.setup(f"redis://{REDIS_USER}:{REDIS_PASSWORD}@{REDIS_HOST}:{REDIS_PORT}/{REDIS_YT_DLP_CACHE_DB}")
+    def __init__(  # noqa: D107, PLR0913
+        self,
+        redis: Redis,
+        name: str,
+        function: Callable[..., YtDlpInfoDict],
+        executor: Executor,
+        ttl: timedelta,
+        negative_ttl: timedelta = YT_DLP_NEGATIVE_CACHE_TTL,
+        live_ttl: timedelta = YT_DLP_LIVE_CACHE_TTL,
+        memory_size: int = YT_DLP_INFO_MEMORY_CACHE_SIZE,
+    ):
+        self.redis = redis
+        self.name = name
+        self.function = function
+        self.executor = executor
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.live_ttl = live_ttl
+        self.memory_size = memory_size
 
-extract_info_async_cached = yt_dlp_cache(ttl=YT_DLP_EXTRACT_INFO_CACHE_TTL)(
-    run_async_wrapper(extract_info, thread_executor),
+        # Ключ -> (момент устаревания по time.monotonic, сериализованное значение)
+        self._memory: OrderedDict[str, tuple[float, bytes]] = OrderedDict()
+        self._memory_lock = threading.Lock()
+
+    def make_key(self, url: str, **kwargs: Any) -> str:  # noqa: ANN401
+        key = f"yt_dlp:{self.name}:{canonicalize_url(url)}"
+        if kwargs:
+            key += f":{orjson.dumps(kwargs, option=orjson.OPT_SORT_KEYS).decode()}"
+        return key
+
+    def _get_from_memory(self, key: str) -> bytes | None:
+        with self._memory_lock:
+            item = self._memory.get(key)
+            if item is None:
+                return None
+
+            expires, data = item
+            if expires < time.monotonic():
+                del self._memory[key]
+                return None
+
+            self._memory.move_to_end(key)
+            return data
+
+    def _put_to_memory(self, key: str, data: bytes, ttl: timedelta) -> None:
+        with self._memory_lock:
+            self._memory[key] = (time.monotonic() + ttl.total_seconds(), data)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_size:
+                self._memory.popitem(last=False)
+
+    def _get_from_redis(self, key: str) -> tuple[bytes, timedelta] | None:
+        """
+        Значение и оставшееся время его жизни в redis
+        """
+        try:
+            pipeline = self.redis.pipeline(transaction=False)
+            pipeline.get(key)
+            pipeline.pttl(key)
+            data, ttl_ms = pipeline.execute()
+        except Exception as exc:  # noqa: BLE001
+            logger.warning("Failed to get %s from yt-dlp cache: %s", key, exc)
+            return None
+
+        if data is None:
+            return None
+        # Отрицательный pttl: ключ без срока жизни или удалён между командами
+        return data, timedelta(milliseconds=ttl_ms) if ttl_ms > 0 else self.ttl
+
+    def _put_to_redis(self, key: str, data: bytes, ttl: timedelta) -> None:
+        try:
+            self.redis.set(key, data, ex=ttl)
+        except Exception as exc:  # noqa: BLE001
+            logger.warning("Failed to put %s to yt-dlp cache: %s", key, exc)
+
+    def _store(self, key: str, value: dict[str, Any], ttl: timedelta) -> bytes | None:
+        try:
+            data = orjson.dumps(value, default=_json_default, option=orjson.OPT_NON_STR_KEYS)
+        except TypeError as exc:
+            logger.warning("Failed to serialize %s for yt-dlp cache: %s", key, exc)
+            return None
+
+        self._put_to_redis(key, data, ttl)
+        return data
+
+    def _load_or_extract(
+        self,
+        key: str,
+        url: str,
+        **kwargs: Any,  # noqa: ANN401
+    ) -> tuple[bytes | None, dict[str, Any], timedelta]:
+        """
+        Выполняется в executor, чтобы не блокировать event loop ни redis, ни yt-dlp
+
+        Возвращает сериализованное значение, само значение и сколько ему осталось жить
+        """
+        cached = self._get_from_redis(key)
+        observe_cache(f"{self.name}_redis", hit=cached is not None)
+        if cached is not None:
+            data, ttl = cached
+            return data, orjson.loads(data), ttl
+
+        try:
+            info = self.function(url, **kwargs)
+        except YoutubeDLError as exc:
+            error_msg = str(exc.msg)
+            if any(pattern in error_msg.lower() for pattern in NEGATIVE_CACHE_ERROR_PATTERNS):
+                value = {"error": error_msg}
+                data = self._store(key, value, self.negative_ttl)
+                if data is not None:
+                    self._put_to_memory(key, data, self.negative_ttl)
+            raise
+
+        value = {"info": info}
+        ttl = self.live_ttl if is_live(info) else self.ttl
+        data = self._store(key, value, ttl)
+        return data, value, ttl
+
+    async def __call__(self, url: str, **kwargs: Any) -> YtDlpInfoDict:  # noqa: ANN401
+        key = self.make_key(url, **kwargs)
+
+        data = self._get_from_memory(key)
+        observe_cache(f"{self.name}_memory", hit=data is not None)
+        if data is not None:
+            value = orjson.loads(data)
+        else:
+            loop = asyncio.get_running_loop()
+            data, value, ttl = await loop.run_in_executor(
+                self.executor,
+                lambda: self._load_or_extract(key, url, **kwargs),
+            )
+            if data is not None:
+                self._put_to_memory(key, data, ttl)
+
+        if "error" in value:
+            logger.info("Using cached yt-dlp error for %s", url)
+            raise DownloadError(value["error"])
+
+        return value["info"]
+
+
+def extract_metadata(url: str, **kwargs: Any) -> YtDlpInfoDict:  # noqa: ANN401
+    """
+    extract_info без подписанных ссылок, её можно долго хранить в кеше
+    """
+    return strip_media_urls(extract_info(url, **kwargs))
+
+
+yt_dlp_redis: Redis = lazy_object_proxy.Proxy(
+    lambda: Redis(
+        host=REDIS_HOST,
+        port=REDIS_PORT,
+        username=REDIS_USER,
+        password=REDIS_PASSWORD,
+        db=REDIS_YT_DLP_CACHE_DB,
+    ),
+)
+
+thread_executor = ThreadPoolExecutor()
+#: Отдельный ограниченный пул, чтобы всплеск ссылок в боте не занимал потоки полного извлечения
+preview_thread_executor = ThreadPoolExecutor(max_workers=YT_DLP_PREVIEW_WORKERS, thread_name_prefix="yt_dlp_preview")
+
+extract_metadata_async_cached = YtDlpInfoCache(
+    yt_dlp_redis,
+    "yt_dlp_metadata",
+    extract_metadata,
+    thread_executor,
+    ttl=YT_DLP_METADATA_CACHE_TTL,
+)
+extract_preview_info_async_cached = YtDlpInfoCache(
+    yt_dlp_redis,
+    "yt_dlp_preview",
+    extract_preview_info,
+    preview_thread_executor,
+    ttl=YT_DLP_METADATA_CACHE_TTL,
 )